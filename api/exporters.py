@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import invest_repo
+import reports
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Blocos de ~64 KiB: poucas escritas no socket sem acumular o arquivo inteiro.
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+TRANSACTION_COLUMNS = list(reports._TX_PAGE_COLUMNS)
+TRADE_COLUMNS = ["id", "date", "symbol", "asset_class", "side", "quantity", "price", "fees", "taxes", "exchange_rate", "note", "asset_id"]
+INCOME_COLUMNS = ["id", "date", "symbol", "asset_class", "type", "amount", "credit_account_name", "note", "asset_id"]
+PRICE_COLUMNS = ["id", "date", "symbol", "asset_class", "price", "source", "asset_id"]
+
+INVEST_EXPORTS = {
+    "trades": (invest_repo.stream_trades, TRADE_COLUMNS),
+    "income": (invest_repo.stream_income, INCOME_COLUMNS),
+    "prices": (invest_repo.stream_prices, PRICE_COLUMNS),
+}
+
+
+def normalize_export_format(value: Any) -> str:
+    fmt = str(value or "csv").strip().lower()
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise ValueError("Formato inválido. Use csv ou ndjson.")
+    return fmt
+
+
+def _csv_value(value: Any) -> Any:
+    return "" if value is None else value
+
+
+def encode_rows(rows: Iterable[dict], fmt: str, columns: list[str], flush_bytes: int = EXPORT_FLUSH_BYTES) -> Iterator[bytes]:
+    """Serializa linhas em CSV (com cabeçalho) ou NDJSON, em blocos de até ~flush_bytes."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n") if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+    for row in rows:
+        if writer is not None:
+            writer.writerow([_csv_value(row.get(col)) for col in columns])
+        else:
+            buf.write(json.dumps({col: row.get(col) for col in columns}, ensure_ascii=False, default=str))
+            buf.write("\n")
+        if buf.tell() >= flush_bytes:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def export_filename(dataset: str, fmt: str, view: str | None = None) -> str:
+    stem = f"{dataset}_{view}" if view else dataset
+    return f"{stem}.{'csv' if fmt == 'csv' else 'ndjson'}"
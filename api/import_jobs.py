@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO
+from uuid import uuid4
+
+import api.importers as importers
+import db
+from tenant import clear_tenant_context, set_current_user_id, set_current_workspace_id
+
+logger = logging.getLogger(__name__)
+
+IMPORT_JOBS_MAX_WORKERS = max(1, int(os.getenv("IMPORT_JOBS_MAX_WORKERS", "2") or "2"))
+IMPORT_JOBS_DIR = Path(os.getenv("IMPORT_JOBS_DIR") or (db.BASE_DIR / "data" / "import_jobs"))
+# Intervalo mínimo entre gravações de progresso na tabela (só PostgreSQL; ver _on_progress).
+IMPORT_JOBS_PROGRESS_INTERVAL_S = max(0.0, float(os.getenv("IMPORT_JOBS_PROGRESS_INTERVAL_S", "2") or "2"))
+# Job 'running' de outra máquina sem terminar há mais que isso é considerado órfão.
+IMPORT_JOBS_STALE_S = max(60, int(os.getenv("IMPORT_JOBS_STALE_S", "3600") or "3600"))
+# Identifica a máquina/contêiner dono dos jobs em execução (worker = "<node>:<pid>").
+IMPORT_JOBS_NODE = str(os.getenv("IMPORT_JOBS_NODE") or socket.gethostname() or "local")
+
+IMPORTERS = {
+    "transactions": importers.import_transactions_csv,
+    "assets": importers.import_assets_csv,
+    "trades": importers.import_trades_csv,
+}
+# Importadores que leem em lotes e reportam progresso.
+_CHUNKED_KINDS = {"transactions", "trades"}
+
+JOB_COLUMNS = """
+    id, workspace_id, created_by, kind, file_name, file_bytes, status,
+    rows_processed, rows_inserted, rows_rejected, rows_skipped, bytes_read,
+    elapsed_s, result, error, created_at, started_at, finished_at
+"""
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+# Progresso ao vivo dos jobs em execução neste processo: {job_id: snapshot}.
+_LIVE: dict[int, dict[str, Any]] = {}
+_LIVE_LOCK = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat(sep=" ")
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=IMPORT_JOBS_MAX_WORKERS, thread_name_prefix="import-job")
+        return _EXECUTOR
+
+
+def shutdown_executor(wait: bool = False) -> None:
+    """Encerra o pool; jobs ainda na fila continuam 'queued' e são retomados por recover_jobs()."""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        executor = _EXECUTOR
+        _EXECUTOR = None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _insert_and_get_id(conn, insert_sql: str, params: tuple | list) -> int:
+    if getattr(conn, "_use_postgres", False):
+        row = conn.execute(insert_sql.rstrip().rstrip(";") + "\nRETURNING id", params).fetchone()
+        return int(row["id"]) if row else 0
+    conn.execute(insert_sql, params)
+    row = conn.execute("SELECT last_insert_rowid() AS id").fetchone()
+    return int(row["id"]) if row else 0
+
+
+def _remove_file(path: str | Path | None) -> None:
+    if not path:
+        return
+    try:
+        Path(path).unlink(missing_ok=True)
+    except OSError:
+        logger.warning("Não foi possível remover o arquivo do job de importação", extra={"path": str(path)})
+
+
+def create_job(kind: str, stream: BinaryIO, file_name: str | None, workspace_id: int, user_id: int) -> dict[str, Any]:
+    """Grava o upload em disco, registra o job como 'queued' e o coloca na fila do pool."""
+    if kind not in IMPORTERS:
+        raise ValueError("Tipo de importação inválido.")
+    IMPORT_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    path = IMPORT_JOBS_DIR / f"{uuid4().hex}.csv"
+    try:
+        with open(path, "wb") as out:
+            shutil.copyfileobj(stream, out, 1024 * 1024)
+        # Conexão própria com commit imediato: o worker precisa enxergar o job antes
+        # do commit da request que o criou.
+        with db.detached_conn() as conn:
+            job_id = _insert_and_get_id(
+                conn,
+                """
+                INSERT INTO import_jobs(workspace_id, created_by, kind, file_name, file_path, file_bytes, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued')
+                """,
+                (int(workspace_id), int(user_id), kind, file_name, str(path), path.stat().st_size),
+            )
+    except Exception:
+        _remove_file(path)
+        raise
+    _executor().submit(_run_job, job_id)
+    return {"job_id": job_id, "status": "queued"}
+
+
+def _worker_id() -> str:
+    return f"{IMPORT_JOBS_NODE}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill(pid, 0) encerraria o processo no Windows; sem como checar, assume vivo.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _is_orphan(job_id: int, worker: str | None) -> bool:
+    """Job 'running' deste nó cujo processo morreu (PID reaproveitado por este processo inclusive)."""
+    node, _, pid = str(worker or "").rpartition(":")
+    if node != IMPORT_JOBS_NODE or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        with _LIVE_LOCK:
+            return int(job_id) not in _LIVE
+    return not _pid_alive(int(pid))
+
+
+def _claim_job(job_id: int) -> dict[str, Any] | None:
+    # Só um worker (de qualquer processo) passa de 'queued' para 'running'.
+    with db.detached_conn() as conn:
+        cur = conn.execute(
+            "UPDATE import_jobs SET status = 'running', worker = ?, started_at = ? WHERE id = ? AND status = 'queued'",
+            (_worker_id(), _now(), int(job_id)),
+        )
+        if cur.rowcount != 1:
+            return None
+        row = conn.execute(
+            "SELECT id, workspace_id, created_by, kind, file_path FROM import_jobs WHERE id = ?",
+            (int(job_id),),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def _counters(snapshot: dict[str, Any]) -> tuple:
+    return (
+        int(snapshot.get("rows_read") or 0),
+        int(snapshot.get("inserted") or 0),
+        int(snapshot.get("rejected") or 0),
+        int(snapshot.get("skipped") or 0),
+        snapshot.get("bytes_read"),
+    )
+
+
+def _on_progress(job_id: int, snapshot: dict[str, Any]) -> None:
+    live = dict(snapshot)
+    now = time.monotonic()
+    with _LIVE_LOCK:
+        state = _LIVE.get(job_id)
+        if state is None:
+            return
+        state.update(live)
+        persist = db.USE_POSTGRES and now - state["persisted_at"] >= IMPORT_JOBS_PROGRESS_INTERVAL_S
+        if persist:
+            state["persisted_at"] = now
+    if not persist:
+        return
+    # No SQLite a transação da importação segura o lock de escrita até o fim, então o
+    # progresso fica só em memória; no PostgreSQL ele também vai para a tabela, visível
+    # a qualquer processo da API.
+    try:
+        with db.detached_conn() as conn:
+            conn.execute(
+                """
+                UPDATE import_jobs
+                SET rows_processed = ?, rows_inserted = ?, rows_rejected = ?, rows_skipped = ?, bytes_read = ?
+                WHERE id = ?
+                """,
+                (*_counters(live), int(job_id)),
+            )
+    except Exception:
+        logger.warning("Falha ao gravar progresso do job de importação", extra={"job_id": job_id}, exc_info=True)
+
+
+def _finish_job(
+    job_id: int,
+    status: str,
+    counters: tuple,
+    elapsed_s: float,
+    result: dict | None = None,
+    error: str | None = None,
+) -> None:
+    with db.detached_conn() as conn:
+        conn.execute(
+            """
+            UPDATE import_jobs
+            SET status = ?, rows_processed = ?, rows_inserted = ?, rows_rejected = ?, rows_skipped = ?,
+                bytes_read = ?, elapsed_s = ?, result = ?, error = ?, finished_at = ?
+            WHERE id = ?
+            """,
+            (
+                status,
+                *counters,
+                round(float(elapsed_s), 3),
+                json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                error,
+                _now(),
+                int(job_id),
+            ),
+        )
+
+
+def _run_job(job_id: int) -> None:
+    job = _claim_job(job_id)
+    if job is None:
+        return
+    job_id = int(job["id"])
+    started = time.monotonic()
+    with _LIVE_LOCK:
+        _LIVE[job_id] = {"started_at": started, "persisted_at": started}
+    set_current_user_id(int(job["created_by"]))
+    set_current_workspace_id(int(job["workspace_id"]))
+    try:
+        kwargs: dict[str, Any] = {"user_id": int(job["created_by"])}
+        if job["kind"] in _CHUNKED_KINDS:
+            kwargs["progress_cb"] = lambda snapshot: _on_progress(job_id, snapshot)
+        with open(job["file_path"], "rb") as fh:
+            result = IMPORTERS[job["kind"]](fh, **kwargs)
+            bytes_read = fh.tell()
+        with _LIVE_LOCK:
+            live = dict(_LIVE.get(job_id) or {})
+        rows_read = live.get("rows_read")
+        if rows_read is None:
+            rows_read = int(result.get("rows") or 0) + int(result.get("rejected") or 0)
+        counters = (
+            int(rows_read),
+            int(result.get("inserted") or 0),
+            int(result.get("rejected") or 0),
+            int(result.get("skipped") or 0),
+            int(bytes_read),
+        )
+        _finish_job(job_id, "done", counters, time.monotonic() - started, result=result)
+    except Exception as e:
+        logger.exception("Falha no job de importação", extra={"job_id": job_id, "kind": job["kind"]})
+        with _LIVE_LOCK:
+            live = dict(_LIVE.get(job_id) or {})
+        # A importação roda numa transação só: em caso de erro nada foi gravado.
+        processed, _, rejected, skipped, bytes_read = _counters(live)
+        try:
+            _finish_job(
+                job_id,
+                "failed",
+                (processed, 0, rejected, skipped, bytes_read),
+                time.monotonic() - started,
+                error=str(e) or e.__class__.__name__,
+            )
+        except Exception:
+            logger.exception("Falha ao registrar erro do job de importação", extra={"job_id": job_id})
+    finally:
+        clear_tenant_context()
+        with _LIVE_LOCK:
+            _LIVE.pop(job_id, None)
+        _remove_file(job["file_path"])
+
+
+def _as_text(value: Any) -> str | None:
+    if isinstance(value, datetime):
+        return value.replace(microsecond=0).isoformat(sep=" ")
+    return str(value) if value is not None else None
+
+
+def _elapsed_s(started_at: Any, finished_at: Any) -> float | None:
+    try:
+        start = datetime.fromisoformat(_as_text(started_at) or "")
+        end = datetime.fromisoformat(_as_text(finished_at) or "")
+    except ValueError:
+        return None
+    return max(0.0, (end - start).total_seconds())
+
+
+def _job_view(row) -> dict[str, Any]:
+    item = dict(row)
+    for key in ("created_at", "started_at", "finished_at"):
+        item[key] = _as_text(item.get(key))
+    result = json.loads(item.pop("result")) if item.get("result") else None
+    item["result"] = result
+    item["errors"] = list((result or {}).get("errors") or [])
+
+    elapsed = item.get("elapsed_s")
+    with _LIVE_LOCK:
+        live = dict(_LIVE.get(int(item["id"])) or {})
+    if item["status"] == "running" and live:
+        # Progresso ao vivo do worker deste processo (mais recente que a tabela).
+        processed, inserted, rejected, skipped, bytes_read = _counters(live)
+        item.update(
+            rows_processed=processed,
+            rows_inserted=inserted,
+            rows_rejected=rejected,
+            rows_skipped=skipped,
+            bytes_read=bytes_read,
+        )
+        elapsed = time.monotonic() - float(live["started_at"])
+    elif elapsed is None and item["started_at"]:
+        # Em execução em outro processo: estimado pelo horário de início.
+        elapsed = _elapsed_s(item["started_at"], _now())
+
+    item["elapsed_s"] = round(elapsed, 3) if elapsed is not None else None
+    item["rows_per_s"] = round(item["rows_processed"] / elapsed, 1) if elapsed else None
+    total = item.get("file_bytes")
+    if item["status"] == "done":
+        item["progress"] = 1.0
+    elif total and item.get("bytes_read") is not None:
+        item["progress"] = round(min(1.0, float(item["bytes_read"]) / float(total)), 4)
+    else:
+        item["progress"] = 0.0 if item["status"] == "queued" else None
+    return item
+
+
+def get_job(job_id: int, workspace_id: int) -> dict[str, Any] | None:
+    with db.detached_conn() as conn:
+        row = conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM import_jobs WHERE id = ? AND workspace_id = ?",
+            (int(job_id), int(workspace_id)),
+        ).fetchone()
+    return _job_view(row) if row else None
+
+
+def list_jobs(workspace_id: int, limit: int = 20) -> list[dict[str, Any]]:
+    with db.detached_conn() as conn:
+        rows = conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM import_jobs WHERE workspace_id = ? ORDER BY id DESC LIMIT ?",
+            (int(workspace_id), max(1, min(int(limit), 200))),
+        ).fetchall()
+    return [_job_view(r) for r in rows]
+
+
+def recover_jobs() -> int:
+    """Na subida da API: recoloca na fila os jobs 'queued' e falha os 'running' órfãos.
+
+    Órfão é o job deste nó cujo processo não existe mais, qualquer que seja a idade; de outros
+    nós (que podem estar vivos) só depois de IMPORT_JOBS_STALE_S.
+    """
+    stale_before = datetime.fromtimestamp(time.time() - IMPORT_JOBS_STALE_S).replace(microsecond=0).isoformat(sep=" ")
+    with db.detached_conn() as conn:
+        running = conn.execute(
+            "SELECT id, file_path, worker, started_at FROM import_jobs WHERE status = 'running'"
+        ).fetchall()
+        orphans = [
+            row
+            for row in running
+            if _is_orphan(row["id"], row["worker"]) or str(_as_text(row["started_at"]) or "") < stale_before
+        ]
+        for row in orphans:
+            conn.execute(
+                """
+                UPDATE import_jobs
+                SET status = 'failed', error = 'Importação interrompida (reinício do servidor).', finished_at = ?
+                WHERE id = ? AND status = 'running'
+                """,
+                (_now(), int(row["id"])),
+            )
+        rows = conn.execute("SELECT id FROM import_jobs WHERE status = 'queued' ORDER BY id").fetchall()
+    for row in orphans:
+        _remove_file(row["file_path"])
+    for row in rows:
+        _executor().submit(_run_job, int(row["id"]))
+    return len(rows)
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import csv
 import io
-from typing import Any
+import os
+from collections.abc import Callable, Iterator
+from typing import Any, BinaryIO
 
 import pandas as pd
 
 import invest_repo
 import repo
 import reports
+from db import get_conn
+
+# Linhas por lote na leitura/gravação de CSVs grandes (memória limitada pelo lote, não pelo arquivo).
+IMPORT_CHUNK_ROWS = max(1, int(os.getenv("IMPORT_CHUNK_ROWS", "5000") or "5000"))
+_SNIFF_BYTES = 64 * 1024
+
+ProgressCallback = Callable[[dict[str, Any]], None]
 
 
 def _norm_trade_side(value: Any) -> str:
@@ -62,15 +72,73 @@ def _is_us_stock_asset(asset: dict) -> bool:
     return _norm_asset_class(asset.get("asset_class")) in {"stock_us", "stocks_us"}
 
 
-def _read_csv_flexible(raw_bytes: bytes) -> pd.DataFrame:
-    text = raw_bytes.decode("utf-8-sig", errors="ignore")
+def _as_stream(source: bytes | BinaryIO) -> BinaryIO:
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _sniff_delimiter(stream: BinaryIO) -> str:
+    # Mesmo critério do sep=None do pandas: a primeira linha decide o separador.
+    sample = stream.read(_SNIFF_BYTES).decode("utf-8-sig", errors="ignore")
+    stream.seek(0)
+    first_line = sample.splitlines()[0] if sample else ""
     try:
-        return pd.read_csv(io.StringIO(text), sep=None, engine="python")
-    except Exception:
-        return pd.read_csv(io.StringIO(text))
+        return csv.Sniffer().sniff(first_line, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
 
 
-def normalize_transactions_df(df: pd.DataFrame) -> pd.DataFrame:
+def iter_csv_chunks(source: bytes | BinaryIO, chunk_rows: int | None = None) -> Iterator[pd.DataFrame]:
+    """Lê o CSV (bytes ou arquivo binário, ex.: UploadFile.file) em DataFrames de até `chunk_rows` linhas.
+
+    Todas as colunas chegam como texto; a conversão fica com os normalizadores. O índice
+    continua entre os lotes, então a linha do arquivo segue sendo índice + 2.
+    """
+    stream = _as_stream(source)
+    sep = _sniff_delimiter(stream)
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="ignore", newline="")
+    try:
+        with pd.read_csv(text, sep=sep, dtype=str, chunksize=max(1, int(chunk_rows or IMPORT_CHUNK_ROWS))) as reader:
+            yield from reader
+    finally:
+        # Não fecha o arquivo de quem chamou (o UploadFile é fechado pelo FastAPI).
+        text.detach()
+
+
+def _read_csv_flexible(source: bytes | BinaryIO) -> pd.DataFrame:
+    chunks = list(iter_csv_chunks(source))
+    return pd.concat(chunks) if chunks else pd.DataFrame()
+
+
+# Linha do arquivo = índice do DataFrame + 2 (cabeçalho na linha 1).
+_CSV_FIRST_DATA_LINE = 2
+# Limite de erros devolvidos na resposta (o total vai em "rejected").
+MAX_REPORTED_ERRORS = 50
+
+
+def _row_errors(out: pd.DataFrame, checks: list[tuple[pd.Series, str]]) -> tuple[pd.Series, list[tuple[int, str]]]:
+    """Aplica as validações em ordem; cada linha rejeitada recebe o motivo da primeira que falhou."""
+    valid = pd.Series(True, index=out.index)
+    errors: list[tuple[int, str]] = []
+    for bad, reason in checks:
+        hit = bad.fillna(True) & valid
+        errors.extend((int(idx) + _CSV_FIRST_DATA_LINE, reason) for idx in out.index[hit])
+        valid &= ~hit
+    errors.sort()
+    return valid, errors
+
+
+def _blank(series: pd.Series) -> pd.Series:
+    return series.isna() | series.astype(str).str.strip().str.lower().isin(["", "nan", "none"])
+
+
+def _format_errors(errors: list[tuple[int, str]]) -> list[str]:
+    return [f"Linha {line}: {reason}" for line, reason in errors[:MAX_REPORTED_ERRORS]]
+
+
+def _normalize_transactions(df: pd.DataFrame) -> tuple[pd.DataFrame, list[tuple[int, str]]]:
     out = df.copy()
     out.columns = [str(c).strip().lower() for c in out.columns]
     required = {"date", "description", "amount", "account"}
@@ -89,9 +157,21 @@ def normalize_transactions_df(df: pd.DataFrame) -> pd.DataFrame:
         else:
             out[opt] = out[opt].astype(str).replace({"nan": None}).where(out[opt].notna(), None)
 
-    out = out.dropna(subset=["date", "description", "account", "amount"])
-    out = out[(out["description"] != "") & (out["account"] != "")]
-    return out[["date", "description", "amount", "account", "category", "method", "notes"]]
+    valid, errors = _row_errors(
+        out,
+        [
+            (out["date"].isna(), "data inválida."),
+            (_blank(out["description"]), "descrição vazia."),
+            (_blank(out["account"]), "conta vazia."),
+            (out["amount"].isna(), "valor inválido."),
+        ],
+    )
+    out = out[valid]
+    return out[["date", "description", "amount", "account", "category", "method", "notes"]], errors
+
+
+def normalize_transactions_df(df: pd.DataFrame) -> pd.DataFrame:
+    return _normalize_transactions(df)[0]
 
 
 def _normalize_assets_df(df: pd.DataFrame) -> pd.DataFrame:
@@ -140,7 +220,7 @@ def _normalize_assets_df(df: pd.DataFrame) -> pd.DataFrame:
     return out[["symbol", "name", "asset_class", "sector", "currency", "broker_account", "source_account"]]
 
 
-def _normalize_trades_df(df: pd.DataFrame) -> pd.DataFrame:
+def _normalize_trades(df: pd.DataFrame) -> tuple[pd.DataFrame, list[tuple[int, str]]]:
     alias = {
         "asset_id": "symbol",
         "asset": "symbol",
@@ -204,61 +284,155 @@ def _normalize_trades_df(df: pd.DataFrame) -> pd.DataFrame:
     out["fees"] = _to_num_mixed(out["fees"]).fillna(0.0)
     out["taxes"] = _to_num_mixed(out["taxes"]).fillna(0.0)
     out["note"] = out["note"].astype(str).replace({"nan": None}).where(out["note"].notna(), None)
-    out = out.dropna(subset=["date", "symbol", "side", "quantity", "price"])
-    out = out[
-        (out["symbol"] != "")
-        & (out["side"].isin(["BUY", "SELL"]))
-        & (out["quantity"] > 0)
-        & (out["price"] > 0)
-        & (out["fees"] >= 0)
-        & (out["taxes"] >= 0)
-    ]
-    return out[["date", "symbol", "side", "quantity", "price", "exchange_rate", "fees", "taxes", "note"]]
-
-
-def import_transactions_csv(raw_bytes: bytes, user_id: int, preview_only: bool = False) -> dict[str, Any]:
-    raw = _read_csv_flexible(raw_bytes)
-    norm = normalize_transactions_df(raw)
-    if preview_only:
+    valid, errors = _row_errors(
+        out,
+        [
+            (out["date"].isna(), "data inválida."),
+            (_blank(out["symbol"]), "ativo vazio."),
+            (~out["side"].isin(["BUY", "SELL"]), "tipo de operação inválido (use compra/venda)."),
+            (~(out["quantity"] > 0), "quantidade deve ser maior que zero."),
+            (~(out["price"] > 0), "preço deve ser maior que zero."),
+            (~(out["fees"] >= 0) | ~(out["taxes"] >= 0), "taxas e impostos não podem ser negativos."),
+        ],
+    )
+    out = out[valid]
+    return out[["date", "symbol", "side", "quantity", "price", "exchange_rate", "fees", "taxes", "note"]], errors
+
+
+def _records(norm: pd.DataFrame) -> list[dict]:
+    return norm.astype(object).where(norm.notna(), None).to_dict(orient="records")
+
+
+def _stream_size(stream: BinaryIO) -> int | None:
+    try:
+        pos = stream.tell()
+        size = stream.seek(0, io.SEEK_END)
+        stream.seek(pos)
+        return int(size)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class _ImportProgress:
+    """Contadores de uma importação em lotes; guarda só os primeiros erros (memória limitada)."""
+
+    def __init__(self, stream: BinaryIO, progress_cb: ProgressCallback | None = None):
+        self._stream = stream
+        self._progress_cb = progress_cb
+        self.bytes_total = _stream_size(stream)
+        self.rows_read = 0
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.skipped = 0
+        self.errors: list[tuple[int, str]] = []
+
+    def add(self, chunk_rows: int, valid: int, inserted: int, rejected: list, skipped: list | None = None) -> None:
+        self.rows_read += int(chunk_rows)
+        self.rows += int(valid)
+        self.inserted += int(inserted)
+        self.rejected += len(rejected)
+        self.skipped += len(skipped or [])
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(sorted(list(rejected) + list(skipped or []))[:room])
+        if self._progress_cb is not None:
+            self._progress_cb(self.snapshot())
+
+    def snapshot(self) -> dict[str, Any]:
+        try:
+            bytes_read = int(self._stream.tell())
+        except (OSError, ValueError):
+            bytes_read = None
         return {
-            "ok": True,
-            "rows": int(len(norm)),
-            "preview": norm.head(20).to_dict(orient="records"),
+            "rows_read": self.rows_read,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "rejected": self.rejected,
+            "skipped": self.skipped,
+            "bytes_read": bytes_read,
+            "bytes_total": self.bytes_total,
         }
 
-    for acc in norm["account"].dropna().unique():
-        repo.create_account(str(acc), "Banco", user_id=user_id)
-    for cat in norm["category"].dropna().unique():
-        if str(cat).strip():
-            repo.create_category(str(cat), "Despesa", user_id=user_id)
 
-    account_map = {r["name"]: int(r["id"]) for r in (repo.list_accounts(user_id=user_id) or [])}
-    category_map = {r["name"]: int(r["id"]) for r in (repo.list_categories(user_id=user_id) or [])}
+def _preview_csv(source: bytes | BinaryIO, normalize, chunk_rows: int | None) -> dict[str, Any]:
+    # Percorre o arquivo todo para contar linhas válidas, mas guarda só as 20 primeiras.
+    preview: list[dict] = []
+    rows = 0
+    rejected = 0
+    errors: list[tuple[int, str]] = []
+    for chunk in iter_csv_chunks(source, chunk_rows):
+        norm, row_errors = normalize(chunk)
+        if len(preview) < 20:
+            preview.extend(norm.head(20 - len(preview)).to_dict(orient="records"))
+        rows += len(norm)
+        rejected += len(row_errors)
+        errors.extend(row_errors[: max(0, MAX_REPORTED_ERRORS - len(errors))])
+    return {
+        "ok": True,
+        "rows": int(rows),
+        "rejected": rejected,
+        "errors": _format_errors(errors),
+        "preview": preview,
+    }
 
-    inserted = 0
-    for _, row in norm.iterrows():
-        acc_id = account_map.get(str(row["account"]))
-        cat_val = row["category"] if row["category"] is not None else None
-        cat_id = category_map.get(str(cat_val)) if cat_val else None
-        if not acc_id:
-            continue
-        repo.insert_transaction(
-            date=str(row["date"]),
-            description=str(row["description"]),
-            amount=float(row["amount"]),
-            account_id=int(acc_id),
-            category_id=int(cat_id) if cat_id else None,
-            method=(str(row["method"]).strip() if row["method"] is not None and str(row["method"]).strip() else None),
-            notes=(str(row["notes"]).strip() if row["notes"] is not None and str(row["notes"]).strip() else None),
-            user_id=user_id,
-        )
-        inserted += 1
 
-    return {"ok": True, "rows": int(len(norm)), "inserted": int(inserted)}
+def _run_chunked_import(source: bytes | BinaryIO, write_chunk, progress_cb, chunk_rows, finish=None) -> _ImportProgress:
+    """Lê e grava lote a lote numa única transação; erro em qualquer lote desfaz o arquivo inteiro."""
+    stream = _as_stream(source)
+    progress = _ImportProgress(stream, progress_cb)
+    conn = get_conn()
+    try:
+        for chunk in iter_csv_chunks(stream, chunk_rows):
+            write_chunk(conn, chunk, progress)
+        if finish is not None:
+            finish(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return progress
+
+
+def import_transactions_csv(
+    source: bytes | BinaryIO,
+    user_id: int,
+    preview_only: bool = False,
+    chunk_rows: int | None = None,
+    progress_cb: ProgressCallback | None = None,
+) -> dict[str, Any]:
+    if preview_only:
+        return _preview_csv(source, _normalize_transactions, chunk_rows)
+
+    months: set[str] = set()
+
+    def write_chunk(conn, chunk: pd.DataFrame, progress: _ImportProgress) -> None:
+        norm, row_errors = _normalize_transactions(chunk)
+        out = repo.bulk_insert_transactions(_records(norm), user_id=user_id, conn=conn, refresh_rollup=False)
+        months.update(out["months"])
+        progress.add(len(chunk), len(norm), out["inserted"], row_errors)
+
+    progress = _run_chunked_import(
+        source,
+        write_chunk,
+        progress_cb,
+        chunk_rows,
+        finish=lambda conn: repo.refresh_monthly_rollup(months, user_id=user_id, conn=conn),
+    )
+    return {
+        "ok": True,
+        "rows": progress.rows,
+        "inserted": progress.inserted,
+        "rejected": progress.rejected,
+        "errors": _format_errors(progress.errors),
+    }
 
 
-def import_assets_csv(raw_bytes: bytes, user_id: int, preview_only: bool = False) -> dict[str, Any]:
-    raw = _read_csv_flexible(raw_bytes)
+def import_assets_csv(source: bytes | BinaryIO, user_id: int, preview_only: bool = False) -> dict[str, Any]:
+    # Cadastro de ativos é pequeno: lido de uma vez.
+    raw = _read_csv_flexible(source)
     norm = _normalize_assets_df(raw)
     if preview_only:
         return {
@@ -332,50 +506,53 @@ def import_assets_csv(raw_bytes: bytes, user_id: int, preview_only: bool = False
     }
 
 
-def import_trades_csv(raw_bytes: bytes, user_id: int, preview_only: bool = False) -> dict[str, Any]:
-    raw = _read_csv_flexible(raw_bytes)
-    norm = _normalize_trades_df(raw)
-    if preview_only:
-        return {
-            "ok": True,
-            "rows": int(len(norm)),
-            "preview": norm.head(20).to_dict(orient="records"),
-        }
-
+def _trade_context(user_id: int) -> dict[str, Any]:
     assets = invest_repo.list_assets(user_id=user_id) or []
     asset_by_symbol = {str(a["symbol"]).upper(): dict(a) for a in assets}
-    cat_id = repo.ensure_category("Investimentos", "Transferencia", user_id=user_id)
+    broker_ids = {int(a["broker_account_id"]) for a in asset_by_symbol.values() if a.get("broker_account_id")}
+    return {
+        "asset_by_symbol": asset_by_symbol,
+        "cat_id": repo.ensure_category("Investimentos", "Transferencia", user_id=user_id),
+        "broker_cash": reports.account_balances_by_id(broker_ids, user_id=user_id),
+    }
 
-    inserted = 0
-    skipped = 0
-    errors: list[str] = []
 
-    for _, row in norm.iterrows():
-        symbol = str(row["symbol"]).upper()
+def _plan_trades(norm: pd.DataFrame, ctx: dict[str, Any]) -> tuple[list[dict], list[tuple[int, str]]]:
+    """Valida as operações contra ativos e saldo da corretora sem gravar nada.
+
+    O saldo de cada corretora é lido uma vez (em _trade_context) e atualizado em memória,
+    linha a linha, na ordem do arquivo (mesmo resultado da checagem por lançamento).
+    """
+    asset_by_symbol = ctx["asset_by_symbol"]
+    cat_id = ctx["cat_id"]
+    broker_cash = ctx["broker_cash"]
+
+    planned: list[dict] = []
+    errors: list[tuple[int, str]] = []
+    for idx, row in zip(norm.index, norm.itertuples(index=False)):
+        line = int(idx) + _CSV_FIRST_DATA_LINE
+        symbol = str(row.symbol).upper()
         asset = asset_by_symbol.get(symbol)
         if not asset:
-            skipped += 1
-            errors.append(f"{symbol}: ativo não encontrado.")
+            errors.append((line, f"{symbol}: ativo não encontrado."))
             continue
 
         broker_acc_id = asset.get("broker_account_id")
         if not broker_acc_id:
-            skipped += 1
-            errors.append(f"{symbol}: ativo sem conta corretora vinculada.")
+            errors.append((line, f"{symbol}: ativo sem conta corretora vinculada."))
             continue
 
-        side = str(row["side"]).upper()
-        qty = float(row["quantity"])
-        price = float(row["price"])
-        exchange_rate = float(row["exchange_rate"] or 0.0)
-        fees = float(row["fees"] or 0.0)
-        taxes = float(row["taxes"] or 0.0)
-        note = (str(row["note"]).strip() if row["note"] is not None and str(row["note"]).strip() else None)
+        side = str(row.side).upper()
+        qty = float(row.quantity)
+        price = float(row.price)
+        exchange_rate = float(row.exchange_rate) if pd.notna(row.exchange_rate) else 0.0
+        fees = float(row.fees or 0.0)
+        taxes = float(row.taxes or 0.0)
+        note = (str(row.note).strip() if row.note is not None and str(row.note).strip() else None)
 
         is_us_stock = _is_us_stock_asset(asset)
         if is_us_stock and exchange_rate <= 0:
-            skipped += 1
-            errors.append(f"{symbol}: cotação USD/BRL obrigatória para Stocks US.")
+            errors.append((line, f"{symbol}: cotação USD/BRL obrigatória para Stocks US."))
             continue
         fx = exchange_rate if is_us_stock else 1.0
 
@@ -383,11 +560,10 @@ def import_trades_csv(raw_bytes: bytes, user_id: int, preview_only: bool = False
         fees_brl = fees * fx if is_us_stock else fees
         taxes_brl = taxes * fx if is_us_stock else taxes
         total_cost = gross + fees_brl + taxes_brl
-        broker_cash = reports.account_balance_by_id(int(broker_acc_id), user_id=user_id)
-        if side == "BUY" and broker_cash < total_cost:
-            skipped += 1
+        available = broker_cash[int(broker_acc_id)]
+        if side == "BUY" and available < total_cost:
             errors.append(
-                f"{symbol}: saldo insuficiente na corretora. Disponível {broker_cash:.2f}, necessário {total_cost:.2f}."
+                (line, f"{symbol}: saldo insuficiente na corretora. Disponível {available:.2f}, necessário {total_cost:.2f}.")
             )
             continue
 
@@ -397,35 +573,57 @@ def import_trades_csv(raw_bytes: bytes, user_id: int, preview_only: bool = False
         else:
             cash = +(gross - fees_brl - taxes_brl)
             desc = f"INV SELL {symbol}"
-
-        repo.insert_transaction(
-            date=str(row["date"]),
-            description=desc,
-            amount=float(cash),
-            account_id=int(broker_acc_id),
-            category_id=int(cat_id),
-            method="INV",
-            notes=note,
-            user_id=user_id,
-        )
-        invest_repo.insert_trade(
-            asset_id=int(asset["id"]),
-            date=str(row["date"]),
-            side=side,
-            quantity=qty,
-            price=price,
-            exchange_rate=fx,
-            fees=fees,
-            taxes=taxes,
-            note=note,
-            user_id=user_id,
+        broker_cash[int(broker_acc_id)] = available + cash
+
+        planned.append(
+            {
+                "asset_id": int(asset["id"]),
+                "date": str(row.date),
+                "side": side,
+                "quantity": qty,
+                "price": price,
+                "exchange_rate": fx,
+                "fees": fees,
+                "taxes": taxes,
+                "note": note,
+                "cash": {"account_id": int(broker_acc_id), "amount": float(cash), "description": desc, "category_id": int(cat_id)},
+            }
         )
-        inserted += 1
+    return planned, errors
+
 
+def import_trades_csv(
+    source: bytes | BinaryIO,
+    user_id: int,
+    preview_only: bool = False,
+    chunk_rows: int | None = None,
+    progress_cb: ProgressCallback | None = None,
+) -> dict[str, Any]:
+    if preview_only:
+        return _preview_csv(source, _normalize_trades, chunk_rows)
+
+    ctx = _trade_context(user_id)
+    dates: set[str] = set()
+
+    def write_chunk(conn, chunk: pd.DataFrame, progress: _ImportProgress) -> None:
+        norm, row_errors = _normalize_trades(chunk)
+        planned, plan_errors = _plan_trades(norm, ctx)
+        inserted = invest_repo.bulk_insert_trades(planned, user_id=user_id, conn=conn, refresh_rollup=False)
+        dates.update(r["date"] for r in planned)
+        progress.add(len(chunk), len(norm), inserted, row_errors, plan_errors)
+
+    progress = _run_chunked_import(
+        source,
+        write_chunk,
+        progress_cb,
+        chunk_rows,
+        finish=lambda conn: repo.refresh_monthly_rollup(sorted(dates), user_id=user_id, conn=conn),
+    )
     return {
         "ok": True,
-        "rows": int(len(norm)),
-        "inserted": int(inserted),
-        "skipped": int(skipped),
-        "errors": errors[:50],
+        "rows": progress.rows,
+        "inserted": progress.inserted,
+        "skipped": progress.skipped,
+        "rejected": progress.rejected,
+        "errors": _format_errors(progress.errors),
     }
@@ -4,6 +4,8 @@ import os
 import re
 import calendar
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from html import escape
 from typing import Any
 from datetime import date as _date, datetime, time, timedelta
@@ -14,9 +16,13 @@ from zoneinfo import ZoneInfo
 import requests
 import pandas as pd
 from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
 import auth
+import api.exporters as exporters
+import api.import_jobs as import_jobs
 import api.importers as importers
 import invest_index_rates
 import invest_rentability
@@ -28,10 +34,12 @@ import repo
 import reports
 import permissions_service
 import security_monitor
-from db import get_conn, init_db
+from db import UnitOfWork, close_pool, get_conn, init_db, pool_stats, query_cache_stats, resolve_user_workspace_id
 from tenant import (
+    clear_current_unit_of_work,
     clear_tenant_context,
     set_current_global_role,
+    set_current_unit_of_work,
     set_current_user_id,
     set_current_workspace_id,
     set_current_workspace_role,
@@ -64,6 +72,7 @@ from .schemas import (
     ListUpdateRequest,
     ManualAssetValueUpdateRequest,
     ProfileUpdateRequest,
+    SyncStatusResponse,
     UserGlobalRoleUpdateRequest,
     WorkspaceAdminCreateRequest,
     WorkspaceMemberCreateRequest,
@@ -400,6 +409,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -407,6 +417,15 @@ app.add_middleware(
 def on_startup() -> None:
     init_db()
     auth.ensure_bootstrap_admin()
+    import_jobs.recover_jobs()
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    _shutdown_login_sync_executor()
+    import_jobs.shutdown_executor()
+    invest_rentability.shutdown_simulation_pool()
+    close_pool()
 
 
 def _row_to_dict(row: Any) -> dict:
@@ -956,16 +975,7 @@ def _prepare_fixed_income_trade(
 
 
 def _quote_group_for_asset(asset: dict) -> str:
-    cls = _norm_asset_class((asset or {}).get("asset_class"))
-    if cls in {"fii", "fiis", "stock_fii"}:
-        return "FIIs"
-    if cls in {"acao_br", "acoes_br", "etf_br", "bdr"}:
-        return "Ações BR"
-    if cls in {"stock_us", "stocks_us", "etf_us"}:
-        return "Stocks"
-    if cls in {"crypto", "cripto"}:
-        return "Cripto"
-    return "Outros"
+    return invest_quotes.quote_group_for_asset(asset)
 
 
 def _norm_card_brand(value: Any) -> str:
@@ -1315,11 +1325,7 @@ def _permission_from_request(method: str, path: str) -> tuple[str, str] | None:
     return module, action
 
 
-def _current_user(
-    request: Request,
-    payload: dict = Depends(_auth_payload),
-    x_workspace_id: int | None = Header(default=None, alias="X-Workspace-Id"),
-) -> dict:
+def _resolve_principal(request: Request, payload: dict, x_workspace_id: int | None) -> tuple[dict, dict | None]:
     uid = int(payload["uid"])
     user = auth.get_user_by_id(uid)
     if not user or not user.get("is_active", True):
@@ -1425,13 +1431,6 @@ def _current_user(
             )
             raise HTTPException(status_code=403, detail="Workspace bloqueado")
 
-    set_current_user_id(uid)
-    set_current_global_role(global_role)
-    if workspace_id is not None:
-        set_current_workspace_id(workspace_id)
-    if member:
-        set_current_workspace_role(str(member.get("workspace_role") or "").strip().upper())
-
     out = dict(user)
     out["global_role"] = global_role
     out["role"] = "admin" if global_role == "SUPER_ADMIN" else "user"
@@ -1440,6 +1439,40 @@ def _current_user(
     out["workspace_status"] = str(member.get("workspace_status") or "").strip().lower() if member else None
     out["workspace_name"] = member.get("workspace_name") if member else None
     out["permissions"] = _effective_permissions_for_user(out, member=member)
+    return out, member
+
+
+def _current_user(
+    request: Request,
+    payload: dict = Depends(_auth_payload),
+    x_workspace_id: int | None = Header(default=None, alias="X-Workspace-Id"),
+) -> dict:
+    uid = int(payload["uid"])
+    try:
+        token_version = int(payload.get("tv", 0) or 0)
+    except Exception:
+        token_version = 0
+    requested = x_workspace_id if x_workspace_id is not None else payload.get("wid", payload.get("workspace_id"))
+    cache_key = (uid, token_version, str(requested) if requested is not None else None)
+
+    # Usuário, membership e permissões efetivas mudam pouco; o dashboard dispara várias
+    # requests em paralelo com o mesmo token. Invalidação: auth/permissions_service.
+    principal = auth.get_cached_principal(cache_key)
+    if principal is None:
+        principal = _resolve_principal(request, payload, x_workspace_id)
+        auth.cache_principal(cache_key, principal)
+    cached_out, member = principal
+
+    out = dict(cached_out)
+    out["permissions"] = [dict(item) for item in cached_out["permissions"]]
+    workspace_id = out["workspace_id"]
+
+    set_current_user_id(uid)
+    set_current_global_role(out["global_role"])
+    if workspace_id is not None:
+        set_current_workspace_id(workspace_id)
+    if member:
+        set_current_workspace_role(str(member.get("workspace_role") or "").strip().upper())
 
     perm = _permission_from_request(request.method, request.url.path)
     if perm:
@@ -1464,67 +1497,6 @@ def _require_admin(user: dict) -> None:
         raise HTTPException(status_code=403, detail="Somente admin pode executar esta operação")
 
 
-def _latest_index_ref_date(index_name: str, user_id: int, workspace_id: int | None = None) -> str | None:
-    try:
-        if workspace_id is not None:
-            set_current_workspace_id(int(workspace_id))
-        set_current_user_id(int(user_id))
-        rows = invest_index_rates.list_index_rates(index_name=index_name, limit=1, user_id=int(user_id))
-        if not rows:
-            return None
-        return str(rows[0].get("ref_date") or "").strip() or None
-    finally:
-        clear_tenant_context()
-
-
-def _sync_scope(user_id: int, workspace_id: int | None = None) -> tuple[str, int]:
-    if workspace_id is not None:
-        return "workspace", int(workspace_id)
-    return "user", int(user_id)
-
-
-def _has_sync_run_today(
-    sync_type: str,
-    sync_key: str,
-    user_id: int,
-    workspace_id: int | None = None,
-    ref_date: str | None = None,
-) -> bool:
-    scope_kind, scope_id = _sync_scope(user_id=user_id, workspace_id=workspace_id)
-    target_date = str(ref_date or _date.today().isoformat())
-    with get_conn() as conn:
-        row = conn.execute(
-            """
-            SELECT 1
-            FROM sync_runs
-            WHERE scope_kind = ? AND scope_id = ? AND sync_type = ? AND sync_key = ? AND ref_date = ?
-            LIMIT 1
-            """,
-            (scope_kind, scope_id, str(sync_type), str(sync_key), target_date),
-        ).fetchone()
-    return bool(row)
-
-
-def _mark_sync_run_today(
-    sync_type: str,
-    sync_key: str,
-    user_id: int,
-    workspace_id: int | None = None,
-    ref_date: str | None = None,
-) -> None:
-    scope_kind, scope_id = _sync_scope(user_id=user_id, workspace_id=workspace_id)
-    target_date = str(ref_date or _date.today().isoformat())
-    with get_conn() as conn:
-        conn.execute(
-            """
-            INSERT INTO sync_runs(scope_kind, scope_id, sync_type, sync_key, ref_date)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(scope_kind, scope_id, sync_type, sync_key, ref_date) DO NOTHING
-            """,
-            (scope_kind, scope_id, str(sync_type), str(sync_key), target_date),
-        )
-
-
 def _manual_asset_updates_today(user_id: int, workspace_id: int | None = None, ref_date: str | None = None) -> set[int]:
     target_date = str(ref_date or _date.today().isoformat())
     params: list[object] = [target_date]
@@ -1592,71 +1564,30 @@ def _sync_indexes_on_login(
     target_indexes: list[str] | None = None,
 ) -> dict[str, Any]:
     today = _date.today()
-    today_iso = today.isoformat()
-    plans: list[tuple[str, str, str]] = []
     target_set = {str(idx or "").strip().upper() for idx in (target_indexes or []) if str(idx or "").strip()}
     status_map: dict[str, str] = {}
 
-    for idx in ("CDI", "SELIC"):
-        if _has_sync_run_today("index_rate_sync", idx, user_id=user_id, workspace_id=workspace_id, ref_date=today_iso):
-            if idx in target_set:
-                status_map[idx] = "up_to_date"
-            continue
-        latest = _latest_index_ref_date(idx, user_id=user_id, workspace_id=workspace_id)
-        if latest:
-            start = (_date.fromisoformat(latest) + timedelta(days=1)).isoformat()
-        else:
-            start = f"{today.year}-01-01"
-        if start <= today_iso:
-            plans.append((idx, start, today_iso))
-        elif idx in target_set:
-            status_map[idx] = "up_to_date"
-
+    index_names = ["CDI", "SELIC"]
     if today.day >= 12:
-        if not _has_sync_run_today("index_rate_sync", "IPCA", user_id=user_id, workspace_id=workspace_id, ref_date=today_iso):
-            latest_ipca = _latest_index_ref_date("IPCA", user_id=user_id, workspace_id=workspace_id)
-            if latest_ipca:
-                start = (_date.fromisoformat(latest_ipca) + timedelta(days=1)).isoformat()
-            else:
-                start = f"{today.year}-01-01"
-            if start <= today_iso:
-                plans.append(("IPCA", start, today_iso))
-            elif "IPCA" in target_set:
-                status_map["IPCA"] = "up_to_date"
-        elif "IPCA" in target_set:
-            status_map["IPCA"] = "up_to_date"
+        index_names.append("IPCA")
     elif "IPCA" in target_set:
         status_map["IPCA"] = "pending_release"
 
-    if target_set:
-        for idx, _, _ in plans:
-            if idx in target_set and idx not in status_map:
-                status_map[idx] = "pending_sync"
-
-    for idx, start, end in plans:
-        try:
-            if workspace_id is not None:
-                set_current_workspace_id(int(workspace_id))
-            set_current_user_id(int(user_id))
-            invest_index_rates.sync_from_bcb(
-                index_names=[idx],
-                date_from=start,
-                date_to=end,
-                timeout_s=10.0,
-                user_id=int(user_id),
-            )
-            _mark_sync_run_today("index_rate_sync", idx, user_id=user_id, workspace_id=workspace_id, ref_date=today_iso)
-            if idx in target_set:
-                status_map[idx] = "updated"
-        except Exception:
-            if idx in target_set:
-                status_map[idx] = "failed"
-            logger.exception(
+    # Série global: só o primeiro login do dia consulta a fonte; os demais workspaces apenas leem.
+    out = invest_index_rates.sync_market_index_rates(index_names=index_names, timeout_s=10.0)
+    for idx, status in out["statuses"].items():
+        if status == "failed":
+            logger.warning(
                 "Falha ao sincronizar índices no login",
-                extra={"user_id": int(user_id), "workspace_id": workspace_id, "index_name": idx},
+                extra={
+                    "user_id": int(user_id),
+                    "workspace_id": workspace_id,
+                    "index_name": idx,
+                    "error": out["errors"].get(idx),
+                },
             )
-        finally:
-            clear_tenant_context()
+        if idx in target_set:
+            status_map[idx] = status
 
     updated = [idx for idx in invest_index_rates.SUPPORTED_INDEX_NAMES if status_map.get(idx) == "updated"]
     up_to_date = [idx for idx in invest_index_rates.SUPPORTED_INDEX_NAMES if status_map.get(idx) == "up_to_date"]
@@ -1810,6 +1741,110 @@ def _build_login_sync_status(
     }
 
 
+LOGIN_SYNC_MAX_WORKERS = max(1, int(os.getenv("LOGIN_SYNC_MAX_WORKERS", "2") or "2"))
+
+# Sync de índices + recálculo da renda fixa rodam fora do /auth/login: o login só enfileira
+# e o frontend consulta /sync/status. Um job ativo por workspace (logins repetidos reaproveitam).
+_LOGIN_SYNC_LOCK = threading.Lock()
+_LOGIN_SYNC_JOBS: dict[tuple[str, int], dict[str, Any]] = {}
+_LOGIN_SYNC_EXECUTOR: ThreadPoolExecutor | None = None
+
+
+def _login_sync_key(user_id: int, workspace_id: int | None = None) -> tuple[str, int]:
+    if workspace_id is not None:
+        return "workspace", int(workspace_id)
+    return "user", int(user_id)
+
+
+def _login_sync_now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat()
+
+
+def _login_sync_executor() -> ThreadPoolExecutor:
+    global _LOGIN_SYNC_EXECUTOR
+    if _LOGIN_SYNC_EXECUTOR is None:
+        _LOGIN_SYNC_EXECUTOR = ThreadPoolExecutor(max_workers=LOGIN_SYNC_MAX_WORKERS, thread_name_prefix="login-sync")
+    return _LOGIN_SYNC_EXECUTOR
+
+
+def _shutdown_login_sync_executor() -> None:
+    global _LOGIN_SYNC_EXECUTOR
+    with _LOGIN_SYNC_LOCK:
+        executor = _LOGIN_SYNC_EXECUTOR
+        _LOGIN_SYNC_EXECUTOR = None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_login_sync(user_id: int, workspace_id: int | None = None) -> dict[str, Any] | None:
+    impacted_sync_context = _collect_login_fixed_income_context(user_id, workspace_id=workspace_id)
+    index_sync_status = _sync_indexes_on_login(
+        user_id,
+        workspace_id=workspace_id,
+        target_indexes=impacted_sync_context.get("impacted_index_names"),
+    )
+    fixed_income_refresh_status = _refresh_fixed_income_on_login(user_id, workspace_id=workspace_id)
+    return _build_login_sync_status(
+        impacted_sync_context,
+        index_sync_status,
+        fixed_income_refresh_status,
+    )
+
+
+def _login_sync_worker(job: dict[str, Any], user_id: int, workspace_id: int | None) -> None:
+    with _LOGIN_SYNC_LOCK:
+        job["state"] = "running"
+        job["started_at"] = _login_sync_now()
+    state = "done"
+    result = None
+    try:
+        result = _run_login_sync(user_id, workspace_id=workspace_id)
+    except Exception:
+        state = "failed"
+        logger.exception(
+            "Falha no sync de login em background",
+            extra={"user_id": int(user_id), "workspace_id": workspace_id},
+        )
+    finally:
+        clear_tenant_context()
+        with _LOGIN_SYNC_LOCK:
+            job["state"] = state
+            job["finished_at"] = _login_sync_now()
+            job["login_sync_status"] = result
+
+
+def _enqueue_login_sync(user_id: int, workspace_id: int | None = None) -> dict[str, Any]:
+    key = _login_sync_key(user_id, workspace_id)
+    with _LOGIN_SYNC_LOCK:
+        job = _LOGIN_SYNC_JOBS.get(key)
+        if job is not None and job["state"] in {"queued", "running"}:
+            return dict(job)
+        job = {
+            "state": "queued",
+            "queued_at": _login_sync_now(),
+            "started_at": None,
+            "finished_at": None,
+            "login_sync_status": None,
+        }
+        _LOGIN_SYNC_JOBS[key] = job
+        _login_sync_executor().submit(_login_sync_worker, job, int(user_id), workspace_id)
+        return dict(job)
+
+
+def _login_sync_snapshot(user_id: int, workspace_id: int | None = None) -> dict[str, Any]:
+    with _LOGIN_SYNC_LOCK:
+        job = _LOGIN_SYNC_JOBS.get(_login_sync_key(user_id, workspace_id))
+        if job is None:
+            return {
+                "state": "idle",
+                "queued_at": None,
+                "started_at": None,
+                "finished_at": None,
+                "login_sync_status": None,
+            }
+        return dict(job)
+
+
 def _current_workspace_id_from_user(user: dict) -> int:
     workspace_id = user.get("workspace_id")
     if workspace_id is None:
@@ -1844,53 +1879,110 @@ def admin_runtime_checks(user: dict = Depends(_current_user)) -> dict:
             "cors_origins_configured": bool(_cors_origins()),
             "database_url_configured": bool(str(os.getenv("DATABASE_URL") or "").strip()),
         },
+        "db_pool": pool_stats(),
+        "db_query_cache": query_cache_stats(),
     }
 
 
+async def _upload_stream(file: UploadFile):
+    """Arquivo do upload (spooled em disco pelo Starlette) para leitura em lotes, sem carregar tudo na memória."""
+    if not await file.read(1):
+        raise HTTPException(status_code=400, detail="Arquivo vazio")
+    await file.seek(0)
+    return file.file
+
+
+def _import_workspace_id(user: dict) -> int | None:
+    workspace_id = user.get("workspace_id") or resolve_user_workspace_id(int(user["id"]))
+    return int(workspace_id) if workspace_id is not None else None
+
+
+async def _enqueue_import(kind: str, file: UploadFile, stream, user: dict, response: Response) -> dict | None:
+    """Grava o upload e enfileira a importação (202 + job_id); None se não houver workspace para escopar o job."""
+    workspace_id = await run_in_threadpool(_import_workspace_id, user)
+    if workspace_id is None:
+        return None
+    job = await run_in_threadpool(import_jobs.create_job, kind, stream, file.filename, workspace_id, int(user["id"]))
+    response.status_code = 202
+    return job
+
+
+def _import_jobs_workspace_id(user: dict) -> int:
+    workspace_id = _import_workspace_id(user)
+    if workspace_id is None:
+        raise HTTPException(status_code=400, detail="Workspace não definido no contexto atual.")
+    return workspace_id
+
+
+@app.get("/import/jobs")
+def list_import_jobs(limit: int = Query(default=20, ge=1, le=200), user: dict = Depends(_current_user)) -> list[dict]:
+    return import_jobs.list_jobs(_import_jobs_workspace_id(user), limit=limit)
+
+
+@app.get("/import/jobs/{job_id}")
+def get_import_job(job_id: int, user: dict = Depends(_current_user)) -> dict:
+    job = import_jobs.get_job(job_id, _import_jobs_workspace_id(user))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Importação não encontrada.")
+    return job
+
+
 @app.post("/import/transactions-csv")
 async def import_transactions_csv_endpoint(
+    response: Response,
     file: UploadFile = File(...),
     preview_only: bool = Form(default=False),
+    background: bool = Form(default=False),
     user: dict = Depends(_current_user),
 ) -> dict:
     uid = int(user["id"])
-    raw = await file.read()
-    if not raw:
-        raise HTTPException(status_code=400, detail="Arquivo vazio")
+    stream = await _upload_stream(file)
     try:
-        return importers.import_transactions_csv(raw, user_id=uid, preview_only=bool(preview_only))
+        if background and not preview_only:
+            job = await _enqueue_import("transactions", file, stream, user, response)
+            if job is not None:
+                return job
+        return await run_in_threadpool(importers.import_transactions_csv, stream, user_id=uid, preview_only=bool(preview_only))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/import/assets-csv")
 async def import_assets_csv_endpoint(
+    response: Response,
     file: UploadFile = File(...),
     preview_only: bool = Form(default=False),
+    background: bool = Form(default=False),
     user: dict = Depends(_current_user),
 ) -> dict:
     uid = int(user["id"])
-    raw = await file.read()
-    if not raw:
-        raise HTTPException(status_code=400, detail="Arquivo vazio")
+    stream = await _upload_stream(file)
     try:
-        return importers.import_assets_csv(raw, user_id=uid, preview_only=bool(preview_only))
+        if background and not preview_only:
+            job = await _enqueue_import("assets", file, stream, user, response)
+            if job is not None:
+                return job
+        return await run_in_threadpool(importers.import_assets_csv, stream, user_id=uid, preview_only=bool(preview_only))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/import/trades-csv")
 async def import_trades_csv_endpoint(
+    response: Response,
     file: UploadFile = File(...),
     preview_only: bool = Form(default=False),
+    background: bool = Form(default=False),
     user: dict = Depends(_current_user),
 ) -> dict:
     uid = int(user["id"])
-    raw = await file.read()
-    if not raw:
-        raise HTTPException(status_code=400, detail="Arquivo vazio")
+    stream = await _upload_stream(file)
     try:
-        return importers.import_trades_csv(raw, user_id=uid, preview_only=bool(preview_only))
+        if background and not preview_only:
+            job = await _enqueue_import("trades", file, stream, user, response)
+            if job is not None:
+                return job
+        return await run_in_threadpool(importers.import_trades_csv, stream, user_id=uid, preview_only=bool(preview_only))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -1941,18 +2033,7 @@ def login(body: LoginRequest, request: Request) -> LoginResponse:
                 )
                 raise HTTPException(status_code=403, detail="Workspace bloqueado")
 
-    impacted_sync_context = _collect_login_fixed_income_context(uid, workspace_id=workspace_id)
-    index_sync_status = _sync_indexes_on_login(
-        uid,
-        workspace_id=workspace_id,
-        target_indexes=impacted_sync_context.get("impacted_index_names"),
-    )
-    fixed_income_refresh_status = _refresh_fixed_income_on_login(uid, workspace_id=workspace_id)
-    login_sync_status = _build_login_sync_status(
-        impacted_sync_context,
-        index_sync_status,
-        fixed_income_refresh_status,
-    )
+    login_sync_job = _enqueue_login_sync(uid, workspace_id=workspace_id)
 
     token = create_token(
         uid,
@@ -1971,7 +2052,7 @@ def login(body: LoginRequest, request: Request) -> LoginResponse:
     out_user["workspace_status"] = str(member.get("workspace_status") or "").strip().lower() if member else None
     out_user["workspace_name"] = member.get("workspace_name") if member else None
     out_user["permissions"] = _effective_permissions_for_user(out_user, member=member)
-    return LoginResponse(token=token, user=out_user, login_sync_status=login_sync_status)
+    return LoginResponse(token=token, user=out_user, login_sync_state=login_sync_job["state"])
 
 
 @app.post("/auth/forgot-password")
@@ -2051,6 +2132,11 @@ def me(user: dict = Depends(_current_user)) -> dict:
     return user
 
 
+@app.get("/sync/status", response_model=SyncStatusResponse)
+def sync_status(user: dict = Depends(_current_user)) -> dict:
+    return _login_sync_snapshot(int(user["id"]), workspace_id=user.get("workspace_id"))
+
+
 @app.put("/me")
 def update_me(body: ProfileUpdateRequest, user: dict = Depends(_current_user)) -> dict:
     try:
@@ -2747,22 +2833,73 @@ def toggle_list_item_acquired(
     return item
 
 
+def _transactions_page(
+    uid: int, date_from: str | None, date_to: str | None, view: str, limit: int, after: str | None
+) -> tuple[list[dict], str | None]:
+    try:
+        return reports.page_transactions(
+            date_from=date_from, date_to=date_to, user_id=uid, view=_norm_view(view), limit=int(limit), after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/transactions")
 def list_transactions(
+    response: Response,
     date_from: str | None = None,
     date_to: str | None = None,
     view: str = Query(default="caixa"),
     limit: int = Query(default=100, ge=1, le=1000),
+    after: str | None = Query(default=None),
     user: dict = Depends(_current_user),
 ) -> list[dict]:
-    uid = int(user["id"])
+    rows, next_cursor = _transactions_page(int(user["id"]), date_from, date_to, view, limit, after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+@app.get("/transactions/page")
+def list_transactions_page(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    view: str = Query(default="caixa"),
+    limit: int = Query(default=100, ge=1, le=1000),
+    after: str | None = Query(default=None),
+    user: dict = Depends(_current_user),
+) -> dict:
+    rows, next_cursor = _transactions_page(int(user["id"]), date_from, date_to, view, limit, after)
+    return {"rows": rows, "next_cursor": next_cursor}
+
+
+def _export_response(rows, fmt: str, columns: list[str], filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        exporters.encode_rows(rows, fmt, columns),
+        media_type=exporters.EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _export_format(value: str) -> str:
+    try:
+        return exporters.normalize_export_format(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/transactions/export")
+def export_transactions(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    view: str = Query(default="caixa"),
+    format: str = Query(default="csv"),
+    user: dict = Depends(_current_user),
+) -> StreamingResponse:
+    fmt = _export_format(format)
     mode = _norm_view(view)
-    df = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
-    if df.empty:
-        return []
-    rows_view = df.sort_values("date", ascending=False).head(int(limit)).copy()
-    rows_view["date"] = rows_view["date"].dt.strftime("%Y-%m-%d")
-    return rows_view.fillna("").to_dict(orient="records")
+    rows = reports.stream_transactions(date_from=date_from, date_to=date_to, user_id=int(user["id"]), view=mode)
+    return _export_response(rows, fmt, exporters.TRANSACTION_COLUMNS, exporters.export_filename("lancamentos", fmt, mode))
 
 
 @app.post("/transactions")
@@ -3280,7 +3417,7 @@ def dashboard_kpis(
 ) -> dict:
     uid = int(user["id"])
     mode = _norm_view(view)
-    df = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
+    df = reports.df_dashboard(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
     if account and not df.empty:
         df = df[df["account"] == account]
     return reports.kpis(df)
@@ -3296,7 +3433,7 @@ def dashboard_monthly(
 ) -> list[dict]:
     uid = int(user["id"])
     mode = _norm_view(view)
-    df = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
+    df = reports.df_dashboard(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
     if account and not df.empty:
         df = df[df["account"] == account]
     out = reports.monthly_summary(df)
@@ -3315,7 +3452,7 @@ def dashboard_wealth_monthly(
 ) -> list[dict]:
     uid = int(user["id"])
     mode = _norm_view(view)
-    df = reports.df_transactions(date_to=date_to, user_id=uid, view=mode)
+    df = reports.df_dashboard(date_to=date_to, user_id=uid, view=mode)
     if account and not df.empty:
         df = df[df["account"] == account]
     out = reports.monthly_wealth_summary(df, date_from=date_from, date_to=date_to)
@@ -3334,7 +3471,7 @@ def dashboard_expenses_by_category(
 ) -> list[dict]:
     uid = int(user["id"])
     mode = _norm_view(view)
-    df = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
+    df = reports.df_dashboard(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
     if account and not df.empty:
         df = df[df["account"] == account]
     out = reports.category_expenses(df)
@@ -3353,7 +3490,7 @@ def dashboard_account_balance(
 ) -> list[dict]:
     uid = int(user["id"])
     mode = _norm_view(view)
-    df = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
+    df = reports.df_dashboard(date_from=date_from, date_to=date_to, user_id=uid, view=mode)
     if account and not df.empty:
         df = df[df["account"] == account]
     out = reports.account_balance(df)
@@ -3362,6 +3499,27 @@ def dashboard_account_balance(
     return out.to_dict(orient="records")
 
 
+@app.get("/dashboard/bundle")
+def dashboard_bundle(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    account: str | None = None,
+    view: str = Query(default="caixa"),
+    wealth_date_from: str | None = None,
+    user: dict = Depends(_current_user),
+) -> dict:
+    uid = int(user["id"])
+    mode = _norm_view(view)
+    return reports.dashboard_bundle(
+        date_from=date_from,
+        date_to=date_to,
+        account=account,
+        user_id=uid,
+        view=mode,
+        wealth_date_from=wealth_date_from,
+    )
+
+
 @app.get("/dashboard/commitments-summary")
 def dashboard_commitments_summary(
     date_from: str | None = None,
@@ -3457,16 +3615,8 @@ def invest_list_index_rates(
         idx = str(index_name or "").strip()
         if auto_sync and idx:
             target_to = str(date_to or "").strip() or _date.today().isoformat()
-            latest = None
             try:
-                existing = invest_index_rates.list_index_rates(
-                    index_name=idx,
-                    date_from=None,
-                    date_to=target_to,
-                    limit=1,
-                    user_id=uid,
-                )
-                latest = str(existing[0].get("ref_date") or "").strip() if existing else None
+                latest = invest_index_rates.latest_market_ref_date(idx)
             except Exception:
                 latest = None
 
@@ -3514,10 +3664,11 @@ def invest_upsert_index_rates(
         raise HTTPException(status_code=400, detail="Informe ao menos um ponto para carga.")
 
     try:
+        # Carga manual vira override do workspace; a série pública vem da sincronização global.
         result = invest_index_rates.bulk_upsert_index_rates(
             index_name=body.index_name,
             points=points,
-            source=(body.source or "").strip() or None,
+            source=(body.source or "").strip() or "MANUAL",
             user_id=int(user["id"]),
         )
         return {"ok": True, **result}
@@ -3964,6 +4115,23 @@ def invest_list_trades(
     return [_row_to_dict(r) for r in rows]
 
 
+@app.get("/invest/export/{dataset}")
+def invest_export(
+    dataset: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    format: str = Query(default="csv"),
+    user: dict = Depends(_current_user),
+) -> StreamingResponse:
+    fmt = _export_format(format)
+    key = str(dataset or "").strip().lower()
+    if key not in exporters.INVEST_EXPORTS:
+        raise HTTPException(status_code=404, detail="Exportação inválida. Use trades, income ou prices.")
+    stream, columns = exporters.INVEST_EXPORTS[key]
+    rows = stream(date_from=date_from, date_to=date_to, user_id=int(user["id"]))
+    return _export_response(rows, fmt, columns, exporters.export_filename(key, fmt))
+
+
 @app.post("/invest/trades")
 def invest_create_trade(
     body: TradeCreateRequest,
@@ -4411,6 +4579,24 @@ def invest_get_quote_job_status(user: dict = Depends(_current_user)) -> dict:
     }
 
 
+@app.middleware("http")
+async def db_unit_of_work_middleware(request, call_next):
+    # Uma conexão e um único commit por request: todo get_conn() da request
+    # (auth, repo, reports, invest_*) reutiliza a conexão da unidade de trabalho.
+    uow = UnitOfWork()
+    set_current_unit_of_work(uow)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await run_in_threadpool(uow.finish, False)
+        raise
+    else:
+        await run_in_threadpool(uow.finish, True)
+        return response
+    finally:
+        clear_current_unit_of_work()
+
+
 @app.middleware("http")
 async def tenant_cleanup_middleware(request, call_next):
     # Defensive cleanup in case lower layers set tenant context.
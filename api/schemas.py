@@ -34,6 +34,15 @@ class LoginResponse(BaseModel):
     token: str
     user: dict
     login_sync_status: LoginSyncStatus | None = None
+    login_sync_state: str | None = None
+
+
+class SyncStatusResponse(BaseModel):
+    state: str
+    queued_at: str | None = None
+    started_at: str | None = None
+    finished_at: str | None = None
+    login_sync_status: LoginSyncStatus | None = None
 
 
 class ProfileUpdateRequest(BaseModel):
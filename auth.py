@@ -7,10 +7,12 @@ import re
 import secrets
 from collections import deque
 from datetime import datetime, timedelta, timezone
+import time
 from threading import Lock
 from typing import Any
 
 from db import get_conn
+from tenant import invalidate_workspace_resolution, repeat_after_unit_of_work
 
 PBKDF2_ITERATIONS = 260_000
 BOOTSTRAP_ADMIN_EMAIL = "willian@tks.global"
@@ -20,11 +22,63 @@ PASSWORD_RESET_TTL_MINUTES = max(15, min(30, int(os.getenv("PASSWORD_RESET_TTL_M
 PASSWORD_RESET_EMAIL_LIMIT_PER_HOUR = max(1, int(os.getenv("PASSWORD_RESET_EMAIL_LIMIT_PER_HOUR", "3") or "3"))
 PASSWORD_RESET_IP_LIMIT_PER_HOUR = max(1, int(os.getenv("PASSWORD_RESET_IP_LIMIT_PER_HOUR", "10") or "10"))
 PASSWORD_RESET_NEUTRAL_MESSAGE = "Se o e-mail existir, você receberá instruções para redefinir sua senha."
+PRINCIPAL_CACHE_TTL_S = max(0.0, float(os.getenv("PRINCIPAL_CACHE_TTL_S", "15") or "15"))
+PRINCIPAL_CACHE_MAX_ENTRIES = 2048
 
 _PASSWORD_RESET_RATE_LOCK = Lock()
 _PASSWORD_RESET_EMAIL_ATTEMPTS: dict[str, deque[float]] = {}
 _PASSWORD_RESET_IP_ATTEMPTS: dict[str, deque[float]] = {}
 
+# (user_id, token_version, workspace solicitado) -> (expira_em, principal resolvido pela API).
+_PRINCIPAL_CACHE_LOCK = Lock()
+_PRINCIPAL_CACHE: dict[tuple[int, int, Any], tuple[float, Any]] = {}
+
+
+def get_cached_principal(key: tuple[int, int, Any]) -> Any | None:
+    with _PRINCIPAL_CACHE_LOCK:
+        entry = _PRINCIPAL_CACHE.get(key)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at <= time.monotonic():
+            _PRINCIPAL_CACHE.pop(key, None)
+            return None
+        return principal
+
+
+def cache_principal(key: tuple[int, int, Any], principal: Any) -> None:
+    if PRINCIPAL_CACHE_TTL_S <= 0:
+        return
+    now = time.monotonic()
+    with _PRINCIPAL_CACHE_LOCK:
+        if len(_PRINCIPAL_CACHE) >= PRINCIPAL_CACHE_MAX_ENTRIES:
+            for k in [k for k, (exp, _) in _PRINCIPAL_CACHE.items() if exp <= now]:
+                _PRINCIPAL_CACHE.pop(k, None)
+            if len(_PRINCIPAL_CACHE) >= PRINCIPAL_CACHE_MAX_ENTRIES:
+                _PRINCIPAL_CACHE.clear()
+        _PRINCIPAL_CACHE[key] = (now + PRINCIPAL_CACHE_TTL_S, principal)
+
+
+def _drop_principals(user_id: int | None) -> None:
+    with _PRINCIPAL_CACHE_LOCK:
+        if user_id is None:
+            _PRINCIPAL_CACHE.clear()
+            return
+        for k in [k for k in _PRINCIPAL_CACHE if k[0] == user_id]:
+            _PRINCIPAL_CACHE.pop(k, None)
+
+
+def invalidate_principal_cache(user_id: int | None = None) -> None:
+    """Descarta os principals de um usuário, ou de todos quando user_id é None (de novo após o commit)."""
+    uid = int(user_id) if user_id is not None else None
+    _drop_principals(uid)
+    repeat_after_unit_of_work(_drop_principals, uid)
+
+
+def _invalidate_user_caches(user_id: int | None = None) -> None:
+    invalidate_workspace_resolution(user_id)
+    invalidate_principal_cache(user_id)
+
 
 def _utc_now() -> datetime:
     return datetime.now(timezone.utc)
@@ -171,6 +225,8 @@ def ensure_bootstrap_admin() -> None:
         )
     conn.commit()
     conn.close()
+    if row:
+        invalidate_principal_cache(int(row["id"]))
 
 
 def get_user_by_id(user_id: int) -> dict[str, Any] | None:
@@ -421,6 +477,7 @@ def create_workspace_with_owner(
     )
     conn.commit()
     conn.close()
+    _invalidate_user_caches(owner_id)
 
     return get_workspace_by_id(ws_id)
 
@@ -438,6 +495,8 @@ def update_workspace_status(workspace_id: int, status: str) -> dict[str, Any] |
     )
     conn.commit()
     conn.close()
+    # O status altera a ordem de resolução de todos os membros do workspace.
+    _invalidate_user_caches()
     if int(cur.rowcount or 0) <= 0:
         return None
     return get_workspace_by_id(ws_id)
@@ -458,6 +517,7 @@ def update_workspace_name(workspace_id: int, workspace_name: str) -> dict[str, A
     )
     conn.commit()
     conn.close()
+    invalidate_principal_cache()
     if int(cur.rowcount or 0) <= 0:
         return None
     return get_workspace_by_id(ws_id)
@@ -481,6 +541,7 @@ def set_user_global_role(user_id: int, global_role: str) -> dict[str, Any] | Non
     )
     conn.commit()
     conn.close()
+    invalidate_principal_cache(uid)
     if int(cur.rowcount or 0) <= 0:
         return None
     return get_user_by_id(uid)
@@ -599,6 +660,7 @@ def upsert_workspace_member(
         (ws_id, uid),
     ).fetchone()
     conn.close()
+    _invalidate_user_caches(uid)
     return dict(row) if row else None
 
 
@@ -610,6 +672,7 @@ def delete_workspace_member(workspace_id: int, user_id: int) -> int:
     )
     conn.commit()
     conn.close()
+    _invalidate_user_caches(int(user_id))
     return int(cur.rowcount or 0)
 
 
@@ -864,6 +927,7 @@ def update_user_profile(
     )
     conn.commit()
     conn.close()
+    invalidate_principal_cache(uid)
 
     updated = get_user_by_id(uid)
     if not updated:
@@ -995,6 +1059,7 @@ def reset_password_with_token(
     )
     conn.commit()
     conn.close()
+    invalidate_principal_cache(uid)
 
     updated = get_user_by_id(uid)
     if not updated:
@@ -1013,5 +1078,6 @@ def claim_legacy_data_for_user(user_id: int) -> None:
     conn.execute("UPDATE income_events SET user_id = ? WHERE user_id IS NULL", (uid,))
     conn.execute("UPDATE prices SET user_id = ? WHERE user_id IS NULL", (uid,))
     conn.execute("UPDATE asset_prices SET user_id = ? WHERE user_id IS NULL", (uid,))
+    conn.execute("DELETE FROM monthly_rollup_state WHERE user_id = ?", (uid,))
     conn.commit()
     conn.close()
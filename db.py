@@ -1,9 +1,22 @@
-﻿import os
+﻿import functools
+import os
 import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Any
 
+from tenant import (
+    cache_workspace_resolution,
+    clear_current_unit_of_work,
+    get_cached_workspace_resolution,
+    get_current_unit_of_work,
+    invalidate_workspace_resolution,
+    set_current_unit_of_work,
+)
+
 BASE_DIR = Path(__file__).resolve().parent
 SQLITE_PATH = BASE_DIR / "data" / "finance.db"
 
@@ -14,37 +27,73 @@ USE_POSTGRES = (not FORCE_SQLITE) and (
 )
 DB_PATH = DATABASE_URL if USE_POSTGRES else SQLITE_PATH
 
+POOL_ENABLED = str(os.getenv("DB_POOL_ENABLED", "1")).strip().lower() in {"1", "true", "yes", "on"}
+POOL_MIN_SIZE = max(0, int(os.getenv("DB_POOL_MIN_SIZE", "1") or "1"))
+POOL_MAX_SIZE = max(1, POOL_MIN_SIZE, int(os.getenv("DB_POOL_MAX_SIZE", "10") or "10"))
+POOL_TIMEOUT_S = max(0.1, float(os.getenv("DB_POOL_TIMEOUT_S", "30") or "30"))
+POOL_MAX_IDLE_S = max(1.0, float(os.getenv("DB_POOL_MAX_IDLE_S", "300") or "300"))
+QUERY_CACHE_SIZE = max(0, int(os.getenv("DB_QUERY_CACHE_SIZE", "2048") or "2048"))
+STREAM_FETCH_SIZE = max(1, int(os.getenv("DB_STREAM_FETCH_SIZE", "2000") or "2000"))
+
+
+def _prepare_threshold_from_env() -> int | None:
+    raw = str(os.getenv("DB_PREPARE_THRESHOLD", "2")).strip().lower()
+    # "off" desliga prepared statements (ex.: PgBouncer em transaction pooling).
+    if raw in {"", "off", "none", "-1"}:
+        return None
+    return max(0, int(raw))
+
+
+PG_PREPARE_THRESHOLD = _prepare_threshold_from_env()
+
+_SCOPE_USER_ID_RE = re.compile(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])")
+_INSERT_OR_IGNORE_RE = re.compile(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO\s+", re.IGNORECASE)
+
 
 class DBCursor:
     def __init__(self, cursor, use_postgres: bool):
         self._cursor = cursor
         self._use_postgres = use_postgres
 
-    def execute(self, query: str, params: tuple | list | None = None):
-        q = _adapt_query(query, self._use_postgres)
+    def execute(self, query: str, params: tuple | list | None = None, workspace_scope: bool = False):
+        q = translate_query(query, workspace_scope, self._use_postgres)
         self._cursor.execute(q, tuple(params or ()))
         return self
 
+    def executemany(self, query: str, seq_of_params, workspace_scope: bool = False):
+        q = translate_query(query, workspace_scope, self._use_postgres)
+        self._cursor.executemany(q, [tuple(p or ()) for p in seq_of_params])
+        return self
+
     def fetchone(self):
         return self._cursor.fetchone()
 
     def fetchall(self):
         return self._cursor.fetchall()
 
+    def fetchmany(self, size: int):
+        return self._cursor.fetchmany(size)
+
     @property
     def rowcount(self):
         return self._cursor.rowcount
 
 
 class DBConn:
-    def __init__(self, conn, use_postgres: bool):
+    def __init__(self, conn, use_postgres: bool, pool=None):
         self._conn = conn
         self._use_postgres = use_postgres
+        self._pool = pool
+        self._closed = False
 
-    def execute(self, query: str, params: tuple | list | None = None):
-        q = _adapt_query(query, self._use_postgres)
+    def execute(self, query: str, params: tuple | list | None = None, workspace_scope: bool = False):
+        q = translate_query(query, workspace_scope, self._use_postgres)
         return self._conn.execute(q, tuple(params or ()))
 
+    def executemany(self, query: str, seq_of_params, workspace_scope: bool = False):
+        """Mesmo comando para vários conjuntos de parâmetros em uma ida ao driver (pipeline no psycopg)."""
+        return self.cursor().executemany(query, seq_of_params, workspace_scope=workspace_scope)
+
     def cursor(self):
         return DBCursor(self._conn.cursor(), self._use_postgres)
 
@@ -55,7 +104,23 @@ class DBConn:
         self._conn.rollback()
 
     def close(self):
-        self._conn.close()
+        if self._closed:
+            return
+        self._closed = True
+        if self._pool is not None:
+            # Devolve ao pool; alterações sem commit são descartadas como num close().
+            self._pool.putconn(self._conn)
+        else:
+            self._conn.close()
+
+    def __del__(self):
+        # Conexão esquecida sem close(): fecha e libera a vaga no pool.
+        if not getattr(self, "_closed", True) and self._pool is not None:
+            self._closed = True
+            try:
+                self._pool.discard(self._conn)
+            except Exception:
+                pass
 
     def __enter__(self):
         return self
@@ -69,15 +134,16 @@ class DBConn:
         return False
 
 
-def _adapt_query(query: str, use_postgres: bool) -> str:
+def _translate_query(query: str, workspace_scope: bool, use_postgres: bool) -> str:
+    q = str(query)
+    if workspace_scope:
+        q = _SCOPE_USER_ID_RE.sub("workspace_id", q)
     if not use_postgres:
-        return query
-
-    q = query
+        return q
 
     # SQLite -> Postgres compatibility for "INSERT OR IGNORE"
-    if re.match(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO\s+", q, re.IGNORECASE):
-        q = re.sub(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO\s+", "INSERT INTO ", q, flags=re.IGNORECASE)
+    if _INSERT_OR_IGNORE_RE.match(q):
+        q = _INSERT_OR_IGNORE_RE.sub("INSERT INTO ", q)
         if "ON CONFLICT" not in q.upper():
             q = q.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
 
@@ -86,7 +152,286 @@ def _adapt_query(query: str, use_postgres: bool) -> str:
     return q
 
 
-def get_conn() -> DBConn:
+# As queries são literais estáticos repetidos milhares de vezes; o texto final por
+# (query, escopo workspace, dialeto) é memoizado num LRU limitado.
+_translate_query_cached = functools.lru_cache(maxsize=QUERY_CACHE_SIZE)(_translate_query)
+
+
+def translate_query(query: str, workspace_scope: bool = False, use_postgres: bool = False) -> str:
+    return _translate_query_cached(str(query), bool(workspace_scope), bool(use_postgres))
+
+
+def scope_sql(query: str) -> str:
+    """Reescreve user_id -> workspace_id (escopo multiworkspace), sem adaptar dialeto."""
+    return translate_query(query, True, False)
+
+
+def _adapt_query(query: str, use_postgres: bool) -> str:
+    return translate_query(query, False, use_postgres)
+
+
+def query_cache_stats() -> dict[str, Any]:
+    info = _translate_query_cached.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+        "prepare_threshold": PG_PREPARE_THRESHOLD if USE_POSTGRES else None,
+    }
+
+
+def _connect_sqlite(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    raw = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+    # Reduce SQLITE_BUSY / "database is locked" on concurrent local usage
+    # (API + frontend actions, dev reloads, etc.).
+    raw.execute("PRAGMA journal_mode=WAL;")
+    raw.execute("PRAGMA busy_timeout=30000;")
+    raw.execute("PRAGMA synchronous=NORMAL;")
+    raw.row_factory = sqlite3.Row
+    return raw
+
+
+class _SQLitePool:
+    """Pool limitado e thread-safe de conexões SQLite já configuradas (PRAGMAs aplicados)."""
+
+    def __init__(self, path: Path, min_size: int, max_size: int, timeout_s: float, max_idle_s: float):
+        self.path = Path(path)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout_s = timeout_s
+        self.max_idle_s = max_idle_s
+        self._cond = threading.Condition()
+        self._idle: list[tuple[sqlite3.Connection, float]] = []
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "connections_created": 0,
+            "requests_num": 0,
+            "requests_waiting": 0,
+            "requests_timeouts": 0,
+            "connections_discarded": 0,
+            "health_check_failures": 0,
+        }
+        for _ in range(min_size):
+            self._size += 1
+            try:
+                self._idle.append((self._new_conn(), time.monotonic()))
+            except Exception:
+                self._size -= 1
+                raise
+
+    def _new_conn(self) -> sqlite3.Connection:
+        raw = _connect_sqlite(self.path)
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return raw
+
+    @staticmethod
+    def _healthy(raw: sqlite3.Connection) -> bool:
+        try:
+            raw.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, raw: sqlite3.Connection) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def getconn(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + self.timeout_s
+        waited = False
+        with self._cond:
+            self._stats["requests_num"] += 1
+        while True:
+            raw = None
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Pool de conexões SQLite encerrado.")
+                if self._idle:
+                    raw, _ = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["requests_timeouts"] += 1
+                        raise RuntimeError(
+                            f"Pool de conexões SQLite esgotado ({self.max_size} conexões em uso)."
+                        )
+                    if not waited:
+                        self._stats["requests_waiting"] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+                    continue
+
+            if raw is None:
+                try:
+                    return self._new_conn()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            if self._healthy(raw):
+                return raw
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            self.discard(raw)
+
+    def putconn(self, raw: sqlite3.Connection) -> None:
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            self.discard(raw)
+            return
+        now = time.monotonic()
+        expired: list[sqlite3.Connection] = []
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                expired.append(raw)
+            else:
+                self._idle.append((raw, now))
+                # Fecha conexões ociosas há muito tempo, preservando o mínimo configurado.
+                while len(self._idle) > 1 and self._size > self.min_size and now - self._idle[0][1] > self.max_idle_s:
+                    expired.append(self._idle.pop(0)[0])
+                    self._size -= 1
+                    self._stats["connections_discarded"] += 1
+            self._cond.notify()
+        for conn in expired:
+            self._close_quietly(conn)
+
+    def discard(self, raw: sqlite3.Connection) -> None:
+        self._close_quietly(raw)
+        with self._cond:
+            self._size -= 1
+            self._stats["connections_discarded"] += 1
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._size -= len(idle)
+            self._idle = []
+            self._cond.notify_all()
+        for raw in idle:
+            self._close_quietly(raw)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "backend": "sqlite",
+                "pool_min": self.min_size,
+                "pool_max": self.max_size,
+                "pool_size": self._size,
+                "pool_available": len(self._idle),
+                **self._stats,
+            }
+
+
+class _PostgresPool:
+    """Adaptador do psycopg_pool.ConnectionPool com a mesma interface do pool SQLite."""
+
+    def __init__(self, url: str, min_size: int, max_size: int, timeout_s: float, max_idle_s: float):
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        self.url = url
+        self._pool = ConnectionPool(
+            url,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout_s,
+            max_idle=max_idle_s,
+            kwargs={"row_factory": dict_row, "prepare_threshold": PG_PREPARE_THRESHOLD},
+            check=ConnectionPool.check_connection,
+            name="domus-db",
+            open=True,
+        )
+
+    def getconn(self):
+        return self._pool.getconn()
+
+    def putconn(self, raw) -> None:
+        from psycopg.pq import TransactionStatus
+
+        try:
+            if raw.info.transaction_status != TransactionStatus.IDLE:
+                raw.rollback()
+        except Exception:
+            self.discard(raw)
+            return
+        self._pool.putconn(raw)
+
+    def discard(self, raw) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+        # Conexão fechada devolvida ao pool é descartada e reposta por ele.
+        self._pool.putconn(raw)
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": "postgres", **self._pool.get_stats()}
+
+
+_POOL_LOCK = threading.Lock()
+_POOL: _SQLitePool | _PostgresPool | None = None
+
+
+def _get_pool() -> _SQLitePool | _PostgresPool | None:
+    global _POOL
+    if not POOL_ENABLED:
+        return None
+    with _POOL_LOCK:
+        current = _POOL
+        if USE_POSTGRES:
+            if isinstance(current, _PostgresPool) and current.url == DATABASE_URL:
+                return current
+        elif isinstance(current, _SQLitePool) and current.path == Path(SQLITE_PATH):
+            return current
+
+        if current is not None:
+            current.close()
+            _POOL = None
+        if USE_POSTGRES:
+            try:
+                _POOL = _PostgresPool(DATABASE_URL, POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT_S, POOL_MAX_IDLE_S)
+            except ImportError:
+                # psycopg_pool é opcional: sem ele, cada get_conn abre uma conexão nova.
+                return None
+        else:
+            _POOL = _SQLitePool(Path(SQLITE_PATH), POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT_S, POOL_MAX_IDLE_S)
+        return _POOL
+
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+        _POOL = None
+
+
+def pool_stats() -> dict[str, Any]:
+    with _POOL_LOCK:
+        current = _POOL
+    if current is None:
+        return {"backend": "postgres" if USE_POSTGRES else "sqlite", "enabled": POOL_ENABLED, "active": False}
+    return {"enabled": True, "active": True, **current.stats()}
+
+
+def _open_conn() -> DBConn:
     if USE_POSTGRES:
         try:
             import psycopg
@@ -96,18 +441,260 @@ def get_conn() -> DBConn:
                 "PostgreSQL habilitado via DATABASE_URL, mas psycopg não está instalado."
             ) from e
 
-        raw = psycopg.connect(DATABASE_URL, row_factory=dict_row)
+        pool = _get_pool()
+        if pool is not None:
+            return DBConn(pool.getconn(), use_postgres=True, pool=pool)
+        raw = psycopg.connect(DATABASE_URL, row_factory=dict_row, prepare_threshold=PG_PREPARE_THRESHOLD)
         return DBConn(raw, use_postgres=True)
 
-    SQLITE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    raw = sqlite3.connect(SQLITE_PATH, check_same_thread=False, timeout=30.0)
-    # Reduce SQLITE_BUSY / "database is locked" on concurrent local usage
-    # (API + frontend actions, dev reloads, etc.).
-    raw.execute("PRAGMA journal_mode=WAL;")
-    raw.execute("PRAGMA busy_timeout=30000;")
-    raw.execute("PRAGMA synchronous=NORMAL;")
-    raw.row_factory = sqlite3.Row
-    return DBConn(raw, use_postgres=False)
+    pool = _get_pool()
+    if pool is not None:
+        return DBConn(pool.getconn(), use_postgres=False, pool=pool)
+    return DBConn(_connect_sqlite(SQLITE_PATH), use_postgres=False)
+
+
+def detached_conn() -> DBConn:
+    """Conexão própria, fora da unidade de trabalho corrente: o commit vale já, não no fim da request."""
+    return _open_conn()
+
+
+class _ScopedConn(DBConn):
+    """Visão de uma conexão compartilhada pela unidade de trabalho corrente.
+
+    Cada handle trabalha num SAVEPOINT próprio, aberto no primeiro comando: commit() incorpora
+    o que ele fez à transação da unidade de trabalho (efetivada uma única vez, no final) e
+    rollback()/close() sem commit desfazem só o trabalho deste handle, como numa conexão
+    própria. Um helper que captura o erro e faz rollback não descarta as escritas anteriores
+    da request, e no PostgreSQL a transação compartilhada não fica abortada.
+    """
+
+    def __init__(self, uow: "UnitOfWork", shared: DBConn):
+        super().__init__(shared._conn, shared._use_postgres)
+        self._uow = uow
+        self._savepoint: str | None = None
+
+    def _begin(self) -> None:
+        self._savepoint = self._uow._open_savepoint(self._savepoint)
+
+    def execute(self, query: str, params: tuple | list | None = None, workspace_scope: bool = False):
+        self._begin()
+        return super().execute(query, params, workspace_scope=workspace_scope)
+
+    def cursor(self):
+        self._begin()
+        return super().cursor()
+
+    def commit(self):
+        savepoint, self._savepoint = self._savepoint, None
+        self._uow._close_savepoint(savepoint, rollback=False)
+
+    def rollback(self):
+        savepoint, self._savepoint = self._savepoint, None
+        self._uow._close_savepoint(savepoint, rollback=True)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Fechar sem commit descarta o que o handle fez, como numa conexão própria.
+        try:
+            self.rollback()
+        except Exception:
+            # Já marcado em _failed: finish() descarta a unidade de trabalho inteira.
+            pass
+
+
+class UnitOfWork:
+    """Conexão única, aberta sob demanda, reutilizada por todo get_conn() do escopo (ex.: uma request)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn: DBConn | None = None
+        self._finished = False
+        self._failed = False
+        self._savepoints: list[str] = []
+        self._savepoint_seq = 0
+        # (função, args) -> None: ordem de registro, sem repetir a mesma chamada.
+        self._after_finish: dict[tuple, None] = {}
+        self.handles = 0
+
+    def acquire(self) -> DBConn | None:
+        with self._lock:
+            if self._finished:
+                return None
+            if self._conn is None:
+                self._conn = _open_conn()
+            self.handles += 1
+            return _ScopedConn(self, self._conn)
+
+    def _open_savepoint(self, current: str | None) -> str | None:
+        with self._lock:
+            if self._conn is None:
+                return None
+            if current is not None and current in self._savepoints:
+                return current
+            raw = self._conn._conn
+            if not self._conn._use_postgres and not raw.in_transaction:
+                # BEGIN explícito: no SQLite o RELEASE do savepoint mais externo faria commit.
+                raw.execute("BEGIN")
+            self._savepoint_seq += 1
+            name = f"uow_sp_{self._savepoint_seq}"
+            raw.execute(f"SAVEPOINT {name}")
+            self._savepoints.append(name)
+            return name
+
+    def _close_savepoint(self, name: str | None, rollback: bool) -> None:
+        with self._lock:
+            if self._conn is None or name is None or name not in self._savepoints:
+                return
+            raw = self._conn._conn
+            try:
+                if rollback:
+                    raw.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                raw.execute(f"RELEASE SAVEPOINT {name}")
+            except Exception:
+                # Estado da transação incerto: nada desta unidade de trabalho pode ser efetivado.
+                self._failed = True
+                raise
+            finally:
+                # Savepoints abertos depois deste deixam de existir junto com ele.
+                del self._savepoints[self._savepoints.index(name):]
+
+    def after_finish(self, callback, *args) -> None:
+        """Registra `callback(*args)` para rodar depois do commit/rollback final."""
+        with self._lock:
+            self._after_finish[(callback, args)] = None
+
+    def _run_after_finish(self) -> None:
+        with self._lock:
+            callbacks, self._after_finish = list(self._after_finish), {}
+        for callback, args in callbacks:
+            callback(*args)
+
+    def finish(self, commit: bool = True) -> None:
+        with self._lock:
+            self._finished = True
+            conn, self._conn = self._conn, None
+            failed = self._failed
+            self._savepoints.clear()
+        try:
+            if conn is None:
+                return
+            try:
+                if commit and not failed:
+                    conn.commit()
+                else:
+                    conn.rollback()
+            finally:
+                conn.close()
+            if commit and failed:
+                raise RuntimeError("Falha ao desfazer parte da unidade de trabalho; alterações descartadas.")
+        finally:
+            self._run_after_finish()
+
+
+@contextmanager
+def unit_of_work():
+    current = get_current_unit_of_work()
+    if current is not None:
+        # Escopos aninhados participam da unidade de trabalho externa.
+        yield current
+        return
+    uow = UnitOfWork()
+    set_current_unit_of_work(uow)
+    try:
+        yield uow
+    except BaseException:
+        uow.finish(commit=False)
+        raise
+    else:
+        uow.finish(commit=True)
+    finally:
+        clear_current_unit_of_work()
+
+
+def get_conn() -> DBConn:
+    uow = get_current_unit_of_work()
+    if uow is not None:
+        scoped = uow.acquire()
+        if scoped is not None:
+            return scoped
+    return _open_conn()
+
+
+def stream_rows(
+    query: str,
+    params: tuple | list | None = None,
+    workspace_scope: bool = False,
+    chunk_size: int | None = None,
+):
+    """Itera as linhas de uma consulta em blocos de `chunk_size` (memória constante).
+
+    Usa uma conexão própria, fora da unidade de trabalho da request: o corpo de um
+    StreamingResponse continua sendo lido depois que o middleware já fez o commit.
+    No PostgreSQL o cursor é nomeado (server-side); no SQLite o próprio sqlite3 avança
+    o cursor sob demanda.
+    """
+    size = max(1, int(chunk_size or STREAM_FETCH_SIZE))
+    conn = _open_conn()
+    try:
+        q = translate_query(query, workspace_scope, conn._use_postgres)
+        if conn._use_postgres:
+            cur = conn._conn.cursor(name=f"stream_{threading.get_ident()}_{time.monotonic_ns()}")
+            cur.itersize = size
+        else:
+            cur = conn._conn.cursor()
+        try:
+            cur.execute(q, tuple(params or ()))
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cur.close()
+    finally:
+        # Somente leitura: descarta a transação antes de devolver a conexão ao pool.
+        try:
+            conn.rollback()
+        finally:
+            conn.close()
+
+
+def resolve_user_workspace_id(user_id: int) -> int | None:
+    """Workspace padrão do usuário (ativo e OWNER primeiro), com cache TTL em tenant.py."""
+    uid = int(user_id)
+    found, workspace_id = get_cached_workspace_resolution(uid)
+    if found:
+        return workspace_id
+
+    conn = get_conn()
+    try:
+        row = conn.execute(
+            """
+            SELECT wu.workspace_id
+            FROM workspace_users wu
+            JOIN workspaces w ON w.id = wu.workspace_id
+            WHERE wu.user_id = ?
+            ORDER BY
+                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
+                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
+                wu.workspace_id
+            LIMIT 1
+            """,
+            (uid,),
+        ).fetchone()
+    except Exception:
+        # Falha de consulta não é cacheada: cai no escopo por user_id só nesta chamada.
+        return None
+    finally:
+        conn.close()
+
+    workspace_id = int(_row_value(row, "workspace_id", 0) or 0) if row else 0
+    resolved = workspace_id if workspace_id > 0 else None
+    cache_workspace_resolution(uid, resolved)
+    return resolved
 
 
 def _sqlite_schema(cur):
@@ -297,6 +884,18 @@ def _sqlite_schema(cur):
     );
     """)
     cur.execute("""
+    CREATE TABLE IF NOT EXISTS market_index_rates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        index_name TEXT NOT NULL,
+        ref_date TEXT NOT NULL,
+        value REAL NOT NULL,
+        source TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+        UNIQUE(index_name, ref_date)
+    );
+    """)
+    cur.execute("""
     CREATE TABLE IF NOT EXISTS benchmark_settings (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         index_name TEXT NOT NULL,
@@ -418,7 +1017,6 @@ def _sqlite_schema(cur):
 
     cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_date ON trades(date);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_prices_date ON prices(date);")
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_index_rates_name_date ON index_rates(index_name, ref_date);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_index_rates_ref_date ON index_rates(ref_date);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_workspace ON lists(workspace_id);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_workspace_status ON lists(workspace_id, status);")
@@ -440,6 +1038,64 @@ def _sqlite_schema(cur):
     );
     """)
 
+    # Importações CSV em segundo plano (api/import_jobs.py). Escopo explícito por workspace_id;
+    # o progresso ao vivo fica em memória no processo que executa o job.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS import_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workspace_id INTEGER NOT NULL,
+        created_by INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        file_name TEXT,
+        file_path TEXT NOT NULL,
+        file_bytes BIGINT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        worker TEXT,
+        rows_processed INTEGER NOT NULL DEFAULT 0,
+        rows_inserted INTEGER NOT NULL DEFAULT 0,
+        rows_rejected INTEGER NOT NULL DEFAULT 0,
+        rows_skipped INTEGER NOT NULL DEFAULT 0,
+        bytes_read BIGINT,
+        elapsed_s REAL,
+        result TEXT,
+        error TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        started_at TEXT,
+        finished_at TEXT
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_workspace ON import_jobs(workspace_id, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs(status);")
+
+    # Agregado mensal do ledger para os dashboards (mantido por repo.py).
+    # basis: 'caixa' | 'competencia'; source: 'transaction' | 'credit_charge'.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_rollup (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        basis TEXT NOT NULL,
+        source TEXT NOT NULL,
+        month TEXT NOT NULL,
+        account_id INTEGER NOT NULL,
+        category_id INTEGER,
+        receitas REAL NOT NULL DEFAULT 0,
+        despesas REAL NOT NULL DEFAULT 0,
+        user_id INTEGER,
+        workspace_id INTEGER
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_rollup_state (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        workspace_id INTEGER,
+        built_at TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_rollup_user_basis_month ON monthly_rollup(user_id, basis, month);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_rollup_workspace_basis_month ON monthly_rollup(workspace_id, basis, month);")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_monthly_rollup_state_user ON monthly_rollup_state(user_id);")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_monthly_rollup_state_workspace ON monthly_rollup_state(workspace_id);")
+
 
 def _postgres_schema(cur):
     cur.execute("""
@@ -628,6 +1284,18 @@ def _postgres_schema(cur):
     );
     """)
     cur.execute("""
+    CREATE TABLE IF NOT EXISTS market_index_rates (
+        id BIGSERIAL PRIMARY KEY,
+        index_name TEXT NOT NULL,
+        ref_date TEXT NOT NULL,
+        value DOUBLE PRECISION NOT NULL,
+        source TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        UNIQUE(index_name, ref_date)
+    );
+    """)
+    cur.execute("""
     CREATE TABLE IF NOT EXISTS benchmark_settings (
         id BIGSERIAL PRIMARY KEY,
         index_name TEXT NOT NULL,
@@ -760,7 +1428,6 @@ def _postgres_schema(cur):
 
     cur.execute("CREATE INDEX IF NOT EXISTS idx_trades_date ON trades(date);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_prices_date ON prices(date);")
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_index_rates_name_date ON index_rates(index_name, ref_date);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_index_rates_ref_date ON index_rates(ref_date);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_workspace ON lists(workspace_id);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_workspace_status ON lists(workspace_id, status);")
@@ -782,6 +1449,64 @@ def _postgres_schema(cur):
     );
     """)
 
+    # Importações CSV em segundo plano (api/import_jobs.py). Escopo explícito por workspace_id;
+    # o progresso ao vivo fica em memória no processo que executa o job.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS import_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        workspace_id BIGINT NOT NULL,
+        created_by BIGINT NOT NULL,
+        kind TEXT NOT NULL,
+        file_name TEXT,
+        file_path TEXT NOT NULL,
+        file_bytes BIGINT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        worker TEXT,
+        rows_processed INTEGER NOT NULL DEFAULT 0,
+        rows_inserted INTEGER NOT NULL DEFAULT 0,
+        rows_rejected INTEGER NOT NULL DEFAULT 0,
+        rows_skipped INTEGER NOT NULL DEFAULT 0,
+        bytes_read BIGINT,
+        elapsed_s REAL,
+        result TEXT,
+        error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        started_at TEXT,
+        finished_at TEXT
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_workspace ON import_jobs(workspace_id, id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs(status);")
+
+    # Agregado mensal do ledger para os dashboards (mantido por repo.py).
+    # basis: 'caixa' | 'competencia'; source: 'transaction' | 'credit_charge'.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_rollup (
+        id BIGSERIAL PRIMARY KEY,
+        basis TEXT NOT NULL,
+        source TEXT NOT NULL,
+        month TEXT NOT NULL,
+        account_id BIGINT NOT NULL,
+        category_id BIGINT,
+        receitas DOUBLE PRECISION NOT NULL DEFAULT 0,
+        despesas DOUBLE PRECISION NOT NULL DEFAULT 0,
+        user_id BIGINT,
+        workspace_id BIGINT
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS monthly_rollup_state (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        workspace_id BIGINT,
+        built_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_rollup_user_basis_month ON monthly_rollup(user_id, basis, month);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_monthly_rollup_workspace_basis_month ON monthly_rollup(workspace_id, basis, month);")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_monthly_rollup_state_user ON monthly_rollup_state(user_id);")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_monthly_rollup_state_workspace ON monthly_rollup_state(workspace_id);")
+
 
 def _row_value(row: Any, key: str, default: Any = None) -> Any:
     if row is None:
@@ -938,6 +1663,46 @@ def _backfill_multiworkspace_phase1(cur) -> None:
         )
 
 
+# Toda query de domínio filtra primeiro pelo tenant (user_id reescrito para workspace_id)
+# e depois por data; índices só em date/workspace_id isolados não atendem os dois.
+_TENANT_DATE_INDEXES: tuple[tuple[str, str, str], ...] = (
+    ("idx_transactions_workspace_date", "transactions", "workspace_id, date"),
+    ("idx_trades_workspace_date", "trades", "workspace_id, date"),
+    ("idx_income_events_workspace_date", "income_events", "workspace_id, date"),
+    ("idx_prices_workspace_date", "prices", "workspace_id, date"),
+    ("idx_asset_prices_workspace_date", "asset_prices", "workspace_id, px_date"),
+    ("idx_index_rates_workspace_date", "index_rates", "workspace_id, ref_date"),
+    # Paginação keyset de /transactions nas visões competência (compra) e futuro (vencimento).
+    ("idx_credit_card_charges_workspace_purchase", "credit_card_charges", "workspace_id, purchase_date"),
+    ("idx_credit_card_charges_workspace_due", "credit_card_charges", "workspace_id, due_date"),
+)
+
+
+def _create_tenant_date_indexes(cur) -> None:
+    for name, table, columns in _TENANT_DATE_INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+
+# Séries de BCB/Yahoo são iguais para todos os workspaces: ficam uma única vez em
+# market_index_rates; index_rates guarda só os overrides MANUAL de cada workspace.
+_MANUAL_INDEX_RATE_SOURCE = "UPPER(COALESCE(source, '')) LIKE 'MANUAL%'"
+
+
+def _migrate_market_index_rates(cur) -> None:
+    # O único global (index_name, ref_date) impedia overrides do mesmo dia em workspaces diferentes.
+    cur.execute("DROP INDEX IF EXISTS ux_index_rates_name_date")
+    cur.execute(
+        f"""
+        INSERT OR IGNORE INTO market_index_rates(index_name, ref_date, value, source, created_at, updated_at)
+        SELECT index_name, ref_date, value, source, created_at, updated_at
+        FROM index_rates
+        WHERE NOT ({_MANUAL_INDEX_RATE_SOURCE})
+        ORDER BY updated_at DESC, id DESC
+        """
+    )
+    cur.execute(f"DELETE FROM index_rates WHERE NOT ({_MANUAL_INDEX_RATE_SOURCE})")
+
+
 def _migrate_multitenant_postgres(cur):
     cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS role TEXT NOT NULL DEFAULT 'user'")
     cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE")
@@ -1121,7 +1886,6 @@ def _migrate_multitenant_postgres(cur):
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_assets_user_symbol ON assets(user_id, symbol)")
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_prices_user_asset_date ON prices(user_id, asset_id, date)")
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_asset_prices_user_asset_date ON asset_prices(user_id, asset_id, px_date)")
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_index_rates_name_date ON index_rates(index_name, ref_date)")
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_sync_runs_scope_type_key_date ON sync_runs(scope_kind, scope_id, sync_type, sync_key, ref_date)")
 
     cur.execute("CREATE INDEX IF NOT EXISTS idx_accounts_user ON accounts(user_id)")
@@ -1167,6 +1931,7 @@ def _migrate_multitenant_postgres(cur):
     cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_workspace_type ON lists(workspace_id, type)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_list_items_workspace ON list_items(workspace_id)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_list_items_workspace_list ON list_items(workspace_id, list_id)")
+    _create_tenant_date_indexes(cur)
 
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_accounts_workspace_name ON accounts(workspace_id, name)")
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_categories_workspace_name ON categories(workspace_id, name)")
@@ -1185,6 +1950,7 @@ def _migrate_multitenant_postgres(cur):
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_cc_inv_user_period ON credit_card_invoices(user_id, card_id, invoice_period)")
     _backfill_fixed_income_assets_phase1(cur)
     _backfill_multiworkspace_phase1(cur)
+    _migrate_market_index_rates(cur)
 
 
 def _add_column_sqlite(cur, table: str, column_def: str):
@@ -1383,7 +2149,6 @@ def _migrate_multitenant_sqlite(cur):
     cur.execute("CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_user ON password_reset_tokens(user_id)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_expires_at ON password_reset_tokens(expires_at)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_used_at ON password_reset_tokens(used_at)")
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_index_rates_name_date ON index_rates(index_name, ref_date)")
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_sync_runs_scope_type_key_date ON sync_runs(scope_kind, scope_id, sync_type, sync_key, ref_date)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_index_rates_ref_date ON index_rates(ref_date)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_sync_runs_ref_date ON sync_runs(ref_date)")
@@ -1440,6 +2205,7 @@ def _migrate_multitenant_sqlite(cur):
     cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_workspace_type ON lists(workspace_id, type)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_list_items_workspace ON list_items(workspace_id)")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_list_items_workspace_list ON list_items(workspace_id, list_id)")
+    _create_tenant_date_indexes(cur)
 
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_accounts_workspace_name ON accounts(workspace_id, name)")
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_categories_workspace_name ON categories(workspace_id, name)")
@@ -1451,6 +2217,7 @@ def _migrate_multitenant_sqlite(cur):
 
     _backfill_fixed_income_assets_phase1(cur)
     _backfill_multiworkspace_phase1(cur)
+    _migrate_market_index_rates(cur)
 
 
 def _fixed_income_asset_class_condition(column_ref: str = "asset_class") -> str:
@@ -1646,3 +2413,5 @@ def init_db() -> None:
         else:
             _sqlite_schema(cur)
             _migrate_multitenant_sqlite(cur)
+    # O backfill pode ter criado workspaces/membros.
+    invalidate_workspace_resolution()
@@ -4,6 +4,7 @@ from datetime import datetime
 import re
 
 from db import get_conn
+from repo import invalidate_monthly_rollup
 
 
 def _add_months(year: int, month: int, delta: int) -> tuple[int, int]:
@@ -213,6 +214,8 @@ def fix_future_credit_due_dates(apply_changes: bool = False) -> dict:
             )
         for card_id, owner_user, owner_workspace, invoice_period, due_day in sorted(invoice_keys):
             _rebuild_invoice(conn, owner_user, owner_workspace, card_id, invoice_period, due_day)
+        # purchase_date mudou: a competência do monthly_rollup precisa ser refeita.
+        invalidate_monthly_rollup(conn)
         conn.commit()
 
     conn.close()
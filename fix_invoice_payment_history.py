@@ -4,7 +4,7 @@ from collections import defaultdict
 from datetime import datetime
 
 from db import get_conn
-from repo import ensure_category
+from repo import ensure_category, invalidate_monthly_rollup
 
 
 DESC_RE = re.compile(r"^PGTO FATURA (.+) \((\d{4}-\d{2})\)$")
@@ -177,6 +177,8 @@ def run(apply: bool = False) -> dict:
             stats["applied"] += 1
 
         if apply:
+            # Reescreve o ledger de vários escopos direto no banco: o rollup é refeito na próxima leitura.
+            invalidate_monthly_rollup(conn)
             conn.commit()
         else:
             conn.rollback()
@@ -55,10 +55,7 @@ import {
   getCards,
   getCategories,
   getDashboardAccountBalance,
-  getDashboardCommitmentsSummary,
-  getDashboardExpenses,
-  getDashboardKpis,
-  getDashboardWealthMonthly,
+  getDashboardBundle,
   getInvestAssets,
   getInvestBenchmarkSettings,
   getInvestIncomes,
@@ -75,6 +72,7 @@ import {
   getList,
   getLists,
   getMe,
+  getSyncStatus,
   updateMeProfile,
   getWorkspaces,
   renameCurrentWorkspace,
@@ -962,6 +960,7 @@ export default function App() {
   const [showResetNewPassword, setShowResetNewPassword] = useState(false);
   const [showResetConfirmPassword, setShowResetConfirmPassword] = useState(false);
   const [loginSyncNotice, setLoginSyncNotice] = useState(null);
+  const [loginSyncDoneSeq, setLoginSyncDoneSeq] = useState(0);
   const [user, setUser] = useState(null);
   const [page, setPage] = useState("Dashboard");
   const [accounts, setAccounts] = useState([]);
@@ -1971,6 +1970,11 @@ export default function App() {
     };
   }, [canAddInvestimentos, page, user]);
 
+  useEffect(() => {
+    if (!user || !loginSyncDoneSeq || page !== "Investimentos") return;
+    reloadInvestData().catch((err) => setInvestMsg(String(err.message || err)));
+  }, [loginSyncDoneSeq]);
+
   useEffect(() => {
     if (!user || page !== "Listas") return;
     let cancelled = false;
@@ -3064,17 +3068,39 @@ export default function App() {
       const data = await login(email, password);
       setToken(data.token);
       setUser(data.user);
-      if (data?.login_sync_status?.should_notify && data?.login_sync_status?.message) {
-        setLoginSyncNotice({
-          level: String(data.login_sync_status.level || "success"),
-          message: String(data.login_sync_status.message || ""),
-        });
+      if (["queued", "running"].includes(String(data?.login_sync_state || ""))) {
+        pollLoginSync();
       }
     } catch (err) {
       setAuthError(String(err.message || err));
     }
   }
 
+  async function pollLoginSync() {
+    // O sync de índices/renda fixa roda em background após o login; consulta até concluir.
+    for (let attempt = 0; attempt < 60; attempt += 1) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      let out;
+      try {
+        out = await getSyncStatus();
+      } catch {
+        return;
+      }
+      if (["queued", "running"].includes(String(out?.state || ""))) continue;
+      const status = out?.login_sync_status;
+      if (status?.should_notify && status?.message) {
+        setLoginSyncNotice({
+          level: String(status.level || "success"),
+          message: String(status.message || ""),
+        });
+      }
+      if (Number(status?.fixed_income_updated || 0) > 0) {
+        setLoginSyncDoneSeq((seq) => seq + 1);
+      }
+      return;
+    }
+  }
+
   async function onForgotPassword(e) {
     e.preventDefault();
     setAuthError("");
@@ -3484,19 +3510,16 @@ export default function App() {
     };
     const wealthFilters = buildDashboardWealthFilters(filters);
     try {
-      const [k, wm, e, ab, cs] = await Promise.all([
-        getDashboardKpis(filters),
-        getDashboardWealthMonthly(wealthFilters),
-        getDashboardExpenses(filters),
+      const [bundle, ab] = await Promise.all([
+        getDashboardBundle({ ...filters, wealth_date_from: wealthFilters.date_from }),
         // Saldo de contas sempre no acumulado real (sem filtros de período/conta/visão).
         getDashboardAccountBalance({ view: "caixa" }),
-        getDashboardCommitmentsSummary(filters),
       ]);
-      setDashKpis(k);
-      setDashWealthMonthly(wm || []);
-      setDashExpenses(e || []);
+      setDashKpis(bundle?.kpis);
+      setDashWealthMonthly(bundle?.wealth_monthly || []);
+      setDashExpenses(bundle?.expenses_by_category || []);
       setDashAccountBalance(ab || []);
-      setDashCommitments(cs || { a_vencer: 0, vencidos: 0 });
+      setDashCommitments(bundle?.commitments_summary || { a_vencer: 0, vencidos: 0 });
       setDashMsg("");
     } catch (err) {
       setDashMsg(String(err.message || err));
@@ -72,6 +72,10 @@ export function getMe() {
   return req("/me");
 }
 
+export function getSyncStatus() {
+  return req("/sync/status");
+}
+
 export function updateMeProfile(payload) {
   return req("/me", {
     method: "PUT",
@@ -341,6 +345,10 @@ export function getDashboardCommitmentsSummary(params = {}) {
   return req(`/dashboard/commitments-summary${qs(params)}`);
 }
 
+export function getDashboardBundle(params = {}) {
+  return req(`/dashboard/bundle${qs(params)}`);
+}
+
 export function getTransactions(params = {}) {
   return req(`/transactions${qs({ limit: 200, ...params })}`);
 }
@@ -585,11 +593,37 @@ export function getInvestRentabilityDivergenceReport(payload = {}, timeoutMs = 0
   });
 }
 
-async function uploadCsv(path, file, previewOnly = false) {
+const IMPORT_JOB_POLL_MS = 1000;
+// Depois disso o polling para; o job segue no servidor e pode ser consultado em /import/jobs.
+const IMPORT_JOB_MAX_WAIT_MS = 30 * 60 * 1000;
+
+export function getImportJob(jobId) {
+  return req(`/import/jobs/${jobId}`);
+}
+
+export function listImportJobs(limit = 20) {
+  return req(`/import/jobs?limit=${limit}`);
+}
+
+// Importação em segundo plano: acompanha o job até terminar e devolve o mesmo resumo da importação síncrona.
+async function waitImportJob(jobId, onProgress) {
+  const deadline = Date.now() + IMPORT_JOB_MAX_WAIT_MS;
+  while (Date.now() < deadline) {
+    const job = await getImportJob(jobId);
+    if (onProgress) onProgress(job);
+    if (job.status === "done") return job.result;
+    if (job.status === "failed") throw new Error(job.error || "Falha na importação.");
+    await new Promise((resolve) => setTimeout(resolve, IMPORT_JOB_POLL_MS));
+  }
+  throw new Error(`A importação #${jobId} ainda não terminou; acompanhe o status mais tarde.`);
+}
+
+async function uploadCsv(path, file, previewOnly = false, onProgress = null) {
   const token = getToken();
   const fd = new FormData();
   fd.append("file", file);
   fd.append("preview_only", previewOnly ? "true" : "false");
+  fd.append("background", previewOnly ? "false" : "true");
   const res = await fetch(`${API_BASE}${path}`, {
     method: "POST",
     headers: token ? { Authorization: `Bearer ${token}` } : {},
@@ -599,17 +633,19 @@ async function uploadCsv(path, file, previewOnly = false) {
     const data = await res.json().catch(() => ({}));
     throw new Error(data.detail || `HTTP ${res.status}`);
   }
-  return res.json();
+  const data = await res.json();
+  if (res.status === 202 && data.job_id) return waitImportJob(data.job_id, onProgress);
+  return data;
 }
 
-export function importTransactionsCsv(file, previewOnly = false) {
-  return uploadCsv("/import/transactions-csv", file, previewOnly);
+export function importTransactionsCsv(file, previewOnly = false, onProgress = null) {
+  return uploadCsv("/import/transactions-csv", file, previewOnly, onProgress);
 }
 
-export function importAssetsCsv(file, previewOnly = false) {
-  return uploadCsv("/import/assets-csv", file, previewOnly);
+export function importAssetsCsv(file, previewOnly = false, onProgress = null) {
+  return uploadCsv("/import/assets-csv", file, previewOnly, onProgress);
 }
 
-export function importTradesCsv(file, previewOnly = false) {
-  return uploadCsv("/import/trades-csv", file, previewOnly);
+export function importTradesCsv(file, previewOnly = false, onProgress = null) {
+  return uploadCsv("/import/trades-csv", file, previewOnly, onProgress);
 }
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import argparse
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from audit_multiworkspace_explain import _format_plan_rows, _query_plan_sql
+from db import USE_POSTGRES, get_conn, init_db, scope_sql
+
+
+REPORT_PATH = Path("INDEX_ADVISOR_REPORT.md")
+
+_PG_SEQ_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+_SQLITE_SCAN_RE = re.compile(r"^SCAN (\w+)")
+_SQLITE_SUBQUERY_RE = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\w+)")
+
+
+def _hot_queries() -> list[dict[str, Any]]:
+    # Mesmas queries dos módulos (escritas com user_id); o advisor aplica o escopo workspace.
+    return [
+        {
+            "name": "transactions_by_period",
+            "sql": (
+                "SELECT t.id, t.date, t.description, t.amount_brl, a.name AS account, c.name AS category "
+                "FROM transactions t "
+                "JOIN accounts a ON a.id = t.account_id AND a.user_id = t.user_id "
+                "LEFT JOIN categories c ON c.id = t.category_id AND c.user_id = t.user_id "
+                "WHERE t.user_id = ? AND t.date >= ? AND t.date <= ? "
+                "ORDER BY t.date DESC, t.id DESC"
+            ),
+            "params": (1, "2026-01-01", "2026-01-31"),
+        },
+        {
+            "name": "trades_by_period",
+            "sql": (
+                "SELECT t.id, t.asset_id, t.date, t.side, t.quantity, t.price, a.symbol, a.asset_class "
+                "FROM trades t "
+                "JOIN assets a ON a.id = t.asset_id AND a.user_id = t.user_id "
+                "WHERE t.user_id = ? AND t.date >= ? AND t.date <= ? "
+                "ORDER BY t.date ASC, t.id ASC"
+            ),
+            "params": (1, "2026-01-01", "2026-12-31"),
+        },
+        {
+            "name": "income_by_period",
+            "sql": (
+                "SELECT i.id, i.asset_id, i.date, i.type, i.amount, a.symbol "
+                "FROM income_events i "
+                "JOIN assets a ON a.id = i.asset_id AND a.user_id = i.user_id "
+                "WHERE i.user_id = ? AND i.date >= ? AND i.date <= ? "
+                "ORDER BY i.date ASC"
+            ),
+            "params": (1, "2026-01-01", "2026-12-31"),
+        },
+        {
+            "name": "latest_prices",
+            "sql": (
+                "SELECT p.asset_id, p.date AS price_date, p.price "
+                "FROM prices p "
+                "JOIN (SELECT asset_id, MAX(date) AS max_date FROM prices WHERE user_id = ? GROUP BY asset_id) m "
+                "ON m.asset_id = p.asset_id AND m.max_date = p.date "
+                "WHERE p.user_id = ?"
+            ),
+            "params": (1, 1),
+        },
+        {
+            "name": "prices_history",
+            "sql": (
+                "SELECT asset_id, date, price FROM prices "
+                "WHERE user_id = ? AND date <= ? ORDER BY date ASC, asset_id ASC"
+            ),
+            "params": (1, "2026-12-31"),
+        },
+        {
+            "name": "latest_asset_snapshots",
+            "sql": (
+                "SELECT p.asset_id, p.px_date, p.price "
+                "FROM asset_prices p "
+                "JOIN (SELECT asset_id, MAX(px_date) AS max_date FROM asset_prices WHERE user_id = ? GROUP BY asset_id) m "
+                "ON m.asset_id = p.asset_id AND m.max_date = p.px_date "
+                "WHERE p.user_id = ?"
+            ),
+            "params": (1, 1),
+        },
+        {
+            "name": "asset_snapshots_history",
+            "sql": (
+                "SELECT asset_id, px_date, price FROM asset_prices "
+                "WHERE user_id = ? AND px_date <= ? ORDER BY px_date ASC, asset_id ASC"
+            ),
+            "params": (1, "2026-12-31"),
+        },
+        {
+            "name": "index_rates_recent",
+            "sql": (
+                "SELECT index_name, ref_date, value FROM index_rates "
+                "WHERE user_id = ? AND ref_date >= ? ORDER BY ref_date DESC"
+            ),
+            "params": (1, "2026-01-01"),
+        },
+        {
+            "name": "market_index_rates_by_name",
+            "sql": (
+                "SELECT ref_date, value FROM market_index_rates "
+                "WHERE index_name = ? AND ref_date >= ? AND ref_date <= ? ORDER BY ref_date"
+            ),
+            "params": ("CDI", "2026-01-01", "2026-12-31"),
+            "scoped": False,
+        },
+    ]
+
+
+def _plan_texts(plan_lines: list[str]) -> list[str]:
+    return [(line[2:] if line.startswith("- ") else line).strip() for line in plan_lines]
+
+
+def _seq_scans(plan_lines: list[str]) -> list[str]:
+    texts = _plan_texts(plan_lines)
+    if USE_POSTGRES:
+        return [table for text in texts for table in _PG_SEQ_SCAN_RE.findall(text)]
+
+    subqueries = {m.group(1) for m in (_SQLITE_SUBQUERY_RE.match(t) for t in texts) if m}
+    tables: list[str] = []
+    for text in texts:
+        # "SCAN t USING INDEX ..." percorre índice; só "SCAN t" puro é varredura da tabela.
+        m = _SQLITE_SCAN_RE.match(text)
+        if m and "USING" not in text and m.group(1) not in subqueries:
+            tables.append(m.group(1))
+    return tables
+
+
+def _full_sorts(plan_lines: list[str]) -> int:
+    # Ordenação completa fora do índice: o filtro usa o tenant mas não a data.
+    texts = _plan_texts(plan_lines)
+    if USE_POSTGRES:
+        return sum(1 for t in texts if t.lstrip("-> ").startswith("Sort "))
+    return sum(1 for t in texts if t.startswith("USE TEMP B-TREE FOR ORDER BY"))
+
+
+def analyze() -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with get_conn() as conn:
+        if USE_POSTGRES:
+            # Sem estatísticas o planner prefere Seq Scan em tabelas pequenas; desligado,
+            # um Seq Scan no plano significa que nenhum índice atende a query.
+            conn.execute("SET LOCAL enable_seqscan = off")
+        for item in _hot_queries():
+            sql = scope_sql(item["sql"]) if item.get("scoped", True) else item["sql"]
+            entry: dict[str, Any] = {
+                "name": item["name"],
+                "sql": sql,
+                "plan": [],
+                "seq_scans": [],
+                "full_sorts": 0,
+                "error": None,
+            }
+            try:
+                rows = conn.execute(_query_plan_sql(sql), tuple(item.get("params") or ())).fetchall() or []
+                entry["plan"] = _format_plan_rows(rows)
+                entry["seq_scans"] = _seq_scans(entry["plan"])
+                entry["full_sorts"] = _full_sorts(entry["plan"])
+            except Exception as e:
+                entry["error"] = str(e)
+            results.append(entry)
+        conn.rollback()
+    return results
+
+
+def _report_lines(results: list[dict[str, Any]]) -> list[str]:
+    ts = datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    lines = [
+        "# Index advisor - queries quentes",
+        "",
+        f"- Gerado em: `{ts}`",
+        f"- Banco alvo: `{'postgres' if USE_POSTGRES else 'sqlite'}`",
+        "",
+    ]
+    for entry in results:
+        if entry["error"]:
+            status = "ERRO"
+        elif entry["seq_scans"]:
+            status = "SEQ SCAN: " + ", ".join(entry["seq_scans"])
+        elif entry["full_sorts"]:
+            status = "sort fora do índice"
+        else:
+            status = "ok"
+        lines.append(f"## {entry['name']} ({status})")
+        lines.append("")
+        lines.append("```sql")
+        lines.append(entry["sql"])
+        lines.append("```")
+        if entry["error"]:
+            lines.append(f"Erro ao analisar: `{entry['error']}`")
+        else:
+            lines.append("Plano:")
+            lines.extend(entry["plan"] or ["- (sem linhas retornadas)"])
+        lines.append("")
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Roda EXPLAIN nas queries quentes e aponta varreduras sequenciais.")
+    parser.add_argument("--report", type=Path, default=None, help=f"grava o relatório em Markdown (ex.: {REPORT_PATH})")
+    parser.add_argument("--strict", action="store_true", help="sai com código 1 se houver seq scan ou erro")
+    args = parser.parse_args(argv)
+
+    init_db()
+    results = analyze()
+    flagged = 0
+    for entry in results:
+        if entry["error"]:
+            flagged += 1
+            print(f"[erro] {entry['name']}: {entry['error']}")
+        elif entry["seq_scans"]:
+            flagged += 1
+            print(f"[seq scan] {entry['name']}: {', '.join(entry['seq_scans'])}")
+        elif entry["full_sorts"]:
+            print(f"[aviso] {entry['name']}: ordenação fora do índice")
+        else:
+            print(f"[ok] {entry['name']}")
+
+    if args.report:
+        args.report.write_text("\n".join(_report_lines(results)).strip() + "\n", encoding="utf-8")
+        print(f"[ok] Relatório salvo em {args.report}")
+
+    return 1 if (args.strict and flagged) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
 import os
-import re
 from datetime import date as _date
-from datetime import datetime
+from datetime import datetime, timedelta
 from contextvars import ContextVar
 from typing import Any
 
@@ -57,6 +56,34 @@ BENCHMARK_DEFAULTS: dict[str, dict[str, Any]] = {
     },
 }
 _USE_WORKSPACE_SCOPE: ContextVar[bool] = ContextVar("invest_index_rates_use_workspace_scope", default=False)
+MARKET_SYNC_SCOPE = ("global", 0)
+_RATES_GENERATION = 0
+
+
+def rates_generation() -> int:
+    """Muda a cada gravação de taxas; caches derivados (ex.: fatores da rentabilidade) comparam com ele."""
+    return _RATES_GENERATION
+
+
+def _bump_rates_generation() -> None:
+    global _RATES_GENERATION
+    _RATES_GENERATION += 1
+
+# Série global (market_index_rates) com os overrides MANUAL do workspace por cima:
+# no mesmo dia, o valor do workspace vence. Parâmetros: (escopo, escopo).
+MERGED_INDEX_RATES_SQL = """
+    SELECT o.id, o.index_name, o.ref_date, o.value, o.source, o.created_at, o.updated_at, o.user_id
+    FROM index_rates o
+    WHERE o.user_id = ?
+    UNION ALL
+    SELECT g.id, g.index_name, g.ref_date, g.value, g.source, g.created_at, g.updated_at, NULL AS user_id
+    FROM market_index_rates g
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM index_rates ov
+        WHERE ov.user_id = ? AND ov.index_name = g.index_name AND ov.ref_date = g.ref_date
+    )
+"""
 
 
 def _wid(user_id: int | None = None) -> int:
@@ -97,14 +124,14 @@ def _wid(user_id: int | None = None) -> int:
         return int(row[0])
 
 
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+    use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
+    return conn.execute(query, tuple(params or ()), workspace_scope=use_workspace)
 
 
-def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+def _executemany(conn, query: str, seq_of_params: list, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    return conn.execute(q, tuple(params or ()))
+    return conn.executemany(query, seq_of_params, workspace_scope=use_workspace)
 
 
 def norm_index_name(value: str | None) -> str:
@@ -346,7 +373,7 @@ def fetch_index_series(index_name: str, date_from: str, date_to: str, timeout_s:
 
 def list_benchmark_settings(user_id: int | None = None) -> list[dict[str, Any]]:
     wid = _wid(user_id)
-    sql = """
+    sql = f"""
         SELECT
             s.id,
             s.index_name,
@@ -366,20 +393,18 @@ def list_benchmark_settings(user_id: int | None = None) -> list[dict[str, Any]]:
         FROM benchmark_settings s
         LEFT JOIN (
             SELECT ir.index_name, ir.ref_date, ir.value, ir.source
-            FROM index_rates ir
+            FROM ({MERGED_INDEX_RATES_SQL}) ir
             JOIN (
-                SELECT index_name, MAX(ref_date) AS max_ref_date
-                FROM index_rates
-                WHERE user_id = ?
-                GROUP BY index_name
+                SELECT m.index_name, MAX(m.ref_date) AS max_ref_date
+                FROM ({MERGED_INDEX_RATES_SQL}) m
+                GROUP BY m.index_name
             ) mx ON mx.index_name = ir.index_name AND mx.max_ref_date = ir.ref_date
-            WHERE ir.user_id = ?
         ) latest ON latest.index_name = s.index_name
         WHERE s.user_id = ?
         ORDER BY COALESCE(s.default_asset_class, ''), s.index_name
     """
     with get_conn() as conn:
-        existing_rows = _exec(conn, sql, (wid, wid, wid)).fetchall()
+        existing_rows = _exec(conn, sql, (wid, wid, wid, wid, wid)).fetchall()
 
     existing = {norm_index_name(row["index_name"]): dict(row) for row in existing_rows}
     out: list[dict[str, Any]] = []
@@ -498,20 +523,20 @@ def list_index_rates(
     lim = max(1, min(int(limit or 2000), 10000))
     wid = _wid(user_id)
 
-    sql = """
-        SELECT id, index_name, ref_date, value, source, created_at, updated_at, user_id
-        FROM index_rates
-        WHERE user_id = ?
+    sql = f"""
+        SELECT r.*
+        FROM ({MERGED_INDEX_RATES_SQL}) r
+        WHERE 1 = 1
     """
-    params: list[Any] = [wid]
+    params: list[Any] = [wid, wid]
     if idx:
-        sql += " AND index_name = ?"
+        sql += " AND r.index_name = ?"
         params.append(idx)
     if d_from:
-        sql += " AND ref_date >= ?"
+        sql += " AND r.ref_date >= ?"
         params.append(d_from)
     if d_to:
-        sql += " AND ref_date <= ?"
+        sql += " AND r.ref_date <= ?"
         params.append(d_to)
     sql += " ORDER BY ref_date DESC, index_name ASC LIMIT ?"
     params.append(lim)
@@ -521,73 +546,164 @@ def list_index_rates(
     return [dict(r) for r in rows]
 
 
+def _normalize_points(points: list[dict[str, Any]], source: str | None) -> list[tuple[str, float, str | None]]:
+    normalized: list[tuple[str, float, str | None]] = []
+    for p in points or []:
+        ref_date = _parse_iso_date(str((p or {}).get("ref_date") or ""))
+        value = float((p or {}).get("value"))
+        src = (str((p or {}).get("source") or source or "").strip() or None)
+        normalized.append((ref_date, value, src))
+    normalized.sort(key=lambda item: item[0])
+    return normalized
+
+
+def _diff_points(
+    existing: dict[str, tuple[float, Any]],
+    normalized: list[tuple[str, float, str | None]],
+) -> tuple[list[tuple[str, float, str | None]], list[tuple[str, float, str | None]], dict[str, int]]:
+    current = dict(existing)
+    changed: set[str] = set()
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    # Diff em memória na mesma ordem da versão ponto a ponto (inclusive datas repetidas no lote).
+    for ref_date, value, src in normalized:
+        if ref_date not in current:
+            current[ref_date] = (value, src)
+            changed.add(ref_date)
+            counts["inserted"] += 1
+            continue
+
+        old_value, old_source_raw = current[ref_date]
+        old_source = (str(old_source_raw).strip() if old_source_raw is not None else None)
+        if old_source and old_source.upper().startswith("MANUAL") and (not src or not src.upper().startswith("MANUAL")):
+            counts["unchanged"] += 1
+            continue
+        if abs(old_value - value) < 1e-12 and old_source == src:
+            counts["unchanged"] += 1
+            continue
+
+        current[ref_date] = (value, src)
+        changed.add(ref_date)
+        counts["updated"] += 1
+
+    to_insert = [(d, current[d][0], current[d][1]) for d in sorted(changed) if d not in existing]
+    to_update = [(d, current[d][0], current[d][1]) for d in sorted(changed) if d in existing]
+    return to_insert, to_update, counts
+
+
 def bulk_upsert_index_rates(
     index_name: str,
     points: list[dict[str, Any]],
     source: str | None = None,
     user_id: int | None = None,
 ) -> dict[str, Any]:
+    """Grava overrides do workspace; a série pública vai para bulk_upsert_market_index_rates."""
     idx = norm_index_name(index_name)
     if idx not in SUPPORTED_INDEX_NAMES:
         raise ValueError(f"Índice não suportado: {index_name}")
 
-    normalized: list[tuple[str, float, str | None]] = []
-    for p in points or []:
-        ref_date = _parse_iso_date(str((p or {}).get("ref_date") or ""))
-        value = float((p or {}).get("value"))
-        src = (str((p or {}).get("source") or source or "").strip() or None)
-        normalized.append((ref_date, value, src))
-
-    normalized.sort(key=lambda item: item[0])
+    normalized = _normalize_points(points, source)
     wid = _wid(user_id)
-    inserted = 0
-    updated = 0
-    unchanged = 0
+    if not normalized:
+        return {"index_name": idx, "total": 0, "inserted": 0, "updated": 0, "unchanged": 0}
 
     with get_conn() as conn:
-        for ref_date, value, src in normalized:
-            existing = _exec(conn, 
-                "SELECT value, source FROM index_rates WHERE user_id = ? AND index_name = ? AND ref_date = ?",
-                (wid, idx, ref_date),
-            ).fetchone()
-
-            if existing is None:
-                _exec(conn, 
-                    """
-                    INSERT INTO index_rates(index_name, ref_date, value, source, user_id)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (idx, ref_date, value, src, wid),
-                )
-                inserted += 1
-                continue
-
-            old_value = float(existing["value"])
-            old_source = (str(existing["source"]).strip() if existing["source"] is not None else None)
-            if old_source and old_source.upper().startswith("MANUAL") and (not src or not src.upper().startswith("MANUAL")):
-                unchanged += 1
-                continue
-            if abs(old_value - value) < 1e-12 and old_source == src:
-                unchanged += 1
-                continue
-
-            _exec(conn, 
+        rows = _exec(conn, 
+            """
+            SELECT ref_date, value, source
+            FROM index_rates
+            WHERE user_id = ? AND index_name = ? AND ref_date >= ? AND ref_date <= ?
+            """,
+            (wid, idx, normalized[0][0], normalized[-1][0]),
+        ).fetchall()
+        existing = {str(r["ref_date"]): (float(r["value"]), r["source"]) for r in rows}
+        to_insert, to_update, counts = _diff_points(existing, normalized)
+
+        if to_insert:
+            _executemany(conn, 
+                """
+                INSERT INTO index_rates(index_name, ref_date, value, source, user_id)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(idx, ref_date, value, src, wid) for ref_date, value, src in to_insert],
+            )
+        if to_update:
+            _executemany(conn, 
                 """
                 UPDATE index_rates
                 SET value = ?, source = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE user_id = ? AND index_name = ? AND ref_date = ?
                 """,
-                (value, src, wid, idx, ref_date),
+                [(value, src, wid, idx, ref_date) for ref_date, value, src in to_update],
             )
-            updated += 1
-
-    return {
-        "index_name": idx,
-        "total": len(normalized),
-        "inserted": inserted,
-        "updated": updated,
-        "unchanged": unchanged,
-    }
+
+    if to_insert or to_update:
+        _bump_rates_generation()
+    return {"index_name": idx, "total": len(normalized), **counts}
+
+
+def bulk_upsert_market_index_rates(
+    index_name: str,
+    points: list[dict[str, Any]],
+    source: str | None = None,
+) -> dict[str, Any]:
+    idx = norm_index_name(index_name)
+    if idx not in SUPPORTED_INDEX_NAMES:
+        raise ValueError(f"Índice não suportado: {index_name}")
+
+    normalized = _normalize_points(points, source)
+    if not normalized:
+        return {"index_name": idx, "total": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    with get_conn() as conn:
+        rows = _exec(conn, 
+            """
+            SELECT ref_date, value, source
+            FROM market_index_rates
+            WHERE index_name = ? AND ref_date >= ? AND ref_date <= ?
+            """,
+            (idx, normalized[0][0], normalized[-1][0]),
+            rewrite_scope=False,
+        ).fetchall()
+        existing = {str(r["ref_date"]): (float(r["value"]), r["source"]) for r in rows}
+        to_insert, to_update, counts = _diff_points(existing, normalized)
+
+        if to_insert:
+            _executemany(conn, 
+                """
+                INSERT INTO market_index_rates(index_name, ref_date, value, source)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(idx, ref_date, value, src) for ref_date, value, src in to_insert],
+                rewrite_scope=False,
+            )
+        if to_update:
+            _executemany(conn, 
+                """
+                UPDATE market_index_rates
+                SET value = ?, source = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE index_name = ? AND ref_date = ?
+                """,
+                [(value, src, idx, ref_date) for ref_date, value, src in to_update],
+                rewrite_scope=False,
+            )
+
+    if to_insert or to_update:
+        _bump_rates_generation()
+    return {"index_name": idx, "total": len(normalized), **counts}
+
+
+def latest_market_ref_date(index_name: str) -> str | None:
+    idx = norm_index_name(index_name)
+    with get_conn() as conn:
+        row = _exec(conn, 
+            "SELECT MAX(ref_date) AS max_ref_date FROM market_index_rates WHERE index_name = ?",
+            (idx,),
+            rewrite_scope=False,
+        ).fetchone()
+    if not row or not row["max_ref_date"]:
+        return None
+    return str(row["max_ref_date"])
 
 
 def sync_from_bcb(
@@ -597,6 +713,7 @@ def sync_from_bcb(
     timeout_s: float = 20.0,
     user_id: int | None = None,
 ) -> dict[str, Any]:
+    # user_id mantido por compatibilidade: a série baixada é global (market_index_rates).
     names_raw = index_names or list(SUPPORTED_INDEX_NAMES)
     names: list[str] = []
     for name in names_raw:
@@ -622,11 +739,10 @@ def sync_from_bcb(
 
     for idx in names:
         points = fetch_index_series(idx, d_from, d_to, timeout_s=timeout_s)
-        res = bulk_upsert_index_rates(
+        res = bulk_upsert_market_index_rates(
             index_name=idx,
             points=points,
             source=_index_source(idx),
-            user_id=user_id,
         )
         out["indexes"][idx] = res
         total_inserted += int(res["inserted"])
@@ -639,3 +755,74 @@ def sync_from_bcb(
         "unchanged": total_unchanged,
     }
     return out
+
+
+def _market_sync_ran(index_name: str, ref_date: str) -> bool:
+    scope_kind, scope_id = MARKET_SYNC_SCOPE
+    with get_conn() as conn:
+        row = _exec(conn, 
+            """
+            SELECT 1
+            FROM sync_runs
+            WHERE scope_kind = ? AND scope_id = ? AND sync_type = 'index_rate_sync' AND sync_key = ? AND ref_date = ?
+            LIMIT 1
+            """,
+            (scope_kind, scope_id, index_name, ref_date),
+            rewrite_scope=False,
+        ).fetchone()
+    return bool(row)
+
+
+def _mark_market_sync(index_name: str, ref_date: str) -> None:
+    scope_kind, scope_id = MARKET_SYNC_SCOPE
+    with get_conn() as conn:
+        _exec(conn, 
+            """
+            INSERT INTO sync_runs(scope_kind, scope_id, sync_type, sync_key, ref_date)
+            VALUES (?, ?, 'index_rate_sync', ?, ?)
+            ON CONFLICT(scope_kind, scope_id, sync_type, sync_key, ref_date) DO NOTHING
+            """,
+            (scope_kind, scope_id, index_name, ref_date),
+            rewrite_scope=False,
+        )
+
+
+def sync_market_index_rates(
+    index_names: list[str] | None = None,
+    timeout_s: float = 20.0,
+    force: bool = False,
+) -> dict[str, Any]:
+    """Atualiza a série global a partir do último dia gravado, no máximo uma vez por dia e índice.
+
+    Usado pelo job agendado e pelo login: o primeiro a rodar no dia consulta a fonte,
+    os demais workspaces só leem market_index_rates.
+    """
+    today = _date.today()
+    today_iso = today.isoformat()
+    names: list[str] = []
+    for name in index_names or ["CDI", "SELIC", "IPCA"]:
+        idx = norm_index_name(name)
+        if idx not in SUPPORTED_INDEX_NAMES:
+            raise ValueError(f"Índice não suportado: {name}")
+        if idx not in names:
+            names.append(idx)
+
+    statuses: dict[str, str] = {}
+    errors: dict[str, str] = {}
+    for idx in names:
+        if not force and _market_sync_ran(idx, today_iso):
+            statuses[idx] = "up_to_date"
+            continue
+        latest = latest_market_ref_date(idx)
+        start = (_date.fromisoformat(latest) + timedelta(days=1)).isoformat() if latest else f"{today.year}-01-01"
+        if start > today_iso:
+            statuses[idx] = "up_to_date"
+            continue
+        try:
+            sync_from_bcb(index_names=[idx], date_from=start, date_to=today_iso, timeout_s=timeout_s)
+            _mark_market_sync(idx, today_iso)
+            statuses[idx] = "updated"
+        except Exception as exc:
+            statuses[idx] = "failed"
+            errors[idx] = str(exc)
+    return {"ref_date": today_iso, "statuses": statuses, "errors": errors}
@@ -2,17 +2,32 @@
 
 from datetime import date
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import os
 import sqlite3
+import ssl
 import threading
 import time
 from typing import Any, Callable, Optional, Tuple
+from urllib.parse import urlsplit
 
 import yfinance as yf
 import pandas as pd
 import requests
 import certifi
 
+try:
+    import httpx
+except ImportError:  # pragma: no cover - sem httpx, update_all_prices usa o modo com threads
+    httpx = None
+
+
+# Bases dos provedores HTTP; sobrescrevíveis para apontar para um servidor fake (testes/benchmark).
+BRAPI_BASE_URL = os.getenv("QUOTE_BRAPI_BASE_URL", "https://brapi.dev").rstrip("/")
+YAHOO_BASE_URL = os.getenv("QUOTE_YAHOO_BASE_URL", "https://query1.finance.yahoo.com").rstrip("/")
+STOOQ_BASE_URL = os.getenv("QUOTE_STOOQ_BASE_URL", "https://stooq.com").rstrip("/")
+QUOTE_HEADERS = {"User-Agent": "finance_app/1.0"}
+
 
 def _read_token_from_env_file(path: str) -> Optional[str]:
     if not os.path.exists(path):
@@ -174,6 +189,73 @@ def _get_brapi_token() -> Optional[str]:
     return None
 
 
+def _epoch_to_date(value: Any) -> str:
+    # BRAPI/Yahoo nem sempre mandam data bonitinha. Se não vier (ou não for epoch), usamos hoje.
+    if not value:
+        return today_str()
+    try:
+        import datetime as _dt
+        return _dt.datetime.fromtimestamp(int(value)).date().isoformat()
+    except Exception:
+        return today_str()
+
+
+def _parse_brapi_response(r) -> Tuple[Optional[float], Optional[str], Optional[str], Optional[str]]:
+    if r.status_code != 200:
+        return None, None, None, f"BRAPI HTTP {r.status_code}: {r.text[:200]}"
+
+    data = r.json()
+
+    results = data.get("results") or []
+    if not results:
+        # BRAPI pode vir com "message" e "error"
+        msg = data.get("message") or data.get("error") or "Sem results."
+        return None, None, None, f"BRAPI: {msg}"
+
+    row = results[0]
+
+    price = row.get("regularMarketPrice")
+    if price is None:
+        return None, None, None, "BRAPI: sem regularMarketPrice."
+    return float(price), _epoch_to_date(row.get("regularMarketTime")), "brapi", None
+
+
+def _parse_yahoo_response(r) -> Tuple[Optional[float], Optional[str], Optional[str], Optional[str]]:
+    if r.status_code != 200:
+        return None, None, None, f"Yahoo HTTP {r.status_code}"
+    data = r.json() or {}
+    rows = (((data.get("quoteResponse") or {}).get("result")) or [])
+    if not rows:
+        return None, None, None, "Yahoo sem resultados."
+    row = rows[0]
+    px = row.get("regularMarketPrice")
+    if px is None:
+        return None, None, None, "Yahoo sem regularMarketPrice."
+    return float(px), _epoch_to_date(row.get("regularMarketTime")), "yahoo_http", None
+
+
+def _parse_stooq_response(r) -> Tuple[Optional[float], Optional[str], Optional[str], Optional[str]]:
+    if r.status_code != 200:
+        return None, None, None, f"Stooq HTTP {r.status_code}"
+    txt = (r.text or "").strip()
+    lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
+    if len(lines) < 1:
+        return None, None, None, "Stooq sem dados."
+    cols = [c.strip().strip('"') for c in lines[0].split(",")]
+    # Symbol,Date,Time,Open,High,Low,Close,Volume...
+    if len(cols) < 7:
+        return None, None, None, "Stooq formato inesperado."
+    px_date = cols[1]
+    close = cols[6]
+    if not close or close.upper() == "N/D" or px_date.upper() == "N/D":
+        return None, None, None, "Stooq sem fechamento."
+    return float(close), px_date, "stooq", None
+
+
+def _clean_symbol(symbol: str) -> str:
+    return (symbol or "").strip().upper().replace(" ", "")
+
+
 def fetch_last_price_brapi(symbol: str) -> Tuple[Optional[float], Optional[str], Optional[str], Optional[str]]:
     """
     Retorna (price, px_date, src, err)
@@ -186,43 +268,9 @@ def fetch_last_price_brapi(symbol: str) -> Tuple[Optional[float], Optional[str],
     if not sym:
         return None, None, None, "Símbolo vazio."
 
-    url = f"https://brapi.dev/api/quote/{sym}"
-    params = {"token": token}
-    headers = {"User-Agent": "finance_app/1.0"}
-
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=6)
-        if r.status_code != 200:
-            return None, None, None, f"BRAPI HTTP {r.status_code}: {r.text[:200]}"
-
-        data = r.json()
-
-        results = data.get("results") or []
-        if not results:
-            # BRAPI pode vir com "message" e "error"
-            msg = data.get("message") or data.get("error") or "Sem results."
-            return None, None, None, f"BRAPI: {msg}"
-
-        row = results[0]
-
-        price = row.get("regularMarketPrice")
-        if price is None:
-            return None, None, None, "BRAPI: sem regularMarketPrice."
-
-        # BRAPI nem sempre manda data bonitinha. Se não vier, usamos hoje.
-        px_date = row.get("regularMarketTime")
-        if px_date:
-            # se vier epoch seconds, converte; se vier string, deixa
-            try:
-                import datetime as _dt
-                px_date = _dt.datetime.fromtimestamp(int(px_date)).date().isoformat()
-            except Exception:
-                px_date = today_str()
-        else:
-            px_date = today_str()
-
-        return float(price), str(px_date), "brapi", None
-
+        r = requests.get(f"{BRAPI_BASE_URL}/api/quote/{sym}", params={"token": token}, headers=QUOTE_HEADERS, timeout=6)
+        return _parse_brapi_response(r)
     except Exception as e:
         return None, None, None, f"BRAPI erro: {e}"
 
@@ -232,35 +280,19 @@ def fetch_last_price_yahoo_http(symbol: str) -> Tuple[Optional[float], Optional[
     Fallback usando endpoint HTTP do Yahoo (sem dependência do curl-cffi do yfinance).
     Retorna (price, px_date, src, err).
     """
-    sym = (symbol or "").strip().upper().replace(" ", "")
+    sym = _clean_symbol(symbol)
     if not sym:
         return None, None, None, "Símbolo vazio."
 
-    url = "https://query1.finance.yahoo.com/v7/finance/quote"
-    headers = {"User-Agent": "finance_app/1.0"}
-    params = {"symbols": sym}
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=8, verify=certifi.where())
-        if r.status_code != 200:
-            return None, None, None, f"Yahoo HTTP {r.status_code}"
-        data = r.json() or {}
-        rows = (((data.get("quoteResponse") or {}).get("result")) or [])
-        if not rows:
-            return None, None, None, "Yahoo sem resultados."
-        row = rows[0]
-        px = row.get("regularMarketPrice")
-        if px is None:
-            return None, None, None, "Yahoo sem regularMarketPrice."
-        ts = row.get("regularMarketTime")
-        if ts:
-            try:
-                import datetime as _dt
-                px_date = _dt.datetime.fromtimestamp(int(ts)).date().isoformat()
-            except Exception:
-                px_date = today_str()
-        else:
-            px_date = today_str()
-        return float(px), str(px_date), "yahoo_http", None
+        r = requests.get(
+            f"{YAHOO_BASE_URL}/v7/finance/quote",
+            params={"symbols": sym},
+            headers=QUOTE_HEADERS,
+            timeout=8,
+            verify=certifi.where(),
+        )
+        return _parse_yahoo_response(r)
     except Exception as e:
         return None, None, None, f"Yahoo HTTP erro: {e}"
 
@@ -270,44 +302,30 @@ def fetch_last_price_stooq_us(symbol: str) -> Tuple[Optional[float], Optional[st
     Fallback para stocks US via stooq (preço diário).
     Retorna (price, px_date, src, err).
     """
-    sym = (symbol or "").strip().upper().replace(" ", "")
+    sym = _clean_symbol(symbol)
     if not sym:
         return None, None, None, "Símbolo vazio."
-    stooq_sym = f"{sym}.US"
-    url = "https://stooq.com/q/l/"
-    params = {"s": stooq_sym, "i": "d"}
-    headers = {"User-Agent": "finance_app/1.0"}
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=8, verify=certifi.where())
-        if r.status_code != 200:
-            return None, None, None, f"Stooq HTTP {r.status_code}"
-        txt = (r.text or "").strip()
-        lines = [ln.strip() for ln in txt.splitlines() if ln.strip()]
-        if len(lines) < 1:
-            return None, None, None, "Stooq sem dados."
-        cols = [c.strip().strip('"') for c in lines[0].split(",")]
-        # Symbol,Date,Time,Open,High,Low,Close,Volume...
-        if len(cols) < 7:
-            return None, None, None, "Stooq formato inesperado."
-        px_date = cols[1]
-        close = cols[6]
-        if not close or close.upper() == "N/D" or px_date.upper() == "N/D":
-            return None, None, None, "Stooq sem fechamento."
-        return float(close), px_date, "stooq", None
+        r = requests.get(
+            f"{STOOQ_BASE_URL}/q/l/",
+            params={"s": f"{sym}.US", "i": "d"},
+            headers=QUOTE_HEADERS,
+            timeout=8,
+            verify=certifi.where(),
+        )
+        return _parse_stooq_response(r)
     except Exception as e:
         return None, None, None, f"Stooq erro: {e}"
 
 
-def fetch_last_price(symbol: str, asset_class: str = "", currency: str = "BRL"):
+def _quote_plan(symbol: str, asset_class: str = "", currency: str = "BRL") -> tuple[list[tuple[str, str]], Optional[str], str]:
     """
-    Estratégia:
-    - Para ativos BR (ações/FIIs), aceita ticker com ou sem ".SA"
-    - Tenta Yahoo primeiro e, se falhar em ativo BR, tenta BRAPI
-    Retorna (price, px_date, src, err)
+    Ordem de fontes para um ativo: ([(fonte, símbolo), ...], erro inicial, erro padrão).
+    Compartilhada pelo fetch síncrono e pelo assíncrono; o primeiro erro não vazio é o reportado.
     """
     cls = (asset_class or "").strip().lower()
     cur = (currency or "BRL").strip().upper()
-    sym = (symbol or "").strip().upper().replace(" ", "")
+    sym = _clean_symbol(symbol)
 
     # Heurística para identificar ativo BR mesmo que classe venha fora do padrão.
     is_b3_by_class = ("acoes" in cls) or ("ações" in cls) or ("fii" in cls) or ("b3" in cls) or ("_br" in cls)
@@ -321,68 +339,285 @@ def fetch_last_price(symbol: str, asset_class: str = "", currency: str = "BRL"):
     is_us_like_symbol = sym.isalpha() and (1 <= len(sym) <= 6) and ("." not in sym) and ("-" not in sym)
     is_crypto_by_class = ("cripto" in cls) or ("crypto" in cls)
 
-    # 1) Para BR, prioriza BRAPI quando configurado e faz fallback para Yahoo.
+    # Para BR, prioriza BRAPI quando configurado e faz fallback para Yahoo.
     if is_b3:
-        brapi_token = _get_brapi_token()
-        err = None
-        if brapi_token:
-            px, px_date, src, err = fetch_last_price_brapi(sym)
-            if px is not None:
-                return px, px_date, src, None
-        else:
-            err = "BRAPI_TOKEN não configurado; usando fallback Yahoo."
+        steps = [("yf", _normalize_b3(sym)), ("yf", sym), ("yahoo_http", _normalize_b3(sym))]
+        if _get_brapi_token():
+            return [("brapi", sym)] + steps, None, "Sem cotação para ativo BR (BRAPI/Yahoo)."
+        return steps, "BRAPI_TOKEN não configurado; usando fallback Yahoo.", "Sem cotação para ativo BR (BRAPI/Yahoo)."
+
+    if is_crypto_by_class:
+        # Cripto no Yahoo costuma ser BASE-USD/BASE-BRL
+        sym_crypto = _normalize_crypto(sym, cur)
+        return [("yahoo_http", sym_crypto), ("yf", sym_crypto)], None, f"Sem cotação para cripto ({sym_crypto})."
+
+    is_us_stock = ("stock" in cls and "us" in cls) or cur == "USD" or is_us_like_symbol
+    if is_us_stock:
+        # Evita travas do yfinance neste ambiente: prioriza HTTP e stooq para US.
+        return [("yahoo_http", sym), ("stooq", sym)], None, "Yahoo não retornou dados agora."
+    # Não-BR (exceto stock US): mantém tentativa padrão via yfinance + HTTP.
+    return [("yf", sym), ("yahoo_http", sym)], None, "Yahoo não retornou dados agora."
+
+
+def _fetch_step(source: str, sym: str) -> Tuple[Optional[float], Optional[str], Optional[str], Optional[str]]:
+    if source == "yf":
+        px, px_date, src = fetch_last_price_yf(sym)
+        return px, px_date, src, None
+    if source == "brapi":
+        return fetch_last_price_brapi(sym)
+    if source == "yahoo_http":
+        return fetch_last_price_yahoo_http(sym)
+    return fetch_last_price_stooq_us(sym)
 
-        # fallback para Yahoo caso BRAPI não retorne
-        px, px_date, src = fetch_last_price_yf(_normalize_b3(sym))
-        if px is not None:
-            return px, px_date, src, None
 
-        px, px_date, src = fetch_last_price_yf(sym)
+def fetch_last_price(symbol: str, asset_class: str = "", currency: str = "BRL"):
+    """
+    Estratégia:
+    - Para ativos BR (ações/FIIs), aceita ticker com ou sem ".SA"
+    - Tenta BRAPI (se configurado) e faz fallback para Yahoo
+    Retorna (price, px_date, src, err)
+    """
+    steps, err, fallback_err = _quote_plan(symbol, asset_class, currency)
+    for source, sym in steps:
+        px, px_date, src, step_err = _fetch_step(source, sym)
         if px is not None:
             return px, px_date, src, None
+        err = err or step_err
+    return None, None, None, err or fallback_err
+
+
+class _AsyncQuoteSession:
+    """httpx.AsyncClient compartilhado (pool de conexões) com limite de requisições simultâneas por host."""
+
+    def __init__(self, client, per_host_limit: int):
+        self.client = client
+        self.per_host_limit = max(1, int(per_host_limit))
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+    async def get(self, url: str, *, params: dict, timeout: float):
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        async with slot:
+            return await self.client.get(url, params=params, timeout=timeout)
+
+
+class _ThreadedQuoteSession:
+    """Mesma interface de _AsyncQuoteSession sobre requests (sem httpx instalado)."""
 
-        px, px_date, src, err_http = fetch_last_price_yahoo_http(_normalize_b3(sym))
+    async def get(self, url: str, *, params: dict, timeout: float):
+        return await asyncio.to_thread(
+            requests.get, url, params=params, headers=QUOTE_HEADERS, timeout=timeout, verify=certifi.where()
+        )
+
+
+async def _fetch_step_async(session: _AsyncQuoteSession, source: str, sym: str):
+    if source == "yf":
+        # yfinance é síncrono: roda numa thread do executor padrão (history já tem timeout próprio).
+        px, px_date, src = await asyncio.to_thread(fetch_last_price_yf, sym)
+        return px, px_date, src, None
+    if not sym:
+        return None, None, None, "Símbolo vazio."
+    try:
+        if source == "brapi":
+            token = _get_brapi_token()
+            if not token:
+                return None, None, None, "BRAPI_TOKEN não configurado (env ou secrets.toml)."
+            brapi_sym = _to_brapi_symbol(sym)
+            r = await session.get(f"{BRAPI_BASE_URL}/api/quote/{brapi_sym}", params={"token": token}, timeout=6)
+            return _parse_brapi_response(r)
+        if source == "yahoo_http":
+            r = await session.get(f"{YAHOO_BASE_URL}/v7/finance/quote", params={"symbols": sym}, timeout=8)
+            return _parse_yahoo_response(r)
+        r = await session.get(f"{STOOQ_BASE_URL}/q/l/", params={"s": f"{sym}.US", "i": "d"}, timeout=8)
+        return _parse_stooq_response(r)
+    except Exception as e:
+        label = {"brapi": "BRAPI erro", "yahoo_http": "Yahoo HTTP erro"}.get(source, "Stooq erro")
+        return None, None, None, f"{label}: {e}"
+
+
+async def fetch_last_price_async(session: _AsyncQuoteSession, symbol: str, asset_class: str = "", currency: str = "BRL"):
+    """Mesma estratégia de fetch_last_price, com HTTP assíncrono e cancelável."""
+    steps, err, fallback_err = _quote_plan(symbol, asset_class, currency)
+    for source, sym in steps:
+        px, px_date, src, step_err = await _fetch_step_async(session, source, sym)
         if px is not None:
             return px, px_date, src, None
-        if err_http:
-            err = err or err_http
-
-        return None, None, None, err or "Sem cotação para ativo BR (BRAPI/Yahoo)."
-    else:
-        is_us_stock = ("stock" in cls and "us" in cls) or cur == "USD" or is_us_like_symbol
-        if is_crypto_by_class:
-            # Cripto no Yahoo costuma ser BASE-USD/BASE-BRL
-            sym_crypto = _normalize_crypto(sym, cur)
-            px, px_date, src, err = fetch_last_price_yahoo_http(sym_crypto)
-            if px is not None:
-                return px, px_date, src, None
-            px, px_date, src = fetch_last_price_yf(sym_crypto)
-            if px is not None:
-                return px, px_date, src, None
-            return None, None, None, err or f"Sem cotação para cripto ({sym_crypto})."
-
-        if is_us_stock:
-            # Evita travas do yfinance neste ambiente: prioriza HTTP e stooq para US.
-            px, px_date, src, err = fetch_last_price_yahoo_http(sym)
-            if px is not None:
-                return px, px_date, src, None
-
-            px, px_date, src, err_stooq = fetch_last_price_stooq_us(sym)
-            if px is not None:
-                return px, px_date, src, None
-            if err_stooq:
-                err = err or err_stooq
+        err = err or step_err
+    return None, None, None, err or fallback_err
+
+
+def _norm_asset_class_key(value: Any) -> str:
+    raw = str(value or "").strip().lower()
+    for src, dst in (("ã", "a"), ("á", "a"), ("à", "a"), ("â", "a"), ("é", "e"), ("ê", "e"), ("í", "i"), ("ó", "o"), ("ô", "o"), ("õ", "o"), ("ú", "u"), ("ç", "c")):
+        raw = raw.replace(src, dst)
+    return "_".join(raw.split())
+
+
+def quote_group_for_asset(asset: dict) -> str:
+    cls = _norm_asset_class_key((asset or {}).get("asset_class"))
+    if cls in {"fii", "fiis", "stock_fii"}:
+        return "FIIs"
+    if cls in {"acao_br", "acoes_br", "etf_br", "bdr"}:
+        return "Ações BR"
+    if cls in {"stock_us", "stocks_us", "etf_us"}:
+        return "Stocks"
+    if cls in {"crypto", "cripto"}:
+        return "Cripto"
+    return "Outros"
+
+
+def quote_fetch_key(asset: dict) -> tuple | None:
+    """O que update_all_prices consulta para o ativo (plano por símbolo + grupo do lote e moeda).
+
+    Ativos com a mesma chave recebem exatamente a mesma cotação.
+    """
+    sym = str((asset or {}).get("symbol") or "").strip()
+    if not _clean_symbol(sym):
+        return None
+    cls = str(asset.get("asset_class") or "").strip()
+    cur = str(asset.get("currency") or "").strip().upper()
+    steps, _, _ = _quote_plan(sym, cls, cur or "BRL")
+    return (quote_group_for_asset(asset), cur, tuple(steps))
+
+
+def _batch_size(env_name: str, default: int) -> int:
+    try:
+        return max(1, min(200, int(os.getenv(env_name, str(default)))))
+    except ValueError:
+        return default
+
+
+def _quote_batch_enabled(batch: bool | None) -> bool:
+    if batch is not None:
+        return bool(batch)
+    return str(os.getenv("QUOTE_BATCH", "1")).strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _parse_batch_quotes(rows: list[dict], src: str) -> dict[str, tuple[float, str, str]]:
+    out: dict[str, tuple[float, str, str]] = {}
+    for row in rows or []:
+        sym = _clean_symbol(row.get("symbol"))
+        price = row.get("regularMarketPrice")
+        if not sym or price is None:
+            continue
+        out[sym] = (float(price), _epoch_to_date(row.get("regularMarketTime")), src)
+    return out
+
+
+async def _fetch_brapi_chunk(session, symbols: list[str], token: str) -> dict[str, tuple[float, str, str]]:
+    try:
+        r = await session.get(f"{BRAPI_BASE_URL}/api/quote/{','.join(symbols)}", params={"token": token}, timeout=10)
+        if r.status_code != 200:
+            return {}
+        return _parse_batch_quotes((r.json() or {}).get("results") or [], "brapi")
+    except Exception:
+        return {}
+
+
+async def _fetch_yahoo_chunk(session, symbols: list[str]) -> dict[str, tuple[float, str, str]]:
+    try:
+        r = await session.get(f"{YAHOO_BASE_URL}/v7/finance/quote", params={"symbols": ",".join(symbols)}, timeout=10)
+        if r.status_code != 200:
+            return {}
+        data = r.json() or {}
+        return _parse_batch_quotes(((data.get("quoteResponse") or {}).get("result")) or [], "yahoo_http")
+    except Exception:
+        return {}
+
+
+async def _fetch_chunks(session, wanted: dict[str, list[int]], size: int, fetch, timeout_s: float) -> dict[int, tuple[float, str, str]]:
+    symbols = list(wanted)
+    chunks = [symbols[i : i + size] for i in range(0, len(symbols), size)]
+
+    async def _one(chunk: list[str]) -> dict[str, tuple[float, str, str]]:
+        try:
+            return await asyncio.wait_for(fetch(session, chunk), timeout_s)
+        except asyncio.TimeoutError:
+            return {}
+
+    hits: dict[int, tuple[float, str, str]] = {}
+    for found in await asyncio.gather(*[_one(chunk) for chunk in chunks]):
+        for sym, quote in found.items():
+            for idx in wanted.get(sym, []):
+                hits[idx] = quote
+    return hits
+
+
+async def _fetch_batch_quotes(session, rows: list[dict[str, Any]], timeout_s: float) -> dict[int, tuple[float, str, str]]:
+    """
+    Pré-busca em lote (vários símbolos por requisição), agrupando como quote_group_for_asset:
+    Ações BR/FIIs via BRAPI (se houver token) e depois Yahoo .SA; Stocks e Cripto via Yahoo.
+    Retorna {índice em rows: (price, px_date, src)} só com os acertos; o resto segue por símbolo.
+    """
+    token = _get_brapi_token()
+    brapi_wanted: dict[str, list[int]] = {}
+    yahoo_wanted: dict[str, list[int]] = {}
+    b3_yahoo: dict[int, str] = {}
+    for idx, a in enumerate(rows):
+        group = quote_group_for_asset(a)
+        sym = _clean_symbol(a.get("symbol"))
+        if not sym or group == "Outros":
+            continue
+        if group in {"Ações BR", "FIIs"}:
+            b3_yahoo[idx] = _normalize_b3(sym)
+            if token:
+                brapi_wanted.setdefault(_to_brapi_symbol(sym), []).append(idx)
+                continue
+            yahoo_wanted.setdefault(b3_yahoo[idx], []).append(idx)
+        elif group == "Cripto":
+            yahoo_wanted.setdefault(_normalize_crypto(sym, a.get("currency") or "USD"), []).append(idx)
         else:
-            # Não-BR (exceto stock US): mantém tentativa padrão via yfinance + HTTP.
-            px, px_date, src = fetch_last_price_yf(sym)
-            if px is not None:
-                return px, px_date, src, None
+            yahoo_wanted.setdefault(sym, []).append(idx)
+
+    brapi_size = _batch_size("BRAPI_BATCH_SIZE", 10)
+    yahoo_size = _batch_size("YAHOO_BATCH_SIZE", 50)
+    first = await asyncio.gather(
+        _fetch_chunks(session, brapi_wanted, brapi_size, lambda sess, chunk: _fetch_brapi_chunk(sess, chunk, token), timeout_s),
+        _fetch_chunks(session, yahoo_wanted, yahoo_size, _fetch_yahoo_chunk, timeout_s),
+    )
+    hits = {**first[0], **first[1]}
+
+    # Ativos BR que a BRAPI não trouxe: segunda rodada em lote no Yahoo (.SA).
+    retry: dict[str, list[int]] = {}
+    for idxs in brapi_wanted.values():
+        for idx in idxs:
+            if idx not in hits:
+                retry.setdefault(b3_yahoo[idx], []).append(idx)
+    if retry:
+        hits.update(await _fetch_chunks(session, retry, yahoo_size, _fetch_yahoo_chunk, timeout_s))
+    return hits
+
+
+def _new_http_client(concurrency: int, per_host_limit: int):
+    limits = httpx.Limits(max_connections=max(concurrency, per_host_limit) * 2, max_keepalive_connections=concurrency)
+    verify = ssl.create_default_context(cafile=certifi.where())
+    return httpx.AsyncClient(limits=limits, headers=QUOTE_HEADERS, verify=verify)
 
-            px, px_date, src, err = fetch_last_price_yahoo_http(sym)
-            if px is not None:
-                return px, px_date, src, None
 
-    return None, None, None, err or "Yahoo não retornou dados agora."
+def fetch_last_prices_batch(assets: list[dict] | None, timeout_s: float = 25.0) -> dict[int, tuple[float, str, str]]:
+    """
+    Busca em lote as cotações dos ativos (dicts com symbol, asset_class, currency).
+    Retorna {índice na lista: (price, px_date, src)} apenas para os símbolos encontrados.
+    """
+    rows = [dict(a) for a in (assets or [])]
+    if not rows:
+        return {}
+
+    async def _run() -> dict[int, tuple[float, str, str]]:
+        if httpx is None:
+            return await _fetch_batch_quotes(_ThreadedQuoteSession(), rows, timeout_s)
+        per_host_limit = int(os.getenv("QUOTE_HOST_CONCURRENCY", "4"))
+        async with _new_http_client(per_host_limit, per_host_limit) as client:
+            return await _fetch_batch_quotes(_AsyncQuoteSession(client, per_host_limit), rows, timeout_s)
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_run())
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        return ex.submit(asyncio.run, _run()).result()
 
 
 def _resolve_quote_limits(
@@ -403,6 +638,35 @@ def _resolve_quote_limits(
     return max_workers, timeout_s
 
 
+def _quote_report_row(a: dict[str, Any], sym: str, elapsed_s: float, payload, error: str | None) -> dict[str, Any]:
+    row = {
+        "asset_id": a.get("id"),
+        "symbol": sym,
+        "ok": False,
+        "price": None,
+        "px_date": None,
+        "src": None,
+        "elapsed_s": elapsed_s,
+        "error": error,
+    }
+    if payload is None:
+        row["error"] = error or f"Falha interna ao consultar {sym}"
+        return row
+
+    try:
+        price, px_date, src, err = payload
+    except ValueError:
+        price, px_date, src = payload
+        err = None
+
+    if price is None:
+        row["error"] = err or "Sem cotação (fonte não retornou dados)"
+        return row
+
+    row.update({"ok": True, "price": float(price), "px_date": px_date, "src": src, "error": None})
+    return row
+
+
 def _fetch_one_asset(a: dict[str, Any], timeout_s: float) -> dict[str, Any]:
     sym = (a.get("symbol") or "").strip()
     cls = (a.get("asset_class") or "").strip()
@@ -413,57 +677,80 @@ def _fetch_one_asset(a: dict[str, Any], timeout_s: float) -> dict[str, Any]:
     elapsed_s = round(time.monotonic() - started, 2)
 
     if not finished:
-        return {
-            "asset_id": a.get("id"),
-            "symbol": sym,
-            "ok": False,
-            "price": None,
-            "px_date": None,
-            "src": None,
-            "elapsed_s": elapsed_s,
-            "error": f"{timeout_err} ao consultar {sym}",
-        }
+        return _quote_report_row(a, sym, elapsed_s, None, f"{timeout_err} ao consultar {sym}")
+    return _quote_report_row(a, sym, elapsed_s, payload, timeout_err)
 
-    if payload is None:
-        return {
-            "asset_id": a.get("id"),
-            "symbol": sym,
-            "ok": False,
-            "price": None,
-            "px_date": None,
-            "src": None,
-            "elapsed_s": elapsed_s,
-            "error": timeout_err or f"Falha interna ao consultar {sym}",
-        }
 
+async def _fetch_one_asset_async(session: _AsyncQuoteSession, a: dict[str, Any], timeout_s: float) -> dict[str, Any]:
+    sym = (a.get("symbol") or "").strip()
+    cls = (a.get("asset_class") or "").strip()
+    cur = (a.get("currency") or "BRL").strip()
+
+    started = time.monotonic()
     try:
-        price, px_date, src, err = payload
-    except ValueError:
-        price, px_date, src = payload
-        err = None
+        # wait_for cancela a requisição em andamento (e libera a conexão) ao estourar o timeout.
+        payload = await asyncio.wait_for(fetch_last_price_async(session, sym, cls, cur), timeout_s)
+        error = None
+    except asyncio.TimeoutError:
+        payload, error = None, f"Timeout de {timeout_s:.0f}s ao consultar {sym}"
+    except Exception as e:
+        payload, error = None, str(e)
+    return _quote_report_row(a, sym, round(time.monotonic() - started, 2), payload, error)
+
+
+async def _update_all_prices_async(
+    rows: list[dict[str, Any]],
+    progress_cb: Callable[[int, int, dict[str, Any]], None] | None,
+    timeout_s: float,
+    concurrency: int,
+    per_host_limit: int,
+    batch: bool = True,
+) -> list[dict[str, Any]]:
+    async with _new_http_client(concurrency, per_host_limit) as client:
+        session = _AsyncQuoteSession(client, per_host_limit)
+        in_flight = asyncio.Semaphore(concurrency)
+        report: list[dict[str, Any] | None] = [None] * len(rows)
+        done = 0
 
-    if price is None:
-        return {
-            "asset_id": a.get("id"),
-            "symbol": sym,
-            "ok": False,
-            "price": None,
-            "px_date": None,
-            "src": None,
-            "elapsed_s": elapsed_s,
-            "error": err or "Sem cotação (fonte não retornou dados)",
-        }
-
-    return {
-        "asset_id": a.get("id"),
-        "symbol": sym,
-        "ok": True,
-        "price": float(price),
-        "px_date": px_date,
-        "src": src,
-        "elapsed_s": elapsed_s,
-        "error": None,
-    }
+        def _finish(idx: int, row: dict[str, Any]) -> None:
+            nonlocal done
+            report[idx] = row
+            done += 1
+            if progress_cb:
+                try:
+                    progress_cb(done, len(rows), row)
+                except Exception:
+                    pass
+
+        pending = list(range(len(rows)))
+        if batch:
+            started = time.monotonic()
+            hits = await _fetch_batch_quotes(session, rows, timeout_s)
+            elapsed_s = round(time.monotonic() - started, 2)
+            for idx, (price, px_date, src) in hits.items():
+                a = rows[idx]
+                _finish(idx, _quote_report_row(a, (a.get("symbol") or "").strip(), elapsed_s, (price, px_date, src, None), None))
+            pending = [idx for idx in pending if idx not in hits]
+
+        async def _run(idx: int) -> tuple[int, dict[str, Any]]:
+            async with in_flight:
+                return idx, await _fetch_one_asset_async(session, rows[idx], timeout_s)
+
+        for fut in asyncio.as_completed([_run(idx) for idx in pending]):
+            _finish(*(await fut))
+    return [r for r in report if r is not None]
+
+
+def _resolve_quote_mode(mode: str | None) -> str:
+    raw = str(mode or os.getenv("QUOTE_FETCH_MODE", "async")).strip().lower()
+    if raw != "async" or httpx is None:
+        return "threads"
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return "async"
+    # Já dentro de um event loop (asyncio.run não pode ser aninhado): mantém o modo com threads.
+    return "threads"
 
 
 def update_all_prices(
@@ -471,9 +758,13 @@ def update_all_prices(
     progress_cb: Callable[[int, int, dict[str, Any]], None] | None = None,
     timeout_s: float | None = None,
     max_workers: int | None = None,
+    mode: str | None = None,
+    batch: bool | None = None,
 ) -> list[dict]:
     """
     assets: lista de dicts com pelo menos: id, symbol, asset_class, currency
+    mode: "async" (padrão, httpx com pool de conexões) ou "threads"; QUOTE_FETCH_MODE define o padrão.
+    batch: pré-busca em lote por provedor (QUOTE_BATCH, ligado por padrão); só as falhas seguem por símbolo.
     Retorna um relatório [{asset_id, symbol, ok, price, px_date, src, error}]
     """
     rows: list[dict[str, Any]] = []
@@ -484,17 +775,45 @@ def update_all_prices(
     if total == 0:
         return []
 
+    workers_override = max_workers
     max_workers, timeout_s = _resolve_quote_limits(
         total,
         max_workers_override=max_workers,
         timeout_s_override=timeout_s,
     )
+    if _resolve_quote_mode(mode) == "async":
+        # Requisições são baratas no modo assíncrono: max_workers explícito limita os ativos em voo,
+        # senão vale QUOTE_ASYNC_CONCURRENCY; o limite por host segura a carga em cada provedor.
+        concurrency = max_workers if workers_override is not None else int(os.getenv("QUOTE_ASYNC_CONCURRENCY", "16"))
+        per_host_limit = int(os.getenv("QUOTE_HOST_CONCURRENCY", "4"))
+        return asyncio.run(
+            _update_all_prices_async(
+                rows, progress_cb, timeout_s, max(1, min(64, concurrency)), per_host_limit, _quote_batch_enabled(batch)
+            )
+        )
+
     report: list[dict[str, Any]] = []
+    done = 0
+    hits: dict[int, tuple[float, str, str]] = {}
+    if _quote_batch_enabled(batch):
+        started = time.monotonic()
+        hits = fetch_last_prices_batch(rows, timeout_s=timeout_s)
+        elapsed_s = round(time.monotonic() - started, 2)
+        for idx, (price, px_date, src) in hits.items():
+            a = rows[idx]
+            row = _quote_report_row(a, (a.get("symbol") or "").strip(), elapsed_s, (price, px_date, src, None), None)
+            row["_idx"] = idx
+            report.append(row)
+            done += 1
+            if progress_cb:
+                try:
+                    progress_cb(done, total, row)
+                except Exception:
+                    pass
 
     with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        fut_map = {ex.submit(_fetch_one_asset, a, timeout_s): i for i, a in enumerate(rows)}
+        fut_map = {ex.submit(_fetch_one_asset, a, timeout_s): i for i, a in enumerate(rows) if i not in hits}
 
-        done = 0
         for fut in as_completed(fut_map):
             row = fut.result()
             row["_idx"] = fut_map[fut]
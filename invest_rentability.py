@@ -1,17 +1,26 @@
 ﻿from __future__ import annotations
 
+import logging
 import math
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from datetime import date as _date
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_HALF_UP, getcontext
-import re
 from contextvars import ContextVar
 from typing import Any
 
-from db import get_conn
+from db import get_conn, resolve_user_workspace_id
+from invest_index_rates import MERGED_INDEX_RATES_SQL, rates_generation
 from tenant import get_current_user_id, get_current_workspace_id
 
 getcontext().prec = 40
+logger = logging.getLogger(__name__)
 
 _RATE_Q = Decimal("0.00000001")
 _INTERMEDIATE_Q = Decimal("0.000001")
@@ -19,6 +28,11 @@ _CURRENT_Q = Decimal("0.000001")
 _BUSINESS_DAYS_YEAR = Decimal("252")
 _FIXED_INCOME_CLASSES = {"renda_fixa", "tesouro_direto", "coe", "fundos"}
 _USE_WORKSPACE_SCOPE: ContextVar[bool] = ContextVar("invest_rentability_use_workspace_scope", default=False)
+# 0 desliga o cache entre execuções; dentro de um lote (update_fixed_income_assets) sempre há cache.
+INDEX_CACHE_TTL_S = max(0.0, float(os.getenv("RENTABILITY_INDEX_CACHE_TTL_S", "0") or "0"))
+# 0/1 = simulação serial; >1 distribui lotes grandes num ProcessPoolExecutor (gravação fica no processo pai).
+SIMULATION_PROCESS_WORKERS = max(0, int(os.getenv("RENTABILITY_PROCESS_WORKERS", "0") or "0"))
+SIMULATION_PROCESS_MIN_ASSETS = max(1, int(os.getenv("RENTABILITY_PROCESS_MIN_ASSETS", "32") or "32"))
 
 
 def _uid(user_id: int | None = None) -> int:
@@ -28,46 +42,22 @@ def _uid(user_id: int | None = None) -> int:
         return int(wid)
 
     uid = int(user_id) if user_id is not None else int(get_current_user_id())
-    conn = get_conn()
-    try:
-        row = _exec(conn, 
-            """
-            SELECT wu.workspace_id
-            FROM workspace_users wu
-            JOIN workspaces w ON w.id = wu.workspace_id
-            WHERE wu.user_id = ?
-            ORDER BY
-                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
-                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
-                wu.workspace_id
-            LIMIT 1
-            """,
-            (uid,),
-            rewrite_scope=False,
-        ).fetchone()
-    except Exception:
-        row = None
-    finally:
-        conn.close()
-
-    if not row:
+    workspace_id = resolve_user_workspace_id(uid)
+    if workspace_id is None:
         _USE_WORKSPACE_SCOPE.set(False)
         return uid
     _USE_WORKSPACE_SCOPE.set(True)
-    try:
-        return int(row["workspace_id"])
-    except Exception:
-        return int(row[0])
+    return int(workspace_id)
 
 
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+    use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
+    return conn.execute(query, tuple(params or ()), workspace_scope=use_workspace)
 
 
-def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+def _executemany(conn, query: str, seq_of_params: list, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    return conn.execute(q, tuple(params or ()))
+    return conn.executemany(query, seq_of_params, workspace_scope=use_workspace)
 
 
 def _norm_text(value: str | None) -> str:
@@ -113,8 +103,64 @@ def _optional_date(value: str | None) -> _date | None:
         return None
 
 
+def _easter(year: int) -> _date:
+    # Computus (algoritmo de Meeus/Jones/Butcher, calendário gregoriano).
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return _date(year, month, day + 1)
+
+
+def _br_national_holidays(year_from: int, year_to: int) -> tuple[_date, ...]:
+    out: set[_date] = set()
+    for year in range(year_from, year_to + 1):
+        for month, day in [(1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25)]:
+            out.add(_date(year, month, day))
+        if year >= 2024:
+            out.add(_date(year, 11, 20))
+        easter = _easter(year)
+        for offset in (-48, -47, -2, 60):  # carnaval (seg/ter), sexta-feira santa, corpus christi
+            out.add(easter + timedelta(days=offset))
+    return tuple(sorted(d for d in out if d.weekday() < 5))
+
+
+# Sem calendário por padrão (dia útil = seg-sex, como sempre foi); RENTABILITY_BR_HOLIDAYS=1
+# desconta os feriados nacionais na contagem de dias úteis.
+_HOLIDAYS: tuple[_date, ...] = (
+    _br_national_holidays(2000, 2100)
+    if str(os.getenv("RENTABILITY_BR_HOLIDAYS", "0")).strip().lower() in {"1", "true", "yes", "on"}
+    else ()
+)
+_HOLIDAY_SET = frozenset(_HOLIDAYS)
+
+
 def _is_business_day(d: _date) -> bool:
-    return d.weekday() < 5
+    return d.weekday() < 5 and d not in _HOLIDAY_SET
+
+
+def _count_business_days(date_from: _date, date_to: _date) -> int:
+    if date_from > date_to:
+        return 0
+    weeks, rest = divmod((date_to - date_from).days + 1, 7)
+    first_weekday = date_from.weekday()
+    count = weeks * 5 + sum(1 for k in range(rest) if (first_weekday + k) % 7 < 5)
+    return count - (bisect_right(_HOLIDAYS, date_to) - bisect_left(_HOLIDAYS, date_from))
+
+
+def _last_business_day(date_from: _date, date_to: _date) -> _date | None:
+    d = date_to
+    while d >= date_from:
+        if _is_business_day(d):
+            return d
+        d -= timedelta(days=1)
+    return None
 
 
 def _iter_days(date_from: _date, date_to: _date):
@@ -168,6 +214,12 @@ def _factor_from_rate(rate_decimal: Decimal) -> Decimal:
 
 
 def _resolve_base_date(conn, asset_row: dict[str, Any]) -> _date:
+    if "min_buy_date" in asset_row:
+        # Já carregado pelo SELECT do lote (update_fixed_income_assets).
+        buy_date = _optional_date(asset_row.get("min_buy_date"))
+        if buy_date:
+            return buy_date
+        return _optional_date(asset_row.get("created_at")) or _date.today()
     trade_row = _exec(conn, 
         """
         SELECT MIN(date) AS min_buy_date
@@ -188,17 +240,17 @@ def _resolve_base_date(conn, asset_row: dict[str, Any]) -> _date:
     return created_date or _date.today()
 
 
-def _load_daily_index_map(conn, index_name: str, date_from: _date, date_to: _date) -> dict[_date, Decimal]:
+def _load_daily_index_map(conn, index_name: str, date_from: _date, date_to: _date, scope_id: int | None) -> dict[_date, Decimal]:
     rows = _exec(conn, 
-        """
-        SELECT ref_date, value
-        FROM index_rates
-        WHERE index_name = ?
-          AND ref_date >= ?
-          AND ref_date <= ?
-        ORDER BY ref_date
+        f"""
+        SELECT r.ref_date, r.value
+        FROM ({MERGED_INDEX_RATES_SQL}) r
+        WHERE r.index_name = ?
+          AND r.ref_date >= ?
+          AND r.ref_date <= ?
+        ORDER BY r.ref_date
         """,
-        (index_name, date_from.isoformat(), date_to.isoformat()),
+        (scope_id, scope_id, index_name, date_from.isoformat(), date_to.isoformat()),
     ).fetchall()
     out: dict[_date, Decimal] = {}
     for r in rows:
@@ -209,18 +261,18 @@ def _load_daily_index_map(conn, index_name: str, date_from: _date, date_to: _dat
     return out
 
 
-def _load_monthly_ipca_map(conn, date_from: _date, date_to: _date) -> dict[str, Decimal]:
+def _load_monthly_ipca_map(conn, date_from: _date, date_to: _date, scope_id: int | None) -> dict[str, Decimal]:
     fetch_from = _date(int(date_from.year), int(date_from.month), 1)
     rows = _exec(conn, 
-        """
-        SELECT ref_date, value
-        FROM index_rates
-        WHERE index_name = 'IPCA'
-          AND ref_date >= ?
-          AND ref_date <= ?
-        ORDER BY ref_date
+        f"""
+        SELECT r.ref_date, r.value
+        FROM ({MERGED_INDEX_RATES_SQL}) r
+        WHERE r.index_name = 'IPCA'
+          AND r.ref_date >= ?
+          AND r.ref_date <= ?
+        ORDER BY r.ref_date
         """,
-        (fetch_from.isoformat(), date_to.isoformat()),
+        (scope_id, scope_id, fetch_from.isoformat(), date_to.isoformat()),
     ).fetchall()
     out: dict[str, Decimal] = {}
     for r in rows:
@@ -231,6 +283,168 @@ def _load_monthly_ipca_map(conn, date_from: _date, date_to: _date) -> dict[str,
     return out
 
 
+class _IndexFactorSeries:
+    """Fatores diários de um índice para um par (multiplicador, spread), com produtos acumulados."""
+
+    def __init__(self, dates: list[_date], base_rates: list[Decimal], pct_multiplier: Decimal, spread_daily_rate: Decimal):
+        self.dates = dates
+        self.prefix = [Decimal("1")]
+        for base_rate in base_rates:
+            eff_rate = _q_rate((base_rate * pct_multiplier) + spread_daily_rate)
+            self.prefix.append(self.prefix[-1] * _factor_from_rate(eff_rate))
+
+    def accrue(self, date_from: _date, date_to: _date) -> tuple[Decimal, int, _date | None]:
+        i = bisect_left(self.dates, date_from)
+        j = bisect_right(self.dates, date_to)
+        if i >= j:
+            return Decimal("1"), 0, None
+        factor = self.prefix[j] if i == 0 else self.prefix[j] / self.prefix[i]
+        return factor, j - i, self.dates[j - 1]
+
+
+class _IndexFactorCache:
+    def __init__(self):
+        self.created_at = time.monotonic()
+        self.generation = rates_generation()
+        self._lock = threading.Lock()
+        # (escopo, índice) -> (início, fim, datas, taxas diárias base)
+        self._windows: dict[tuple[Any, str], tuple[_date, _date, list[_date], list[Decimal]]] = {}
+        self._series: dict[tuple[Any, str, Decimal, Decimal], _IndexFactorSeries] = {}
+        # escopo -> (início, fim, IPCA mensal por "AAAA-MM")
+        self._ipca: dict[Any, tuple[_date, _date, dict[str, Decimal]]] = {}
+
+    def is_fresh(self) -> bool:
+        return self.generation == rates_generation() and (time.monotonic() - self.created_at) < INDEX_CACHE_TTL_S
+
+    def series(
+        self,
+        conn,
+        scope_id: int | None,
+        index_name: str,
+        date_from: _date,
+        date_to: _date,
+        pct_multiplier: Decimal,
+        spread_daily_rate: Decimal,
+    ) -> _IndexFactorSeries:
+        with self._lock:
+            window = self._window(conn, scope_id, index_name, date_from, date_to)
+            series_key = (scope_id, index_name, pct_multiplier, spread_daily_rate)
+            series = self._series.get(series_key)
+            if series is None:
+                series = _IndexFactorSeries(window[2], window[3], pct_multiplier, spread_daily_rate)
+                self._series[series_key] = series
+            return series
+
+    def prime(self, conn, scope_id: int | None, index_name: str, date_from: _date, date_to: _date) -> None:
+        """Carrega de uma vez a janela que cobre todos os ativos do lote."""
+        with self._lock:
+            if index_name == "IPCA":
+                self._ipca_window(conn, scope_id, date_from, date_to)
+            else:
+                self._window(conn, scope_id, index_name, date_from, date_to)
+
+    def export_windows(self) -> dict[str, dict]:
+        """Janelas já carregadas, em estruturas puras (picklable) para os workers do pool."""
+        with self._lock:
+            return {"daily": dict(self._windows), "ipca": dict(self._ipca)}
+
+    @classmethod
+    def from_windows(cls, windows: dict[str, dict]) -> "_IndexFactorCache":
+        cache = cls()
+        cache._windows.update(windows.get("daily") or {})
+        cache._ipca.update(windows.get("ipca") or {})
+        return cache
+
+    def ipca_map(self, conn, scope_id: int | None, date_from: _date, date_to: _date) -> dict[str, Decimal]:
+        with self._lock:
+            return self._ipca_window(conn, scope_id, date_from, date_to)
+
+    def _window(self, conn, scope_id, index_name: str, date_from: _date, date_to: _date):
+        key = (scope_id, index_name)
+        window = self._windows.get(key)
+        if window is None or date_from < window[0] or date_to > window[1]:
+            start = min(date_from, window[0]) if window else date_from
+            end = max(date_to, window[1]) if window else date_to
+            idx_map = _load_daily_index_map(conn, index_name, start, end, scope_id)
+            dates = sorted(idx_map.keys())
+            window = (start, end, dates, [_daily_rate_from_index_value(idx_map[d]) for d in dates])
+            self._windows[key] = window
+            self._series = {k: v for k, v in self._series.items() if k[:2] != key}
+        return window
+
+    def _ipca_window(self, conn, scope_id, date_from: _date, date_to: _date) -> dict[str, Decimal]:
+        window = self._ipca.get(scope_id)
+        if window is None or date_from < window[0] or date_to > window[1]:
+            start = min(date_from, window[0]) if window else date_from
+            end = max(date_to, window[1]) if window else date_to
+            window = (start, end, _load_monthly_ipca_map(conn, start, end, scope_id))
+            self._ipca[scope_id] = window
+        return window[2]
+
+
+_INDEX_RUN_CACHE: ContextVar[_IndexFactorCache | None] = ContextVar("invest_rentability_index_run_cache", default=None)
+_PROCESS_INDEX_CACHE: _IndexFactorCache | None = None
+_PROCESS_INDEX_CACHE_LOCK = threading.Lock()
+
+
+@contextmanager
+def index_factor_cache():
+    """Compartilha os fatores diários entre todos os ativos simulados dentro do bloco."""
+    if _INDEX_RUN_CACHE.get() is not None:
+        yield
+        return
+    token = _INDEX_RUN_CACHE.set(_IndexFactorCache())
+    try:
+        yield
+    finally:
+        _INDEX_RUN_CACHE.reset(token)
+
+
+def _index_cache() -> _IndexFactorCache:
+    global _PROCESS_INDEX_CACHE
+    run_cache = _INDEX_RUN_CACHE.get()
+    if run_cache is not None:
+        return run_cache
+    if INDEX_CACHE_TTL_S <= 0:
+        return _IndexFactorCache()
+    with _PROCESS_INDEX_CACHE_LOCK:
+        if _PROCESS_INDEX_CACHE is None or not _PROCESS_INDEX_CACHE.is_fresh():
+            _PROCESS_INDEX_CACHE = _IndexFactorCache()
+        return _PROCESS_INDEX_CACHE
+
+
+def invalidate_index_factor_cache() -> None:
+    global _PROCESS_INDEX_CACHE
+    with _PROCESS_INDEX_CACHE_LOCK:
+        _PROCESS_INDEX_CACHE = None
+
+
+_SIMULATION_POOL: ProcessPoolExecutor | None = None
+_SIMULATION_POOL_WORKERS = 0
+_SIMULATION_POOL_LOCK = threading.Lock()
+
+
+def _simulation_pool(workers: int) -> ProcessPoolExecutor:
+    global _SIMULATION_POOL, _SIMULATION_POOL_WORKERS
+    with _SIMULATION_POOL_LOCK:
+        if _SIMULATION_POOL is None or _SIMULATION_POOL_WORKERS != workers:
+            if _SIMULATION_POOL is not None:
+                _SIMULATION_POOL.shutdown(wait=False, cancel_futures=True)
+            _SIMULATION_POOL = ProcessPoolExecutor(max_workers=workers)
+            _SIMULATION_POOL_WORKERS = workers
+        return _SIMULATION_POOL
+
+
+def shutdown_simulation_pool() -> None:
+    global _SIMULATION_POOL, _SIMULATION_POOL_WORKERS
+    with _SIMULATION_POOL_LOCK:
+        pool = _SIMULATION_POOL
+        _SIMULATION_POOL = None
+        _SIMULATION_POOL_WORKERS = 0
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
 def _norm_rentability_type(value: str | None) -> str:
     raw = _norm_text(value)
     mapping = {
@@ -281,6 +495,7 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
 
     base_date = _resolve_base_date(conn, asset)
     last_update = _optional_date(asset.get("last_update")) or base_date
+    scope_id = asset.get("workspace_id", asset.get("user_id"))
     start_date = last_update + timedelta(days=1)
     if start_date > as_of:
         return {"ok": True, "updated": False, "reason": "already_up_to_date", "current_value": float(base_value), "last_update": last_update.isoformat()}
@@ -309,12 +524,12 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
             return {"ok": False, "updated": False, "reason": "missing_fixed_rate"}
         daily_rate = _annual_pct_to_daily_rate(fixed_rate)
         factor = _factor_from_rate(daily_rate)
-        for d in _iter_days(start_date, as_of):
-            if not _is_business_day(d):
-                continue
-            current *= factor
-            processed_days += 1
-            effective_last_date = d
+        # Mesmo fator quantizado por dia útil: factor ** n substitui o laço dia a dia.
+        business_days = _count_business_days(start_date, as_of)
+        if business_days:
+            current *= factor ** business_days
+            processed_days = business_days
+            effective_last_date = _last_business_day(start_date, as_of) or last_update
 
     elif rent_type in {"PCT_CDI", "PCT_SELIC"}:
         idx_name = _norm_index_name(asset.get("index_name") or ("CDI" if rent_type == "PCT_CDI" else "SELIC"))
@@ -325,9 +540,9 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
         spread_rate = _to_decimal(asset.get("spread_rate"), Decimal("0")) or Decimal("0")
         spread_daily_rate = _annual_pct_to_daily_rate(spread_rate) if spread_rate != 0 else Decimal("0")
 
-        idx_map = _load_daily_index_map(conn, idx_name, start_date, as_of)
-        applicable_dates = sorted([d for d in idx_map.keys() if d >= start_date and d <= as_of])
-        if not applicable_dates:
+        series = _index_cache().series(conn, scope_id, idx_name, start_date, as_of, pct_multiplier, spread_daily_rate)
+        factor, steps, last_index_date = series.accrue(start_date, as_of)
+        if not steps:
             return {
                 "ok": True,
                 "updated": False,
@@ -337,12 +552,9 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
                 "rentability_type": rent_type,
                 "processed_steps": 0,
             }
-        for d in applicable_dates:
-            base_rate = _daily_rate_from_index_value(idx_map[d])
-            eff_rate = _q_rate((base_rate * pct_multiplier) + spread_daily_rate)
-            current *= _factor_from_rate(eff_rate)
-            processed_days += 1
-            effective_last_date = d
+        current *= factor
+        processed_days = steps
+        effective_last_date = last_index_date
 
     elif rent_type in {"CDI_SPREAD", "SELIC_SPREAD"}:
         idx_name = _norm_index_name(asset.get("index_name") or ("CDI" if rent_type == "CDI_SPREAD" else "SELIC"))
@@ -351,9 +563,9 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
             return {"ok": False, "updated": False, "reason": "missing_spread_rate"}
         spread_daily_rate = _annual_pct_to_daily_rate(spread_rate)
 
-        idx_map = _load_daily_index_map(conn, idx_name, start_date, as_of)
-        applicable_dates = sorted([d for d in idx_map.keys() if d >= start_date and d <= as_of])
-        if not applicable_dates:
+        series = _index_cache().series(conn, scope_id, idx_name, start_date, as_of, Decimal("1"), spread_daily_rate)
+        factor, steps, last_index_date = series.accrue(start_date, as_of)
+        if not steps:
             return {
                 "ok": True,
                 "updated": False,
@@ -363,12 +575,9 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
                 "rentability_type": rent_type,
                 "processed_steps": 0,
             }
-        for d in applicable_dates:
-            base_rate = _daily_rate_from_index_value(idx_map[d])
-            eff_rate = _q_rate(base_rate + spread_daily_rate)
-            current *= _factor_from_rate(eff_rate)
-            processed_days += 1
-            effective_last_date = d
+        current *= factor
+        processed_days = steps
+        effective_last_date = last_index_date
 
     elif rent_type == "IPCA_SPREAD":
         spread_rate = _to_decimal(asset.get("spread_rate"))
@@ -376,7 +585,7 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
             return {"ok": False, "updated": False, "reason": "missing_spread_rate"}
         spread_daily_rate = _annual_pct_to_daily_rate(spread_rate)
         spread_factor = _factor_from_rate(spread_daily_rate)
-        ipca_map = _load_monthly_ipca_map(conn, start_date, as_of)
+        ipca_map = _index_cache().ipca_map(conn, scope_id, start_date, as_of)
 
         for d in _iter_days(start_date, as_of):
             if _is_month_end(d):
@@ -417,6 +626,85 @@ def _simulate_asset_value(conn, asset: dict[str, Any], as_of: _date) -> dict[str
     }
 
 
+def _asset_update_result(asset_id: int, sim: dict[str, Any]) -> dict[str, Any]:
+    if not sim.get("ok", False):
+        return {"ok": False, "asset_id": int(asset_id), "updated": False, "reason": sim.get("reason", "calc_error")}
+    if not sim.get("updated", False):
+        out = {
+            "ok": True,
+            "asset_id": int(asset_id),
+            "updated": False,
+            "reason": sim.get("reason", "no_change"),
+        }
+        if sim.get("last_update") is not None:
+            out["last_update"] = sim.get("last_update")
+        return out
+    return {
+        "ok": True,
+        "asset_id": int(asset_id),
+        "updated": True,
+        "rentability_type": sim.get("rentability_type"),
+        "processed_steps": int(sim.get("processed_steps", 0)),
+        "current_value": float(sim["current_value"]),
+        "last_update": sim.get("last_update"),
+    }
+
+
+def _asset_index_windows(conn, asset: dict[str, Any], as_of: _date) -> list[tuple[str, _date]]:
+    """Índices (e data inicial) que a simulação do ativo vai ler; usado para pré-carregar o lote."""
+    rent_type = _norm_rentability_type(asset.get("rentability_type") or "MANUAL")
+    if rent_type in {"PCT_CDI", "PCT_SELIC", "CDI_SPREAD", "SELIC_SPREAD"}:
+        default = "CDI" if rent_type.startswith(("PCT_CDI", "CDI")) else "SELIC"
+        index_name = _norm_index_name(asset.get("index_name") or default)
+    elif rent_type == "IPCA_SPREAD":
+        index_name = "IPCA"
+    else:
+        return []
+    last_update = _optional_date(asset.get("last_update")) or _resolve_base_date(conn, asset)
+    start_date = last_update + timedelta(days=1)
+    return [(index_name, start_date)] if start_date <= as_of else []
+
+
+def _simulate_chunk(windows: dict[str, dict], assets: list[dict[str, Any]], as_of: _date) -> list[dict[str, Any]]:
+    """Executado no worker: sem banco, só com os ativos e as janelas de índice enviadas pelo pai."""
+    getcontext().prec = 40
+    token = _INDEX_RUN_CACHE.set(_IndexFactorCache.from_windows(windows))
+    try:
+        return [_simulate_asset_value(None, asset, as_of) for asset in assets]
+    finally:
+        _INDEX_RUN_CACHE.reset(token)
+
+
+def _simulate_assets(conn, assets: list[dict[str, Any]], as_of: _date, process_workers: int | None = None) -> list[dict[str, Any]]:
+    """Simula o lote (dentro de index_factor_cache) com os índices pré-carregados; opcionalmente em processos."""
+    windows: dict[tuple[Any, str], _date] = {}
+    for asset in assets:
+        scope_id = asset.get("workspace_id", asset.get("user_id"))
+        for index_name, start_date in _asset_index_windows(conn, asset, as_of):
+            key = (scope_id, index_name)
+            windows[key] = min(start_date, windows.get(key, start_date))
+    cache = _index_cache()
+    for (scope_id, index_name), start_date in windows.items():
+        cache.prime(conn, scope_id, index_name, start_date, as_of)
+
+    workers = SIMULATION_PROCESS_WORKERS if process_workers is None else max(0, int(process_workers))
+    if workers > 1 and len(assets) >= SIMULATION_PROCESS_MIN_ASSETS:
+        payload = cache.export_windows()
+        chunk_size = max(1, math.ceil(len(assets) / (workers * 4)))
+        try:
+            pool = _simulation_pool(workers)
+            futures = [
+                pool.submit(_simulate_chunk, payload, assets[i : i + chunk_size], as_of)
+                for i in range(0, len(assets), chunk_size)
+            ]
+            return [sim for future in futures for sim in future.result()]
+        except (BrokenProcessPool, OSError) as exc:
+            logger.warning("Pool de simulação indisponível (%s); seguindo em modo serial.", exc)
+            shutdown_simulation_pool()
+
+    return [_simulate_asset_value(conn, asset, as_of) for asset in assets]
+
+
 def update_investment_value(asset_id: int, as_of_date: str | None = None, user_id: int | None = None) -> dict[str, Any]:
     uid = _uid(user_id)
     as_of = _parse_date(as_of_date, "as_of_date") if as_of_date else _date.today()
@@ -437,36 +725,38 @@ def update_investment_value(asset_id: int, as_of_date: str | None = None, user_i
 
         asset = dict(row)
         sim = _simulate_asset_value(conn, asset, as_of)
-        if not sim.get("ok", False):
-            return {"ok": False, "asset_id": int(asset_id), "updated": False, "reason": sim.get("reason", "calc_error")}
-        if not sim.get("updated", False):
-            out = {
-                "ok": True,
-                "asset_id": int(asset_id),
-                "updated": False,
-                "reason": sim.get("reason", "no_change"),
-            }
-            if sim.get("last_update") is not None:
-                out["last_update"] = sim.get("last_update")
-            return out
+        if sim.get("ok", False) and sim.get("updated", False):
+            _exec(conn, 
+                """
+                UPDATE assets
+                SET current_value = ?, last_update = ?
+                WHERE id = ? AND user_id = ?
+                """,
+                (float(sim["current_value"]), sim.get("last_update"), int(asset_id), uid),
+            )
+        return _asset_update_result(int(asset_id), sim)
 
-        _exec(conn, 
-            """
-            UPDATE assets
-            SET current_value = ?, last_update = ?
-            WHERE id = ? AND user_id = ?
-            """,
-            (float(sim["current_value"]), sim.get("last_update"), int(asset_id), uid),
-        )
-        return {
-            "ok": True,
-            "asset_id": int(asset_id),
-            "updated": True,
-            "rentability_type": sim.get("rentability_type"),
-            "processed_steps": int(sim.get("processed_steps", 0)),
-            "current_value": float(sim["current_value"]),
-            "last_update": sim.get("last_update"),
-        }
+
+# Ativos de renda fixa do escopo com a data da primeira compra, para simular o lote sem consultas por ativo.
+_FIXED_INCOME_ASSETS_SQL = """
+    SELECT
+        a.id, a.symbol, a.name, a.user_id, a.created_at, a.asset_class, a.rentability_type, a.index_name,
+        a.index_pct, a.spread_rate, a.fixed_rate, a.principal_amount, a.current_value, a.last_update,
+        (
+            SELECT MIN(t.date)
+            FROM trades t
+            WHERE t.asset_id = a.id
+              AND COALESCE(t.user_id, 0) = COALESCE(a.user_id, 0)
+              AND UPPER(COALESCE(t.side, '')) = 'BUY'
+        ) AS min_buy_date
+    FROM assets a
+    WHERE a.user_id = ?
+      AND (
+        LOWER(REPLACE(COALESCE(a.asset_class, ''), '_', ' ')) IN ('renda fixa', 'tesouro direto', 'coe', 'fundos')
+        OR UPPER(COALESCE(a.asset_class, '')) IN ('RENDA_FIXA', 'TESOURO_DIRETO', 'COE', 'FUNDOS')
+      )
+    ORDER BY a.id
+"""
 
 
 def update_fixed_income_assets(
@@ -476,29 +766,27 @@ def update_fixed_income_assets(
     reset_from_principal: bool = False,
     asset_ids: list[int] | None = None,
     exclude_asset_ids: list[int] | None = None,
+    process_workers: int | None = None,
 ) -> dict[str, Any]:
     uid = _uid(user_id)
     as_of = _parse_date(as_of_date, "as_of_date") if as_of_date else _date.today()
 
-    with get_conn() as conn:
+    results: list[dict[str, Any]] = []
+    updated = 0
+    skipped = 0
+    errors = 0
+    selected_assets: list[dict[str, Any]] = []
+    filter_ids = {int(x) for x in (asset_ids or []) if int(x) > 0}
+    excluded_ids = {int(x) for x in (exclude_asset_ids or []) if int(x) > 0}
+
+    # Uma conexão/transação para o lote: ativos e primeira compra num SELECT, índices pré-carregados,
+    # simulação em memória e um único executemany com os valores novos.
+    with get_conn() as conn, index_factor_cache():
         rows = _exec(conn, 
-            """
-            SELECT
-                id, user_id, created_at, asset_class, rentability_type, principal_amount
-            FROM assets
-            WHERE user_id = ?
-              AND (
-                LOWER(REPLACE(COALESCE(asset_class, ''), '_', ' ')) IN ('renda fixa', 'tesouro direto', 'coe', 'fundos')
-                OR UPPER(COALESCE(asset_class, '')) IN ('RENDA_FIXA', 'TESOURO_DIRETO', 'COE', 'FUNDOS')
-              )
-            ORDER BY id
-            """,
+            _FIXED_INCOME_ASSETS_SQL,
             (uid,),
         ).fetchall()
 
-        selected_assets: list[dict[str, Any]] = []
-        filter_ids = {int(x) for x in (asset_ids or []) if int(x) > 0}
-        excluded_ids = {int(x) for x in (exclude_asset_ids or []) if int(x) > 0}
         for row in rows:
             item = dict(row)
             if filter_ids and int(item["id"]) not in filter_ids:
@@ -509,35 +797,39 @@ def update_fixed_income_assets(
                 continue
             selected_assets.append(item)
 
+        writes: dict[int, tuple[float, str | None]] = {}
         if reset_from_principal:
             for asset in selected_assets:
                 principal = _to_decimal(asset.get("principal_amount"))
                 if principal is None:
                     continue
-                base_date = _resolve_base_date(conn, asset)
-                _exec(conn, 
-                    """
-                    UPDATE assets
-                    SET current_value = ?, last_update = ?
-                    WHERE id = ? AND user_id = ?
-                    """,
-                    (float(principal.quantize(_CURRENT_Q, rounding=ROUND_HALF_UP)), base_date.isoformat(), int(asset["id"]), uid),
-                )
-
-    results: list[dict[str, Any]] = []
-    updated = 0
-    skipped = 0
-    errors = 0
-
-    for asset in selected_assets:
-        res = update_investment_value(int(asset["id"]), as_of_date=as_of.isoformat(), user_id=uid)
-        results.append(res)
-        if not res.get("ok", False):
-            errors += 1
-        elif res.get("updated", False):
-            updated += 1
-        else:
-            skipped += 1
+                reset_value = float(principal.quantize(_CURRENT_Q, rounding=ROUND_HALF_UP))
+                reset_date = _resolve_base_date(conn, asset).isoformat()
+                asset["current_value"] = reset_value
+                asset["last_update"] = reset_date
+                writes[int(asset["id"])] = (reset_value, reset_date)
+
+        sims = _simulate_assets(conn, selected_assets, as_of, process_workers)
+        for asset, sim in zip(selected_assets, sims):
+            res = _asset_update_result(int(asset["id"]), sim)
+            results.append(res)
+            if not res.get("ok", False):
+                errors += 1
+            elif res.get("updated", False):
+                updated += 1
+                writes[int(asset["id"])] = (float(sim["current_value"]), sim.get("last_update"))
+            else:
+                skipped += 1
+
+        if writes:
+            _executemany(conn, 
+                """
+                UPDATE assets
+                SET current_value = ?, last_update = ?
+                WHERE id = ? AND user_id = ?
+                """,
+                [(value, last_update, asset_id, uid) for asset_id, (value, last_update) in writes.items()],
+            )
 
     return {
         "ok": True,
@@ -559,37 +851,22 @@ def preview_divergence_report(
     only_auto: bool = True,
     threshold_pct: float = 0.0,
     limit: int = 200,
+    process_workers: int | None = None,
 ) -> dict[str, Any]:
     uid = _uid(user_id)
     as_of = _parse_date(as_of_date, "as_of_date") if as_of_date else _date.today()
     threshold = abs(float(threshold_pct or 0.0))
     max_rows = max(1, int(limit or 200))
 
-    with get_conn() as conn:
-        rows = _exec(conn, 
-            """
-            SELECT
-                id, symbol, name, user_id, created_at, asset_class, rentability_type, index_name,
-                index_pct, spread_rate, fixed_rate, principal_amount, current_value, last_update
-            FROM assets
-            WHERE user_id = ?
-              AND (
-                LOWER(REPLACE(COALESCE(asset_class, ''), '_', ' ')) IN ('renda fixa', 'tesouro direto', 'coe', 'fundos')
-                OR UPPER(COALESCE(asset_class, '')) IN ('RENDA_FIXA', 'TESOURO_DIRETO', 'COE', 'FUNDOS')
-              )
-            ORDER BY id
-            """,
-            (uid,),
-        ).fetchall()
+    with get_conn() as conn, index_factor_cache():
+        rows = _exec(conn, _FIXED_INCOME_ASSETS_SQL, (uid,)).fetchall()
+        assets = [dict(row) for row in rows]
+        if only_auto:
+            assets = [a for a in assets if _is_auto_rentability_type(a.get("rentability_type"))]
 
         report_rows: list[dict[str, Any]] = []
-        for row in rows:
-            asset = dict(row)
-            if only_auto and not _is_auto_rentability_type(asset.get("rentability_type")):
-                continue
-
+        for asset, sim in zip(assets, _simulate_assets(conn, assets, as_of, process_workers)):
             stored = _to_decimal(asset.get("current_value"))
-            sim = _simulate_asset_value(conn, asset, as_of)
             if not sim.get("ok", False):
                 report_rows.append(
                     {
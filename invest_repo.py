@@ -1,8 +1,8 @@
-﻿from db import get_conn
+﻿from db import get_conn, resolve_user_workspace_id, stream_rows
 from tenant import get_current_user_id, get_current_workspace_id
-import re
 from contextvars import ContextVar
 from datetime import datetime
+import repo
 
 ASSET_CLASSES = {
     "Ações BR": "ACAO_BR",
@@ -60,52 +60,27 @@ def _uid(user_id: int | None = None) -> int:
         return int(wid)
 
     uid = int(user_id) if user_id is not None else int(get_current_user_id())
-    conn = get_conn()
-    try:
-        row = _exec(conn, 
-            """
-            SELECT wu.workspace_id
-            FROM workspace_users wu
-            JOIN workspaces w ON w.id = wu.workspace_id
-            WHERE wu.user_id = ?
-            ORDER BY
-                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
-                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
-                wu.workspace_id
-            LIMIT 1
-            """,
-            (uid,),
-            rewrite_scope=False,
-        ).fetchone()
-    except Exception:
-        row = None
-    finally:
-        conn.close()
-
-    if not row:
+    workspace_id = resolve_user_workspace_id(uid)
+    if workspace_id is None:
         _USE_WORKSPACE_SCOPE.set(False)
         return uid
     _USE_WORKSPACE_SCOPE.set(True)
-    try:
-        return int(row["workspace_id"])
-    except Exception:
-        return int(row[0])
+    return int(workspace_id)
 
 
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+    use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
+    return conn.execute(query, tuple(params or ()), workspace_scope=use_workspace)
 
 
-def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+def _executemany(conn, query: str, seq_of_params: list, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    return conn.execute(q, tuple(params or ()))
+    return conn.executemany(query, seq_of_params, workspace_scope=use_workspace)
 
 
 def _cur_exec(cur, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    cur.execute(q, tuple(params or ()))
+    cur.execute(query, tuple(params or ()), workspace_scope=use_workspace)
     return cur
 
 
@@ -264,6 +239,73 @@ def insert_trade(
     conn.close()
 
 
+def bulk_insert_trades(rows: list[dict], user_id: int | None = None, conn=None, refresh_rollup: bool = True) -> int:
+    """Grava operações e os lançamentos de caixa na corretora numa única transação.
+
+    Cada linha traz os campos de trades e o lançamento em `cash` (account_id, amount,
+    description, category_id). Com `conn`, roda na transação de quem chamou (sem commit);
+    refresh_rollup=False deixa o monthly_rollup para quem grava em vários lotes."""
+    if not rows:
+        return 0
+    uid = _uid(user_id)
+    own = conn is None
+    c = get_conn() if own else conn
+    try:
+        _executemany(
+            c,
+            """
+            INSERT INTO transactions(date, description, amount_brl, account_id, category_id, method, notes, user_id)
+            VALUES (?, ?, ?, ?, ?, 'INV', ?, ?)
+            """,
+            [
+                (
+                    str(r["date"]),
+                    r["cash"]["description"],
+                    float(r["cash"]["amount"]),
+                    int(r["cash"]["account_id"]),
+                    int(r["cash"]["category_id"]) if r["cash"].get("category_id") else None,
+                    r.get("note"),
+                    uid,
+                )
+                for r in rows
+            ],
+        )
+        _executemany(
+            c,
+            """
+            INSERT INTO trades(asset_id, date, side, quantity, price, exchange_rate, fees, taxes, note, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    int(r["asset_id"]),
+                    str(r["date"]),
+                    r["side"],
+                    float(r["quantity"]),
+                    float(r["price"]),
+                    float(r.get("exchange_rate") or 1.0),
+                    float(r.get("fees") or 0.0),
+                    float(r.get("taxes") or 0.0),
+                    r.get("note"),
+                    uid,
+                )
+                for r in rows
+            ],
+        )
+        if refresh_rollup:
+            repo.refresh_monthly_rollup([r["date"] for r in rows], user_id=user_id, conn=c)
+        if own:
+            c.commit()
+    except Exception:
+        if own:
+            c.rollback()
+        raise
+    finally:
+        if own:
+            c.close()
+    return len(rows)
+
+
 def list_trades(asset_id=None, date_from=None, date_to=None, user_id: int | None = None):
     uid = _uid(user_id)
     conn = get_conn()
@@ -290,6 +332,31 @@ def list_trades(asset_id=None, date_from=None, date_to=None, user_id: int | None
     return rows
 
 
+def _stream_period(q: str, params: list, alias: str, date_from=None, date_to=None, chunk_size: int | None = None):
+    # Escopo já resolvido por _uid na chamada; o iterador pode rodar em outra thread.
+    if date_from:
+        q += f" AND {alias}.date >= ?"
+        params.append(date_from)
+    if date_to:
+        q += f" AND {alias}.date <= ?"
+        params.append(date_to)
+    q += f" ORDER BY {alias}.date ASC, {alias}.id ASC"
+    return (dict(r) for r in stream_rows(q, params, workspace_scope=_USE_WORKSPACE_SCOPE.get(), chunk_size=chunk_size))
+
+
+def stream_trades(date_from=None, date_to=None, user_id: int | None = None, chunk_size: int | None = None):
+    """Histórico completo de negociações em ordem cronológica, lido em blocos (exportação)."""
+    uid = _uid(user_id)
+    q = """
+        SELECT t.id, t.date, a.symbol, a.asset_class, t.side, t.quantity, t.price, t.fees, t.taxes,
+               t.exchange_rate, t.note, t.asset_id
+        FROM trades t
+        JOIN assets a ON a.id = t.asset_id AND a.user_id = t.user_id
+        WHERE t.user_id = ?
+    """
+    return _stream_period(q, [uid], "t", date_from, date_to, chunk_size)
+
+
 def delete_trade(trade_id: int, user_id: int | None = None):
     uid = _uid(user_id)
     conn = get_conn()
@@ -490,12 +557,14 @@ def delete_trade_with_cash_reversal(trade_id: int, user_id: int | None = None) -
                 ),
             )
             _exec(conn, "DELETE FROM trades WHERE id = ? AND user_id = ?", (int(trade_id), uid))
+            repo.refresh_monthly_rollup([trade["date"]], user_id=user_id, conn=conn)
             conn.commit()
             return True, "Operação excluída e saldo da corretora ajustado por lançamento compensatório."
 
         _reverse_fixed_income_asset_totals_after_trade_delete(conn, trade, uid)
         _exec(conn, "DELETE FROM transactions WHERE id = ? AND user_id = ?", (chosen_tx_id, uid))
         _exec(conn, "DELETE FROM trades WHERE id = ? AND user_id = ?", (int(trade_id), uid))
+        repo.refresh_monthly_rollup([trade["date"]], user_id=user_id, conn=conn)
         conn.commit()
         return True, "Operação excluída e saldo da corretora ajustado."
     except Exception as e:
@@ -522,6 +591,32 @@ def upsert_price(asset_id: int, date: str, price: float, source: str | None = No
     conn.close()
 
 
+def upsert_prices_bulk(rows: list[dict]) -> int:
+    """
+    Grava cotações de vários workspaces numa única transação (job de cotações).
+    rows: [{workspace_id, asset_id, date, price, source}]
+    """
+    params = [
+        (int(r["asset_id"]), str(r["date"]), float(r["price"]), r.get("source"), int(r["workspace_id"]))
+        for r in (rows or [])
+    ]
+    if not params:
+        return 0
+    with get_conn() as conn:
+        _executemany(conn, 
+            """
+            INSERT INTO prices(asset_id, date, price, source, user_id)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(asset_id, date) DO UPDATE SET
+                price=excluded.price,
+                source=excluded.source
+            """,
+            params,
+            rewrite_scope=True,
+        )
+    return len(params)
+
+
 def upsert_asset_snapshot(asset_id: int, px_date: str, price: float, source: str | None = None, user_id: int | None = None):
     uid = _uid(user_id)
     conn = get_conn()
@@ -591,6 +686,18 @@ def list_prices(asset_id: int | None = None, limit: int = 200, user_id: int | No
     return rows
 
 
+def stream_prices(date_from=None, date_to=None, user_id: int | None = None, chunk_size: int | None = None):
+    """Histórico de cotações (não só a última) em ordem cronológica, lido em blocos (exportação)."""
+    uid = _uid(user_id)
+    q = """
+        SELECT p.id, p.date, a.symbol, a.asset_class, p.price, p.source, p.asset_id
+        FROM prices p
+        JOIN assets a ON a.id = p.asset_id AND a.user_id = p.user_id
+        WHERE p.user_id = ?
+    """
+    return _stream_period(q, [uid], "p", date_from, date_to, chunk_size)
+
+
 def upsert_quote_job_status(
     *,
     workspace_id: int,
@@ -721,6 +828,20 @@ def list_income(asset_id=None, date_from=None, date_to=None, user_id: int | None
     return rows
 
 
+def stream_income(date_from=None, date_to=None, user_id: int | None = None, chunk_size: int | None = None):
+    """Proventos em ordem cronológica, lidos em blocos (exportação)."""
+    uid = _uid(user_id)
+    q = """
+        SELECT i.id, i.date, a.symbol, a.asset_class, i.type, i.amount, acc.name AS credit_account_name,
+               i.note, i.asset_id
+        FROM income_events i
+        JOIN assets a ON a.id = i.asset_id AND a.user_id = i.user_id
+        LEFT JOIN accounts acc ON acc.id = i.credit_account_id AND acc.user_id = i.user_id
+        WHERE i.user_id = ?
+    """
+    return _stream_period(q, [uid], "i", date_from, date_to, chunk_size)
+
+
 def delete_income_with_cash_reversal(income_id: int, user_id: int | None = None):
     uid = _uid(user_id)
     conn = get_conn()
@@ -774,6 +895,7 @@ def delete_income_with_cash_reversal(income_id: int, user_id: int | None = None)
 
         if tx_id is not None:
             _exec(conn, "DELETE FROM transactions WHERE id = ? AND user_id = ?", (tx_id, uid))
+            repo.refresh_monthly_rollup([row["date"]], user_id=user_id, conn=conn)
         _exec(conn, "DELETE FROM income_events WHERE id = ? AND user_id = ?", (int(income_id), uid))
         conn.commit()
         return True, "Provento excluído e saldo da conta ajustado."
@@ -1,8 +1,8 @@
+import numpy as np
 import pandas as pd
-import re
 from contextvars import ContextVar
 
-from db import get_conn
+from db import get_conn, resolve_user_workspace_id
 from tenant import get_current_user_id, get_current_workspace_id
 
 _FIXED_INCOME_CLASSES = {"renda_fixa", "tesouro_direto", "coe", "fundos"}
@@ -16,46 +16,18 @@ def _uid(user_id: int | None = None) -> int:
         return int(wid)
 
     uid = int(user_id) if user_id is not None else int(get_current_user_id())
-    conn = get_conn()
-    try:
-        row = conn.execute(
-            """
-            SELECT wu.workspace_id
-            FROM workspace_users wu
-            JOIN workspaces w ON w.id = wu.workspace_id
-            WHERE wu.user_id = ?
-            ORDER BY
-                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
-                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
-                wu.workspace_id
-            LIMIT 1
-            """,
-            (uid,),
-        ).fetchone()
-    except Exception:
-        row = None
-    finally:
-        conn.close()
-
-    if not row:
+    workspace_id = resolve_user_workspace_id(uid)
+    if workspace_id is None:
         _USE_WORKSPACE_SCOPE.set(False)
         return uid
     _USE_WORKSPACE_SCOPE.set(True)
-    try:
-        return int(row["workspace_id"])
-    except Exception:
-        return int(row[0])
-
-
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+    return int(workspace_id)
 
 
 def _query_df(query: str, params: list | tuple | None = None) -> pd.DataFrame:
     conn = get_conn()
     use_workspace = _USE_WORKSPACE_SCOPE.get()
-    q = _scope_sql(query) if use_workspace else str(query)
-    rows = conn.execute(q, params or ()).fetchall()
+    rows = conn.execute(query, params or (), workspace_scope=use_workspace).fetchall()
     conn.close()
     return pd.DataFrame([dict(r) for r in rows])
 
@@ -174,70 +146,134 @@ def df_latest_asset_snapshots(user_id: int | None = None):
     )
 
 
-def positions_avg_cost(trades_df: pd.DataFrame):
-    if trades_df.empty:
-        return pd.DataFrame(columns=["asset_id", "symbol", "asset_class", "qty", "avg_cost", "cost_basis", "realized_pnl"])
-
-    trades_df = trades_df.sort_values(["date", "id"]).copy()
-    state = {}
-    rows = []
-
-    for _, r in trades_df.iterrows():
-        aid = int(r["asset_id"])
-        sym = r["symbol"]
-        cls = r["asset_class"]
-        side = r["side"]
-        qty = float(r["quantity"])
-        price = float(r["price"])
-        fees = float(r["fees"] or 0.0)
-        taxes = float(r["taxes"] or 0.0)
-        exchange_rate = float(r.get("exchange_rate") or 1.0)
-        is_usd = str(r.get("currency") or "").strip().upper() == "USD"
-        fx = exchange_rate if is_usd and exchange_rate > 0 else 1.0
-        gross_brl = qty * price * fx
-        fees_brl = fees * fx if is_usd else fees
-        taxes_brl = taxes * fx if is_usd else taxes
-        cls_norm = _norm_asset_class(cls)
-        is_fixed_income = cls_norm in _FIXED_INCOME_CLASSES
-
-        if aid not in state:
-            state[aid] = dict(symbol=sym, asset_class=cls, qty=0.0, cost_basis=0.0, realized_pnl=0.0, last_fx=1.0)
-
-        s = state[aid]
-        s["last_fx"] = fx
-        if side == "BUY":
-            s["qty"] += qty
-            buy_cost = (gross_brl + fees_brl) if is_fixed_income else (gross_brl + fees_brl + taxes_brl)
-            s["cost_basis"] += max(0.0, buy_cost)
+def _apply_trade(state: dict, r) -> None:
+    aid = int(r["asset_id"])
+    sym = r["symbol"]
+    cls = r["asset_class"]
+    side = r["side"]
+    qty = float(r["quantity"])
+    price = float(r["price"])
+    fees = float(r["fees"] or 0.0)
+    taxes = float(r["taxes"] or 0.0)
+    exchange_rate = float(r.get("exchange_rate") or 1.0)
+    is_usd = str(r.get("currency") or "").strip().upper() == "USD"
+    fx = exchange_rate if is_usd and exchange_rate > 0 else 1.0
+    gross_brl = qty * price * fx
+    fees_brl = fees * fx if is_usd else fees
+    taxes_brl = taxes * fx if is_usd else taxes
+    cls_norm = _norm_asset_class(cls)
+    is_fixed_income = cls_norm in _FIXED_INCOME_CLASSES
+
+    if aid not in state:
+        state[aid] = dict(symbol=sym, asset_class=cls, qty=0.0, cost_basis=0.0, realized_pnl=0.0, last_fx=1.0)
+
+    s = state[aid]
+    s["last_fx"] = fx
+    if side == "BUY":
+        s["qty"] += qty
+        buy_cost = (gross_brl + fees_brl) if is_fixed_income else (gross_brl + fees_brl + taxes_brl)
+        s["cost_basis"] += max(0.0, buy_cost)
+    else:
+        if s["qty"] <= 0:
+            avg_cost = 0.0
         else:
-            if s["qty"] <= 0:
-                avg_cost = 0.0
-            else:
-                avg_cost = s["cost_basis"] / s["qty"] if s["qty"] != 0 else 0.0
+            avg_cost = s["cost_basis"] / s["qty"] if s["qty"] != 0 else 0.0
 
-            proceeds = gross_brl - fees_brl - taxes_brl
-            cost_removed = avg_cost * qty
-            s["realized_pnl"] += proceeds - cost_removed
-            s["qty"] -= qty
-            s["cost_basis"] -= cost_removed
+        proceeds = gross_brl - fees_brl - taxes_brl
+        cost_removed = avg_cost * qty
+        s["realized_pnl"] += proceeds - cost_removed
+        s["qty"] -= qty
+        s["cost_basis"] -= cost_removed
 
-        state[aid] = s
 
-    for aid, s in state.items():
-        qty = s["qty"]
-        avg_cost = (s["cost_basis"] / qty) if qty else 0.0
-        rows.append(
-            {
-                "asset_id": aid,
-                "symbol": s["symbol"],
-                "asset_class": s["asset_class"],
-                "qty": qty,
-                "avg_cost": avg_cost,
-                "cost_basis": s["cost_basis"],
-                "realized_pnl": s["realized_pnl"],
-                "last_fx": s["last_fx"],
-            }
-        )
+_POSITION_COLUMNS = ["asset_id", "symbol", "asset_class", "qty", "avg_cost", "cost_basis", "realized_pnl"]
+
+
+def _trade_values(trades_df: pd.DataFrame, column: str, default: float) -> np.ndarray:
+    if column not in trades_df.columns:
+        return np.full(len(trades_df), default, dtype=float)
+    col = trades_df[column]
+    if col.dtype == object:
+        # Mesma semântica de `valor or default` de _apply_trade.
+        col = col.map(lambda v: v or default)
+    return col.astype(float).to_numpy()
+
+
+def positions_avg_cost(trades_df: pd.DataFrame):
+    if trades_df.empty:
+        return pd.DataFrame(columns=_POSITION_COLUMNS)
+
+    trades_df = trades_df.sort_values(["date", "id"])
+    asset_ids = trades_df["asset_id"].astype("int64").to_numpy()
+    qty = trades_df["quantity"].astype(float).to_numpy()
+    price = trades_df["price"].astype(float).to_numpy()
+    fees = _trade_values(trades_df, "fees", 0.0)
+    taxes = _trade_values(trades_df, "taxes", 0.0)
+    exchange_rate = _trade_values(trades_df, "exchange_rate", 1.0)
+    if "currency" in trades_df.columns:
+        is_usd = trades_df["currency"].map(lambda v: str(v or "").strip().upper() == "USD").to_numpy(dtype=bool)
+    else:
+        is_usd = np.zeros(len(trades_df), dtype=bool)
+    cls_norm = trades_df["asset_class"].map({v: _norm_asset_class(v) for v in trades_df["asset_class"].unique()})
+    is_fixed_income = cls_norm.isin(_FIXED_INCOME_CLASSES).to_numpy()
+    is_buy = (trades_df["side"] == "BUY").to_numpy()
+
+    fx = np.where(is_usd & (exchange_rate > 0), exchange_rate, 1.0)
+    gross_brl = qty * price * fx
+    fees_brl = np.where(is_usd, fees * fx, fees)
+    taxes_brl = np.where(is_usd, taxes * fx, taxes)
+    buy_cost = np.where(is_fixed_income, gross_brl + fees_brl, gross_brl + fees_brl + taxes_brl)
+    buy_cost = np.where(buy_cost > 0.0, buy_cost, 0.0)
+    proceeds = gross_brl - fees_brl - taxes_brl
+
+    # Agrupa por ativo preservando a ordem cronológica dentro de cada grupo.
+    order = np.argsort(asset_ids, kind="stable")
+    grouped_ids = asset_ids[order]
+    starts = np.flatnonzero(np.r_[True, grouped_ids[1:] != grouped_ids[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    # Saída na ordem da primeira aparição de cada ativo, como no dicionário de estado.
+    segments = sorted(zip(order[starts], starts, ends))
+
+    symbols = trades_df["symbol"].to_numpy()
+    classes = trades_df["asset_class"].to_numpy()
+    rows = {name: [] for name in ["asset_id", "symbol", "asset_class", "qty", "avg_cost", "cost_basis", "realized_pnl", "last_fx"]}
+    for first, start, end in segments:
+        idx = order[start:end]
+        seg_buy = is_buy[idx]
+        sells = np.flatnonzero(~seg_buy)
+        split = int(sells[0]) if len(sells) else len(idx)
+
+        # Até a primeira venda, quantidade e custo são somas acumuladas sequenciais.
+        s_qty = 0.0
+        s_cost = 0.0
+        s_pnl = 0.0
+        if split:
+            s_qty = float(np.cumsum(np.r_[0.0, qty[idx[:split]]])[-1])
+            s_cost = float(np.cumsum(np.r_[0.0, buy_cost[idx[:split]]])[-1])
+
+        # A partir da primeira venda o custo médio depende do estado anterior: laço segmentado.
+        tail = idx[split:]
+        for t_buy, t_qty, t_cost, t_proceeds in zip(
+            seg_buy[split:].tolist(), qty[tail].tolist(), buy_cost[tail].tolist(), proceeds[tail].tolist()
+        ):
+            if t_buy:
+                s_qty += t_qty
+                s_cost += t_cost
+            else:
+                avg_cost = 0.0 if s_qty <= 0 else s_cost / s_qty
+                cost_removed = avg_cost * t_qty
+                s_pnl += t_proceeds - cost_removed
+                s_qty -= t_qty
+                s_cost -= cost_removed
+
+        rows["asset_id"].append(int(asset_ids[first]))
+        rows["symbol"].append(symbols[first])
+        rows["asset_class"].append(classes[first])
+        rows["qty"].append(s_qty)
+        rows["avg_cost"].append((s_cost / s_qty) if s_qty else 0.0)
+        rows["cost_basis"].append(s_cost)
+        rows["realized_pnl"].append(s_pnl)
+        rows["last_fx"].append(float(fx[idx[-1]]))
 
     return pd.DataFrame(rows)
 
@@ -375,29 +411,56 @@ def df_asset_snapshots_upto(up_to_date: str, user_id: int | None = None) -> pd.D
     )
 
 
-def investments_value_timeseries(
+_TIMESERIES_COLUMNS = [
+    "date",
+    "invest_market_value",
+    "invested_amount",
+    "income_amount",
+    "realized_pnl",
+    "unrealized_pnl",
+    "total_return",
+    "return_pct",
+]
+
+
+def df_prices_history(up_to_date: str, user_id: int | None = None) -> pd.DataFrame:
+    uid = _uid(user_id)
+    return _query_df(
+        """
+        SELECT asset_id, date AS price_date, price
+        FROM prices
+        WHERE user_id = ? AND date <= ?
+        ORDER BY date ASC, asset_id ASC
+        """,
+        [uid, up_to_date],
+    )
+
+
+def df_asset_snapshots_history(up_to_date: str, user_id: int | None = None) -> pd.DataFrame:
+    uid = _uid(user_id)
+    return _query_df(
+        """
+        SELECT asset_id, px_date AS snapshot_date, price AS snapshot_price
+        FROM asset_prices
+        WHERE user_id = ? AND px_date <= ?
+        ORDER BY px_date ASC, asset_id ASC
+        """,
+        [uid, up_to_date],
+    )
+
+
+def _timeseries_inputs(
     date_from: str,
     date_to: str,
-    asset_class: str | None = None,
-    user_id: int | None = None,
-) -> pd.DataFrame:
+    asset_class: str | None,
+    user_id: int | None,
+):
     tdf = df_trades(None, date_to, user_id=user_id)
     if asset_class:
         selected = str(asset_class).strip()
         tdf = tdf[tdf["asset_class"].astype(str) == selected].copy() if not tdf.empty else tdf
     if tdf.empty:
-        return pd.DataFrame(
-            columns=[
-                "date",
-                "invest_market_value",
-                "invested_amount",
-                "income_amount",
-                "realized_pnl",
-                "unrealized_pnl",
-                "total_return",
-                "return_pct",
-            ]
-        )
+        return None
 
     tdf = tdf.copy()
     tdf["date"] = pd.to_datetime(tdf["date"])
@@ -411,72 +474,107 @@ def investments_value_timeseries(
     incomes_df = df_income(None, date_to, user_id=user_id)
     if asset_class and not incomes_df.empty:
         incomes_df = incomes_df[incomes_df["asset_class"].astype(str) == selected].copy()
+    return tdf, dates, assets, incomes_df
+
+
+def _num_or_zero(value) -> float:
+    num = pd.to_numeric(value, errors="coerce")
+    return 0.0 if pd.isna(num) else float(num)
+
+
+def investments_value_timeseries(
+    date_from: str,
+    date_to: str,
+    asset_class: str | None = None,
+    user_id: int | None = None,
+) -> pd.DataFrame:
+    inputs = _timeseries_inputs(date_from, date_to, asset_class, user_id)
+    if inputs is None:
+        return pd.DataFrame(columns=_TIMESERIES_COLUMNS)
+    tdf, dates, assets, incomes_df = inputs
+    if len(dates) == 0:
+        return pd.DataFrame([])
+
+    # Uma única passada ordenada: trades, cotações, ajustes manuais e proventos
+    # avançam por ponteiros e o estado das posições é carregado de um dia para o outro.
+    last_day = dates[-1].strftime("%Y-%m-%d")
+    trades = tdf.sort_values(["date", "id"]).to_dict(orient="records")
+    prices = df_prices_history(last_day, user_id=user_id)
+    price_rows = [] if prices.empty else list(
+        zip(prices["price_date"].astype(str), prices["asset_id"].astype(int), prices["price"])
+    )
+    snapshots = df_asset_snapshots_history(last_day, user_id=user_id)
+    snapshot_rows = [] if snapshots.empty else list(
+        zip(snapshots["snapshot_date"].astype(str), snapshots["asset_id"].astype(int), snapshots["snapshot_price"])
+    )
+    income_rows = []
+    if incomes_df is not None and not incomes_df.empty:
+        income_rows = list(zip(incomes_df["date"], incomes_df["amount"]))
+        income_rows.sort(key=lambda item: item[0])
+
+    asset_meta = {}
+    if not assets.empty:
+        for a in assets.to_dict(orient="records"):
+            asset_meta[int(a["id"])] = (
+                str(a.get("currency")).upper() == "USD",
+                _num_or_zero(a.get("current_value")),
+                pd.to_datetime(a.get("last_update"), errors="coerce"),
+            )
+    missing_meta = (False, 0.0, pd.NaT)
+
+    state = {}
+    fixed_income = {}
+    last_price = {}
+    last_snapshot = {}
+    income_amount = 0.0
+    ti = pi = si = ii = 0
     out = []
 
     for d in dates:
         d_str = d.strftime("%Y-%m-%d")
-        t_day = tdf[tdf["date"] <= d].copy()
-        pos = positions_avg_cost(t_day)
-        if pos.empty:
+        while ti < len(trades) and trades[ti]["date"] <= d:
+            _apply_trade(state, trades[ti])
+            ti += 1
+        if not state:
             continue
+        while pi < len(price_rows) and price_rows[pi][0] <= d_str:
+            _, aid, price = price_rows[pi]
+            last_price[aid] = _num_or_zero(price)
+            pi += 1
+        while si < len(snapshot_rows) and snapshot_rows[si][0] <= d_str:
+            snapshot_date, aid, snapshot_price = snapshot_rows[si]
+            last_snapshot[aid] = (_num_or_zero(snapshot_price), pd.to_datetime(snapshot_date, errors="coerce"))
+            si += 1
+        while ii < len(income_rows) and income_rows[ii][0] <= d:
+            income_amount += _num_or_zero(income_rows[ii][1])
+            ii += 1
+
+        invested_amount = 0.0
+        market_value = 0.0
+        realized_pnl = 0.0
+        for aid, s in state.items():
+            if aid not in fixed_income:
+                fixed_income[aid] = _norm_asset_class(str(s["asset_class"])) in _FIXED_INCOME_CLASSES
+            is_fixed_income = fixed_income[aid]
+            is_usd, cv, current_dt = asset_meta.get(aid, missing_meta)
+            qty = s["qty"]
+            price = last_price.get(aid, 0.0)
+            if is_fixed_income and price <= 0:
+                price = (s["cost_basis"] / qty) if qty else 0.0
+            fx = s["last_fx"] if is_usd and not pd.isna(s["last_fx"]) else 1.0
+            value = qty * price * fx
+            if is_fixed_income and qty > 0:
+                snapshot_price, snapshot_dt = last_snapshot.get(aid, (0.0, pd.NaT))
+                snapshot_current = pd.isna(current_dt) or pd.isna(snapshot_dt) or snapshot_dt >= current_dt
+                current_applies_to_day = not pd.isna(current_dt) and current_dt <= d
+                if snapshot_price > 0 and snapshot_current:
+                    value = snapshot_price
+                elif current_applies_to_day and cv > 0:
+                    value = cv
+            invested_amount += s["cost_basis"]
+            market_value += value
+            realized_pnl += s["realized_pnl"]
 
-        prices = df_prices_upto(d_str, user_id=user_id)
-        if not prices.empty:
-            pos = pos.merge(prices[["asset_id", "price"]], on="asset_id", how="left")
-        else:
-            pos["price"] = 0.0
-        snapshots = df_asset_snapshots_upto(d_str, user_id=user_id)
-        if not snapshots.empty:
-            pos = pos.merge(snapshots[["asset_id", "snapshot_price", "snapshot_date"]], on="asset_id", how="left")
-        else:
-            pos["snapshot_price"] = 0.0
-            pos["snapshot_date"] = None
-
-        if not assets.empty:
-            pos = pos.merge(
-                assets.rename(columns={"id": "asset_id"})[["asset_id", "currency", "current_value", "last_update"]],
-                on="asset_id",
-                how="left",
-            )
-        else:
-            pos["currency"] = None
-            pos["current_value"] = None
-            pos["last_update"] = None
-
-        pos["price"] = pd.to_numeric(pos["price"], errors="coerce").fillna(0.0)
-        pos["snapshot_price"] = pd.to_numeric(pos.get("snapshot_price", 0.0), errors="coerce").fillna(0.0)
-        cls_norm = pos.get("asset_class", "").astype(str).map(_norm_asset_class)
-        fixed_income_mask = cls_norm.isin(_FIXED_INCOME_CLASSES)
-        missing_price_mask = pos["price"] <= 0
-        pos.loc[fixed_income_mask & missing_price_mask, "price"] = pd.to_numeric(
-            pos.get("avg_cost", 0.0), errors="coerce"
-        ).fillna(0.0)
-        fx = pd.to_numeric(pos.get("last_fx", 1.0), errors="coerce").fillna(1.0)
-        is_usd_asset = pos.get("currency", "").astype(str).str.upper().eq("USD")
-        fx_factor = fx.where(is_usd_asset, 1.0)
-        pos["market_value"] = pos["qty"] * pos["price"] * fx_factor
-        open_position_mask = pd.to_numeric(pos.get("qty", 0.0), errors="coerce").fillna(0.0) > 0
-        snapshot_dt = pd.to_datetime(pos.get("snapshot_date"), errors="coerce")
-        current_dt = pd.to_datetime(pos.get("last_update"), errors="coerce")
-        current_applies_to_day = current_dt.notna() & (current_dt <= d)
-        snapshot_current = current_dt.isna() | snapshot_dt.isna() | (snapshot_dt >= current_dt)
-        snapshot_override_mask = fixed_income_mask & open_position_mask & (pos["snapshot_price"] > 0) & snapshot_current
-        pos.loc[snapshot_override_mask, "market_value"] = pos.loc[snapshot_override_mask, "snapshot_price"]
-        cv = pd.to_numeric(pos.get("current_value", 0.0), errors="coerce").fillna(0.0)
-        stale_snapshot_mask = (pos["snapshot_price"] <= 0) | ~snapshot_current
-        current_value_mask = fixed_income_mask & open_position_mask & current_applies_to_day & stale_snapshot_mask & (cv > 0)
-        pos.loc[current_value_mask, "market_value"] = cv[current_value_mask]
-        income_amount = 0.0
-        if incomes_df is not None and not incomes_df.empty:
-            income_amount = float(
-                pd.to_numeric(
-                    incomes_df[incomes_df["date"] <= d]["amount"],
-                    errors="coerce",
-                ).fillna(0.0).sum()
-            )
-        invested_amount = float(pd.to_numeric(pos.get("cost_basis", 0.0), errors="coerce").fillna(0.0).sum())
-        market_value = float(pd.to_numeric(pos.get("market_value", 0.0), errors="coerce").fillna(0.0).sum())
-        realized_pnl = float(pd.to_numeric(pos.get("realized_pnl", 0.0), errors="coerce").fillna(0.0).sum())
         unrealized_pnl = market_value - invested_amount
         total_return = income_amount + realized_pnl + unrealized_pnl
         return_pct = (total_return / invested_amount * 100.0) if invested_amount > 0 else 0.0
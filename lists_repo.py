@@ -1,9 +1,8 @@
 from datetime import datetime
-import re
 from contextvars import ContextVar
 from datetime import datetime
 
-from db import get_conn
+from db import get_conn, resolve_user_workspace_id
 from tenant import get_current_user_id, get_current_workspace_id
 
 
@@ -17,44 +16,17 @@ def _uid(user_id: int | None = None) -> int:
         return int(wid)
 
     uid = int(user_id) if user_id is not None else int(get_current_user_id())
-    conn = get_conn()
-    try:
-        row = _exec(
-            conn,
-            """
-            SELECT wu.workspace_id
-            FROM workspace_users wu
-            JOIN workspaces w ON w.id = wu.workspace_id
-            WHERE wu.user_id = ?
-            ORDER BY
-                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
-                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
-                wu.workspace_id
-            LIMIT 1
-            """,
-            (uid,),
-            rewrite_scope=False,
-        ).fetchone()
-    except Exception:
-        row = None
-    finally:
-        conn.close()
-
-    if not row:
+    workspace_id = resolve_user_workspace_id(uid)
+    if workspace_id is None:
         _USE_WORKSPACE_SCOPE.set(False)
         return uid
     _USE_WORKSPACE_SCOPE.set(True)
-    return int(row["workspace_id"])
-
-
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+    return int(workspace_id)
 
 
 def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    return conn.execute(q, tuple(params or ()))
+    return conn.execute(query, tuple(params or ()), workspace_scope=use_workspace)
 
 
 def _insert_and_get_id(conn, insert_sql: str, params: tuple | list | None = None) -> int:
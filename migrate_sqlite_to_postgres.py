@@ -27,6 +27,7 @@ TABLES = [
     "credit_card_charges",
     "assets",
     "index_rates",
+    "market_index_rates",
     "sync_runs",
     "trades",
     "income_events",
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Any
 
+from auth import invalidate_principal_cache
 from db import USE_POSTGRES, get_conn
 
 
@@ -142,6 +143,7 @@ def upsert_permission(
     )
     conn.commit()
     conn.close()
+    invalidate_principal_cache()
 
 
 def seed_default_guest_permissions(workspace_user_id: int) -> None:
@@ -166,6 +168,7 @@ def seed_default_guest_permissions(workspace_user_id: int) -> None:
         )
     conn.commit()
     conn.close()
+    invalidate_principal_cache()
 
 
 def replace_permissions(workspace_user_id: int, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
@@ -207,6 +210,8 @@ def replace_permissions(workspace_user_id: int, items: list[dict[str, Any]]) ->
         )
     conn.commit()
     conn.close()
+    # Permissões mudam raramente; descartar todos os principals evita resolver o dono do workspace_user_id.
+    invalidate_principal_cache()
     return normalized
 
 
@@ -218,6 +223,7 @@ def delete_permissions_for_workspace_user(workspace_user_id: int) -> int:
     )
     conn.commit()
     conn.close()
+    invalidate_principal_cache()
     return int(cur.rowcount or 0)
 
 
@@ -246,6 +252,15 @@ def can_access(user: dict[str, Any], module: str, action: str) -> bool:
     if workspace_id is None or user_id is None:
         return False
 
+    effective = user.get("permissions")
+    if isinstance(effective, list):
+        # Permissões efetivas já resolvidas para o principal (api.main._current_user).
+        col = _action_column(act)
+        for item in effective:
+            if str((item or {}).get("module") or "").strip().lower() == mod:
+                return bool((item or {}).get(col))
+        return False
+
     wu_id = _workspace_user_id(int(user_id), int(workspace_id))
     if not wu_id:
         return False
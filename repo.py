@@ -1,4 +1,4 @@
-﻿from db import get_conn
+﻿from db import get_conn, resolve_user_workspace_id
 from tenant import get_current_user_id, get_current_workspace_id
 from datetime import date, datetime
 import calendar
@@ -16,46 +16,195 @@ def _uid(user_id: int | None = None) -> int:
         return int(wid)
 
     uid = int(user_id) if user_id is not None else int(get_current_user_id())
-    conn = get_conn()
-    try:
-        row = _exec(conn, 
-            """
-            SELECT wu.workspace_id
-            FROM workspace_users wu
-            JOIN workspaces w ON w.id = wu.workspace_id
-            WHERE wu.user_id = ?
-            ORDER BY
-                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
-                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
-                wu.workspace_id
-            LIMIT 1
-            """,
-            (uid,),
-            rewrite_scope=False,
-        ).fetchone()
-    except Exception:
-        row = None
-    finally:
-        conn.close()
-
-    if not row:
+    workspace_id = resolve_user_workspace_id(uid)
+    if workspace_id is None:
         _USE_WORKSPACE_SCOPE.set(False)
         return uid
     _USE_WORKSPACE_SCOPE.set(True)
-    try:
-        return int(row["workspace_id"])
-    except Exception:
-        return int(row[0])
+    return int(workspace_id)
 
 
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+    use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
+    return conn.execute(query, tuple(params or ()), workspace_scope=use_workspace)
 
 
-def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
+def _executemany(conn, query: str, seq_of_params: list, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    return conn.execute(q, tuple(params or ()))
+    return conn.executemany(query, seq_of_params, workspace_scope=use_workspace)
+
+
+def _rollup_months(*dates) -> set[str]:
+    return {str(d)[:7] for d in dates if d and len(str(d)) >= 7}
+
+
+def _is_commitment_method(method: str | None) -> bool:
+    return str(method or "").strip().upper() in {"FUTURO", "AGENDADO"}
+
+
+def _month_bounds(month: str) -> tuple[str, str]:
+    year, mon = int(month[:4]), int(month[5:7])
+    nxt = f"{year + 1:04d}-01-01" if mon == 12 else f"{year:04d}-{mon + 1:02d}-01"
+    return f"{year:04d}-{mon:02d}-01", nxt
+
+
+def _tx_months(conn, where: str, params: tuple | list) -> set[str]:
+    rows = _exec(conn, f"SELECT DISTINCT SUBSTR(date, 1, 7) AS month FROM transactions WHERE {where}", params).fetchall()
+    return {str(r["month"]) for r in rows if r["month"]}
+
+
+# Chave (classe) dos advisory locks do monthly_rollup no PostgreSQL; +1 para escopo por workspace.
+_ROLLUP_LOCK_CLASS = 0x6D72
+
+
+def _lock_monthly_rollup(conn, uid: int) -> None:
+    # O recálculo é DELETE + INSERT ... SELECT sem chave única: em READ COMMITTED dois
+    # escritores do mesmo escopo inseririam os dois e o mês ficaria contado em dobro.
+    # O lock vale até o fim da transação. No SQLite o lock de escrita já serializa.
+    if getattr(conn, "_use_postgres", False):
+        conn.execute(
+            "SELECT pg_advisory_xact_lock(CAST(? AS INTEGER), CAST(? AS INTEGER))",
+            (_ROLLUP_LOCK_CLASS + int(_USE_WORKSPACE_SCOPE.get()), int(uid)),
+        )
+
+
+def _rebuild_monthly_rollup(conn, uid: int, months: set[str] | None = None) -> None:
+    """Recalcula o monthly_rollup do escopo a partir do ledger (só os meses informados, ou tudo)."""
+    _lock_monthly_rollup(conn, uid)
+    ranges: list[tuple[str, str] | None] = [None] if months is None else [_month_bounds(m) for m in sorted(months)]
+    for bounds in ranges:
+        tx_range = ""
+        ch_range = ""
+        params: list = [uid]
+        if bounds is not None:
+            tx_range = " AND t.date >= ? AND t.date < ?"
+            ch_range = " AND ch.purchase_date >= ? AND ch.purchase_date < ?"
+            params.extend(bounds)
+            _exec(conn, "DELETE FROM monthly_rollup WHERE user_id = ? AND month = ?", (uid, bounds[0][:7]))
+        else:
+            _exec(conn, "DELETE FROM monthly_rollup WHERE user_id = ?", (uid,))
+
+        # Compromissos (futuro/agendado) não entram em caixa/competência até a liquidação.
+        for basis, extra in [("caixa", ""), ("competencia", " AND SUBSTR(t.description, 1, 12) <> 'PGTO FATURA '")]:
+            _exec(conn, 
+                f"""
+                INSERT INTO monthly_rollup(basis, source, month, account_id, category_id, receitas, despesas, user_id)
+                SELECT
+                    '{basis}',
+                    'transaction',
+                    SUBSTR(t.date, 1, 7),
+                    t.account_id,
+                    t.category_id,
+                    SUM(CASE WHEN t.amount_brl > 0 THEN t.amount_brl ELSE 0 END),
+                    SUM(CASE WHEN t.amount_brl < 0 THEN t.amount_brl ELSE 0 END),
+                    t.user_id
+                FROM transactions t
+                WHERE t.user_id = ?
+                  AND LOWER(TRIM(COALESCE(t.method, ''))) NOT IN ('futuro', 'agendado'){extra}{tx_range}
+                GROUP BY SUBSTR(t.date, 1, 7), t.account_id, t.category_id, t.user_id
+                """,
+                params,
+            )
+        _exec(conn, 
+            f"""
+            INSERT INTO monthly_rollup(basis, source, month, account_id, category_id, receitas, despesas, user_id)
+            SELECT
+                'competencia',
+                'credit_charge',
+                SUBSTR(ch.purchase_date, 1, 7),
+                cc.card_account_id,
+                ch.category_id,
+                0,
+                -SUM(ABS(ch.amount)),
+                ch.user_id
+            FROM credit_card_charges ch
+            JOIN credit_cards cc ON cc.id = ch.card_id AND cc.user_id = ch.user_id
+            WHERE ch.user_id = ?{ch_range}
+            GROUP BY SUBSTR(ch.purchase_date, 1, 7), cc.card_account_id, ch.category_id, ch.user_id
+            """,
+            params,
+        )
+
+
+def _touch_monthly_rollup(conn, uid: int, months: set[str] | None) -> None:
+    # months=None -> recálculo completo do escopo; conjunto vazio -> nada a fazer.
+    if months is not None and not months:
+        return
+    _rebuild_monthly_rollup(conn, uid, months)
+
+
+def refresh_monthly_rollup(months=None, user_id: int | None = None, conn=None) -> None:
+    """Recalcula meses ("YYYY-MM" ou datas) do monthly_rollup; sem meses, o escopo inteiro.
+
+    Com `conn`, roda na transação de quem chamou (sem commit)."""
+    uid = _uid(user_id)
+    target = None if months is None else _rollup_months(*months)
+    if conn is not None:
+        _touch_monthly_rollup(conn, uid, target)
+        return
+    own = get_conn()
+    _touch_monthly_rollup(own, uid, target)
+    own.commit()
+    own.close()
+
+
+def invalidate_monthly_rollup(conn=None) -> None:
+    """Descarta o estado de todos os escopos; cada um é reconstruído na próxima leitura."""
+    own = conn if conn is not None else get_conn()
+    own.execute("DELETE FROM monthly_rollup_state")
+    if conn is None:
+        own.commit()
+        own.close()
+
+
+def fetch_monthly_rollup(
+    view: str = "caixa",
+    month_from: str | None = None,
+    month_to: str | None = None,
+    user_id: int | None = None,
+):
+    uid = _uid(user_id)
+    basis = "competencia" if str(view or "").strip().lower() == "competencia" else "caixa"
+    conn = get_conn()
+    built = _exec(conn, "SELECT id FROM monthly_rollup_state WHERE user_id = ?", (uid,)).fetchone()
+    if not built:
+        # Primeira leitura do escopo: materializa o histórico. O índice único serializa leitores concorrentes.
+        cur = _exec(conn, 
+            "INSERT OR IGNORE INTO monthly_rollup_state(user_id, built_at) VALUES (?, ?)",
+            (uid, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+        if int(cur.rowcount or 0) > 0:
+            _rebuild_monthly_rollup(conn, uid)
+        conn.commit()
+
+    q = """
+        SELECT
+            r.month,
+            r.source,
+            ac.name AS account,
+            c.name AS category,
+            CASE WHEN r.source = 'credit_charge' THEN 'Despesa' ELSE c.kind END AS category_kind,
+            SUM(r.receitas) AS receitas,
+            SUM(r.despesas) AS despesas
+        FROM monthly_rollup r
+        JOIN accounts ac ON ac.id = r.account_id AND ac.user_id = r.user_id
+        LEFT JOIN categories c ON c.id = r.category_id AND c.user_id = r.user_id
+        WHERE r.user_id = ? AND r.basis = ?
+    """
+    params: list = [uid, basis]
+    if basis == "competencia":
+        # Pagamentos de fatura saem da competência; as compras do cartão entram no lugar.
+        q += " AND NOT (r.source = 'transaction' AND COALESCE(c.name, '') = 'Fatura Cartão')"
+    if month_from:
+        q += " AND r.month >= ?"
+        params.append(str(month_from)[:7])
+    if month_to:
+        q += " AND r.month <= ?"
+        params.append(str(month_to)[:7])
+    q += " GROUP BY r.month, r.source, ac.name, c.name, c.kind ORDER BY r.month ASC"
+    rows = _exec(conn, q, params).fetchall()
+    conn.close()
+    return rows
 
 
 def list_accounts(user_id: int | None = None):
@@ -141,6 +290,85 @@ def create_category(name: str, kind: str, user_id: int | None = None):
     conn.close()
 
 
+_NAMED_INSERTS = {
+    "accounts": "INSERT INTO accounts(name, type, currency, show_on_dashboard, user_id) VALUES (?, ?, 'BRL', FALSE, ?)",
+    "categories": "INSERT INTO categories(name, kind, user_id) VALUES (?, ?, ?)",
+}
+
+
+def _resolve_named_ids(conn, table: str, names, default_kind: str, uid: int) -> tuple[dict[str, int], int]:
+    """Mapa nome -> id de accounts/categories do escopo; os ausentes são criados em lote com `default_kind`."""
+    q = f"SELECT id, name FROM {table} WHERE user_id = ?"
+    ids = {str(r["name"]): int(r["id"]) for r in _exec(conn, q, (uid,)).fetchall()}
+    missing = sorted({str(n).strip() for n in names if n and str(n).strip()} - set(ids))
+    if missing:
+        _executemany(conn, _NAMED_INSERTS[table], [(name, default_kind, uid) for name in missing])
+        ids = {str(r["name"]): int(r["id"]) for r in _exec(conn, q, (uid,)).fetchall()}
+    return ids, len(missing)
+
+
+def bulk_insert_transactions(rows: list[dict], user_id: int | None = None, conn=None, refresh_rollup: bool = True) -> dict:
+    """Insere lançamentos normalizados (conta/categoria por nome) numa única transação.
+
+    Contas e categorias são resolvidas com uma consulta por tabela (as ausentes viram
+    Banco/Despesa) e os lançamentos vão num único executemany; o monthly_rollup é
+    recalculado uma vez para os meses afetados (refresh_rollup=False devolve os meses em
+    "months" para quem grava em vários lotes). Com `conn`, roda na transação de quem
+    chamou (sem commit); sem ela, qualquer erro desfaz o lote inteiro."""
+    uid = _uid(user_id)
+    own = conn is None
+    c = get_conn() if own else conn
+    try:
+        accounts, accounts_created = _resolve_named_ids(c, "accounts", {r["account"] for r in rows}, "Banco", uid)
+        categories, categories_created = _resolve_named_ids(c, "categories", {r.get("category") for r in rows}, "Despesa", uid)
+        params = []
+        months: set[str] = set()
+        for r in rows:
+            category = str(r.get("category") or "").strip()
+            method = str(r.get("method") or "").strip() or None
+            notes = str(r.get("notes") or "").strip() or None
+            params.append(
+                (
+                    str(r["date"]),
+                    str(r["description"]).strip(),
+                    float(r["amount"]),
+                    accounts[str(r["account"]).strip()],
+                    categories.get(category) if category else None,
+                    method,
+                    notes,
+                    uid,
+                )
+            )
+            if not _is_commitment_method(method):
+                months.update(_rollup_months(r["date"]))
+        if params:
+            _executemany(
+                c,
+                """
+                INSERT INTO transactions(date, description, amount_brl, account_id, category_id, method, notes, user_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                params,
+            )
+        if refresh_rollup:
+            _touch_monthly_rollup(c, uid, months)
+        if own:
+            c.commit()
+    except Exception:
+        if own:
+            c.rollback()
+        raise
+    finally:
+        if own:
+            c.close()
+    return {
+        "inserted": len(params),
+        "accounts_created": accounts_created,
+        "categories_created": categories_created,
+        "months": sorted(months),
+    }
+
+
 def insert_transaction(
     date: str,
     description: str,
@@ -171,6 +399,8 @@ def insert_transaction(
             uid,
         ),
     )
+    if not _is_commitment_method(method):
+        _touch_monthly_rollup(conn, uid, _rollup_months(date))
     conn.commit()
     conn.close()
 
@@ -178,10 +408,12 @@ def insert_transaction(
 def delete_transaction(tx_id: int, user_id: int | None = None):
     uid = _uid(user_id)
     conn = get_conn()
+    months = _tx_months(conn, "id = ? AND user_id = ?", (int(tx_id), uid))
     _exec(conn, 
         "DELETE FROM transactions WHERE id = ? AND user_id = ?",
         (int(tx_id), uid),
     )
+    _touch_monthly_rollup(conn, uid, months)
     conn.commit()
     conn.close()
 
@@ -209,13 +441,16 @@ def delete_transaction_with_scope(tx_id: int, scope: str = "single", user_id: in
     is_commitment = method in {"FUTURO", "AGENDADO"}
     if mode != "future" or not is_commitment:
         cur = _exec(conn, "DELETE FROM transactions WHERE id = ? AND user_id = ?", (int(tx_id), uid))
-        conn.commit()
         deleted = cur.rowcount if cur.rowcount is not None else 0
+        _touch_monthly_rollup(conn, uid, _rollup_months(row["date"]))
+        conn.commit()
         conn.close()
         return int(deleted)
 
     recurrence_id = str(row["recurrence_id"] or "").strip()
     if recurrence_id:
+        # Parcelas já liquidadas mantêm o recurrence_id e estão no rollup.
+        months = _tx_months(conn, "user_id = ? AND recurrence_id = ? AND date >= ?", (uid, recurrence_id, str(row["date"])))
         cur = _exec(conn, 
             """
             DELETE FROM transactions
@@ -225,8 +460,9 @@ def delete_transaction_with_scope(tx_id: int, scope: str = "single", user_id: in
             """,
             (uid, recurrence_id, str(row["date"])),
         )
-        conn.commit()
         deleted = cur.rowcount if cur.rowcount is not None else 0
+        _touch_monthly_rollup(conn, uid, months)
+        conn.commit()
         conn.close()
         return int(deleted)
 
@@ -296,13 +532,14 @@ def delete_credit_commitment_with_scope(charge_id: int, scope: str = "single", u
 
     amounts_by_invoice: dict[tuple[int, str], float] = {}
     ids_to_delete: list[int] = []
+    months: set[str] = set()
 
     if mode == "future":
         group_id = _extract_future_credit_group(row["note"])
         if group_id:
             rows = _exec(conn, 
                 """
-                SELECT id, card_id, invoice_period, amount
+                SELECT id, card_id, invoice_period, amount, purchase_date
                 FROM credit_card_charges
                 WHERE user_id = ?
                   AND COALESCE(paid, FALSE) = FALSE
@@ -313,6 +550,7 @@ def delete_credit_commitment_with_scope(charge_id: int, scope: str = "single", u
             ).fetchall()
             for r in rows:
                 ids_to_delete.append(int(r["id"]))
+                months.update(_rollup_months(r["purchase_date"]))
                 key = (int(r["card_id"]), str(r["invoice_period"]))
                 amounts_by_invoice[key] = float(amounts_by_invoice.get(key, 0.0)) + abs(float(r["amount"] or 0.0))
         else:
@@ -320,7 +558,7 @@ def delete_credit_commitment_with_scope(charge_id: int, scope: str = "single", u
             if base_desc:
                 rows = _exec(conn, 
                     """
-                    SELECT id, card_id, invoice_period, amount
+                    SELECT id, card_id, invoice_period, amount, purchase_date
                     FROM credit_card_charges
                     WHERE user_id = ?
                       AND COALESCE(paid, FALSE) = FALSE
@@ -343,11 +581,13 @@ def delete_credit_commitment_with_scope(charge_id: int, scope: str = "single", u
                 ).fetchall()
                 for r in rows:
                     ids_to_delete.append(int(r["id"]))
+                    months.update(_rollup_months(r["purchase_date"]))
                     key = (int(r["card_id"]), str(r["invoice_period"]))
                     amounts_by_invoice[key] = float(amounts_by_invoice.get(key, 0.0)) + abs(float(r["amount"] or 0.0))
 
     if not ids_to_delete:
         ids_to_delete = [int(row["id"])]
+        months = _rollup_months(row["purchase_date"])
         key = (int(row["card_id"]), str(row["invoice_period"]))
         amounts_by_invoice[key] = abs(float(row["amount"] or 0.0))
 
@@ -381,6 +621,7 @@ def delete_credit_commitment_with_scope(charge_id: int, scope: str = "single", u
                 (total, status, int(inv["id"]), uid),
             )
 
+    _touch_monthly_rollup(conn, uid, months)
     conn.commit()
     deleted = len(ids_to_delete)
     conn.close()
@@ -454,6 +695,8 @@ def settle_commitment_transaction(
             uid,
         ),
     )
+    # Antes da liquidação o compromisso não estava no rollup; passa a contar na data do pagamento.
+    _touch_monthly_rollup(conn, uid, _rollup_months(payment_date))
     conn.commit()
     conn.close()
 
@@ -547,6 +790,8 @@ def create_transaction(
         """,
         (date, description, float(amount), int(category_id), int(account_id), method, notes, uid),
     )
+    if not _is_commitment_method(method):
+        _touch_monthly_rollup(conn, uid, _rollup_months(date))
     conn.commit()
     conn.close()
 
@@ -554,10 +799,12 @@ def create_transaction(
 def delete_transactions_by_description_prefix(prefix: str, user_id: int | None = None) -> int:
     uid = _uid(user_id)
     conn = get_conn()
+    months = _tx_months(conn, "user_id = ? AND description LIKE ?", (uid, f"{prefix}%"))
     cur = _exec(conn, 
         "DELETE FROM transactions WHERE user_id = ? AND description LIKE ?",
         (uid, f"{prefix}%"),
     )
+    _touch_monthly_rollup(conn, uid, months)
     conn.commit()
     deleted = cur.rowcount if cur.rowcount is not None else 0
     conn.close()
@@ -567,10 +814,12 @@ def delete_transactions_by_description_prefix(prefix: str, user_id: int | None =
 def delete_transactions_by_description_exact(desc: str, user_id: int | None = None) -> int:
     uid = _uid(user_id)
     conn = get_conn()
+    months = _tx_months(conn, "user_id = ? AND description = ?", (uid, desc))
     cur = _exec(conn, 
         "DELETE FROM transactions WHERE user_id = ? AND description = ?",
         (uid, desc),
     )
+    _touch_monthly_rollup(conn, uid, months)
     conn.commit()
     deleted = cur.rowcount if cur.rowcount is not None else 0
     conn.close()
@@ -671,6 +920,7 @@ def clear_transactions(user_id: int | None = None):
     uid = _uid(user_id)
     conn = get_conn()
     cur = _exec(conn, "DELETE FROM transactions WHERE user_id = ?", (uid,))
+    _touch_monthly_rollup(conn, uid, None)
     conn.commit()
     conn.close()
     return cur.rowcount
@@ -784,6 +1034,8 @@ def update_credit_card(
             uid,
         ),
     )
+    # As compras entram no rollup pela conta vinculada ao cartão, que pode ter mudado.
+    _touch_monthly_rollup(conn, uid, None)
     conn.commit()
     conn.close()
 
@@ -941,6 +1193,7 @@ def register_credit_charge(
             """,
             (int(card_id), invoice_period, due_date, value, uid),
         )
+    _touch_monthly_rollup(conn, uid, _rollup_months(purchase_date))
     conn.commit()
     conn.close()
 
@@ -1214,6 +1467,7 @@ def pay_credit_card_invoice(
         "UPDATE credit_card_charges SET paid = TRUE WHERE user_id = ? AND card_id = ? AND invoice_period = ?",
         (uid, int(inv["card_id"]), str(inv["invoice_period"])),
     )
+    _touch_monthly_rollup(conn, uid, _rollup_months(payment_date))
     conn.commit()
     conn.close()
     return {"ok": True, "paid_amount": abs(remaining)}
@@ -1,8 +1,7 @@
 ﻿import pandas as pd
-import re
 from contextvars import ContextVar
 
-from db import get_conn
+from db import get_conn, resolve_user_workspace_id, stream_rows
 import repo
 from tenant import get_current_user_id, get_current_workspace_id
 
@@ -16,46 +15,17 @@ def _uid(user_id: int | None = None) -> int:
         return int(wid)
 
     uid = int(user_id) if user_id is not None else int(get_current_user_id())
-    conn = get_conn()
-    try:
-        row = _exec(conn, 
-            """
-            SELECT wu.workspace_id
-            FROM workspace_users wu
-            JOIN workspaces w ON w.id = wu.workspace_id
-            WHERE wu.user_id = ?
-            ORDER BY
-                CASE WHEN LOWER(COALESCE(w.status, 'active')) = 'active' THEN 0 ELSE 1 END,
-                CASE WHEN UPPER(COALESCE(wu.role, '')) = 'OWNER' THEN 0 ELSE 1 END,
-                wu.workspace_id
-            LIMIT 1
-            """,
-            (uid,),
-            rewrite_scope=False,
-        ).fetchone()
-    except Exception:
-        row = None
-    finally:
-        conn.close()
-
-    if not row:
+    workspace_id = resolve_user_workspace_id(uid)
+    if workspace_id is None:
         _USE_WORKSPACE_SCOPE.set(False)
         return uid
     _USE_WORKSPACE_SCOPE.set(True)
-    try:
-        return int(row["workspace_id"])
-    except Exception:
-        return int(row[0])
-
-
-def _scope_sql(query: str) -> str:
-    return re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", str(query))
+    return int(workspace_id)
 
 
 def _exec(conn, query: str, params: tuple | list | None = None, rewrite_scope: bool | None = None):
     use_workspace = _USE_WORKSPACE_SCOPE.get() if rewrite_scope is None else bool(rewrite_scope)
-    q = _scope_sql(query) if use_workspace else str(query)
-    return conn.execute(q, tuple(params or ()))
+    return conn.execute(query, tuple(params or ()), workspace_scope=use_workspace)
 
 
 def _future_method_mask(df: pd.DataFrame) -> pd.Series:
@@ -189,6 +159,256 @@ def df_transactions(
     return union.sort_values(["date", "id"]).reset_index(drop=True)
 
 
+_FUTURE_METHOD_SQL = "LOWER(TRIM(COALESCE(t.method, ''))) IN ('futuro', 'agendado')"
+_TX_PAGE_COLUMNS = [
+    "id", "date", "description", "amount_brl", "account", "category", "category_kind", "method", "notes",
+    "source_type", "charge_status", "invoice_period", "due_date", "card_id", "card_name", "is_future_entry",
+]
+_CHARGE_ID_PREFIX = {"cc": 1, "ccf": 1}
+
+
+def parse_transactions_cursor(cursor: str | None) -> tuple[str, int, int] | None:
+    """Cursor "data|id" (id como devolvido: 123, cc-45 ou ccf-45) -> (data, origem, id numérico)."""
+    raw = str(cursor or "").strip()
+    if not raw:
+        return None
+    try:
+        date_s, id_s = raw.split("|", 1)
+        prefix, _, num = id_s.rpartition("-")
+        rank = _CHARGE_ID_PREFIX[prefix] if prefix else 0
+        return str(pd.Timestamp(date_s).strftime("%Y-%m-%d")), rank, int(num)
+    except (KeyError, ValueError, TypeError):
+        raise ValueError("Cursor inválido. Use o next_cursor devolvido pela página anterior.")
+
+
+def _normalize_tx_view(view: str | None) -> str:
+    mode = str(view or "caixa").strip().lower()
+    return mode if mode in {"caixa", "competencia", "futuro"} else "caixa"
+
+
+def _transactions_union_sql(
+    mode: str, uid: int, date_from: str | None, date_to: str | None, today: str
+) -> tuple[str, list]:
+    """UNION ALL de transactions e credit_card_charges com as regras de df_transactions por visão.
+
+    Colunas extras src_rank (0 lançamento, 1 cartão) e sort_id definem a ordem estável (data, origem, id).
+    """
+    tx_sql = f"""
+        SELECT
+            CAST(t.id AS TEXT) AS id, 0 AS src_rank, t.id AS sort_id, t.date AS date,
+            t.description, t.amount_brl, ac.name AS account, c.name AS category, c.kind AS category_kind,
+            t.method, t.notes, 'transaction' AS source_type,
+            CASE
+                WHEN {_FUTURE_METHOD_SQL} AND t.date < ? THEN 'Vencido'
+                WHEN {_FUTURE_METHOD_SQL} THEN 'Pendente'
+            END AS charge_status,
+            NULL AS invoice_period, NULL AS due_date, NULL AS card_id, NULL AS card_name
+        FROM transactions t
+        JOIN accounts ac ON ac.id = t.account_id AND ac.user_id = t.user_id
+        LEFT JOIN categories c ON c.id = t.category_id AND c.user_id = t.user_id
+        WHERE t.user_id = ?
+          AND {"" if mode == "futuro" else "NOT "}({_FUTURE_METHOD_SQL})
+    """
+    params: list = [today, uid]
+    if mode == "competencia":
+        # Pagamentos de fatura saem da competência: as compras do cartão entram no lugar.
+        tx_sql += """
+          AND SUBSTR(COALESCE(t.description, ''), 1, 12) <> 'PGTO FATURA '
+          AND COALESCE(c.name, '') <> 'Fatura Cartão'
+        """
+    if date_from:
+        tx_sql += " AND t.date >= ?"
+        params.append(date_from)
+    if date_to:
+        tx_sql += " AND t.date <= ?"
+        params.append(date_to)
+
+    parts = [tx_sql]
+    if mode in {"competencia", "futuro"}:
+        date_col = "ch.purchase_date" if mode == "competencia" else "ch.due_date"
+        charge_sql = f"""
+            SELECT
+                ('{"cc" if mode == "competencia" else "ccf"}-' || CAST(ch.id AS TEXT)) AS id, 1 AS src_rank, ch.id AS sort_id,
+                {date_col} AS date,
+                COALESCE(ch.description, ('{"COMPRA" if mode == "competencia" else "COMPROMISSO"} CARTAO ' || cc.name)) AS description,
+                -ABS(ch.amount) AS amount_brl, ca.name AS account, c.name AS category, 'Despesa' AS category_kind,
+                '{"Credito" if mode == "competencia" else "Futuro"}' AS method, ch.note AS notes,
+                '{"credit_charge" if mode == "competencia" else "credit_commitment"}' AS source_type,
+                {"CASE WHEN COALESCE(ch.paid, FALSE) = TRUE THEN 'Pago' ELSE 'Pendente' END" if mode == "competencia" else "'Aguardando Fatura'"} AS charge_status,
+                ch.invoice_period, ch.due_date, cc.id AS card_id, cc.name AS card_name
+            FROM credit_card_charges ch
+            JOIN credit_cards cc ON cc.id = ch.card_id AND cc.user_id = ch.user_id
+            JOIN accounts ca ON ca.id = cc.card_account_id AND ca.user_id = cc.user_id
+            LEFT JOIN categories c ON c.id = ch.category_id AND c.user_id = ch.user_id
+            WHERE ch.user_id = ?
+        """
+        params.append(uid)
+        if mode == "futuro":
+            charge_sql += " AND COALESCE(ch.paid, FALSE) = FALSE AND ch.due_date >= ?"
+            params.append(today)
+        if date_from:
+            charge_sql += f" AND {date_col} >= ?"
+            params.append(date_from)
+        if date_to:
+            charge_sql += f" AND {date_col} <= ?"
+            params.append(date_to)
+        parts.append(charge_sql)
+
+    return f"SELECT * FROM ({' UNION ALL '.join(parts)}) u", params
+
+
+def _transaction_row(row, mode: str) -> dict:
+    item = dict(row)
+    is_tx = int(item.pop("src_rank")) == 0
+    item.pop("sort_id", None)
+    item["id"] = int(item["id"]) if is_tx else item["id"]
+    item["date"] = str(item["date"])[:10]
+    item["is_future_entry"] = (mode == "futuro") if is_tx else ""
+    return {col: ("" if item.get(col) is None else item.get(col)) for col in _TX_PAGE_COLUMNS}
+
+
+def page_transactions(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user_id: int | None = None,
+    view: str = "caixa",
+    limit: int = 100,
+    after: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """Página de lançamentos (mais recentes primeiro) com ORDER BY/LIMIT no banco.
+
+    Mesmas regras de df_transactions por visão, num UNION ALL entre transactions e
+    credit_card_charges; ordem (data, origem, id) decrescente e cursor keyset em `after`.
+    Retorna (linhas, next_cursor).
+    """
+    mode = _normalize_tx_view(view)
+    uid = _uid(user_id)
+    today = pd.Timestamp.today().normalize().strftime("%Y-%m-%d")
+    page_size = max(1, int(limit))
+    cursor = parse_transactions_cursor(after)
+
+    q, params = _transactions_union_sql(mode, uid, date_from, date_to, today)
+    if cursor:
+        q += " WHERE (u.date < ? OR (u.date = ? AND (u.src_rank < ? OR (u.src_rank = ? AND u.sort_id < ?))))"
+        params += [cursor[0], cursor[0], cursor[1], cursor[1], cursor[2]]
+    q += " ORDER BY u.date DESC, u.src_rank DESC, u.sort_id DESC LIMIT ?"
+    params.append(page_size + 1)
+
+    conn = get_conn()
+    try:
+        fetched = _exec(conn, q, params).fetchall()
+    finally:
+        conn.close()
+
+    rows = [_transaction_row(r, mode) for r in fetched[:page_size]]
+    next_cursor = None
+    if len(fetched) > page_size and rows:
+        next_cursor = f"{rows[-1]['date']}|{rows[-1]['id']}"
+    return rows, next_cursor
+
+
+def stream_transactions(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user_id: int | None = None,
+    view: str = "caixa",
+    chunk_size: int | None = None,
+):
+    """Todos os lançamentos da visão em ordem cronológica, lidos em blocos via db.stream_rows.
+
+    O escopo (workspace) é resolvido já na chamada; o iterador devolvido pode ser consumido
+    em outra thread/contexto (ex.: StreamingResponse).
+    """
+    mode = _normalize_tx_view(view)
+    uid = _uid(user_id)
+    scope = _USE_WORKSPACE_SCOPE.get()
+    today = pd.Timestamp.today().normalize().strftime("%Y-%m-%d")
+    q, params = _transactions_union_sql(mode, uid, date_from, date_to, today)
+    q += " ORDER BY u.date ASC, u.src_rank ASC, u.sort_id ASC"
+    rows = stream_rows(q, params, workspace_scope=scope, chunk_size=chunk_size)
+    return (_transaction_row(r, mode) for r in rows)
+
+
+_DASHBOARD_COLUMNS = ["date", "account", "category", "category_kind", "amount_brl"]
+
+
+def _rollup_frame(rows) -> pd.DataFrame:
+    r = pd.DataFrame([dict(x) for x in rows or []])
+    if r.empty:
+        return pd.DataFrame()
+    r["date"] = pd.to_datetime(r["month"].astype(str) + "-01")
+    keys = ["date", "account", "category", "category_kind"]
+    # Uma linha de receitas e outra de despesas por grupo: as agregações por sinal continuam valendo.
+    out = pd.concat(
+        [
+            r[keys].assign(amount_brl=r["receitas"].astype(float)),
+            r[keys].assign(amount_brl=r["despesas"].astype(float)),
+        ],
+        ignore_index=True,
+    )
+    return out.loc[out["amount_brl"] != 0].reset_index(drop=True)
+
+
+def df_dashboard(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user_id: int | None = None,
+    view: str = "caixa",
+) -> pd.DataFrame:
+    """Base dos dashboards: meses completos vêm do monthly_rollup e as bordas parciais do período, do ledger.
+
+    Traz só date/account/category/category_kind/amount_brl, o que kpis, monthly_summary,
+    monthly_wealth_summary, category_expenses e account_balance usam. A visão futuro depende
+    da data de hoje e continua saindo do ledger.
+    """
+    mode = str(view or "caixa").strip().lower()
+    if mode not in {"caixa", "competencia"}:
+        return df_transactions(date_from=date_from, date_to=date_to, user_id=user_id, view=mode)
+
+    try:
+        start = pd.Timestamp(date_from).normalize() if date_from else None
+        end = pd.Timestamp(date_to).normalize() if date_to else None
+    except (TypeError, ValueError):
+        return df_transactions(date_from=date_from, date_to=date_to, user_id=user_id, view=mode)
+
+    first_full = None if start is None else (start if start.day == 1 else start + pd.offsets.MonthBegin(1))
+    last_full = None if end is None else (end if end.is_month_end else end - pd.offsets.MonthEnd(1))
+    if first_full is not None and last_full is not None and first_full > last_full:
+        return df_transactions(date_from=date_from, date_to=date_to, user_id=user_id, view=mode)
+
+    parts: list[pd.DataFrame] = []
+    if start is not None and first_full != start:
+        parts.append(
+            df_transactions(
+                date_from=date_from,
+                date_to=(first_full - pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+                user_id=user_id,
+                view=mode,
+            )
+        )
+    rows = repo.fetch_monthly_rollup(
+        view=mode,
+        month_from=first_full.strftime("%Y-%m") if first_full is not None else None,
+        month_to=last_full.strftime("%Y-%m") if last_full is not None else None,
+        user_id=user_id,
+    )
+    parts.append(_rollup_frame(rows))
+    if end is not None and last_full != end:
+        parts.append(
+            df_transactions(
+                date_from=(last_full + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+                date_to=date_to,
+                user_id=user_id,
+                view=mode,
+            )
+        )
+
+    parts = [p[_DASHBOARD_COLUMNS] for p in parts if p is not None and not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True).sort_values("date", kind="stable").reset_index(drop=True)
+
+
 def kpis(df: pd.DataFrame) -> dict:
     if df is None or df.empty:
         return {"receitas": 0.0, "despesas": 0.0, "saldo": 0.0}
@@ -304,6 +524,29 @@ def account_balance_by_id(account_id: int, user_id: int | None = None) -> float:
     return float(row["bal"] if row else 0.0)
 
 
+def account_balances_by_id(account_ids, user_id: int | None = None) -> dict[int, float]:
+    """Saldo de caixa de várias contas numa consulta (contas sem lançamentos ficam com 0)."""
+    ids = sorted({int(a) for a in account_ids if a})
+    if not ids:
+        return {}
+    uid = _uid(user_id)
+    conn = get_conn()
+    rows = _exec(conn, 
+        f"""
+        SELECT account_id, COALESCE(SUM(amount_brl), 0) AS bal
+        FROM transactions
+        WHERE user_id = ? AND account_id IN ({", ".join("?" for _ in ids)})
+          AND UPPER(TRIM(COALESCE(method, ''))) NOT IN ('FUTURO', 'AGENDADO')
+        GROUP BY account_id
+        """,
+        [uid, *ids],
+    ).fetchall()
+    conn.close()
+    out = {i: 0.0 for i in ids}
+    out.update({int(r["account_id"]): float(r["bal"] or 0.0) for r in rows})
+    return out
+
+
 def commitments_summary(
     date_from: str | None = None,
     date_to: str | None = None,
@@ -362,3 +605,56 @@ def commitments_summary(
     return {"a_vencer": a_vencer, "vencidos": vencidos}
 
 
+def _records(df: pd.DataFrame) -> list[dict]:
+    if df is None or df.empty:
+        return []
+    return df.to_dict(orient="records")
+
+
+def dashboard_bundle(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    account: str | None = None,
+    user_id: int | None = None,
+    view: str = "caixa",
+    wealth_date_from: str | None = None,
+) -> dict:
+    """Todos os blocos do dashboard a partir de uma única carga da base.
+
+    O patrimônio mensal acumula desde o início do histórico: a base é carregada em duas
+    fatias disjuntas (antes de date_from e o período), e só o período alimenta os demais blocos.
+    wealth_date_from amplia só a janela exibida do patrimônio (padrão: date_from).
+    """
+    period = df_dashboard(date_from=date_from, date_to=date_to, user_id=user_id, view=view)
+    history = period
+    if date_from:
+        try:
+            before = (pd.Timestamp(date_from).normalize() - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            before = None
+        if before:
+            prior = df_dashboard(date_to=before, user_id=user_id, view=view)
+            frames = [d for d in [prior, period] if d is not None and not d.empty]
+            history = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    if account:
+        if not period.empty:
+            period = period[period["account"] == account]
+        if not history.empty:
+            history = history[history["account"] == account]
+
+    return {
+        "kpis": kpis(period),
+        "monthly": _records(monthly_summary(period)),
+        "wealth_monthly": _records(
+            monthly_wealth_summary(history, date_from=wealth_date_from or date_from, date_to=date_to)
+        ),
+        "expenses_by_category": _records(category_expenses(period)),
+        "account_balance": _records(account_balance(period)),
+        "commitments_summary": commitments_summary(
+            date_from=date_from,
+            date_to=date_to,
+            account=account,
+            user_id=user_id,
+        ),
+    }
@@ -1,9 +1,22 @@
+import os
+import time
+from collections.abc import Callable
 from contextvars import ContextVar
+from threading import Lock
+from typing import Any
+
+WORKSPACE_RESOLUTION_TTL_S = max(0.0, float(os.getenv("WORKSPACE_RESOLUTION_TTL_S", "60") or "60"))
+WORKSPACE_RESOLUTION_MAX_ENTRIES = 4096
 
 _current_user_id: ContextVar[int | None] = ContextVar("current_user_id", default=None)
 _current_workspace_id: ContextVar[int | None] = ContextVar("current_workspace_id", default=None)
 _current_workspace_role: ContextVar[str | None] = ContextVar("current_workspace_role", default=None)
 _current_global_role: ContextVar[str | None] = ContextVar("current_global_role", default=None)
+_current_unit_of_work: ContextVar[Any | None] = ContextVar("current_unit_of_work", default=None)
+
+# user_id -> (expira_em, workspace_id | None). None = usuário sem workspace (escopo legado por user_id).
+_workspace_resolution_lock = Lock()
+_workspace_resolution_cache: dict[int, tuple[float, int | None]] = {}
 
 
 def set_current_user_id(user_id: int) -> None:
@@ -68,8 +81,77 @@ def get_current_global_role(required: bool = False) -> str | None:
     return role
 
 
+def set_current_unit_of_work(unit_of_work: Any) -> None:
+    _current_unit_of_work.set(unit_of_work)
+
+
+def clear_current_unit_of_work() -> None:
+    _current_unit_of_work.set(None)
+
+
+def get_current_unit_of_work() -> Any | None:
+    return _current_unit_of_work.get()
+
+
+def repeat_after_unit_of_work(callback: Callable[..., None], *args: Any) -> None:
+    """Agenda `callback(*args)` para quando a unidade de trabalho corrente terminar (após o commit).
+
+    Para invalidação de cache: limpar só durante a request deixaria outra request concorrente
+    recolocar no cache o estado antigo, ainda visível até o commit.
+    """
+    uow = _current_unit_of_work.get()
+    if uow is not None:
+        uow.after_finish(callback, *args)
+
+
 def clear_tenant_context() -> None:
     clear_current_user_id()
     clear_current_workspace_id()
     clear_current_workspace_role()
     clear_current_global_role()
+
+
+def get_cached_workspace_resolution(user_id: int) -> tuple[bool, int | None]:
+    """Retorna (encontrado, workspace_id) do cache de resolução de escopo, respeitando o TTL."""
+    uid = int(user_id)
+    with _workspace_resolution_lock:
+        entry = _workspace_resolution_cache.get(uid)
+        if entry is None:
+            return False, None
+        expires_at, workspace_id = entry
+        if expires_at <= time.monotonic():
+            _workspace_resolution_cache.pop(uid, None)
+            return False, None
+        return True, workspace_id
+
+
+def cache_workspace_resolution(user_id: int, workspace_id: int | None) -> None:
+    if WORKSPACE_RESOLUTION_TTL_S <= 0:
+        return
+    now = time.monotonic()
+    with _workspace_resolution_lock:
+        if len(_workspace_resolution_cache) >= WORKSPACE_RESOLUTION_MAX_ENTRIES:
+            expired = [k for k, (exp, _) in _workspace_resolution_cache.items() if exp <= now]
+            for k in expired:
+                _workspace_resolution_cache.pop(k, None)
+            if len(_workspace_resolution_cache) >= WORKSPACE_RESOLUTION_MAX_ENTRIES:
+                _workspace_resolution_cache.clear()
+        _workspace_resolution_cache[int(user_id)] = (
+            now + WORKSPACE_RESOLUTION_TTL_S,
+            int(workspace_id) if workspace_id is not None else None,
+        )
+
+
+def _drop_workspace_resolution(user_id: int | None) -> None:
+    with _workspace_resolution_lock:
+        if user_id is None:
+            _workspace_resolution_cache.clear()
+        else:
+            _workspace_resolution_cache.pop(int(user_id), None)
+
+
+def invalidate_workspace_resolution(user_id: int | None = None) -> None:
+    """Invalida a resolução de um usuário, ou de todos quando user_id é None (de novo após o commit)."""
+    uid = int(user_id) if user_id is not None else None
+    _drop_workspace_resolution(uid)
+    repeat_after_unit_of_work(_drop_workspace_resolution, uid)
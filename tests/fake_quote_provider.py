@@ -0,0 +1,186 @@
+"""
+Servidor HTTP local que imita BRAPI, Yahoo (v7/finance/quote) e Stooq para testes e benchmark.
+
+Uso como benchmark:
+    python tests/fake_quote_provider.py --assets 200 --latency-ms 120
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, unquote, urlsplit
+
+QUOTE_EPOCH = 1767614400  # 2026-01-05 12:00 UTC
+
+
+class FakeQuoteProvider:
+    """Preços determinísticos por símbolo; latência fixa; símbolos em `hang` demoram `hang_s`."""
+
+    def __init__(self, prices: dict[str, float], latency_s: float = 0.0, hang: set[str] | None = None, hang_s: float = 5.0):
+        self.prices = {k.upper(): float(v) for k, v in prices.items()}
+        self.latency_s = float(latency_s)
+        self.hang = {s.upper() for s in (hang or set())}
+        self.hang_s = float(hang_s)
+        self.connections = 0
+        self.requests: list[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+        self.base_url = ""
+
+    def _enter(self, path: str) -> None:
+        with self._lock:
+            self.requests.append(path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _delay(self, symbols: list[str]) -> None:
+        if any(s.upper() in self.hang for s in symbols):
+            time.sleep(self.hang_s)
+        elif self.latency_s:
+            time.sleep(self.latency_s)
+
+    def _respond(self, path: str, query: dict[str, list[str]]) -> tuple[int, str, str]:
+        if path.startswith("/api/quote/"):
+            symbols = [s for s in unquote(path[len("/api/quote/") :]).split(",") if s]
+            self._delay(symbols)
+            results = [
+                {"symbol": s.upper(), "regularMarketPrice": self.prices[s.upper()], "regularMarketTime": QUOTE_EPOCH}
+                for s in symbols
+                if s.upper() in self.prices
+            ]
+            if not results:
+                return 404, "application/json", json.dumps({"error": True, "message": "Não encontramos a ação"})
+            return 200, "application/json", json.dumps({"results": results})
+        if path == "/v7/finance/quote":
+            symbols = [s for s in (query.get("symbols") or [""])[0].split(",") if s]
+            self._delay(symbols)
+            results = [
+                {"symbol": s.upper(), "regularMarketPrice": self.prices[s.upper()], "regularMarketTime": QUOTE_EPOCH}
+                for s in symbols
+                if s.upper() in self.prices
+            ]
+            return 200, "application/json", json.dumps({"quoteResponse": {"result": results, "error": None}})
+        if path == "/q/l/":
+            sym = (query.get("s") or [""])[0].upper()
+            self._delay([sym])
+            price = self.prices.get(sym)
+            if price is None:
+                return 200, "text/csv", f"{sym},N/D,N/D,N/D,N/D,N/D,N/D,N/D\n"
+            return 200, "text/csv", f"{sym},2026-01-05,22:00:00,{price},{price},{price},{price},1000\n"
+        return 404, "text/plain", "not found"
+
+    def start(self) -> "FakeQuoteProvider":
+        provider = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Sem Nagle: cabeçalho e corpo saem em escritas separadas e a conexão é reaproveitada.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with provider._lock:
+                    provider.connections += 1
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                provider._enter(parts.path)
+                try:
+                    status, ctype, body = provider._respond(parts.path, parse_qs(parts.query))
+                finally:
+                    provider._leave()
+                payload = body.encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", ctype)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # cliente cancelou (timeout)
+
+            def log_message(self, format, *args):
+                return
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @contextmanager
+    def patched(self, invest_quotes_module, brapi_token: str | None = "fake-token"):
+        """Aponta os provedores HTTP para este servidor e desliga o yfinance (sem rede)."""
+        env = {"BRAPI_TOKEN": brapi_token} if brapi_token else {}
+        with mock.patch.multiple(
+            invest_quotes_module,
+            BRAPI_BASE_URL=self.base_url,
+            YAHOO_BASE_URL=self.base_url,
+            STOOQ_BASE_URL=self.base_url,
+            fetch_last_price_yf=lambda sym: (None, None, None),
+        ), mock.patch.object(invest_quotes_module, "_get_brapi_token", return_value=brapi_token), mock.patch.dict(
+            "os.environ", env
+        ):
+            yield self
+
+
+def _bench(argv: list[str] | None = None) -> int:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import invest_quotes
+
+    parser = argparse.ArgumentParser(description="Benchmark de update_all_prices contra o provedor fake.")
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    symbols = [f"TST{n:03d}3" for n in range(args.assets)]
+    assets = [{"id": n, "symbol": s, "asset_class": "Ações BR", "currency": "BRL"} for n, s in enumerate(symbols)]
+    for mode in ["threads", "async"]:
+        provider = FakeQuoteProvider({s: 10.0 + n for n, s in enumerate(symbols)}, latency_s=args.latency_ms / 1000).start()
+        try:
+            with provider.patched(invest_quotes):
+                started = time.monotonic()
+                report = invest_quotes.update_all_prices(assets, max_workers=args.max_workers, mode=mode)
+                elapsed = time.monotonic() - started
+        finally:
+            provider.stop()
+        ok = sum(1 for r in report if r.get("ok"))
+        print(
+            json.dumps(
+                {
+                    "mode": mode,
+                    "assets": len(assets),
+                    "ok": ok,
+                    "elapsed_s": round(elapsed, 3),
+                    "requests": len(provider.requests),
+                    "connections": provider.connections,
+                }
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_bench(sys.argv[1:]))
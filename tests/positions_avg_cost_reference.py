@@ -0,0 +1,114 @@
+"""
+Referência linha a linha de positions_avg_cost e gerador de trades sintéticos para testes e benchmark.
+
+Uso como benchmark:
+    python tests/positions_avg_cost_reference.py --sizes 10000,100000 --assets 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+
+def synthetic_trades(n_trades: int, n_assets: int, seed: int) -> pd.DataFrame:
+    rng = random.Random(seed)
+    classes = [("Ações", "BRL"), ("Stocks", "USD"), ("Renda Fixa", "BRL"), ("Tesouro Direto", "BRL"), ("FII", "BRL")]
+    dates = pd.date_range("2020-01-01", "2026-01-01", freq="D")
+    rows = []
+    for trade_id in range(1, n_trades + 1):
+        aid = rng.randrange(1, n_assets + 1)
+        asset_class, currency = classes[aid % len(classes)]
+        rows.append(
+            {
+                "id": trade_id,
+                "asset_id": aid,
+                "date": dates[rng.randrange(len(dates))],
+                "side": "BUY" if rng.random() < 0.65 else "SELL",
+                "quantity": round(rng.uniform(0.5, 200.0), 4),
+                "price": round(rng.uniform(1.0, 500.0), 2),
+                "exchange_rate": round(rng.uniform(4.5, 5.8), 4) if currency == "USD" else 1.0,
+                "fees": round(rng.uniform(0.0, 10.0), 2),
+                "taxes": round(rng.uniform(0.0, 3.0), 2),
+                "symbol": f"AST{aid}",
+                "asset_class": asset_class,
+                "currency": currency,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def positions_avg_cost_rows(trades_df: pd.DataFrame) -> pd.DataFrame:
+    """Implementação anterior de invest_reports.positions_avg_cost (iterrows), base da paridade."""
+    import invest_reports
+
+    if trades_df.empty:
+        return pd.DataFrame(columns=invest_reports._POSITION_COLUMNS)
+
+    trades_df = trades_df.sort_values(["date", "id"]).copy()
+    state = {}
+    rows = []
+
+    for _, r in trades_df.iterrows():
+        invest_reports._apply_trade(state, r)
+
+    for aid, s in state.items():
+        qty = s["qty"]
+        avg_cost = (s["cost_basis"] / qty) if qty else 0.0
+        rows.append(
+            {
+                "asset_id": aid,
+                "symbol": s["symbol"],
+                "asset_class": s["asset_class"],
+                "qty": qty,
+                "avg_cost": avg_cost,
+                "cost_basis": s["cost_basis"],
+                "realized_pnl": s["realized_pnl"],
+                "last_fx": s["last_fx"],
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def _best_of(fn, trades_df, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(trades_df)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _bench(argv: list[str] | None = None) -> int:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import invest_reports
+    from pandas.testing import assert_frame_equal
+
+    parser = argparse.ArgumentParser(description="Compara positions_avg_cost (arrays) com a versão linha a linha.")
+    parser.add_argument("--sizes", default="10000,100000", help="Quantidades de trades separadas por vírgula.")
+    parser.add_argument("--assets", type=int, default=300, help="Quantidade de ativos distintos.")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções por cenário (usa o melhor tempo).")
+    args = parser.parse_args(argv)
+
+    print(f"{'trades':>10} {'iterrows (s)':>14} {'arrays (s)':>12} {'speedup':>9}")
+    for size in [int(s) for s in str(args.sizes).split(",") if s.strip()]:
+        trades_df = synthetic_trades(size, args.assets, seed=size)
+        assert_frame_equal(
+            positions_avg_cost_rows(trades_df),
+            invest_reports.positions_avg_cost(trades_df),
+            check_exact=True,
+        )
+        rows_s = _best_of(positions_avg_cost_rows, trades_df, args.repeat)
+        arrays_s = _best_of(invest_reports.positions_avg_cost, trades_df, args.repeat)
+        print(f"{size:>10} {rows_s:>14.4f} {arrays_s:>12.4f} {rows_s / arrays_s:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_bench(sys.argv[1:]))
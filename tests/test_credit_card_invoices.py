@@ -23,6 +23,7 @@ class CreditCardInvoiceTests(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        db_module.close_pool()
         db_module.SQLITE_PATH = cls._orig_sqlite_path
         db_module.DB_PATH = cls._orig_db_path
         db_module.DATABASE_URL = cls._orig_database_url
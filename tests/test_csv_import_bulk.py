@@ -0,0 +1,205 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api.importers as importers
+import api.main as main_module
+import db as db_module
+import repo
+import reports
+import tenant
+
+
+class BulkCsvImportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_csv_import_bulk.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        main_module._shutdown_login_sync_executor()
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in [
+                "monthly_rollup",
+                "monthly_rollup_state",
+                "trades",
+                "assets",
+                "transactions",
+                "categories",
+                "accounts",
+                "workspace_users",
+                "workspaces",
+                "users",
+            ]:
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (1, 'owner@example.com', 'x', 'Owner', 'user', 'USER', 1)
+                """
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute("INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)")
+            conn.execute("INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (10, 'Conta', 'Banco', 'BRL', 101)")
+        tenant.invalidate_workspace_resolution()
+
+    def _count(self, table: str) -> int:
+        with db_module.get_conn() as conn:
+            return int(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+
+    def test_transactions_are_inserted_in_one_batch_with_row_errors(self):
+        csv_text = "\n".join(
+            [
+                "date,description,amount,account,category,method",
+                "2026-01-05,Salario,5000,Conta,Salario,PIX",
+                "2026-01-06,Mercado,-120.5,Nubank,Mercado,Debito",
+                "xx/yy,Data ruim,-10,Conta,Mercado,PIX",
+                "2026-01-07,,-10,Conta,Mercado,PIX",
+                "2026-02-01,Aluguel,-1800,Conta,Moradia,Futuro",
+                "2026-02-02,Sem valor,abc,Conta,,PIX",
+                "2026-02-03,Sem categoria,-5,Nubank,,PIX",
+            ]
+        )
+        with mock.patch.object(repo, "insert_transaction") as single, mock.patch.object(
+            db_module, "_open_conn", wraps=db_module._open_conn
+        ) as opened:
+            out = importers.import_transactions_csv(csv_text.encode("utf-8"), user_id=1)
+
+        single.assert_not_called()
+        self.assertLessEqual(opened.call_count, 6)
+        self.assertEqual((4, 4, 3), (out["rows"], out["inserted"], out["rejected"]))
+        self.assertEqual(
+            ["Linha 4: data inválida.", "Linha 5: descrição vazia.", "Linha 7: valor inválido."],
+            out["errors"],
+        )
+        accounts = {r["name"]: r["type"] for r in repo.list_accounts(user_id=1)}
+        self.assertEqual({"Conta": "Banco", "Nubank": "Banco"}, accounts)
+        self.assertEqual({"Salario", "Mercado", "Moradia"}, {r["name"] for r in repo.list_categories(user_id=1)})
+
+        ledger = reports.df_transactions(user_id=1)
+        rollup = reports.df_dashboard(user_id=1)
+        self.assertEqual(reports.kpis(ledger), reports.kpis(rollup))
+        self.assertAlmostEqual(5000 - 120.5 - 5, float(ledger["amount_brl"].sum()))
+
+    def test_failed_batch_leaves_no_partial_data(self):
+        csv_text = "date,description,amount,account,category\n2026-01-05,A,1,Nova,Cat\n2026-01-06,B,2,Nova,Cat\n"
+        with mock.patch.object(repo, "_touch_monthly_rollup", side_effect=RuntimeError("disco cheio")):
+            with self.assertRaises(RuntimeError):
+                importers.import_transactions_csv(csv_text.encode("utf-8"), user_id=1)
+        self.assertEqual(0, self._count("transactions"))
+        self.assertEqual(["Conta"], [r["name"] for r in repo.list_accounts(user_id=1)])
+
+    def test_trades_track_broker_cash_in_memory(self):
+        with db_module.get_conn() as conn:
+            conn.execute("INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (12, 'XP', 'Corretora', 'BRL', 101)")
+            conn.execute(
+                "INSERT INTO assets(id, symbol, name, asset_class, currency, broker_account_id, workspace_id) VALUES (1, 'PETR4', 'Petrobras', 'Ações BR', 'BRL', 12, 101)"
+            )
+            conn.execute(
+                "INSERT INTO transactions(date, description, amount_brl, account_id, method, workspace_id) VALUES ('2026-01-02', 'Aporte', 1000, 12, 'PIX', 101)"
+            )
+        csv_text = "\n".join(
+            [
+                "date;ativo;tipo;quantidade;preco;taxas",
+                "03/01/2026;PETR4;compra;10;40;1",
+                "04/01/2026;PETR4;compra;20;40;0",
+                "05/01/2026;PETR4;venda;5;50;0",
+                "06/01/2026;PETR4;compra;5;40;0",
+                "07/01/2026;VALE3;compra;1;60;0",
+                "08/01/2026;PETR4;compra;0;40;0",
+            ]
+        )
+        with mock.patch.object(reports, "account_balance_by_id") as per_row:
+            out = importers.import_trades_csv(csv_text.encode("utf-8"), user_id=1)
+
+        per_row.assert_not_called()
+        self.assertEqual((5, 3, 2, 1), (out["rows"], out["inserted"], out["skipped"], out["rejected"]))
+        self.assertTrue(out["errors"][0].startswith("Linha 3: PETR4: saldo insuficiente"), out["errors"])
+        self.assertEqual("Linha 6: VALE3: ativo não encontrado.", out["errors"][1])
+        self.assertEqual("Linha 7: quantidade deve ser maior que zero.", out["errors"][2])
+        self.assertEqual(3, self._count("trades"))
+        # 1000 - 401 + 250 - 200
+        self.assertAlmostEqual(649.0, reports.account_balance_by_id(12, user_id=1))
+
+
+    def _big_csv(self, n: int) -> bytes:
+        lines = ["date;description;amount;account;category"]
+        for i in range(n):
+            amount = "abc" if i % 97 == 0 else f"-{i % 50 + 1}.5"
+            lines.append(f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d};Compra {i};{amount};Conta {i % 3};Cat {i % 4}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def test_chunked_reader_reports_progress_and_matches_single_batch(self):
+        raw = self._big_csv(1000)
+        events = []
+        out = importers.import_transactions_csv(io.BytesIO(raw), user_id=1, chunk_rows=128, progress_cb=events.append)
+
+        self.assertEqual(8, len(events))
+        self.assertEqual([min(1000, 128 * (k + 1)) for k in range(8)], [e["rows_read"] for e in events])
+        self.assertEqual(len(raw), events[-1]["bytes_total"])
+        self.assertEqual((989, 989, 11), (out["rows"], out["inserted"], out["rejected"]))
+        self.assertEqual("Linha 2: valor inválido.", out["errors"][0])
+        self.assertEqual("Linha 972: valor inválido.", out["errors"][-1])
+        self.assertEqual(989, self._count("transactions"))
+        ledger = reports.df_transactions(user_id=1)
+        self.assertEqual(reports.kpis(ledger), reports.kpis(reports.df_dashboard(user_id=1)))
+
+        preview = importers.import_transactions_csv(raw, user_id=1, preview_only=True, chunk_rows=100)
+        self.assertEqual((989, 11, 20), (preview["rows"], preview["rejected"], len(preview["preview"])))
+
+    def test_failure_in_a_later_chunk_rolls_back_earlier_chunks(self):
+        raw = self._big_csv(300)
+        real = repo.bulk_insert_transactions
+        calls = []
+
+        def flaky(rows, **kwargs):
+            calls.append(len(rows))
+            if len(calls) == 3:
+                raise RuntimeError("conexão perdida")
+            return real(rows, **kwargs)
+
+        with mock.patch.object(repo, "bulk_insert_transactions", side_effect=flaky):
+            with self.assertRaises(RuntimeError):
+                importers.import_transactions_csv(raw, user_id=1, chunk_rows=100)
+        self.assertEqual(0, self._count("transactions"))
+
+    def test_upload_endpoint_streams_the_spooled_file(self):
+        client = TestClient(main_module.app)
+        main_module.app.dependency_overrides[main_module._current_user] = lambda: {"id": 1}
+        try:
+            with mock.patch.object(importers, "IMPORT_CHUNK_ROWS", 50):
+                resp = client.post("/import/transactions-csv", files={"file": ("extrato.csv", self._big_csv(200), "text/csv")})
+            empty = client.post("/import/transactions-csv", files={"file": ("vazio.csv", b"", "text/csv")})
+        finally:
+            main_module.app.dependency_overrides.clear()
+        self.assertEqual(200, resp.status_code, resp.text)
+        self.assertEqual((197, 3), (resp.json()["inserted"], resp.json()["rejected"]))
+        self.assertEqual(400, empty.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
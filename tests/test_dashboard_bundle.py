@@ -0,0 +1,122 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import auth as auth_module
+import db as db_module
+import repo
+import reports
+import tenant
+from api.main import app
+from api.security import create_token
+
+
+class DashboardBundleTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_dashboard_bundle.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+        cls.client = TestClient(app)
+
+        with db_module.get_conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (1, "owner@example.com", "x", "Owner", "user", "USER", 1),
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute(
+                "INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)"
+            )
+            conn.execute("INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (10, 'Conta', 'Banco', 'BRL', 101)")
+            conn.execute("INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (11, 'Cartao', 'Cartao', 'BRL', 101)")
+            conn.execute("INSERT INTO categories(id, name, kind, workspace_id) VALUES (20, 'Salario', 'Receita', 101)")
+            conn.execute("INSERT INTO categories(id, name, kind, workspace_id) VALUES (21, 'Mercado', 'Despesa', 101)")
+        tenant.invalidate_workspace_resolution()
+        auth_module.invalidate_principal_cache()
+
+        repo.create_credit_card("Cartao", "Visa", "Black", "Credito", 11, 10, 10, 3, user_id=1)
+        card_id = int(repo.list_credit_cards(user_id=1)[0]["id"])
+        repo.insert_transaction("2025-12-05", "Salario", 4000.0, 10, 20, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-01-05", "Salario", 5000.0, 10, 20, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-01-20", "Mercado", -350.0, 10, 21, "Debito", None, user_id=1)
+        repo.insert_transaction("2026-02-10", "Mercado", -420.5, 10, 21, "Debito", None, user_id=1)
+        repo.insert_transaction("2026-02-28", "Aluguel", -1800.0, 10, 21, "Futuro", None, user_id=1)
+        repo.register_credit_charge(card_id, "2026-02-03", 250.0, 21, "Compra", user_id=1)
+
+        token = create_token(
+            user_id=1,
+            email="owner@example.com",
+            workspace_id=101,
+            global_role="USER",
+            workspace_role="OWNER",
+        )
+        cls.headers = {"Authorization": f"Bearer {token}"}
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        auth_module.invalidate_principal_cache()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def _get(self, path: str, params: dict):
+        resp = self.client.get(path, params=params, headers=self.headers)
+        self.assertEqual(200, resp.status_code, resp.text)
+        return resp.json()
+
+    def test_bundle_matches_individual_endpoints(self):
+        for view in ["caixa", "competencia", "futuro"]:
+            for params in [
+                {"date_from": "2026-01-01", "date_to": "2026-02-28"},
+                {"date_from": "2026-01-15", "date_to": "2026-02-20", "account": "Conta"},
+                {"date_to": "2026-02-28"},
+            ]:
+                params = {**params, "view": view}
+                bundle = self._get("/dashboard/bundle", params)
+                self.assertEqual(self._get("/dashboard/kpis", params), bundle["kpis"])
+                self.assertEqual(self._get("/dashboard/monthly", params), bundle["monthly"])
+                self.assertEqual(self._get("/dashboard/wealth-monthly", params), bundle["wealth_monthly"])
+                self.assertEqual(self._get("/dashboard/expenses-by-category", params), bundle["expenses_by_category"])
+                self.assertEqual(self._get("/dashboard/account-balance", params), bundle["account_balance"])
+                commitments = {k: v for k, v in params.items() if k != "view"}
+                self.assertEqual(
+                    self._get("/dashboard/commitments-summary", commitments),
+                    bundle["commitments_summary"],
+                )
+
+    def test_wealth_window_can_start_before_period(self):
+        bundle = self._get(
+            "/dashboard/bundle",
+            {"date_from": "2026-02-01", "date_to": "2026-02-28", "wealth_date_from": "2025-12-01"},
+        )
+        self.assertEqual(["2025-12", "2026-01", "2026-02"], [r["month"] for r in bundle["wealth_monthly"]])
+        self.assertEqual(["2026-02"], [r["month"] for r in bundle["monthly"]])
+
+    def test_bundle_loads_each_slice_once(self):
+        with mock.patch.object(reports, "df_dashboard", wraps=reports.df_dashboard) as spy:
+            self._get("/dashboard/bundle", {"date_from": "2026-01-01", "date_to": "2026-02-28"})
+        self.assertEqual(2, spy.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import gc
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import db as db_module
+
+
+class SQLitePoolTests(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._db_path = Path(self._tmpdir.name) / "finance_test_pool.db"
+        self._orig = {
+            "SQLITE_PATH": db_module.SQLITE_PATH,
+            "DB_PATH": db_module.DB_PATH,
+            "DATABASE_URL": db_module.DATABASE_URL,
+            "USE_POSTGRES": db_module.USE_POSTGRES,
+            "POOL_ENABLED": db_module.POOL_ENABLED,
+            "POOL_MIN_SIZE": db_module.POOL_MIN_SIZE,
+            "POOL_MAX_SIZE": db_module.POOL_MAX_SIZE,
+            "POOL_TIMEOUT_S": db_module.POOL_TIMEOUT_S,
+        }
+        db_module.close_pool()
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = self._db_path
+        db_module.DB_PATH = self._db_path
+        db_module.POOL_ENABLED = True
+        db_module.POOL_MIN_SIZE = 1
+        db_module.POOL_MAX_SIZE = 2
+        db_module.POOL_TIMEOUT_S = 0.2
+        with db_module.get_conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, v TEXT)")
+
+    def tearDown(self):
+        db_module.close_pool()
+        for name, value in self._orig.items():
+            setattr(db_module, name, value)
+        self._tmpdir.cleanup()
+
+    def test_closed_connection_is_reused(self):
+        conn = db_module.get_conn()
+        raw = conn._conn
+        conn.close()
+        conn.close()
+        again = db_module.get_conn()
+        self.assertIs(raw, again._conn)
+        again.close()
+        stats = db_module.pool_stats()
+        self.assertEqual("sqlite", stats["backend"])
+        self.assertTrue(stats["active"])
+        self.assertEqual(1, stats["pool_size"])
+        self.assertEqual(1, stats["pool_available"])
+
+    def test_uncommitted_changes_are_discarded_on_release(self):
+        conn = db_module.get_conn()
+        conn.execute("INSERT INTO t(v) VALUES (?)", ("rascunho",))
+        conn.close()
+        with db_module.get_conn() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        self.assertEqual(0, total)
+
+    def test_pool_is_bounded_and_times_out(self):
+        first = db_module.get_conn()
+        second = db_module.get_conn()
+        with self.assertRaises(RuntimeError):
+            db_module.get_conn()
+        self.assertEqual(1, db_module.pool_stats()["requests_timeouts"])
+        first.close()
+        second.close()
+
+    def test_waiting_request_gets_released_connection(self):
+        db_module.close_pool()
+        db_module.POOL_TIMEOUT_S = 5.0
+        holders = [db_module.get_conn(), db_module.get_conn()]
+        got = []
+        worker = threading.Thread(target=lambda: got.append(db_module.get_conn()))
+        worker.start()
+        holders[0].close()
+        worker.join(timeout=5)
+        self.assertEqual(1, len(got))
+        got[0].close()
+        holders[1].close()
+        self.assertGreaterEqual(db_module.pool_stats()["requests_waiting"], 1)
+
+    def test_leaked_connection_frees_its_slot(self):
+        leaked = db_module.get_conn()
+        other = db_module.get_conn()
+        del leaked
+        gc.collect()
+        third = db_module.get_conn()
+        third.close()
+        other.close()
+        self.assertEqual(1, db_module.pool_stats()["connections_discarded"])
+
+    def test_broken_idle_connection_is_replaced(self):
+        conn = db_module.get_conn()
+        raw = conn._conn
+        conn.close()
+        raw.close()
+        with db_module.get_conn() as conn:
+            self.assertIsNot(raw, conn._conn)
+            self.assertEqual(1, conn.execute("SELECT 1").fetchone()[0])
+        self.assertEqual(1, db_module.pool_stats()["health_check_failures"])
+
+    def test_pool_follows_sqlite_path_changes(self):
+        conn = db_module.get_conn()
+        conn.close()
+        other_path = Path(self._tmpdir.name) / "finance_test_pool_other.db"
+        db_module.SQLITE_PATH = other_path
+        with db_module.get_conn() as conn:
+            conn.execute("CREATE TABLE other_t (id INTEGER)")
+        self.assertTrue(other_path.exists())
+
+    def test_disabled_pool_opens_direct_connections(self):
+        db_module.close_pool()
+        db_module.POOL_ENABLED = False
+        conn = db_module.get_conn()
+        self.assertIsNone(conn._pool)
+        conn.close()
+        self.assertFalse(db_module.pool_stats()["active"])
+
+
+if __name__ == "__main__":
+    unittest.main()
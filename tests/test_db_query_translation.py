@@ -0,0 +1,56 @@
+import re
+import unittest
+
+import db as db_module
+
+
+def _legacy_translate(query: str, workspace_scope: bool, use_postgres: bool) -> str:
+    q = str(query)
+    if workspace_scope:
+        q = re.sub(r"(?<![A-Za-z0-9_])user_id(?![A-Za-z0-9_])", "workspace_id", q)
+    if not use_postgres:
+        return q
+    if re.match(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO\s+", q, re.IGNORECASE):
+        q = re.sub(r"^\s*INSERT\s+OR\s+IGNORE\s+INTO\s+", "INSERT INTO ", q, flags=re.IGNORECASE)
+        if "ON CONFLICT" not in q.upper():
+            q = q.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
+    return q.replace("?", "%s")
+
+
+class QueryTranslationTests(unittest.TestCase):
+    QUERIES = [
+        "SELECT id, name FROM accounts WHERE user_id = ? ORDER BY name",
+        "SELECT a.id FROM assets a JOIN trades t ON t.asset_id = a.id AND t.user_id = a.user_id WHERE a.user_id = ?",
+        "SELECT wu.workspace_id FROM workspace_users wu WHERE wu.user_id = ? AND created_by_user_id IS NULL",
+        "  insert or ignore into categories(name, kind, user_id) VALUES (?, ?, ?);",
+        "INSERT OR IGNORE INTO prices(asset_id, date, price) VALUES (?, ?, ?) ON CONFLICT(asset_id, date) DO NOTHING",
+        "UPDATE assets SET current_value = ? WHERE id = ? AND user_id = ?",
+    ]
+
+    def test_matches_legacy_regex_translation(self):
+        for query in self.QUERIES:
+            for workspace_scope in (False, True):
+                for use_postgres in (False, True):
+                    with self.subTest(query=query, workspace_scope=workspace_scope, use_postgres=use_postgres):
+                        self.assertEqual(
+                            _legacy_translate(query, workspace_scope, use_postgres),
+                            db_module.translate_query(query, workspace_scope, use_postgres),
+                        )
+
+    def test_scope_sql_only_rewrites_whole_identifier(self):
+        q = db_module.scope_sql("SELECT owner_user_id, user_id, user_idx FROM t WHERE t.user_id = ?")
+        self.assertEqual("SELECT owner_user_id, workspace_id, user_idx FROM t WHERE t.workspace_id = ?", q)
+
+    def test_repeated_translation_is_served_from_cache(self):
+        query = "SELECT COUNT(*) FROM transactions WHERE user_id = ? AND date >= ? -- query_cache_test"
+        before = db_module.query_cache_stats()
+        for _ in range(5):
+            db_module.translate_query(query, True, True)
+        after = db_module.query_cache_stats()
+        self.assertEqual(before["misses"] + 1, after["misses"])
+        self.assertEqual(before["hits"] + 4, after["hits"])
+        self.assertLessEqual(after["size"], after["max_size"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import db as db_module
+from api.main import app
+from api.security import create_token
+from tenant import get_current_unit_of_work
+
+
+class _FakePgRaw:
+    """Conexão PostgreSQL mínima: erro aborta a transação até ROLLBACK TO SAVEPOINT/ROLLBACK."""
+
+    def __init__(self):
+        self.rows: list[str] = []
+        self.committed: list[str] = []
+        self.savepoints: list[tuple[str, int]] = []
+        self.aborted = False
+
+    def execute(self, query, params=()):
+        q = " ".join(str(query).split())
+        if q.startswith("ROLLBACK TO SAVEPOINT "):
+            name = q.rsplit(" ", 1)[1]
+            idx = [n for n, _ in self.savepoints].index(name)
+            del self.rows[self.savepoints[idx][1]:]
+            del self.savepoints[idx + 1:]
+            self.aborted = False
+            return self
+        if self.aborted:
+            raise RuntimeError("current transaction is aborted")
+        if q.startswith("SAVEPOINT "):
+            self.savepoints.append((q.split(" ", 1)[1], len(self.rows)))
+        elif q.startswith("RELEASE SAVEPOINT "):
+            idx = [n for n, _ in self.savepoints].index(q.rsplit(" ", 1)[1])
+            del self.savepoints[idx:]
+        elif q.startswith("INSERT"):
+            self.rows.append(params[0])
+        elif q.startswith("SELECT falha"):
+            self.aborted = True
+            raise RuntimeError("relation does not exist")
+        return self
+
+    def commit(self):
+        if self.aborted:
+            raise RuntimeError("current transaction is aborted")
+        self.committed.extend(self.rows)
+        self.rows, self.savepoints = [], []
+
+    def rollback(self):
+        self.rows, self.savepoints, self.aborted = [], [], False
+
+    def close(self):
+        pass
+
+
+class UnitOfWorkTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_unit_of_work.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in ["workspace_users", "workspaces", "accounts", "users"]:
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (1, "owner@example.com", "x", "Owner", "user", "USER", 1),
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute(
+                "INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)"
+            )
+
+    def _insert_account(self, conn, name: str) -> None:
+        conn.execute(
+            "INSERT INTO accounts(name, type, currency, user_id) VALUES (?, ?, ?, ?)",
+            (name, "Banco", "BRL", 1),
+        )
+
+    def _account_names(self) -> list[str]:
+        with db_module.get_conn() as conn:
+            rows = conn.execute("SELECT name FROM accounts ORDER BY name").fetchall()
+        return [r["name"] for r in rows]
+
+    def test_get_conn_reuses_single_connection_inside_scope(self):
+        with db_module.unit_of_work() as uow:
+            first = db_module.get_conn()
+            second = db_module.get_conn()
+            self.assertIs(first._conn, second._conn)
+            first.close()
+            # Fechar um handle não fecha a conexão compartilhada.
+            second.execute("SELECT 1").fetchone()
+            second.close()
+            self.assertEqual(2, uow.handles)
+        self.assertIsNone(get_current_unit_of_work())
+
+    def test_commit_is_deferred_until_scope_ends(self):
+        with db_module.unit_of_work():
+            with db_module.get_conn() as conn:
+                self._insert_account(conn, "Conta A")
+            with db_module.get_conn() as conn:
+                self._insert_account(conn, "Conta B")
+                # Mesma transação: a escrita anterior é visível.
+                count = conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+                self.assertEqual(2, count)
+        self.assertEqual(["Conta A", "Conta B"], self._account_names())
+
+    def test_exception_rolls_back_whole_scope(self):
+        with self.assertRaises(ValueError):
+            with db_module.unit_of_work():
+                with db_module.get_conn() as conn:
+                    self._insert_account(conn, "Conta A")
+                raise ValueError("falha no meio da request")
+        self.assertEqual([], self._account_names())
+
+    def test_nested_scope_joins_outer_unit_of_work(self):
+        with db_module.unit_of_work() as outer:
+            with db_module.unit_of_work() as inner:
+                self.assertIs(outer, inner)
+                with db_module.get_conn() as conn:
+                    self._insert_account(conn, "Conta A")
+            self.assertIs(outer, get_current_unit_of_work())
+        self.assertEqual(["Conta A"], self._account_names())
+
+    def test_caught_failure_only_discards_the_failing_handle(self):
+        def failing_helper() -> tuple[bool, str]:
+            # Padrão de invest_repo.delete_*_with_cash_reversal: captura, rollback e segue.
+            conn = db_module.get_conn()
+            try:
+                self._insert_account(conn, "Conta B")
+                conn.execute("INSERT INTO users(id, email, password_hash) VALUES (1, 'dup@example.com', 'x')")
+                conn.commit()
+                return True, ""
+            except sqlite3.IntegrityError as e:
+                conn.rollback()
+                return False, str(e)
+            finally:
+                conn.close()
+
+        with db_module.unit_of_work():
+            with db_module.get_conn() as conn:
+                self._insert_account(conn, "Conta A")
+            ok, _ = failing_helper()
+            self.assertFalse(ok)
+            with db_module.get_conn() as conn:
+                self._insert_account(conn, "Conta C")
+        self.assertEqual(["Conta A", "Conta C"], self._account_names())
+
+    def test_handle_closed_without_commit_discards_only_its_writes(self):
+        with db_module.unit_of_work():
+            outer = db_module.get_conn()
+            self._insert_account(outer, "Conta A")
+            inner = db_module.get_conn()
+            self._insert_account(inner, "Conta B")
+            inner.close()
+            outer.commit()
+            outer.close()
+        self.assertEqual(["Conta A"], self._account_names())
+
+    def test_caught_postgres_error_does_not_abort_the_request_transaction(self):
+        raw = _FakePgRaw()
+        with mock.patch.object(db_module, "_open_conn", return_value=db_module.DBConn(raw, use_postgres=True)):
+            with db_module.unit_of_work():
+                with db_module.get_conn() as conn:
+                    conn.execute("INSERT INTO t(v) VALUES (?)", ("A",))
+                # Como resolve_user_workspace_id: erro de consulta engolido, handle fechado.
+                conn = db_module.get_conn()
+                try:
+                    conn.execute("SELECT falha FROM tabela_inexistente")
+                except RuntimeError:
+                    pass
+                finally:
+                    conn.close()
+                with db_module.get_conn() as conn:
+                    conn.execute("INSERT INTO t(v) VALUES (?)", ("C",))
+        self.assertEqual(["A", "C"], raw.committed)
+
+    def test_get_conn_after_finish_opens_regular_connection(self):
+        uow = db_module.UnitOfWork()
+        shared = uow.acquire()
+        uow.finish()
+        self.assertIsNone(uow.acquire())
+        self.assertIsInstance(shared, db_module.DBConn)
+
+    def test_request_checks_out_a_single_pooled_connection(self):
+        token = create_token(
+            user_id=1,
+            email="owner@example.com",
+            workspace_id=101,
+            global_role="USER",
+            workspace_role="OWNER",
+        )
+        headers = {"Authorization": f"Bearer {token}"}
+        self.client.get("/accounts", headers=headers)
+
+        before = db_module.pool_stats()["requests_num"]
+        resp = self.client.get("/accounts", headers=headers)
+        self.assertEqual(200, resp.status_code, resp.text)
+        self.assertEqual(before + 1, db_module.pool_stats()["requests_num"])
+
+
+if __name__ == "__main__":
+    unittest.main()
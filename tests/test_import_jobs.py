@@ -0,0 +1,200 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api.import_jobs as import_jobs
+import api.importers as importers
+import api.main as main_module
+import db as db_module
+import repo
+import tenant
+
+
+class ImportJobsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_import_jobs.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+        cls._orig_jobs_dir = import_jobs.IMPORT_JOBS_DIR
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        import_jobs.IMPORT_JOBS_DIR = Path(cls._tmpdir.name) / "import_jobs"
+        db_module.init_db()
+
+        with db_module.get_conn() as conn:
+            for uid, ws in [(1, 101), (2, 102)]:
+                conn.execute(
+                    "INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active) VALUES (?, ?, 'x', 'U', 'user', 'USER', 1)",
+                    (uid, f"u{uid}@example.com"),
+                )
+                conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (?, ?, ?, 'active')", (ws, f"WS{ws}", uid))
+                conn.execute("INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (?, ?, 'OWNER', ?)", (ws, uid, uid))
+            conn.execute("INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (10, 'Conta', 'Banco', 'BRL', 101)")
+        tenant.invalidate_workspace_resolution()
+        cls.client = TestClient(main_module.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        import_jobs.shutdown_executor(wait=True)
+        main_module._shutdown_login_sync_executor()
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        import_jobs.IMPORT_JOBS_DIR = cls._orig_jobs_dir
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in ["monthly_rollup", "monthly_rollup_state", "transactions", "categories", "import_jobs"]:
+                conn.execute(f"DELETE FROM {table}")
+
+    def tearDown(self):
+        main_module.app.dependency_overrides.clear()
+
+    def _as_user(self, uid: int) -> None:
+        main_module.app.dependency_overrides[main_module._current_user] = lambda: {"id": uid}
+
+    def _csv(self, n: int) -> bytes:
+        lines = ["date;description;amount;account;category"]
+        for i in range(n):
+            amount = "abc" if i % 50 == 0 else f"-{i % 30 + 1}.25"
+            lines.append(f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d};Compra {i};{amount};Conta;Cat {i % 3}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _wait(self, job_id: int, uid: int = 1) -> dict:
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            self._as_user(uid)
+            resp = self.client.get(f"/import/jobs/{job_id}")
+            self.assertEqual(200, resp.status_code, resp.text)
+            if resp.json()["status"] in {"done", "failed"}:
+                return resp.json()
+            time.sleep(0.02)
+        self.fail("job de importação não terminou")
+
+    def _count(self, table: str) -> int:
+        with db_module.get_conn() as conn:
+            return int(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+
+    def test_background_upload_returns_job_and_reports_progress(self):
+        seen = []
+        real_progress = import_jobs._on_progress
+
+        def spy(job_id, snapshot):
+            real_progress(job_id, snapshot)
+            seen.append(import_jobs.get_job(job_id, 101))
+
+        self._as_user(1)
+        with mock.patch.object(importers, "IMPORT_CHUNK_ROWS", 100), mock.patch.object(import_jobs, "_on_progress", side_effect=spy):
+            resp = self.client.post(
+                "/import/transactions-csv",
+                files={"file": ("extrato.csv", self._csv(400), "text/csv")},
+                data={"background": "true"},
+            )
+            self.assertEqual(202, resp.status_code, resp.text)
+            self.assertEqual("queued", resp.json()["status"])
+            job = self._wait(resp.json()["job_id"])
+
+        self.assertEqual("done", job["status"], job)
+        self.assertEqual((400, 392, 8, 0), (job["rows_processed"], job["rows_inserted"], job["rows_rejected"], job["rows_skipped"]))
+        self.assertEqual(1.0, job["progress"])
+        self.assertIsNotNone(job["rows_per_s"])
+        self.assertEqual("Linha 2: valor inválido.", job["errors"][0])
+        self.assertEqual(392, job["result"]["inserted"])
+        self.assertEqual(392, self._count("transactions"))
+        self.assertEqual([], list(import_jobs.IMPORT_JOBS_DIR.iterdir()))
+
+        self.assertEqual([100, 200, 300, 400], [v["rows_processed"] for v in seen])
+        self.assertTrue(all(v["status"] == "running" for v in seen))
+        self.assertIsNotNone(seen[0]["rows_per_s"])
+        self.assertIsNotNone(seen[0]["progress"])
+
+        listed = self.client.get("/import/jobs").json()
+        self.assertEqual([job["id"]], [j["id"] for j in listed])
+
+    def test_failed_job_reports_error_and_leaves_no_rows(self):
+        self._as_user(1)
+        with mock.patch.object(repo, "bulk_insert_transactions", side_effect=RuntimeError("disco cheio")):
+            resp = self.client.post(
+                "/import/transactions-csv",
+                files={"file": ("extrato.csv", self._csv(10), "text/csv")},
+                data={"background": "true"},
+            )
+            job = self._wait(resp.json()["job_id"])
+        self.assertEqual("failed", job["status"])
+        self.assertEqual("disco cheio", job["error"])
+        self.assertEqual(0, job["rows_inserted"])
+        self.assertEqual(0, self._count("transactions"))
+
+    def test_jobs_are_scoped_to_the_workspace(self):
+        self._as_user(1)
+        resp = self.client.post(
+            "/import/transactions-csv",
+            files={"file": ("extrato.csv", self._csv(5), "text/csv")},
+            data={"background": "true"},
+        )
+        job_id = resp.json()["job_id"]
+        self._wait(job_id)
+
+        self._as_user(2)
+        self.assertEqual(404, self.client.get(f"/import/jobs/{job_id}").status_code)
+        self.assertEqual([], self.client.get("/import/jobs").json())
+
+        # Sem background o endpoint segue síncrono.
+        self._as_user(1)
+        sync = self.client.post("/import/transactions-csv", files={"file": ("extrato.csv", self._csv(5), "text/csv")})
+        self.assertEqual(200, sync.status_code)
+        self.assertEqual(4, sync.json()["inserted"])
+
+    def test_recover_requeues_pending_and_fails_orphaned_jobs(self):
+        import_jobs.IMPORT_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        pending = import_jobs.IMPORT_JOBS_DIR / "pending.csv"
+        pending.write_bytes(self._csv(3))
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO import_jobs(id, workspace_id, created_by, kind, file_path, file_bytes, status) VALUES (1, 101, 1, 'transactions', ?, ?, 'queued')",
+                (str(pending), pending.stat().st_size),
+            )
+            conn.execute(
+                "INSERT INTO import_jobs(id, workspace_id, created_by, kind, file_path, status, started_at) VALUES (2, 101, 1, 'trades', 'x.csv', 'running', '2020-01-01 00:00:00')"
+            )
+            # Recentes: deste nó com o processo morto ou com o PID deste processo (reinício) são órfãos;
+            # de outro nó seguem 'running' até ficarem velhos.
+            dead = subprocess.Popen([sys.executable, "-c", "pass"])
+            dead.wait()
+            node = import_jobs.IMPORT_JOBS_NODE
+            for job_id, worker in [(3, f"{node}:{dead.pid}"), (4, f"{node}:{os.getpid()}"), (5, "outro-no:1")]:
+                conn.execute(
+                    "INSERT INTO import_jobs(id, workspace_id, created_by, kind, file_path, status, worker, started_at) VALUES (?, 101, 1, 'trades', 'x.csv', 'running', ?, ?)",
+                    (job_id, worker, import_jobs._now()),
+                )
+
+        self.assertEqual(1, import_jobs.recover_jobs())
+        self.assertEqual("done", self._wait(1)["status"])
+        for job_id in [2, 3, 4]:
+            orphan = import_jobs.get_job(job_id, 101)
+            self.assertEqual("failed", orphan["status"], job_id)
+            self.assertIn("interrompida", orphan["error"])
+        self.assertEqual("running", import_jobs.get_job(5, 101)["status"])
+        self.assertEqual(2, self._count("transactions"))
+
+
+if __name__ == "__main__":
+    unittest.main()
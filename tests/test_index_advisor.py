@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import db as db_module
+import index_advisor
+
+
+class IndexAdvisorTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_index_advisor.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def _by_name(self) -> dict:
+        return {entry["name"]: entry for entry in index_advisor.analyze()}
+
+    def test_hot_queries_use_tenant_date_indexes(self):
+        results = self._by_name()
+        for name, entry in results.items():
+            with self.subTest(query=name):
+                self.assertIsNone(entry["error"])
+                self.assertEqual([], entry["seq_scans"], entry["plan"])
+                self.assertEqual(0, entry["full_sorts"], entry["plan"])
+        plan = " ".join(results["transactions_by_period"]["plan"])
+        self.assertIn("idx_transactions_workspace_date", plan)
+
+    def test_missing_composite_index_is_reported(self):
+        with db_module.get_conn() as conn:
+            conn.execute("DROP INDEX idx_transactions_workspace_date")
+        # O cache de statements do sqlite3 guarda o EXPLAIN já preparado na conexão do pool.
+        db_module.close_pool()
+        try:
+            entry = self._by_name()["transactions_by_period"]
+            self.assertGreater(entry["full_sorts"], 0, entry["plan"])
+        finally:
+            db_module.init_db()
+            db_module.close_pool()
+
+    def test_plain_table_scan_is_flagged(self):
+        plan = ["- MATERIALIZE m", "- SCAN m", "- SCAN trades", "- SCAN assets USING INDEX idx_assets_workspace"]
+        self.assertEqual(["trades"], index_advisor._seq_scans(plan))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import db as db_module
+import invest_index_rates
+import tenant
+
+
+class BulkUpsertIndexRatesTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_index_rates.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            conn.execute("DELETE FROM index_rates")
+        tenant.set_current_workspace_id(101)
+
+    def tearDown(self):
+        tenant.clear_current_workspace_id()
+
+    def _points(self, start_day: int, days: int, value: float = 0.05, source: str | None = None):
+        out = []
+        for d in range(start_day, start_day + days):
+            p = {"ref_date": f"2026-01-{d:02d}", "value": value}
+            if source:
+                p["source"] = source
+            out.append(p)
+        return out
+
+    def _rates(self) -> dict[str, tuple[float, str]]:
+        rows = invest_index_rates.list_index_rates("CDI")
+        return {r["ref_date"]: (float(r["value"]), r["source"]) for r in rows}
+
+    def test_insert_then_rerun_is_unchanged(self):
+        res = invest_index_rates.bulk_upsert_index_rates("CDI", self._points(1, 20), source="BCB")
+        self.assertEqual((20, 20, 0, 0), (res["total"], res["inserted"], res["updated"], res["unchanged"]))
+
+        res = invest_index_rates.bulk_upsert_index_rates("CDI", self._points(1, 20), source="BCB")
+        self.assertEqual((0, 0, 20), (res["inserted"], res["updated"], res["unchanged"]))
+        self.assertEqual(20, len(self._rates()))
+
+    def test_mixed_batch_updates_and_keeps_manual_rows(self):
+        invest_index_rates.bulk_upsert_index_rates("CDI", self._points(1, 5), source="BCB")
+        invest_index_rates.bulk_upsert_index_rates("CDI", [{"ref_date": "2026-01-03", "value": 0.9}], source="MANUAL")
+
+        res = invest_index_rates.bulk_upsert_index_rates("CDI", self._points(1, 8, value=0.06), source="BCB")
+        self.assertEqual((3, 4, 1), (res["inserted"], res["updated"], res["unchanged"]))
+
+        rates = self._rates()
+        self.assertEqual((0.9, "MANUAL"), rates["2026-01-03"])
+        self.assertEqual((0.06, "BCB"), rates["2026-01-01"])
+        self.assertEqual((0.06, "BCB"), rates["2026-01-08"])
+
+    def test_repeated_dates_in_batch_count_like_sequential_upserts(self):
+        points = [
+            {"ref_date": "2026-01-02", "value": 0.05},
+            {"ref_date": "2026-01-02", "value": 0.05},
+            {"ref_date": "2026-01-02", "value": 0.07},
+        ]
+        res = invest_index_rates.bulk_upsert_index_rates("CDI", points, source="BCB")
+        self.assertEqual((1, 1, 1), (res["inserted"], res["updated"], res["unchanged"]))
+        self.assertEqual({"2026-01-02": (0.07, "BCB")}, self._rates())
+
+    def test_batch_uses_constant_number_of_statements(self):
+        invest_index_rates.bulk_upsert_index_rates("CDI", self._points(1, 10), source="BCB")
+        with mock.patch.object(invest_index_rates, "_exec", wraps=invest_index_rates._exec) as exec_spy, mock.patch.object(
+            invest_index_rates, "_executemany", wraps=invest_index_rates._executemany
+        ) as many_spy:
+            invest_index_rates.bulk_upsert_index_rates("CDI", self._points(1, 31, value=0.06), source="BCB")
+        self.assertEqual(1, exec_spy.call_count)
+        self.assertEqual(2, many_spy.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
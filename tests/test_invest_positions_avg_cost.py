@@ -0,0 +1,61 @@
+import unittest
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import invest_reports
+from positions_avg_cost_reference import positions_avg_cost_rows, synthetic_trades as _synthetic_trades
+
+
+class PositionsAvgCostParityTests(unittest.TestCase):
+    def _assert_parity(self, trades_df: pd.DataFrame) -> pd.DataFrame:
+        expected = positions_avg_cost_rows(trades_df)
+        actual = invest_reports.positions_avg_cost(trades_df)
+        assert_frame_equal(expected, actual, check_exact=True)
+        return actual
+
+    def test_empty_frame_keeps_columns(self):
+        df = invest_reports.positions_avg_cost(pd.DataFrame())
+        self.assertTrue(df.empty)
+        self.assertEqual(invest_reports._POSITION_COLUMNS, list(df.columns))
+
+    def test_parity_on_randomized_trades(self):
+        for seed in (1, 7, 42):
+            with self.subTest(seed=seed):
+                self._assert_parity(_synthetic_trades(2000, 25, seed))
+
+    def test_buy_then_sell_uses_average_cost(self):
+        df = pd.DataFrame(
+            [
+                {"id": 1, "asset_id": 3, "date": pd.Timestamp("2026-01-02"), "side": "BUY", "quantity": 10.0,
+                 "price": 10.0, "exchange_rate": 1.0, "fees": 1.0, "taxes": 0.0, "symbol": "PETR4",
+                 "asset_class": "Ações", "currency": "BRL"},
+                {"id": 2, "asset_id": 3, "date": pd.Timestamp("2026-01-03"), "side": "BUY", "quantity": 10.0,
+                 "price": 20.0, "exchange_rate": 1.0, "fees": 1.0, "taxes": 0.0, "symbol": "PETR4",
+                 "asset_class": "Ações", "currency": "BRL"},
+                {"id": 3, "asset_id": 3, "date": pd.Timestamp("2026-01-04"), "side": "SELL", "quantity": 5.0,
+                 "price": 30.0, "exchange_rate": 1.0, "fees": 0.0, "taxes": 0.0, "symbol": "PETR4",
+                 "asset_class": "Ações", "currency": "BRL"},
+            ]
+        )
+        row = self._assert_parity(df).iloc[0]
+        self.assertAlmostEqual(15.0, float(row["qty"]), places=9)
+        self.assertAlmostEqual(15.1, float(row["avg_cost"]), places=9)
+        self.assertAlmostEqual(150.0 - 75.5, float(row["realized_pnl"]), places=9)
+
+    def test_parity_with_missing_fees_and_unsorted_input(self):
+        df = _synthetic_trades(300, 6, 99).sample(frac=1.0, random_state=3)
+        df["fees"] = df["fees"].astype(object)
+        df.loc[df.index[::5], "fees"] = None
+        df["currency"] = df["currency"].astype(object)
+        df.loc[df.index[::7], "currency"] = None
+        self._assert_parity(df)
+
+    def test_output_follows_first_appearance_order(self):
+        df = _synthetic_trades(500, 10, 5)
+        first_seen = df.sort_values(["date", "id"])["asset_id"].drop_duplicates().tolist()
+        self.assertEqual(first_seen, self._assert_parity(df)["asset_id"].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
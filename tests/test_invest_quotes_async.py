@@ -0,0 +1,110 @@
+import asyncio
+import time
+import unittest
+
+import invest_quotes
+from fake_quote_provider import FakeQuoteProvider
+
+
+def _assets() -> list[dict]:
+    return [
+        {"id": 1, "symbol": "PETR4", "asset_class": "Ações BR", "currency": "BRL"},
+        {"id": 2, "symbol": "HGLG11", "asset_class": "FIIs", "currency": "BRL"},
+        {"id": 3, "symbol": "AAPL", "asset_class": "Stocks US", "currency": "USD"},
+        {"id": 4, "symbol": "MSFT", "asset_class": "Stocks US", "currency": "USD"},
+        {"id": 5, "symbol": "BTC", "asset_class": "Cripto", "currency": "USD"},
+        {"id": 6, "symbol": "XXXX3", "asset_class": "Ações BR", "currency": "BRL"},
+    ]
+
+
+PRICES = {
+    "PETR4": 37.5,
+    "HGLG11": 160.2,
+    "AAPL": 231.0,
+    "MSFT.US": 415.3,  # só no stooq
+    "BTC-USD": 97000.0,
+}
+
+
+class AsyncQuoteFetchTests(unittest.TestCase):
+    def setUp(self):
+        self.provider = FakeQuoteProvider(PRICES).start()
+
+    def tearDown(self):
+        self.provider.stop()
+
+    def _strip_timing(self, report: list[dict]) -> list[dict]:
+        return [{k: v for k, v in r.items() if k != "elapsed_s"} for r in report]
+
+    def test_async_mode_matches_thread_mode(self):
+        with self.provider.patched(invest_quotes):
+            threads = invest_quotes.update_all_prices(_assets(), mode="threads")
+            asynced = invest_quotes.update_all_prices(_assets(), mode="async")
+
+        self.assertEqual(self._strip_timing(threads), self._strip_timing(asynced))
+        by_symbol = {r["symbol"]: r for r in asynced}
+        self.assertEqual(("brapi", 37.5), (by_symbol["PETR4"]["src"], by_symbol["PETR4"]["price"]))
+        self.assertEqual(("stooq", 415.3), (by_symbol["MSFT"]["src"], by_symbol["MSFT"]["price"]))
+        self.assertEqual("yahoo_http", by_symbol["BTC"]["src"])
+        self.assertFalse(by_symbol["XXXX3"]["ok"])
+        self.assertIn("BRAPI", by_symbol["XXXX3"]["error"])
+
+    def test_async_mode_reuses_connections_and_limits_each_host(self):
+        symbols = [f"TST{n:02d}3" for n in range(20)]
+        self.provider.prices.update({s: 10.0 for s in symbols})
+        self.provider.latency_s = 0.02
+        assets = [{"id": n, "symbol": s, "asset_class": "Ações BR", "currency": "BRL"} for n, s in enumerate(symbols)]
+
+        with self.provider.patched(invest_quotes):
+            report = asyncio.run(invest_quotes._update_all_prices_async(assets, None, 10.0, 16, 2, batch=False))
+
+        self.assertTrue(all(r["ok"] for r in report))
+        self.assertEqual(20, len(self.provider.requests))
+        self.assertLessEqual(self.provider.max_in_flight, 2)
+        self.assertLessEqual(self.provider.connections, 2)
+
+    def test_batch_groups_symbols_per_provider_and_falls_back_for_misses(self):
+        symbols = [f"TST{n:02d}3" for n in range(25)]
+        self.provider.prices.update({s: 10.0 + n for n, s in enumerate(symbols)})
+        self.provider.prices["ONLY11.SA"] = 99.0  # BRAPI não tem; Yahoo .SA tem
+        assets = _assets() + [{"id": 100 + n, "symbol": s, "asset_class": "Ações BR", "currency": "BRL"} for n, s in enumerate(symbols)]
+        assets.append({"id": 200, "symbol": "ONLY11", "asset_class": "FIIs", "currency": "BRL"})
+
+        for mode in ["async", "threads"]:
+            self.provider.requests.clear()
+            with self.provider.patched(invest_quotes):
+                report = invest_quotes.update_all_prices(assets, mode=mode)
+            by_id = {r["asset_id"]: r for r in report}
+            self.assertEqual([a["id"] for a in assets], [r["asset_id"] for r in report])
+            self.assertEqual(("yahoo_http", 99.0), (by_id[200]["src"], by_id[200]["price"]), mode)
+            self.assertEqual(("brapi", 34.0), (by_id[124]["src"], by_id[124]["price"]), mode)
+            self.assertEqual("stooq", by_id[4]["src"], mode)
+            self.assertFalse(by_id[6]["ok"], mode)
+
+            brapi = [r for r in self.provider.requests if r.startswith("/api/quote/")]
+            # 28 símbolos BR em lotes de 10 + fallback individual só para o XXXX3.
+            self.assertEqual(4, len(brapi), mode)
+            self.assertLess(len(self.provider.requests), len(assets), mode)
+
+    def test_batch_helper_reports_only_hits(self):
+        self.provider.prices["PETR4.SA"] = 37.4
+        with self.provider.patched(invest_quotes, brapi_token=None):
+            hits = invest_quotes.fetch_last_prices_batch(_assets())
+        # Sem token, ativos BR vão direto ao Yahoo com sufixo .SA.
+        self.assertEqual({0: 37.4, 2: 231.0, 4: 97000.0}, {k: v[0] for k, v in hits.items()})
+        self.assertTrue(all(v[2] == "yahoo_http" for v in hits.values()))
+
+    def test_timeout_cancels_pending_request(self):
+        self.provider.hang = {"PETR4"}
+        assets = _assets()[:2]
+        started = time.monotonic()
+        with self.provider.patched(invest_quotes):
+            report = asyncio.run(invest_quotes._update_all_prices_async(assets, None, 0.3, 4, 4))
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertFalse(report[0]["ok"])
+        self.assertIn("Timeout", report[0]["error"])
+        self.assertTrue(report[1]["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,303 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import db as db_module
+import invest_reports
+
+
+def _investments_value_timeseries_per_day(
+    date_from: str,
+    date_to: str,
+    asset_class: str | None = None,
+    user_id: int | None = None,
+) -> pd.DataFrame:
+    # Implementação de referência (anterior ao motor incremental): recalcula posições e
+    # consulta preços dia a dia.
+    inputs = invest_reports._timeseries_inputs(date_from, date_to, asset_class, user_id)
+    if inputs is None:
+        return pd.DataFrame(columns=invest_reports._TIMESERIES_COLUMNS)
+    tdf, dates, assets, incomes_df = inputs
+    out = []
+
+    for d in dates:
+        d_str = d.strftime("%Y-%m-%d")
+        t_day = tdf[tdf["date"] <= d].copy()
+        pos = invest_reports.positions_avg_cost(t_day)
+        if pos.empty:
+            continue
+
+        prices = invest_reports.df_prices_upto(d_str, user_id=user_id)
+        if not prices.empty:
+            pos = pos.merge(prices[["asset_id", "price"]], on="asset_id", how="left")
+        else:
+            pos["price"] = 0.0
+        snapshots = invest_reports.df_asset_snapshots_upto(d_str, user_id=user_id)
+        if not snapshots.empty:
+            pos = pos.merge(snapshots[["asset_id", "snapshot_price", "snapshot_date"]], on="asset_id", how="left")
+        else:
+            pos["snapshot_price"] = 0.0
+            pos["snapshot_date"] = None
+
+        if not assets.empty:
+            pos = pos.merge(
+                assets.rename(columns={"id": "asset_id"})[["asset_id", "currency", "current_value", "last_update"]],
+                on="asset_id",
+                how="left",
+            )
+        else:
+            pos["currency"] = None
+            pos["current_value"] = None
+            pos["last_update"] = None
+
+        pos["price"] = pd.to_numeric(pos["price"], errors="coerce").fillna(0.0)
+        pos["snapshot_price"] = pd.to_numeric(pos.get("snapshot_price", 0.0), errors="coerce").fillna(0.0)
+        cls_norm = pos.get("asset_class", "").astype(str).map(invest_reports._norm_asset_class)
+        fixed_income_mask = cls_norm.isin(invest_reports._FIXED_INCOME_CLASSES)
+        missing_price_mask = pos["price"] <= 0
+        pos.loc[fixed_income_mask & missing_price_mask, "price"] = pd.to_numeric(
+            pos.get("avg_cost", 0.0), errors="coerce"
+        ).fillna(0.0)
+        fx = pd.to_numeric(pos.get("last_fx", 1.0), errors="coerce").fillna(1.0)
+        is_usd_asset = pos.get("currency", "").astype(str).str.upper().eq("USD")
+        fx_factor = fx.where(is_usd_asset, 1.0)
+        pos["market_value"] = pos["qty"] * pos["price"] * fx_factor
+        open_position_mask = pd.to_numeric(pos.get("qty", 0.0), errors="coerce").fillna(0.0) > 0
+        snapshot_dt = pd.to_datetime(pos.get("snapshot_date"), errors="coerce")
+        current_dt = pd.to_datetime(pos.get("last_update"), errors="coerce")
+        current_applies_to_day = current_dt.notna() & (current_dt <= d)
+        snapshot_current = current_dt.isna() | snapshot_dt.isna() | (snapshot_dt >= current_dt)
+        snapshot_override_mask = fixed_income_mask & open_position_mask & (pos["snapshot_price"] > 0) & snapshot_current
+        pos.loc[snapshot_override_mask, "market_value"] = pos.loc[snapshot_override_mask, "snapshot_price"]
+        cv = pd.to_numeric(pos.get("current_value", 0.0), errors="coerce").fillna(0.0)
+        stale_snapshot_mask = (pos["snapshot_price"] <= 0) | ~snapshot_current
+        current_value_mask = fixed_income_mask & open_position_mask & current_applies_to_day & stale_snapshot_mask & (cv > 0)
+        pos.loc[current_value_mask, "market_value"] = cv[current_value_mask]
+        income_amount = 0.0
+        if incomes_df is not None and not incomes_df.empty:
+            income_amount = float(
+                pd.to_numeric(
+                    incomes_df[incomes_df["date"] <= d]["amount"],
+                    errors="coerce",
+                ).fillna(0.0).sum()
+            )
+        invested_amount = float(pd.to_numeric(pos.get("cost_basis", 0.0), errors="coerce").fillna(0.0).sum())
+        market_value = float(pd.to_numeric(pos.get("market_value", 0.0), errors="coerce").fillna(0.0).sum())
+        realized_pnl = float(pd.to_numeric(pos.get("realized_pnl", 0.0), errors="coerce").fillna(0.0).sum())
+        unrealized_pnl = market_value - invested_amount
+        total_return = income_amount + realized_pnl + unrealized_pnl
+        return_pct = (total_return / invested_amount * 100.0) if invested_amount > 0 else 0.0
+        out.append(
+            {
+                "date": d,
+                "invest_market_value": market_value,
+                "invested_amount": invested_amount,
+                "income_amount": income_amount,
+                "realized_pnl": realized_pnl,
+                "unrealized_pnl": unrealized_pnl,
+                "total_return": total_return,
+                "return_pct": return_pct,
+            }
+        )
+
+    return pd.DataFrame(out)
+
+
+class InvestTimeseriesIncrementalParityTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_timeseries.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in ["asset_prices", "prices", "income_events", "trades", "assets", "users"]:
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, is_active)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (1, "test@example.com", "x", "Test", "user", 1),
+            )
+        self.uid = 1
+
+    def _asset(self, symbol, asset_class, currency="BRL", current_value=None, last_update=None) -> int:
+        with db_module.get_conn() as conn:
+            return int(
+                conn.execute(
+                    """
+                    INSERT INTO assets(symbol, name, asset_class, currency, current_value, last_update, user_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (symbol, symbol, asset_class, currency, current_value, last_update, self.uid),
+                ).lastrowid
+            )
+
+    def _trade(self, asset_id, date, side, quantity, price, exchange_rate=1.0, fees=0.0, taxes=0.0):
+        with db_module.get_conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO trades(asset_id, date, side, quantity, price, exchange_rate, fees, taxes, user_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (asset_id, date, side, quantity, price, exchange_rate, fees, taxes, self.uid),
+            )
+
+    def _price(self, asset_id, date, price):
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO prices(asset_id, date, price, source, user_id) VALUES (?, ?, ?, ?, ?)",
+                (asset_id, date, price, "test", self.uid),
+            )
+
+    def _snapshot(self, asset_id, date, price):
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO asset_prices(asset_id, px_date, price, source, user_id) VALUES (?, ?, ?, ?, ?)",
+                (asset_id, date, price, "manual_current_value", self.uid),
+            )
+
+    def _income(self, asset_id, date, amount):
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO income_events(asset_id, date, type, amount, user_id) VALUES (?, ?, ?, ?, ?)",
+                (asset_id, date, "DIVIDENDO", amount, self.uid),
+            )
+
+    def _assert_parity(self, date_from, date_to, asset_class=None):
+        expected = _investments_value_timeseries_per_day(
+            date_from, date_to, asset_class=asset_class, user_id=self.uid
+        )
+        actual = invest_reports.investments_value_timeseries(date_from, date_to, asset_class=asset_class, user_id=self.uid)
+        assert_frame_equal(
+            expected.reset_index(drop=True),
+            actual.reset_index(drop=True),
+            check_exact=False,
+            rtol=1e-9,
+            atol=1e-6,
+        )
+        return actual
+
+    def _seed_mixed_portfolio(self):
+        petr = self._asset("PETR4", "Ações")
+        aapl = self._asset("AAPL", "Stocks", currency="USD")
+        cdb = self._asset("CDB_INTER", "Renda Fixa", current_value=10450.0, last_update="2026-02-20")
+        tesouro = self._asset("TESOURO_IPCA", "Tesouro Direto")
+
+        self._trade(petr, "2026-01-05", "BUY", 100, 30.0, fees=4.9, taxes=0.3)
+        self._trade(petr, "2026-01-20", "BUY", 50, 33.0, fees=4.9)
+        self._trade(petr, "2026-02-10", "SELL", 80, 35.5, fees=4.9, taxes=1.2)
+        self._trade(aapl, "2026-01-08", "BUY", 10, 180.0, exchange_rate=4.95, fees=1.0)
+        self._trade(aapl, "2026-02-03", "BUY", 5, 175.0, exchange_rate=5.05)
+        self._trade(cdb, "2026-01-02", "BUY", 1, 10000.0)
+        self._trade(tesouro, "2026-01-15", "BUY", 2, 3000.0, fees=2.0)
+        self._trade(tesouro, "2026-02-25", "SELL", 2, 3150.0)
+
+        self._price(petr, "2026-01-05", 30.2)
+        self._price(petr, "2026-01-12", 31.0)
+        self._price(petr, "2026-02-14", 36.1)
+        self._price(aapl, "2026-01-10", 182.5)
+        self._price(aapl, "2026-02-05", 178.0)
+        self._snapshot(cdb, "2026-01-31", 10150.0)
+        self._snapshot(cdb, "2026-02-28", 10520.0)
+        self._snapshot(tesouro, "2026-02-01", 6080.0)
+
+        self._income(petr, "2026-01-25", 42.0)
+        self._income(aapl, "2026-02-12", 7.5)
+
+    def test_parity_on_mixed_portfolio_full_range(self):
+        self._seed_mixed_portfolio()
+        df = self._assert_parity("2025-12-01", "2026-03-10")
+        self.assertEqual(invest_reports._TIMESERIES_COLUMNS, list(df.columns))
+        self.assertEqual(pd.Timestamp("2026-01-02"), df["date"].iloc[0])
+
+    def test_parity_when_window_starts_after_first_trade(self):
+        self._seed_mixed_portfolio()
+        self._assert_parity("2026-02-01", "2026-02-28")
+
+    def test_parity_with_asset_class_filter(self):
+        self._seed_mixed_portfolio()
+        for asset_class in ["Ações", "Stocks", "Renda Fixa", "Tesouro Direto"]:
+            with self.subTest(asset_class=asset_class):
+                self._assert_parity("2026-01-01", "2026-03-05", asset_class=asset_class)
+
+    def test_parity_for_fixed_income_current_value_and_stale_snapshot(self):
+        cdb = self._asset("CDB_BANCO", "Renda Fixa", current_value=56115.98, last_update="2026-06-09")
+        self._trade(cdb, "2026-05-28", "BUY", 1, 25890.25)
+        self._trade(cdb, "2026-06-09", "BUY", 1, 30000.0)
+        self._snapshot(cdb, "2026-05-28", 26115.98)
+
+        df = self._assert_parity("2026-05-20", "2026-06-15")
+        last = df.iloc[-1]
+        self.assertAlmostEqual(56115.98, float(last["invest_market_value"]), places=2)
+
+    def test_empty_portfolio_returns_expected_columns(self):
+        df = invest_reports.investments_value_timeseries("2026-01-01", "2026-01-31", user_id=self.uid)
+        self.assertTrue(df.empty)
+        self.assertEqual(invest_reports._TIMESERIES_COLUMNS, list(df.columns))
+
+    def test_parity_on_randomized_ledger(self):
+        rng = random.Random(20260401)
+        classes = [("Ações", "BRL"), ("Stocks", "USD"), ("Renda Fixa", "BRL"), ("FII", "BRL")]
+        days = pd.date_range("2025-10-01", "2026-01-31", freq="D")
+        for idx in range(6):
+            asset_class, currency = classes[idx % len(classes)]
+            last_update = rng.choice([None, days[rng.randrange(len(days))].strftime("%Y-%m-%d")])
+            aid = self._asset(
+                f"AST{idx}",
+                asset_class,
+                currency=currency,
+                current_value=rng.choice([None, round(rng.uniform(1000, 5000), 2)]),
+                last_update=last_update,
+            )
+            qty = 0.0
+            for day in sorted(rng.sample(list(days), 12)):
+                d = day.strftime("%Y-%m-%d")
+                if qty > 0 and rng.random() < 0.35:
+                    sold = round(min(qty, rng.uniform(1, qty)), 4)
+                    self._trade(aid, d, "SELL", sold, round(rng.uniform(10, 60), 2), exchange_rate=5.1, fees=1.0)
+                    qty -= sold
+                else:
+                    bought = round(rng.uniform(1, 40), 4)
+                    self._trade(
+                        aid, d, "BUY", bought, round(rng.uniform(10, 60), 2),
+                        exchange_rate=round(rng.uniform(4.8, 5.3), 4), fees=1.0, taxes=0.2,
+                    )
+                    qty += bought
+            for day in sorted(rng.sample(list(days), 20)):
+                self._price(aid, day.strftime("%Y-%m-%d"), round(rng.uniform(10, 60), 2))
+            for day in sorted(rng.sample(list(days), 4)):
+                self._snapshot(aid, day.strftime("%Y-%m-%d"), round(rng.uniform(500, 4000), 2))
+            for day in sorted(rng.sample(list(days), 3)):
+                self._income(aid, day.strftime("%Y-%m-%d"), round(rng.uniform(1, 50), 2))
+
+        self._assert_parity("2025-09-15", "2026-02-15")
+        self._assert_parity("2025-11-10", "2025-12-20", asset_class="Renda Fixa")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,6 +24,7 @@ class ListsPhase3RepoTests(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        db_module.close_pool()
         clear_tenant_context()
         db_module.SQLITE_PATH = cls._orig_sqlite_path
         db_module.DB_PATH = cls._orig_db_path
@@ -0,0 +1,120 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api.main as main_module
+import auth as auth_module
+import db as db_module
+from api.main import app
+
+
+class LoginBackgroundSyncTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_login_sync.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+        cls.client = TestClient(app)
+
+        pwd = auth_module._hash_password("secret123")
+        with db_module.get_conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (1, "owner@example.com", pwd, "Owner", "user", "USER", 1),
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute(
+                "INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)"
+            )
+        auth_module.invalidate_principal_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        main_module._shutdown_login_sync_executor()
+        db_module.close_pool()
+        auth_module.invalidate_principal_cache()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        main_module._LOGIN_SYNC_JOBS.clear()
+
+    def _login(self) -> dict:
+        resp = self.client.post("/auth/login", json={"email": "owner@example.com", "password": "secret123"})
+        self.assertEqual(200, resp.status_code, resp.text)
+        return resp.json()
+
+    def _status(self, token: str) -> dict:
+        resp = self.client.get("/sync/status", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(200, resp.status_code, resp.text)
+        return resp.json()
+
+    def _wait_finished(self, token: str) -> dict:
+        for _ in range(200):
+            out = self._status(token)
+            if out["state"] not in {"queued", "running"}:
+                return out
+            time.sleep(0.01)
+        self.fail("sync de login não terminou")
+
+    def test_login_returns_before_sync_and_status_reports_result(self):
+        release = threading.Event()
+        result = {"should_notify": True, "level": "success", "message": "Renda fixa conferida no login."}
+
+        def slow_sync(user_id, workspace_id=None):
+            release.wait(5)
+            return result
+
+        with mock.patch.object(main_module, "_run_login_sync", side_effect=slow_sync) as sync:
+            data = self._login()
+            self.assertIn(data["login_sync_state"], {"queued", "running"})
+            self.assertIsNone(data["login_sync_status"])
+            self.assertIn(self._status(data["token"])["state"], {"queued", "running"})
+
+            release.set()
+            out = self._wait_finished(data["token"])
+
+        self.assertEqual("done", out["state"])
+        self.assertEqual(result["message"], out["login_sync_status"]["message"])
+        sync.assert_called_once_with(1, workspace_id=101)
+
+    def test_repeated_logins_share_the_active_workspace_job(self):
+        release = threading.Event()
+        with mock.patch.object(main_module, "_run_login_sync", side_effect=lambda *a, **k: release.wait(5) and None) as sync:
+            first = self._login()
+            self._login()
+            self._login()
+            release.set()
+            self._wait_finished(first["token"])
+        self.assertEqual(1, sync.call_count)
+
+    def test_failed_sync_is_reported_without_blocking_login(self):
+        with mock.patch.object(main_module, "_run_login_sync", side_effect=RuntimeError("BCB fora do ar")):
+            data = self._login()
+            out = self._wait_finished(data["token"])
+        self.assertEqual("failed", out["state"])
+        self.assertIsNone(out["login_sync_status"])
+
+
+if __name__ == "__main__":
+    unittest.main()
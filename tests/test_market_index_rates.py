@@ -0,0 +1,128 @@
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+import db as db_module
+import invest_index_rates
+import invest_rentability
+import tenant
+
+
+class MarketIndexRatesTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_market_index_rates.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in ["index_rates", "market_index_rates", "sync_runs"]:
+                conn.execute(f"DELETE FROM {table}")
+
+    def tearDown(self):
+        tenant.clear_current_workspace_id()
+
+    def _market(self, days: range, value: float = 0.05):
+        points = [{"ref_date": f"2026-01-{d:02d}", "value": value} for d in days]
+        return invest_index_rates.bulk_upsert_market_index_rates("CDI", points, source="BCB")
+
+    def _rates(self, workspace_id: int) -> dict[str, tuple[float, str]]:
+        tenant.set_current_workspace_id(workspace_id)
+        rows = invest_index_rates.list_index_rates("CDI")
+        return {r["ref_date"]: (float(r["value"]), r["source"]) for r in rows}
+
+    def test_init_moves_downloaded_rows_to_global_store(self):
+        with db_module.get_conn() as conn:
+            for ws, source, value in [(101, "BCB", 0.05), (102, "BCB", 0.05), (102, "MANUAL", 0.9)]:
+                ref_date = "2026-01-03" if source == "MANUAL" else "2026-01-02"
+                conn.execute(
+                    "INSERT INTO index_rates(index_name, ref_date, value, source, workspace_id) VALUES ('CDI', ?, ?, ?, ?)",
+                    (ref_date, value, source, ws),
+                )
+        db_module.init_db()
+
+        with db_module.get_conn() as conn:
+            market = conn.execute("SELECT ref_date, source FROM market_index_rates").fetchall()
+            overrides = conn.execute("SELECT workspace_id, ref_date, source FROM index_rates").fetchall()
+        self.assertEqual([("2026-01-02", "BCB")], [(r["ref_date"], r["source"]) for r in market])
+        self.assertEqual([(102, "2026-01-03", "MANUAL")], [tuple(r) for r in overrides])
+
+    def test_workspace_override_wins_over_global_series(self):
+        self._market(range(1, 6))
+        tenant.set_current_workspace_id(101)
+        invest_index_rates.bulk_upsert_index_rates("CDI", [{"ref_date": "2026-01-03", "value": 0.9}], source="MANUAL")
+
+        ws101 = self._rates(101)
+        self.assertEqual(5, len(ws101))
+        self.assertEqual((0.9, "MANUAL"), ws101["2026-01-03"])
+        self.assertEqual((0.05, "BCB"), ws101["2026-01-04"])
+        self.assertEqual((0.05, "BCB"), self._rates(102)["2026-01-03"])
+
+        with db_module.get_conn() as conn:
+            stored = conn.execute("SELECT COUNT(*) FROM index_rates").fetchone()[0]
+        self.assertEqual(1, stored)
+
+    def test_rentability_loaders_read_merged_view(self):
+        self._market(range(1, 6))
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO market_index_rates(index_name, ref_date, value, source) VALUES ('IPCA', '2026-01-01', 0.5, 'BCB')"
+            )
+        tenant.set_current_workspace_id(101)
+        invest_index_rates.bulk_upsert_index_rates("CDI", [{"ref_date": "2026-01-02", "value": 0.07}], source="MANUAL")
+        invest_index_rates.bulk_upsert_index_rates("IPCA", [{"ref_date": "2026-01-01", "value": 0.4}], source="MANUAL")
+
+        for ws, cdi_day2, ipca_jan in [(101, "0.07", "0.00400000"), (102, "0.05", "0.00500000")]:
+            tenant.set_current_workspace_id(ws)
+            scope_id = invest_rentability._uid()
+            with db_module.get_conn() as conn:
+                cdi = invest_rentability._load_daily_index_map(conn, "CDI", date(2026, 1, 1), date(2026, 1, 31), scope_id)
+                ipca = invest_rentability._load_monthly_ipca_map(conn, date(2026, 1, 15), date(2026, 1, 31), scope_id)
+            self.assertEqual(5, len(cdi))
+            self.assertEqual(str(cdi[date(2026, 1, 2)]), cdi_day2)
+            self.assertEqual(str(ipca["2026-01"]), ipca_jan)
+
+    def test_market_sync_fetches_once_per_day_for_all_workspaces(self):
+        points = [{"index_name": "CDI", "ref_date": "2026-01-02", "value": 0.05, "source": "BCB"}]
+        with mock.patch.object(invest_index_rates, "fetch_index_series", return_value=points) as fetch:
+            first = invest_index_rates.sync_market_index_rates(["CDI"])
+            tenant.set_current_workspace_id(102)
+            second = invest_index_rates.sync_market_index_rates(["CDI"])
+
+        self.assertEqual({"CDI": "updated"}, first["statuses"])
+        self.assertEqual({"CDI": "up_to_date"}, second["statuses"])
+        self.assertEqual(1, fetch.call_count)
+        self.assertEqual("2026-01-02", invest_index_rates.latest_market_ref_date("CDI"))
+
+    def test_market_sync_reports_failures_without_marking_the_day(self):
+        with mock.patch.object(invest_index_rates, "fetch_index_series", side_effect=RuntimeError("HTTP 503")):
+            out = invest_index_rates.sync_market_index_rates(["SELIC"])
+        self.assertEqual({"SELIC": "failed"}, out["statuses"])
+        self.assertIn("503", out["errors"]["SELIC"])
+        with db_module.get_conn() as conn:
+            self.assertEqual(0, conn.execute("SELECT COUNT(*) FROM sync_runs").fetchone()[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import db as db_module
+import repo
+import reports
+import tenant
+
+
+class MonthlyRollupTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_monthly_rollup.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in [
+                "monthly_rollup",
+                "monthly_rollup_state",
+                "credit_card_charges",
+                "credit_card_invoices",
+                "credit_cards",
+                "transactions",
+                "categories",
+                "accounts",
+                "workspace_users",
+                "workspaces",
+                "users",
+            ]:
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (1, "owner@example.com", "x", "Owner", "user", "USER", 1),
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute(
+                "INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)"
+            )
+            for acc_id, name, acc_type in [(10, "Conta", "Banco"), (11, "Cartao", "Cartao"), (12, "Reserva", "Banco")]:
+                conn.execute(
+                    "INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (?, ?, ?, 'BRL', 101)",
+                    (acc_id, name, acc_type),
+                )
+            for cat_id, name, kind in [
+                (20, "Salario", "Receita"),
+                (21, "Mercado", "Despesa"),
+                (22, "Transferencias", "Transferencia"),
+                (23, "Fatura Cartão", "Despesa"),
+            ]:
+                conn.execute(
+                    "INSERT INTO categories(id, name, kind, workspace_id) VALUES (?, ?, ?, 101)",
+                    (cat_id, name, kind),
+                )
+        tenant.invalidate_workspace_resolution()
+
+        repo.create_credit_card("Cartao", "Visa", "Black", "Credito", 11, 10, 10, 3, user_id=1)
+        self.card_id = int(repo.list_credit_cards(user_id=1)[0]["id"])
+
+        repo.insert_transaction("2026-01-05", "Salario", 5000.0, 10, 20, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-01-20", "Mercado", -350.0, 10, 21, "Debito", None, user_id=1)
+        repo.insert_transaction("2026-01-25", "Aplicacao", -1000.0, 10, 22, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-01-25", "Aplicacao", 1000.0, 12, 22, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-02-10", "Mercado", -420.5, 10, 21, "Debito", None, user_id=1)
+        repo.insert_transaction("2026-02-15", "Sem categoria", -12.0, 10, None, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-03-05", "Salario", 5100.0, 10, 20, "PIX", None, user_id=1)
+        repo.insert_transaction("2026-03-28", "Aluguel", -1800.0, 10, 21, "Futuro", None, user_id=1)
+        repo.register_credit_charge(self.card_id, "2026-02-03", 250.0, 21, "Compra 1", user_id=1)
+        repo.register_credit_charge(self.card_id, "2026-03-12", 99.9, None, "Compra 2", user_id=1)
+
+    def _assert_dashboards_match_ledger(self, date_from=None, date_to=None):
+        for view in ["caixa", "competencia"]:
+            ledger = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=1, view=view)
+            rollup = reports.df_dashboard(date_from=date_from, date_to=date_to, user_id=1, view=view)
+            msg = f"view={view} {date_from}..{date_to}"
+
+            expected, got = reports.kpis(ledger), reports.kpis(rollup)
+            for key in expected:
+                self.assertAlmostEqual(expected[key], got[key], places=6, msg=msg)
+            self.assertEqual(
+                reports.monthly_summary(ledger).round(6).to_dict(orient="records"),
+                reports.monthly_summary(rollup).round(6).to_dict(orient="records"),
+                msg,
+            )
+            self.assertEqual(
+                reports.category_expenses(ledger).round(6).to_dict(orient="records"),
+                reports.category_expenses(rollup).round(6).to_dict(orient="records"),
+                msg,
+            )
+            self.assertEqual(
+                reports.account_balance(ledger).round(6).to_dict(orient="records"),
+                reports.account_balance(rollup).round(6).to_dict(orient="records"),
+                msg,
+            )
+            self.assertEqual(
+                reports.monthly_wealth_summary(ledger, date_from, date_to).round(6).to_dict(orient="records"),
+                reports.monthly_wealth_summary(rollup, date_from, date_to).round(6).to_dict(orient="records"),
+                msg,
+            )
+
+    def test_dashboards_match_ledger_for_full_and_partial_periods(self):
+        for date_from, date_to in [
+            (None, None),
+            ("2026-01-01", "2026-02-28"),
+            ("2026-01-15", "2026-03-10"),
+            ("2026-02-05", "2026-02-20"),
+            (None, "2026-02-14"),
+            ("2026-02-02", None),
+        ]:
+            self._assert_dashboards_match_ledger(date_from, date_to)
+
+    def test_rollup_is_built_once_and_serves_compact_rows(self):
+        reports.df_dashboard(user_id=1)
+        with db_module.get_conn() as conn:
+            state = conn.execute("SELECT workspace_id FROM monthly_rollup_state").fetchall()
+            caixa = conn.execute(
+                "SELECT COUNT(*) FROM monthly_rollup WHERE workspace_id = 101 AND basis = 'caixa'"
+            ).fetchone()[0]
+        self.assertEqual([101], [r["workspace_id"] for r in state])
+        # Compromisso futuro não entra; os demais lançamentos viram um grupo por mês/conta/categoria.
+        self.assertEqual(7, caixa)
+
+    def test_write_paths_keep_rollup_in_sync(self):
+        reports.df_dashboard(user_id=1)
+
+        tx_id = int(repo.fetch_transactions(date_from="2026-02-10", date_to="2026-02-10", user_id=1)[0]["id"])
+        repo.delete_transaction(tx_id, user_id=1)
+        commitment = repo.fetch_transactions(date_from="2026-03-28", date_to="2026-03-28", user_id=1)[0]
+        repo.settle_commitment_transaction(int(commitment["id"]), "2026-03-30", 10, 1800.0, user_id=1)
+        repo.register_credit_charge(self.card_id, "2026-03-15", 40.0, 21, "Compra 3", user_id=1)
+        invoice = repo.list_credit_card_invoices(user_id=1, card_id=self.card_id)[0]
+        repo.pay_credit_card_invoice(int(invoice["id"]), "2026-03-20", user_id=1)
+
+        self._assert_dashboards_match_ledger()
+        self._assert_dashboards_match_ledger("2026-03-01", "2026-03-31")
+
+    def test_invalidated_state_rebuilds_from_ledger(self):
+        reports.df_dashboard(user_id=1)
+        with db_module.get_conn() as conn:
+            # Escrita fora do repo (ex.: script de manutenção).
+            conn.execute(
+                """
+                INSERT INTO transactions(date, description, amount_brl, account_id, category_id, method, workspace_id)
+                VALUES ('2026-01-30', 'Ajuste', -75.0, 10, 21, 'PIX', 101)
+                """
+            )
+        repo.invalidate_monthly_rollup()
+        self._assert_dashboards_match_ledger()
+
+    def test_postgres_rebuild_takes_scope_lock_before_deleting(self):
+        class Recorder:
+            def __init__(self):
+                self.statements = []
+
+            def execute(self, query, params=()):
+                self.statements.append((" ".join(query.split()), tuple(params)))
+                return self
+
+        raw = Recorder()
+        token = repo._USE_WORKSPACE_SCOPE.set(True)
+        try:
+            repo._rebuild_monthly_rollup(db_module.DBConn(raw, use_postgres=True), 101, {"2026-01"})
+        finally:
+            repo._USE_WORKSPACE_SCOPE.reset(token)
+        lock_sql, lock_params = raw.statements[0]
+        self.assertIn("pg_advisory_xact_lock", lock_sql)
+        self.assertEqual((repo._ROLLUP_LOCK_CLASS + 1, 101), lock_params)
+        self.assertTrue(raw.statements[1][0].startswith("DELETE FROM monthly_rollup"))
+
+
+if __name__ == "__main__":
+    unittest.main()
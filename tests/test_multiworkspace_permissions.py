@@ -29,6 +29,7 @@ class MultiWorkspacePermissionsTests(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        db_module.close_pool()
         db_module.SQLITE_PATH = cls._orig_sqlite_path
         db_module.DB_PATH = cls._orig_db_path
         db_module.DATABASE_URL = cls._orig_database_url
@@ -89,6 +90,8 @@ class MultiWorkspacePermissionsTests(unittest.TestCase):
                     (102, 3, 'OWNER', 3)
                 """
             )
+        # Os testes alteram workspaces/permissões via SQL direto, fora dos hooks de invalidação.
+        auth_module.invalidate_principal_cache()
 
     def _headers(
         self,
@@ -0,0 +1,131 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import auth as auth_module
+import db as db_module
+import permissions_service
+from api.main import app
+from api.security import create_token
+
+
+class PrincipalCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_principal_cache.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        auth_module.invalidate_principal_cache()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        pwd = auth_module._hash_password("secret123")
+        with db_module.get_conn() as conn:
+            for table in ["permissions", "workspace_users", "workspaces", "accounts", "users"]:
+                conn.execute(f"DELETE FROM {table}")
+            for row in [
+                (1, "owner@example.com", pwd, "Owner", "user", "USER", 1),
+                (2, "guest@example.com", pwd, "Guest", "user", "USER", 1),
+            ]:
+                conn.execute(
+                    """
+                    INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    row,
+                )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute(
+                """
+                INSERT INTO workspace_users(workspace_id, user_id, role, created_by)
+                VALUES (101, 1, 'OWNER', 1), (101, 2, 'GUEST', 1)
+                """
+            )
+        auth_module.invalidate_principal_cache()
+
+    def _headers(self, user_id: int, email: str, workspace_role: str, token_version: int = 0) -> dict[str, str]:
+        token = create_token(
+            user_id=user_id,
+            email=email,
+            workspace_id=101,
+            global_role="USER",
+            workspace_role=workspace_role,
+            token_version=token_version,
+        )
+        return {"Authorization": f"Bearer {token}"}
+
+    def _guest_workspace_user_id(self) -> int:
+        ws_user = permissions_service.get_workspace_user(101, 2)
+        self.assertIsNotNone(ws_user)
+        return int(ws_user["id"])
+
+    def test_repeated_requests_resolve_principal_once(self):
+        headers = self._headers(1, "owner@example.com", "OWNER")
+        with mock.patch.object(auth_module, "get_user_by_id", wraps=auth_module.get_user_by_id) as spy:
+            for _ in range(3):
+                resp = self.client.get("/accounts", headers=headers)
+                self.assertEqual(200, resp.status_code, resp.text)
+        self.assertEqual(1, spy.call_count)
+
+    def test_replace_permissions_invalidates_guest_principal(self):
+        wsu_id = self._guest_workspace_user_id()
+        permissions_service.replace_permissions(wsu_id, [{"module": "contas", "can_view": True}])
+        headers = self._headers(2, "guest@example.com", "GUEST")
+        self.assertEqual(200, self.client.get("/accounts", headers=headers).status_code)
+
+        permissions_service.replace_permissions(wsu_id, [{"module": "contas", "can_view": False}])
+        self.assertEqual(403, self.client.get("/accounts", headers=headers).status_code)
+
+    def test_token_version_bump_rejects_cached_session(self):
+        headers = self._headers(1, "owner@example.com", "OWNER")
+        self.assertEqual(200, self.client.get("/accounts", headers=headers).status_code)
+
+        auth_module.update_user_profile(
+            user_id=1,
+            email="owner@example.com",
+            current_password="secret123",
+            new_password="NovaSenha#2026",
+        )
+        self.assertEqual(401, self.client.get("/accounts", headers=headers).status_code)
+
+    def test_principal_is_invalidated_again_after_commit(self):
+        key = (2, 0, 101)
+        with db_module.unit_of_work():
+            auth_module.invalidate_principal_cache(2)
+            # Request concorrente resolve o principal antigo antes do commit.
+            auth_module.cache_principal(key, {"stale": True})
+            self.assertIsNotNone(auth_module.get_cached_principal(key))
+        self.assertIsNone(auth_module.get_cached_principal(key))
+
+    def test_removed_member_loses_access(self):
+        permissions_service.replace_permissions(self._guest_workspace_user_id(), [{"module": "contas", "can_view": True}])
+        headers = self._headers(2, "guest@example.com", "GUEST")
+        self.assertEqual(200, self.client.get("/accounts", headers=headers).status_code)
+
+        auth_module.delete_workspace_member(101, 2)
+        self.assertEqual(403, self.client.get("/accounts", headers=headers).status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
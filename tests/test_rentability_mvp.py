@@ -1,11 +1,14 @@
 import tempfile
 import unittest
+from datetime import date, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
+from unittest import mock
 
 from fastapi import HTTPException
 
 import db as db_module
+import invest_index_rates
 import invest_rentability
 from api.main import _validate_asset_rentability
 
@@ -28,6 +31,7 @@ class _IsolatedDbTestCase(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        db_module.close_pool()
         db_module.SQLITE_PATH = cls._orig_sqlite_path
         db_module.DB_PATH = cls._orig_db_path
         db_module.DATABASE_URL = cls._orig_database_url
@@ -340,6 +344,233 @@ class RentabilityEngineTests(_IsolatedDbTestCase):
         self.assertGreater(abs(float(row["delta_pct"])), 0.01)
 
 
+class IndexFactorCacheTests(_IsolatedDbTestCase):
+    def _insert_cdi_month(self):
+        for day in range(2, 31):
+            if date(2026, 1, day).weekday() >= 5:
+                continue
+            self._insert_index_rate(index_name="CDI", ref_date=f"2026-01-{day:02d}", value=0.040 + day / 10000)
+
+    def _loop_expected(self, start_day: int, pct: Decimal, spread_annual: Decimal) -> Decimal:
+        # Acumulação dia a dia (implementação original) como referência.
+        spread_daily = invest_rentability._annual_pct_to_daily_rate(spread_annual) if spread_annual else Decimal("0")
+        current = Decimal("1000.0")
+        with db_module.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT ref_date, value FROM index_rates WHERE index_name = 'CDI' AND ref_date >= ? ORDER BY ref_date",
+                (f"2026-01-{start_day:02d}",),
+            ).fetchall()
+        for r in rows:
+            base = invest_rentability._daily_rate_from_index_value(Decimal(str(r["value"])))
+            eff = invest_rentability._q_rate((base * pct) + spread_daily)
+            current *= invest_rentability._factor_from_rate(eff)
+        return current.quantize(invest_rentability._CURRENT_Q, rounding=ROUND_HALF_UP)
+
+    def test_cumulative_factors_match_daily_accrual(self):
+        self._insert_cdi_month()
+        cases = [
+            ("RF_CDI_110", "PCT_CDI", 110.0, None, "2026-01-01", 2, Decimal("1.1"), Decimal("0")),
+            ("RF_CDI_100_LATE", "PCT_CDI", 100.0, None, "2026-01-14", 15, Decimal("1"), Decimal("0")),
+            ("RF_CDI_SPREAD", "CDI_SPREAD", None, 2.5, "2026-01-09", 10, Decimal("1"), Decimal("2.5")),
+        ]
+        ids = {}
+        for symbol, rent_type, pct, spread, last_update, *_ in cases:
+            ids[symbol] = self._create_asset(
+                symbol=symbol,
+                rentability_type=rent_type,
+                index_name="CDI",
+                index_pct=pct,
+                spread_rate=spread,
+                last_update=last_update,
+            )
+
+        out = invest_rentability.update_fixed_income_assets(as_of_date="2026-01-31", user_id=self.uid)
+        self.assertEqual(3, out["updated"])
+        for symbol, _, _, _, _, start_day, pct, spread in cases:
+            row = self._asset_row(ids[symbol])
+            self.assertEqual("2026-01-30", row.get("last_update"), symbol)
+            self.assertAlmostEqual(float(self._loop_expected(start_day, pct, spread)), float(row["current_value"]), places=6)
+
+    def test_batch_loads_each_index_once(self):
+        self._insert_cdi_month()
+        for n, last_update in enumerate(["2026-01-20", "2026-01-02", "2026-01-10", "2026-01-05"]):
+            self._create_asset(
+                symbol=f"RF_CDI_{n}",
+                rentability_type="PCT_CDI",
+                index_name="CDI",
+                index_pct=100.0 + n,
+                last_update=last_update,
+            )
+        with mock.patch.object(
+            invest_rentability, "_load_daily_index_map", wraps=invest_rentability._load_daily_index_map
+        ) as loader:
+            out = invest_rentability.update_fixed_income_assets(as_of_date="2026-01-31", user_id=self.uid)
+        self.assertEqual(4, out["updated"])
+        # O lote pré-carrega a janela a partir do ativo mais antigo (03/01) numa única leitura.
+        self.assertEqual(1, loader.call_count)
+
+    def test_process_cache_expires_on_rate_writes(self):
+        with mock.patch.object(invest_rentability, "INDEX_CACHE_TTL_S", 60.0):
+            invest_rentability.invalidate_index_factor_cache()
+            first = invest_rentability._index_cache()
+            self.assertIs(first, invest_rentability._index_cache())
+            invest_index_rates.bulk_upsert_market_index_rates("CDI", [{"ref_date": "2026-03-02", "value": 0.05}], source="BCB")
+            self.assertIsNot(first, invest_rentability._index_cache())
+        invest_rentability.invalidate_index_factor_cache()
+
+
+class BatchUpdateTests(_IsolatedDbTestCase):
+    def _create_pair(self, suffix: str, **kwargs) -> tuple[int, int]:
+        return (
+            self._create_asset(symbol=f"RF_A_{suffix}", **kwargs),
+            self._create_asset(symbol=f"RF_B_{suffix}", **kwargs),
+        )
+
+    def test_batch_matches_per_asset_updates_in_one_transaction(self):
+        for day in range(2, 31):
+            if date(2026, 1, day).weekday() < 5:
+                self._insert_index_rate(index_name="CDI", ref_date=f"2026-01-{day:02d}", value=0.05)
+        self._insert_index_rate(index_name="IPCA", ref_date="2026-01-01", value=0.42)
+        pairs = [
+            self._create_pair("PRE", rentability_type="PREFIXADO", fixed_rate=11.0, last_update="2026-01-02"),
+            self._create_pair("CDI", rentability_type="PCT_CDI", index_name="CDI", index_pct=105.0, last_update="2026-01-06"),
+            self._create_pair("IPCA", rentability_type="IPCA_SPREAD", spread_rate=6.0, last_update="2025-12-31"),
+            self._create_pair("BAD", rentability_type="PREFIXADO", last_update="2026-01-02"),
+            self._create_pair("NEW", rentability_type="PREFIXADO", fixed_rate=10.0, last_update="2026-01-31"),
+        ]
+        singles = {b: invest_rentability.update_investment_value(b, as_of_date="2026-01-31", user_id=self.uid) for _, b in pairs}
+
+        with mock.patch.object(invest_rentability, "get_conn", wraps=invest_rentability.get_conn) as conns, mock.patch.object(
+            invest_rentability, "_executemany", wraps=invest_rentability._executemany
+        ) as many:
+            out = invest_rentability.update_fixed_income_assets(
+                as_of_date="2026-01-31", user_id=self.uid, asset_ids=[a for a, _ in pairs]
+            )
+        self.assertEqual(1, conns.call_count)
+        self.assertEqual(1, many.call_count)
+        self.assertEqual((5, 3, 1, 1), (out["total_assets"], out["updated"], out["skipped"], out["errors"]))
+
+        by_id = {r["asset_id"]: r for r in out["results"]}
+        for a, b in pairs:
+            batch_res = dict(by_id[a], asset_id=b)
+            self.assertEqual(singles[b], batch_res)
+            row_a, row_b = self._asset_row(a), self._asset_row(b)
+            self.assertEqual((row_b["current_value"], row_b["last_update"]), (row_a["current_value"], row_a["last_update"]))
+
+    def test_reset_from_principal_is_written_with_the_batch(self):
+        asset_id = self._create_asset(
+            symbol="RF_RESET",
+            rentability_type="PREFIXADO",
+            fixed_rate=12.0,
+            current_value=1500.0,
+            last_update="2026-01-31",
+        )
+        self._insert_trade(asset_id=asset_id, date="2026-01-30")
+        out = invest_rentability.update_fixed_income_assets(
+            as_of_date="2026-01-30", user_id=self.uid, reset_from_principal=True
+        )
+        self.assertEqual("already_up_to_date", out["results"][0]["reason"])
+        row = self._asset_row(asset_id)
+        self.assertEqual((1000.0, "2026-01-30"), (row["current_value"], row["last_update"]))
+
+
+class ProcessPoolSimulationTests(_IsolatedDbTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        invest_rentability.shutdown_simulation_pool()
+        super().tearDownClass()
+
+    def _seed(self) -> list[int]:
+        for day in range(2, 31):
+            if date(2026, 1, day).weekday() < 5:
+                self._insert_index_rate(index_name="CDI", ref_date=f"2026-01-{day:02d}", value=0.04 + day / 10000)
+        self._insert_index_rate(index_name="IPCA", ref_date="2026-01-01", value=0.42)
+        ids = []
+        for n in range(6):
+            ids.append(self._create_asset(symbol=f"RF_PRE_{n}", rentability_type="PREFIXADO", fixed_rate=9.0 + n, last_update="2024-01-02"))
+            ids.append(self._create_asset(symbol=f"RF_CDI_{n}", rentability_type="PCT_CDI", index_name="CDI", index_pct=100.0 + n, last_update=f"2026-01-{n + 2:02d}"))
+            ids.append(self._create_asset(symbol=f"RF_IPCA_{n}", rentability_type="IPCA_SPREAD", spread_rate=5.0 + n, last_update="2025-12-31"))
+        return ids
+
+    def test_process_mode_matches_serial_simulation(self):
+        self._seed()
+        serial = invest_rentability.preview_divergence_report(as_of_date="2026-01-31", user_id=self.uid, process_workers=0)
+        with mock.patch.object(invest_rentability, "SIMULATION_PROCESS_MIN_ASSETS", 1):
+            parallel = invest_rentability.preview_divergence_report(as_of_date="2026-01-31", user_id=self.uid, process_workers=2)
+        self.assertEqual(18, parallel["total_rows"])
+        self.assertEqual(serial, parallel)
+
+    def test_process_mode_keeps_writes_in_parent(self):
+        ids = self._seed()
+        expected = {
+            r["asset_id"]: r["projected_current_value"]
+            for r in invest_rentability.preview_divergence_report(as_of_date="2026-01-31", user_id=self.uid)["rows"]
+        }
+        with mock.patch.object(invest_rentability, "SIMULATION_PROCESS_MIN_ASSETS", 1), mock.patch.object(
+            invest_rentability, "_simulate_asset_value", wraps=invest_rentability._simulate_asset_value
+        ) as sim_spy:
+            out = invest_rentability.update_fixed_income_assets(as_of_date="2026-01-31", user_id=self.uid, process_workers=2)
+        self.assertEqual(0, sim_spy.call_count)  # a simulação roda só nos workers
+        self.assertEqual(18, out["updated"])
+        for asset_id in ids:
+            self.assertAlmostEqual(expected[asset_id], float(self._asset_row(asset_id)["current_value"]), places=6)
+
+
+class PrefixadoClosedFormTests(_IsolatedDbTestCase):
+    def _loop_expected(self, principal: str, fixed_rate: str, start: date, as_of: date) -> tuple[Decimal, date | None]:
+        # Laço dia a dia (implementação original) como referência.
+        factor = invest_rentability._factor_from_rate(invest_rentability._annual_pct_to_daily_rate(Decimal(fixed_rate)))
+        current = Decimal(principal)
+        last = None
+        for d in invest_rentability._iter_days(start, as_of):
+            if invest_rentability._is_business_day(d):
+                current *= factor
+                last = d
+        return current.quantize(invest_rentability._CURRENT_Q, rounding=ROUND_HALF_UP), last
+
+    def test_multi_year_spans_match_daily_loop(self):
+        cases = [
+            ("RF_PRE_A", "1000.0", "12.0", "2019-12-31", "2026-06-30"),
+            ("RF_PRE_B", "25000.55", "9.87", "2021-03-05", "2025-01-04"),  # último dia é sábado
+            ("RF_PRE_C", "310.1", "14.25", "2023-07-14", "2026-02-16"),  # início num sábado
+            ("RF_PRE_D", "1000000.0", "6.5", "2015-01-01", "2026-12-31"),
+        ]
+        for symbol, principal, fixed_rate, last_update, as_of in cases:
+            asset_id = self._create_asset(
+                symbol=symbol,
+                rentability_type="PREFIXADO",
+                fixed_rate=float(fixed_rate),
+                principal_amount=float(principal),
+                current_value=float(principal),
+                last_update=last_update,
+            )
+            res = invest_rentability.update_investment_value(asset_id, as_of_date=as_of, user_id=self.uid)
+            expected, last = self._loop_expected(
+                principal, fixed_rate, date.fromisoformat(last_update) + timedelta(days=1), date.fromisoformat(as_of)
+            )
+            self.assertTrue(res["updated"], symbol)
+            self.assertEqual(last.isoformat(), res["last_update"], symbol)
+            self.assertEqual(str(expected), str(Decimal(str(res["current_value"])).quantize(invest_rentability._CURRENT_Q)), symbol)
+
+    def test_weekend_only_window_keeps_value(self):
+        asset_id = self._create_asset(symbol="RF_PRE_WKD", rentability_type="PREFIXADO", fixed_rate=12.0, last_update="2026-01-09")
+        res = invest_rentability.update_investment_value(asset_id, as_of_date="2026-01-11", user_id=self.uid)
+        self.assertFalse(res["updated"])
+        self.assertEqual("2026-01-09", self._asset_row(asset_id).get("last_update"))
+
+    def test_business_day_counter_matches_iteration_with_holidays(self):
+        holidays = invest_rentability._br_national_holidays(2020, 2027)
+        self.assertIn(date(2024, 2, 13), holidays)  # terça de carnaval
+        self.assertIn(date(2025, 4, 18), holidays)  # sexta-feira santa
+        with mock.patch.object(invest_rentability, "_HOLIDAYS", holidays), mock.patch.object(
+            invest_rentability, "_HOLIDAY_SET", frozenset(holidays)
+        ):
+            for start, end in [(date(2020, 1, 1), date(2026, 12, 31)), (date(2024, 2, 10), date(2024, 2, 18)), (date(2025, 4, 19), date(2025, 4, 20))]:
+                brute = sum(1 for d in invest_rentability._iter_days(start, end) if invest_rentability._is_business_day(d))
+                self.assertEqual(brute, invest_rentability._count_business_days(start, end))
+            self.assertEqual(date(2025, 4, 17), invest_rentability._last_business_day(date(2025, 4, 1), date(2025, 4, 20)))
+
+
 class ApiRentabilityValidationTests(unittest.TestCase):
     def _assert_http_400(self, fn, expected_fragment: str):
         with self.assertRaises(HTTPException) as ctx:
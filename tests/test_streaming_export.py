@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+import tempfile
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import api.exporters as exporters
+import api.main as main_module
+import db as db_module
+import invest_repo
+import repo
+import reports
+import tenant
+
+
+class StreamingExportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_streaming_export.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+        with db_module.get_conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (1, 'owner@example.com', 'x', 'Owner', 'user', 'USER', 1)
+                """
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute("INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)")
+            for acc_id, name, acc_type in [(10, "Conta", "Banco"), (11, "Cartao", "Cartao")]:
+                conn.execute(
+                    "INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (?, ?, ?, 'BRL', 101)",
+                    (acc_id, name, acc_type),
+                )
+            conn.execute("INSERT INTO categories(id, name, kind, workspace_id) VALUES (21, 'Mercado', 'Despesa', 101)")
+            conn.execute(
+                "INSERT INTO assets(id, symbol, name, asset_class, currency, workspace_id) VALUES (1, 'PETR4', 'Petrobras', 'Ações BR', 'BRL', 101)"
+            )
+            for n in range(30):
+                d = f"2026-01-{n + 1:02d}"
+                conn.execute(
+                    "INSERT INTO trades(asset_id, date, side, quantity, price, note, workspace_id) VALUES (1, ?, 'BUY', 1, ?, ?, 101)",
+                    (d, 30.0 + n, f"nota, com \"aspas\" {n}"),
+                )
+                conn.execute(
+                    "INSERT INTO prices(asset_id, date, price, source, workspace_id) VALUES (1, ?, ?, 'brapi', 101)",
+                    (d, 31.0 + n),
+                )
+        tenant.invalidate_workspace_resolution()
+
+        today = date.today()
+        repo.create_credit_card("Cartao", "Visa", "Black", "Credito", 11, 10, 10, 3, user_id=1)
+        card_id = int(repo.list_credit_cards(user_id=1)[0]["id"])
+        for n in range(-50, 0):
+            repo.insert_transaction((today + timedelta(days=n)).isoformat(), f"Mercado {n}", -1.0 * n, 10, 21, "Debito", None, user_id=1)
+        repo.insert_transaction((today + timedelta(days=10)).isoformat(), "Aluguel", -1800.0, 10, 21, "Futuro", None, user_id=1)
+        for n in [-20, -3]:
+            repo.register_credit_charge(card_id, (today + timedelta(days=n)).isoformat(), 80.0, 21, "Compra", user_id=1)
+
+        cls.client = TestClient(main_module.app)
+        main_module.app.dependency_overrides[main_module._current_user] = lambda: {"id": 1}
+
+    @classmethod
+    def tearDownClass(cls):
+        main_module.app.dependency_overrides.clear()
+        main_module._shutdown_login_sync_executor()
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def _all_pages(self, view: str) -> list[dict]:
+        rows, after = [], None
+        while True:
+            page, after = reports.page_transactions(user_id=1, view=view, limit=500, after=after)
+            rows.extend(page)
+            if after is None:
+                return rows
+
+    def test_transactions_export_matches_every_view(self):
+        for view in ["caixa", "competencia", "futuro"]:
+            expected = [str(r["id"]) for r in reversed(self._all_pages(view))]
+            streamed = [str(r["id"]) for r in reports.stream_transactions(user_id=1, view=view, chunk_size=3)]
+            self.assertEqual(expected, streamed, view)
+
+            resp = self.client.get("/transactions/export", params={"view": view})
+            self.assertEqual(200, resp.status_code, resp.text)
+            self.assertTrue(resp.headers["content-type"].startswith("text/csv"))
+            self.assertIn(f"lancamentos_{view}.csv", resp.headers["content-disposition"])
+            rows = list(csv.DictReader(io.StringIO(resp.text)))
+            self.assertEqual(expected, [r["id"] for r in rows], view)
+
+    def test_invest_exports_stream_full_history(self):
+        resp = self.client.get("/invest/export/trades", params={"format": "ndjson", "date_from": "2026-01-11"})
+        self.assertEqual(200, resp.status_code, resp.text)
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        self.assertEqual(20, len(lines))
+        self.assertEqual("2026-01-11", lines[0]["date"])
+        self.assertEqual('nota, com "aspas" 10', lines[0]["note"])
+        self.assertEqual(exporters.TRADE_COLUMNS, list(lines[0]))
+
+        prices = list(csv.DictReader(io.StringIO(self.client.get("/invest/export/prices").text)))
+        self.assertEqual(30, len(prices))
+        self.assertEqual(30, len(list(invest_repo.stream_prices(user_id=1, chunk_size=7))))
+        self.assertEqual(200, self.client.get("/invest/export/income").status_code)
+
+        self.assertEqual(404, self.client.get("/invest/export/assets").status_code)
+        self.assertEqual(400, self.client.get("/invest/export/trades", params={"format": "xlsx"}).status_code)
+
+    def test_encoder_flushes_in_bounded_blocks(self):
+        rows = ({"id": n, "date": "2026-01-01", "note": "x" * 50} for n in range(1000))
+        chunks = list(exporters.encode_rows(rows, "csv", ["id", "date", "note"], flush_bytes=4096))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(c) < 4096 + 200 for c in chunks))
+        parsed = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+        self.assertEqual(["id", "date", "note"], parsed[0])
+        self.assertEqual(1001, len(parsed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import tempfile
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import api.main as main_module
+import db as db_module
+import repo
+import reports
+import tenant
+
+
+class TransactionsPaginationTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_tx_pagination.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+        with db_module.get_conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                VALUES (1, 'owner@example.com', 'x', 'Owner', 'user', 'USER', 1)
+                """
+            )
+            conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (101, 'WS', 1, 'active')")
+            conn.execute("INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)")
+            for acc_id, name, acc_type in [(10, "Conta", "Banco"), (11, "Cartao", "Cartao")]:
+                conn.execute(
+                    "INSERT INTO accounts(id, name, type, currency, workspace_id) VALUES (?, ?, ?, 'BRL', 101)",
+                    (acc_id, name, acc_type),
+                )
+            for cat_id, name, kind in [(20, "Salario", "Receita"), (21, "Mercado", "Despesa"), (23, "Fatura Cartão", "Despesa")]:
+                conn.execute("INSERT INTO categories(id, name, kind, workspace_id) VALUES (?, ?, ?, 101)", (cat_id, name, kind))
+        tenant.invalidate_workspace_resolution()
+
+        today = date.today()
+        day = lambda n: (today + timedelta(days=n)).isoformat()
+        repo.create_credit_card("Cartao", "Visa", "Black", "Credito", 11, 10, 10, 3, user_id=1)
+        card_id = int(repo.list_credit_cards(user_id=1)[0]["id"])
+        for n in range(-60, 0, 3):
+            repo.insert_transaction(day(n), f"Mercado {n}", -10.0 - n, 10, 21, "Debito", None, user_id=1)
+        # Vários lançamentos no mesmo dia exercitam o desempate por origem/id.
+        for k in range(4):
+            repo.insert_transaction(day(-30), f"Salario {k}", 1000.0 + k, 10, 20, "PIX", None, user_id=1)
+        repo.insert_transaction(day(-20), "PGTO FATURA Cartao", -300.0, 10, 23, "PIX", None, user_id=1)
+        repo.insert_transaction(day(-5), "Aluguel atrasado", -1800.0, 10, 21, "Futuro", None, user_id=1)
+        repo.insert_transaction(day(15), "Aluguel", -1800.0, 10, 21, "Agendado", None, user_id=1)
+        for n in [-40, -30, -30, -2, 0]:
+            repo.register_credit_charge(card_id, day(n), 50.0 + abs(n), 21, f"Compra {n}", user_id=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        main_module._shutdown_login_sync_executor()
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def _expected(self, view: str, date_from=None, date_to=None) -> list[tuple]:
+        df = reports.df_transactions(date_from=date_from, date_to=date_to, user_id=1, view=view)
+        if df.empty:
+            return []
+        return sorted(
+            ((str(r["id"]), r["date"].strftime("%Y-%m-%d"), round(float(r["amount_brl"]), 6), r["charge_status"] or "") for _, r in df.iterrows()),
+            key=lambda x: x[:2],
+        )
+
+    def _walk(self, view: str, limit: int, date_from=None, date_to=None) -> list[dict]:
+        rows, after = [], None
+        for _ in range(100):
+            page, after = reports.page_transactions(date_from, date_to, user_id=1, view=view, limit=limit, after=after)
+            self.assertLessEqual(len(page), limit)
+            rows.extend(page)
+            if after is None:
+                return rows
+        self.fail("paginação não terminou")
+
+    def test_pages_match_dataframe_rules_for_every_view(self):
+        for view in ["caixa", "competencia", "futuro"]:
+            for date_from, date_to in [(None, None), ((date.today() - timedelta(days=35)).isoformat(), date.today().isoformat())]:
+                expected = self._expected(view, date_from, date_to)
+                self.assertTrue(expected, view)
+                for limit in [1, 4, 1000]:
+                    rows = self._walk(view, limit, date_from, date_to)
+                    got = sorted(
+                        ((str(r["id"]), r["date"], round(float(r["amount_brl"]), 6), r["charge_status"]) for r in rows),
+                        key=lambda x: x[:2],
+                    )
+                    self.assertEqual(expected, got, f"view={view} limit={limit} {date_from}..{date_to}")
+                    self.assertEqual(len(rows), len({str(r["id"]) for r in rows}))
+                    keys = [r["date"] for r in rows]
+                    self.assertEqual(sorted(keys, reverse=True), keys)
+
+    def test_competencia_replaces_invoice_payments_with_card_charges(self):
+        rows = self._walk("competencia", 1000)
+        descriptions = {r["description"] for r in rows}
+        self.assertNotIn("PGTO FATURA Cartao", descriptions)
+        self.assertTrue(any(str(r["id"]).startswith("cc-") for r in rows))
+        futuro = self._walk("futuro", 1000)
+        self.assertEqual({"Vencido", "Pendente", "Aguardando Fatura"}, {r["charge_status"] for r in futuro})
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(ValueError):
+            reports.page_transactions(user_id=1, after="ontem|abc")
+
+    def test_endpoints_expose_next_cursor(self):
+        client = TestClient(main_module.app)
+        main_module.app.dependency_overrides[main_module._current_user] = lambda: {"id": 1}
+        try:
+            first = client.get("/transactions/page", params={"limit": 5})
+            self.assertEqual(200, first.status_code, first.text)
+            body = first.json()
+            self.assertEqual(5, len(body["rows"]))
+            self.assertTrue(body["next_cursor"])
+
+            legacy = client.get("/transactions", params={"limit": 5, "after": body["next_cursor"]})
+            self.assertEqual(200, legacy.status_code, legacy.text)
+            self.assertIsInstance(legacy.json(), list)
+            self.assertEqual(5, len(legacy.json()))
+            self.assertTrue(legacy.headers.get("X-Next-Cursor"))
+            self.assertFalse({r["id"] for r in body["rows"]} & {r["id"] for r in legacy.json()})
+
+            bad = client.get("/transactions/page", params={"after": "x"})
+            self.assertEqual(400, bad.status_code)
+        finally:
+            main_module.app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import db as db_module
+import invest_quotes
+import update_quotes_job
+
+
+class UpdateQuotesJobDedupTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_quotes_job.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+        with db_module.get_conn() as conn:
+            for uid, ws in [(1, 101), (2, 102), (3, 103)]:
+                conn.execute(
+                    "INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active) VALUES (?, ?, 'x', 'U', 'user', 'USER', 1)",
+                    (uid, f"u{uid}@example.com"),
+                )
+                conn.execute("INSERT INTO workspaces(id, name, owner_user_id, status) VALUES (?, ?, ?, 'active')", (ws, f"WS{ws}", uid))
+            assets = [
+                (1, "PETR4", "Ações BR", "BRL", 101),
+                (2, "AAPL", "Stocks US", "USD", 101),
+                (3, "PETR4.SA", "Ações BR", "BRL", 102),
+                (4, "VALE3", "Ações BR", "BRL", 102),
+                (5, "PETR4", "Ações BR", "BRL", 103),
+                (6, "AAPL", "Stocks US", "USD", 103),
+            ]
+            for asset_id, symbol, cls_name, currency, ws in assets:
+                conn.execute(
+                    "INSERT INTO assets(id, symbol, name, asset_class, currency, workspace_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    (asset_id, symbol, symbol, cls_name, currency, ws),
+                )
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def _fake_update_all_prices(self, assets, **kwargs):
+        prices = {"PETR4": 37.5, "PETR4.SA": 37.5, "AAPL": 231.0}
+        return [
+            {
+                "asset_id": a["id"],
+                "symbol": a["symbol"],
+                "ok": a["symbol"] in prices,
+                "price": prices.get(a["symbol"]),
+                "px_date": "2026-01-05" if a["symbol"] in prices else None,
+                "src": "brapi" if a["symbol"] in prices else None,
+                "error": None if a["symbol"] in prices else "Sem cotação",
+            }
+            for a in assets
+        ]
+
+    def test_each_symbol_is_fetched_once_and_fanned_out(self):
+        with mock.patch.object(invest_quotes, "update_all_prices", side_effect=self._fake_update_all_prices) as fetch:
+            summary = update_quotes_job.run_job(force=True)
+
+        self.assertEqual(1, fetch.call_count)
+        fetched = [a["symbol"] for a in fetch.call_args.kwargs["assets"]]
+        # PETR4 e PETR4.SA seguem planos de consulta diferentes (fallback sem .SA), então não se fundem.
+        self.assertEqual(["PETR4", "AAPL", "PETR4.SA", "VALE3"], fetched)
+        self.assertEqual((6, 4, 1.5), (summary["assets_total"], summary["unique_symbols"], summary["dedup_ratio"]))
+        self.assertEqual((6, 5, 1), (summary["quotes_total"], summary["saved_total"], summary["error_total"]))
+
+        with db_module.get_conn() as conn:
+            prices = conn.execute("SELECT asset_id, price, workspace_id FROM prices ORDER BY asset_id").fetchall()
+            statuses = dict(conn.execute("SELECT workspace_id, last_status FROM quote_job_status").fetchall())
+        self.assertEqual(
+            [(1, 37.5, 101), (2, 231.0, 101), (3, 37.5, 102), (5, 37.5, 103), (6, 231.0, 103)],
+            [tuple(r) for r in prices],
+        )
+        self.assertEqual({101: "success", 102: "warning", 103: "success"}, statuses)
+
+    def test_same_symbol_in_other_currency_is_fetched_separately(self):
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO assets(id, symbol, name, asset_class, currency, workspace_id) VALUES (7, 'BTC', 'BTC', 'Cripto', 'BRL', 101)"
+            )
+            conn.execute(
+                "INSERT INTO assets(id, symbol, name, asset_class, currency, workspace_id) VALUES (8, 'BTC', 'BTC', 'Cripto', 'USD', 102)"
+            )
+        prices = {"BRL": 350000.0, "USD": 65000.0}
+
+        def fake(assets, **kwargs):
+            return [
+                {
+                    "asset_id": a["id"],
+                    "symbol": a["symbol"],
+                    "ok": a["symbol"] == "BTC",
+                    "price": prices[a["currency"]] if a["symbol"] == "BTC" else None,
+                    "px_date": "2026-01-05",
+                    "src": "yahoo",
+                    "error": None,
+                }
+                for a in assets
+            ]
+
+        try:
+            with mock.patch.object(invest_quotes, "update_all_prices", side_effect=fake) as fetch:
+                update_quotes_job.run_job(force=True)
+            btc = [a["currency"] for a in fetch.call_args.kwargs["assets"] if a["symbol"] == "BTC"]
+            self.assertEqual(["BRL", "USD"], btc)
+            with db_module.get_conn() as conn:
+                saved = dict(conn.execute("SELECT asset_id, price FROM prices WHERE asset_id IN (7, 8)").fetchall())
+            self.assertEqual({7: 350000.0, 8: 65000.0}, saved)
+        finally:
+            with db_module.get_conn() as conn:
+                conn.execute("DELETE FROM prices WHERE asset_id IN (7, 8)")
+                conn.execute("DELETE FROM assets WHERE id IN (7, 8)")
+
+
+if __name__ == "__main__":
+    unittest.main()
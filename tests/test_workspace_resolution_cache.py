@@ -0,0 +1,117 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import auth as auth_module
+import db as db_module
+import repo
+import tenant
+
+
+class WorkspaceResolutionCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmpdir = tempfile.TemporaryDirectory()
+        cls._db_path = Path(cls._tmpdir.name) / "finance_test_workspace_resolution.db"
+        cls._orig_sqlite_path = db_module.SQLITE_PATH
+        cls._orig_db_path = db_module.DB_PATH
+        cls._orig_database_url = db_module.DATABASE_URL
+        cls._orig_use_postgres = db_module.USE_POSTGRES
+
+        db_module.DATABASE_URL = ""
+        db_module.USE_POSTGRES = False
+        db_module.SQLITE_PATH = cls._db_path
+        db_module.DB_PATH = cls._db_path
+        db_module.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_module.close_pool()
+        tenant.invalidate_workspace_resolution()
+        db_module.SQLITE_PATH = cls._orig_sqlite_path
+        db_module.DB_PATH = cls._orig_db_path
+        db_module.DATABASE_URL = cls._orig_database_url
+        db_module.USE_POSTGRES = cls._orig_use_postgres
+        cls._tmpdir.cleanup()
+
+    def setUp(self):
+        with db_module.get_conn() as conn:
+            for table in ["permissions", "workspace_users", "workspaces", "users"]:
+                conn.execute(f"DELETE FROM {table}")
+            for uid, email in [(1, "owner@example.com"), (2, "guest@example.com")]:
+                conn.execute(
+                    """
+                    INSERT INTO users(id, email, password_hash, display_name, role, global_role, is_active)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (uid, email, "x", email, "user", "USER", 1),
+                )
+            conn.execute(
+                """
+                INSERT INTO workspaces(id, name, owner_user_id, status)
+                VALUES (101, 'WS Owner', 1, 'active'), (102, 'WS Other', 2, 'active')
+                """
+            )
+            conn.execute(
+                "INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (101, 1, 'OWNER', 1)"
+            )
+        tenant.invalidate_workspace_resolution()
+
+    def _count_queries(self):
+        return mock.patch.object(db_module, "get_conn", wraps=db_module.get_conn)
+
+    def test_resolution_is_served_from_cache(self):
+        with self._count_queries() as spy:
+            self.assertEqual(101, db_module.resolve_user_workspace_id(1))
+            self.assertEqual(101, db_module.resolve_user_workspace_id(1))
+            self.assertEqual(101, repo._uid(1))
+        self.assertEqual(1, spy.call_count)
+
+    def test_user_without_workspace_is_cached_as_legacy_scope(self):
+        self.assertIsNone(db_module.resolve_user_workspace_id(2))
+        self.assertEqual(2, repo._uid(2))
+        self.assertEqual((True, None), tenant.get_cached_workspace_resolution(2))
+
+    def test_upsert_and_delete_member_invalidate_user(self):
+        self.assertIsNone(db_module.resolve_user_workspace_id(2))
+
+        auth_module.upsert_workspace_member(102, 2, role="GUEST", created_by=2)
+        self.assertEqual(102, db_module.resolve_user_workspace_id(2))
+
+        auth_module.delete_workspace_member(102, 2)
+        self.assertIsNone(db_module.resolve_user_workspace_id(2))
+
+    def test_membership_change_is_invalidated_again_after_commit(self):
+        self.assertIsNone(db_module.resolve_user_workspace_id(2))
+        with db_module.unit_of_work():
+            auth_module.upsert_workspace_member(102, 2, role="GUEST", created_by=2)
+            # Request concorrente ainda lê o estado anterior ao commit e o recoloca no cache.
+            tenant.cache_workspace_resolution(2, None)
+        self.assertEqual((False, None), tenant.get_cached_workspace_resolution(2))
+        self.assertEqual(102, db_module.resolve_user_workspace_id(2))
+
+    def test_workspace_status_change_invalidates_members(self):
+        with db_module.get_conn() as conn:
+            conn.execute(
+                "INSERT INTO workspace_users(workspace_id, user_id, role, created_by) VALUES (102, 1, 'GUEST', 2)"
+            )
+        self.assertEqual(101, db_module.resolve_user_workspace_id(1))
+
+        auth_module.update_workspace_status(101, "blocked")
+        # Workspace ativo passa na frente do OWNER bloqueado.
+        self.assertEqual(102, db_module.resolve_user_workspace_id(1))
+
+    def test_entries_expire_after_ttl(self):
+        self.assertEqual(101, db_module.resolve_user_workspace_id(1))
+        with db_module.get_conn() as conn:
+            conn.execute("DELETE FROM workspace_users WHERE user_id = 1")
+        self.assertEqual(101, db_module.resolve_user_workspace_id(1))
+
+        later = tenant.time.monotonic() + tenant.WORKSPACE_RESOLUTION_TTL_S + 1
+        with mock.patch.object(tenant.time, "monotonic", return_value=later):
+            self.assertIsNone(db_module.resolve_user_workspace_id(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
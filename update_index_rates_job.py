@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+import invest_index_rates
+
+
+DEFAULT_INDEXES = ("CDI", "SELIC", "IPCA")
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = str(os.getenv(name, "")).strip()
+    if not raw:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
+def run_job(*, index_names: list[str] | None = None, timeout_s: float = 20.0, force: bool = False) -> dict:
+    # Uma consulta por índice para todos os workspaces; o resultado vai para market_index_rates.
+    out = invest_index_rates.sync_market_index_rates(
+        index_names=index_names or list(DEFAULT_INDEXES),
+        timeout_s=timeout_s,
+        force=force,
+    )
+    return {
+        "ok": not out["errors"],
+        "ref_date": out["ref_date"],
+        "statuses": out["statuses"],
+        "errors": out["errors"],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Sincroniza a série global de índices (CDI/SELIC/IPCA).")
+    parser.add_argument("--indexes", nargs="*", default=None, help="Índices a sincronizar (padrão: CDI SELIC IPCA).")
+    parser.add_argument("--timeout-s", type=float, default=_env_float("INDEX_JOB_TIMEOUT_S", 20.0))
+    parser.add_argument("--force", action="store_true", help="Consulta a fonte mesmo se já sincronizou hoje.")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = run_job(index_names=args.indexes, timeout_s=float(args.timeout_s), force=bool(args.force))
+    except Exception as exc:
+        summary = {
+            "ok": False,
+            "error": str(exc),
+        }
+
+    print(json.dumps(summary, ensure_ascii=True))
+    return 0 if summary.get("ok") else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
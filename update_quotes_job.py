@@ -125,6 +125,8 @@ def run_job(
         "processed_workspaces": 0,
         "skipped_workspaces": 0,
         "assets_total": 0,
+        "unique_symbols": 0,
+        "dedup_ratio": 0.0,
         "quotes_total": 0,
         "saved_total": 0,
         "error_total": 0,
@@ -134,6 +136,30 @@ def run_job(
     workspaces = _iter_target_workspaces()
     summary["workspace_count"] = len(workspaces)
 
+    def _finish_status(workspace_id: int, status: str, reason: str | None, info: dict) -> None:
+        invest_repo.upsert_quote_job_status(
+            workspace_id=workspace_id,
+            last_started_at=now.isoformat(),
+            last_finished_at=datetime.now(tz).isoformat(),
+            last_status=status,
+            last_reason=reason,
+            last_saved_total=info["saved"],
+            last_total=info["quotes"],
+            last_error_total=info["errors"],
+            last_run_scope="automatic",
+        )
+
+    def _fail(info: dict, exc: Exception) -> None:
+        info["errors"] += 1
+        info["error"] = str(exc)
+        summary["error_total"] += 1
+        if info["workspace_id"] > 0:
+            _finish_status(info["workspace_id"], "error", str(exc), info)
+
+    # 1) Coleta os ativos de cada workspace e agrupa pelo que de fato é consultado (símbolo, classe e moeda).
+    pending: list[tuple[dict, list[dict]]] = []
+    unique_assets: list[dict] = []
+    unique_index: dict[str, int] = {}
     for ws in workspaces:
         workspace_id = int(ws.get("workspace_id") or 0)
         owner_user_id = int(ws.get("owner_user_id") or 0)
@@ -147,12 +173,12 @@ def run_job(
             "errors": 0,
             "skipped": False,
         }
+        summary["workspaces"].append(workspace_info)
 
         if workspace_id <= 0 or owner_user_id <= 0:
             workspace_info["skipped"] = True
             workspace_info["skip_reason"] = "missing_scope"
             summary["skipped_workspaces"] += 1
-            summary["workspaces"].append(workspace_info)
             continue
 
         try:
@@ -176,76 +202,78 @@ def run_job(
             if not assets:
                 workspace_info["skipped"] = True
                 workspace_info["skip_reason"] = "no_assets"
-                invest_repo.upsert_quote_job_status(
-                    workspace_id=workspace_id,
-                    last_started_at=now.isoformat(),
-                    last_finished_at=datetime.now(tz).isoformat(),
-                    last_status="skipped",
-                    last_reason="no_assets",
-                    last_saved_total=0,
-                    last_total=0,
-                    last_error_total=0,
-                    last_run_scope="automatic",
-                )
+                _finish_status(workspace_id, "skipped", "no_assets", workspace_info)
                 summary["skipped_workspaces"] += 1
-                summary["workspaces"].append(workspace_info)
                 continue
 
+            for asset in assets:
+                key = invest_quotes.quote_fetch_key(asset) or f"#{workspace_id}:{asset.get('id')}"
+                if key not in unique_index:
+                    unique_index[key] = len(unique_assets)
+                    unique_assets.append({**asset, "id": len(unique_assets)})
+                asset["_quote_idx"] = unique_index[key]
+            pending.append((workspace_info, assets))
+        except Exception as exc:
+            _fail(workspace_info, exc)
+        finally:
+            clear_tenant_context()
+
+    # 2) Uma consulta por símbolo distinto, compartilhada por todos os workspaces.
+    summary["unique_symbols"] = len(unique_assets)
+    quoted = sum(len(assets) for _, assets in pending)
+    summary["dedup_ratio"] = round(quoted / len(unique_assets), 2) if unique_assets else 0.0
+    report: list[dict] = []
+    if unique_assets:
+        try:
             report = invest_quotes.update_all_prices(
-                assets=assets,
+                assets=unique_assets,
                 timeout_s=timeout_s,
                 max_workers=max_workers,
             )
-            workspace_info["quotes"] = len(report)
-            summary["quotes_total"] += len(report)
-
-            for row in report:
-                if not row.get("ok"):
-                    workspace_info["errors"] += 1
-                    continue
-                invest_repo.upsert_price(
-                    asset_id=int(row["asset_id"]),
-                    date=str(row["px_date"]),
-                    price=float(row["price"]),
-                    source=row.get("src") or "auto_job",
-                    user_id=owner_user_id,
-                )
-                workspace_info["saved"] += 1
-
-            summary["processed_workspaces"] += 1
-            summary["saved_total"] += workspace_info["saved"]
-            summary["error_total"] += workspace_info["errors"]
-            invest_repo.upsert_quote_job_status(
-                workspace_id=workspace_id,
-                last_started_at=now.isoformat(),
-                last_finished_at=datetime.now(tz).isoformat(),
-                last_status="success" if workspace_info["errors"] == 0 else "warning",
-                last_reason=None,
-                last_saved_total=workspace_info["saved"],
-                last_total=workspace_info["quotes"],
-                last_error_total=workspace_info["errors"],
-                last_run_scope="automatic",
-            )
-            summary["workspaces"].append(workspace_info)
         except Exception as exc:
-            workspace_info["errors"] += 1
-            workspace_info["error"] = str(exc)
-            summary["error_total"] += 1
-            if workspace_id > 0:
-                invest_repo.upsert_quote_job_status(
-                    workspace_id=workspace_id,
-                    last_started_at=now.isoformat(),
-                    last_finished_at=datetime.now(tz).isoformat(),
-                    last_status="error",
-                    last_reason=str(exc),
-                    last_saved_total=workspace_info["saved"],
-                    last_total=workspace_info["quotes"],
-                    last_error_total=workspace_info["errors"],
-                    last_run_scope="automatic",
-                )
-            summary["workspaces"].append(workspace_info)
-        finally:
-            clear_tenant_context()
+            for workspace_info, _ in pending:
+                _fail(workspace_info, exc)
+            pending = []
+
+    # 3) Distribui os resultados para os preços de cada workspace numa gravação em lote.
+    price_rows: list[dict] = []
+    for workspace_info, assets in pending:
+        for asset in assets:
+            row = report[asset["_quote_idx"]]
+            workspace_info["quotes"] += 1
+            if not row.get("ok"):
+                workspace_info["errors"] += 1
+                continue
+            price_rows.append(
+                {
+                    "workspace_id": workspace_info["workspace_id"],
+                    "asset_id": int(asset["id"]),
+                    "date": str(row["px_date"]),
+                    "price": float(row["price"]),
+                    "source": row.get("src") or "auto_job",
+                }
+            )
+            workspace_info["saved"] += 1
+        summary["quotes_total"] += workspace_info["quotes"]
+
+    try:
+        invest_repo.upsert_prices_bulk(price_rows)
+    except Exception as exc:
+        for workspace_info, _ in pending:
+            workspace_info["saved"] = 0
+            _fail(workspace_info, exc)
+        pending = []
+
+    for workspace_info, _ in pending:
+        summary["processed_workspaces"] += 1
+        summary["saved_total"] += workspace_info["saved"]
+        summary["error_total"] += workspace_info["errors"]
+        _finish_status(
+            workspace_info["workspace_id"],
+            "success" if workspace_info["errors"] == 0 else "warning",
+            None,
+            workspace_info,
+        )
 
     summary["finished_at"] = datetime.now(tz).isoformat()
     return summary